@@ -22,6 +22,7 @@ from galaxy.managers.tools import DynamicToolManager
 from galaxy.managers.users import UserManager
 from galaxy.managers.workflows import WorkflowsManager
 from galaxy.model.database_heartbeat import DatabaseHeartbeat
+from galaxy.model.disk_usage import DiskUsageLedger
 from galaxy.model.tags import GalaxyTagHandler
 from galaxy.queue_worker import (
     GalaxyQueueWorker,
@@ -176,9 +177,14 @@ class UniverseApplication(config.ConfiguresGalaxyMixin):
             permitted_actions=self.security_agent.permitted_actions)
         # Load quota management.
         if self.config.enable_quotas:
-            self.quota_agent = galaxy.quota.QuotaAgent(self.model)
+            self.quota_agent = galaxy.quota.QuotaAgent(self.model, cache_ttl=self.config.quota_cache_ttl)
         else:
             self.quota_agent = galaxy.quota.NoQuotaAgent(self.model)
+        # Apply changes of disk usage recorded in the ledger
+        self.disk_usage_ledger = None
+        if self.config.enable_disk_usage_ledger:
+            self.disk_usage_ledger = DiskUsageLedger(self.model)
+            self.application_stack.register_postfork_function(self.disk_usage_ledger.start)
         # Heartbeat for thread profiling
         self.heartbeat = None
         from galaxy import auth
@@ -296,6 +302,12 @@ class UniverseApplication(config.ConfiguresGalaxyMixin):
         except Exception as e:
             exception = exception or e
             log.exception("Failed to shutdown job manager cleanly")
+        try:
+            if self.disk_usage_ledger:
+                self.disk_usage_ledger.shutdown()
+        except Exception as e:
+            exception = exception or e
+            log.exception("Failed to shutdown disk usage ledger cleanly")
         try:
             self.object_store.shutdown()
         except Exception as e:
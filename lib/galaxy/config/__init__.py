@@ -1024,6 +1024,7 @@ def init_models_from_config(config, map_install_models=False, object_store=None,
         slow_query_log_threshold=config.slow_query_log_threshold,
         thread_local_log=config.thread_local_log,
         log_query_counts=config.database_log_query_counts,
+        use_disk_usage_ledger=config.enable_disk_usage_ledger,
     )
     return model
 
@@ -3,7 +3,7 @@ import tarfile
 
 from galaxy.datatypes.binary import CompressedArchive
 from galaxy.datatypes.data import get_file_peek, Text
-from galaxy.datatypes.sniff import build_sniff_from_prefix
+from galaxy.datatypes.sniff import build_sniff_from_prefix, TAR_MAGIC
 from galaxy.util import nice_size
 
 log = logging.getLogger(__name__)
@@ -40,6 +40,7 @@ class Augustus(CompressedArchive):
         Class describing an Augustus prediction model
     """
     file_ext = "augustus"
+    sniff_magic = TAR_MAGIC
     edam_data = "data_0950"
     compressed = True
 
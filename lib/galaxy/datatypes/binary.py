@@ -27,6 +27,7 @@ from galaxy.datatypes.data import (
     get_file_peek,
 )
 from galaxy.datatypes.metadata import DictParameter, ListParameter, MetadataElement, MetadataParameter
+from galaxy.datatypes.sniff import TAR_MAGIC
 from galaxy.util import nice_size, sqlite
 from galaxy.util.checkers import is_bz2, is_gzip
 from . import data, dataproviders
@@ -89,6 +90,7 @@ class Ab1(Binary):
 class Idat(Binary):
     """Binary data in idat format"""
     file_ext = "idat"
+    sniff_magic = b"IDAT"
     edam_format = "format_2058"
     edam_data = "data_2603"
 
@@ -272,6 +274,7 @@ class BamNative(CompressedArchive):
     edam_format = "format_2572"
     edam_data = "data_0863"
     file_ext = "unsorted.bam"
+    sniff_magic = util.gzip_magic  # BGZF
     sort_flag = None
 
     MetadataElement(name="bam_version", default=None, desc="BAM Version", param=MetadataParameter, readonly=True, visible=False, optional=True, no_value=None)
@@ -663,6 +666,7 @@ class BamQuerynameSorted(BamInputSorted):
 
 class CRAM(Binary):
     file_ext = "cram"
+    sniff_magic = b"CRAM"
     edam_format = "format_3462"
     edam_data = "format_0863"
 
@@ -725,6 +729,7 @@ class Bcf(BaseBcf):
 
     """
     file_ext = "bcf"
+    sniff_magic = util.gzip_magic  # BGZF
 
     MetadataElement(name="bcf_index", desc="BCF Index File", param=metadata.FileParameter, file_ext="csi", readonly=True, no_value=None, visible=False, optional=True)
 
@@ -774,6 +779,7 @@ class BcfUncompressed(BaseBcf):
     False
     """
     file_ext = "bcf_uncompressed"
+    sniff_magic = b"BCF"
 
     def sniff(self, filename):
         try:
@@ -799,11 +805,12 @@ class H5(Binary):
     False
     """
     file_ext = "h5"
+    sniff_magic = binascii.unhexlify("894844460d0a1a0a")
     edam_format = "format_3590"
 
     def __init__(self, **kwd):
         super().__init__(**kwd)
-        self._magic = binascii.unhexlify("894844460d0a1a0a")
+        self._magic = self.sniff_magic
 
     def sniff(self, filename):
         # The first 8 bytes of any hdf5 file are 0x894844460d0a1a0a
@@ -1097,6 +1104,11 @@ class GmxBinary(Binary):
     magic_number = None  # variables to be overwritten in the child class
     file_ext = ""
 
+    @property
+    def sniff_magic(self):
+        if self.magic_number is not None:
+            return struct.pack('>1i', self.magic_number)
+
     def sniff(self, filename):
         # The first 4 bytes of any GROMACS binary file containing the magic number
         try:
@@ -1407,6 +1419,7 @@ class Sff(Binary):
     edam_format = "format_3284"
     edam_data = "data_0924"
     file_ext = "sff"
+    sniff_magic = b'.sff'
 
     def sniff(self, filename):
         # The first 4 bytes of any sff file is '.sff', and the file is binary. For details
@@ -1449,6 +1462,7 @@ class BigWig(Binary):
     def __init__(self, **kwd):
         super().__init__(**kwd)
         self._magic = 0x888FFC26
+        self.sniff_magic = struct.pack("I", self._magic)
         self._name = "BigWig"
 
     def _unpack(self, pattern, handle):
@@ -1486,6 +1500,7 @@ class BigBed(BigWig):
     def __init__(self, **kwd):
         Binary.__init__(self, **kwd)
         self._magic = 0x8789F2EB
+        self.sniff_magic = struct.pack("I", self._magic)
         self._name = "BigBed"
 
 
@@ -1494,6 +1509,7 @@ class TwoBit(Binary):
     edam_format = "format_3009"
     edam_data = "data_0848"
     file_ext = "twobit"
+    sniff_magic = (struct.pack(">L", TWOBIT_MAGIC_NUMBER), struct.pack(">L", TWOBIT_MAGIC_NUMBER_SWAP))
 
     def sniff(self, filename):
         try:
@@ -1528,6 +1544,7 @@ class SQlite(Binary):
     MetadataElement(name="table_columns", default={}, param=DictParameter, desc="Database Table Columns", readonly=True, visible=True, no_value={})
     MetadataElement(name="table_row_count", default={}, param=DictParameter, desc="Database Table Row Count", readonly=True, visible=True, no_value={})
     file_ext = "sqlite"
+    sniff_magic = b'SQLite format 3\0'
     edam_format = "format_3621"
 
     def init_meta(self, dataset, copy_from=None):
@@ -2094,6 +2111,10 @@ class Xlsx(Binary):
 class ExcelXls(Binary):
     """Class describing an Excel (xls) file"""
     file_ext = "excel.xls"
+    sniff_magic = (
+        binascii.unhexlify("d0cf11e0a1b11ae1"),  # OLE2 compound document, Excel 97 and later
+        b"\x09\x04\x06\x00\x00\x00\x10\x00",  # Excel 4 worksheet
+    )
     edam_format = "format_3468"
 
     def sniff(self, filename):
@@ -2122,6 +2143,7 @@ class ExcelXls(Binary):
 class Sra(Binary):
     """ Sequence Read Archive (SRA) datatype originally from mdshw5/sra-tools-galaxy"""
     file_ext = 'sra'
+    sniff_magic = b'NCBI.sra'
 
     def sniff(self, filename):
         """ The first 8 bytes of any NCBI sra file is 'NCBI.sra', and the file is binary.
@@ -2154,6 +2176,7 @@ class Sra(Binary):
 class RData(Binary):
     """Generic R Data file datatype implementation"""
     file_ext = 'rdata'
+    sniff_magic = (b'RDX2\nX\n', util.gzip_magic)
 
     def sniff(self, filename):
         rdata_header = b'RDX2\nX\n'
@@ -2170,6 +2193,7 @@ class RData(Binary):
 
 
 class OxliBinary(Binary):
+    sniff_magic = b'OXLI'
 
     @staticmethod
     def _sniff(filename, oxlitype):
@@ -2351,6 +2375,7 @@ class PostgresqlArchive(CompressedArchive):
     MetadataElement(name="version", default=None, param=MetadataParameter, desc="PostgreSQL database version",
                     readonly=True, visible=True, no_value=None)
     file_ext = "postgresql"
+    sniff_magic = TAR_MAGIC
 
     def set_meta(self, dataset, overwrite=True, **kwd):
         super().set_meta(dataset, overwrite=overwrite, **kwd)
@@ -2395,6 +2420,7 @@ class Fast5Archive(CompressedArchive):
     MetadataElement(name="fast5_count", default='0', param=MetadataParameter, desc="Read Count",
                     readonly=True, visible=True, no_value=None)
     file_ext = "fast5.tar"
+    sniff_magic = TAR_MAGIC
 
     def set_meta(self, dataset, overwrite=True, **kwd):
         super().set_meta(dataset, overwrite=overwrite, **kwd)
@@ -2534,6 +2560,7 @@ class SearchGuiArchive(CompressedArchive):
 class NetCDF(Binary):
     """Binary data in netCDF format"""
     file_ext = "netcdf"
+    sniff_magic = b'CDF'
     edam_format = "format_3650"
     edam_data = "data_0943"
 
@@ -2677,10 +2704,11 @@ class DAA(Binary):
     False
     """
     file_ext = "daa"
+    sniff_magic = binascii.unhexlify("6be33e6d47530e3c")
 
     def __init__(self, **kwd):
         super().__init__(**kwd)
-        self._magic = binascii.unhexlify("6be33e6d47530e3c")
+        self._magic = self.sniff_magic
 
     def sniff(self, filename):
         # The first 8 bytes of any daa file are 0x3c0e53476d3ee36b
@@ -2700,10 +2728,11 @@ class RMA6(Binary):
     False
     """
     file_ext = "rma6"
+    sniff_magic = binascii.unhexlify("000003f600000006")
 
     def __init__(self, **kwd):
         super().__init__(**kwd)
-        self._magic = binascii.unhexlify("000003f600000006")
+        self._magic = self.sniff_magic
 
     def sniff(self, filename):
         # The first 8 bytes of any daa file are 0x3c0e53476d3ee36b
@@ -2723,10 +2752,11 @@ class DMND(Binary):
     False
     """
     file_ext = "dmnd"
+    sniff_magic = binascii.unhexlify("6d18ee15a4f84a02")
 
     def __init__(self, **kwd):
         super().__init__(**kwd)
-        self._magic = binascii.unhexlify("6d18ee15a4f84a02")
+        self._magic = self.sniff_magic
 
     def sniff(self, filename):
         # The first 8 bytes of any dmnd file are 0x24af8a415ee186d
@@ -2771,6 +2801,7 @@ class BafTar(CompressedArchive):
     edam_data = "data_2536"  # mass spectrometry data
     edam_format = "format_3712"  # TODO: add more raw formats to EDAM?
     file_ext = "brukerbaf.d.tar"
+    sniff_magic = TAR_MAGIC
 
     def get_signature_file(self):
         return "analysis.baf"
@@ -2,7 +2,6 @@ import abc
 import logging
 import mimetypes
 import os
-import shutil
 import string
 import tempfile
 import zipfile
@@ -15,6 +14,7 @@ from markupsafe import escape
 from galaxy import util
 from galaxy.datatypes.metadata import MetadataElement  # import directly to maintain ease of use in Datatype class definitions
 from galaxy.datatypes.sniff import build_sniff_from_prefix
+from galaxy.datatypes.util.merge import concatenate_files
 from galaxy.util import (
     compression_utils,
     FILENAME_VALID_CHARS,
@@ -122,6 +122,9 @@ class Data(metaclass=DataMeta):
     # The dataset contains binary data --> do not space_to_tab or convert newlines, etc.
     # Allow binary file uploads of this type when True.
     is_binary = True
+    # Bytes (or a tuple of alternative bytes) any file of this type starts with,
+    # the sniffer is skipped for files starting differently.
+    sniff_magic = None
     # Composite datatypes
     composite_type = None
     composite_files = OrderedDict()
@@ -760,17 +763,14 @@ class Data(metaclass=DataMeta):
 
     def merge(split_files, output_file):
         """
-            Merge files with copy.copyfileobj() will not hit the
-            max argument limitation of cat. gz and bz2 files are also working.
+            Merge files by concatenating them, without copying the data through
+            Python where the platform allows it (see galaxy.datatypes.util.merge).
+            This will not hit the max argument limitation of cat. gz and bz2
+            files are also working.
         """
         if not split_files:
             raise ValueError('Asked to merge zero files as %s' % output_file)
-        elif len(split_files) == 1:
-            shutil.copyfileobj(open(split_files[0], 'rb'), open(output_file, 'wb'))
-        else:
-            with open(output_file, 'wb') as fdst:
-                for fsrc in split_files:
-                    shutil.copyfileobj(open(fsrc, 'rb'), fdst)
+        concatenate_files(split_files, output_file)
 
     merge = staticmethod(merge)
 
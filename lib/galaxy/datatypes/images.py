@@ -6,9 +6,9 @@ import logging
 import zipfile
 from urllib.parse import quote_plus
 
+from galaxy.datatypes.sniff import build_sniff_from_prefix
 from galaxy.datatypes.text import Html as HtmlFromText
 from galaxy.util import nice_size
-from galaxy.util.image_util import check_image_type
 from . import data
 
 log = logging.getLogger(__name__)
@@ -24,6 +24,7 @@ log = logging.getLogger(__name__)
 # to our main public instance.
 
 
+@build_sniff_from_prefix
 class Image(data.Data):
     """Class describing an image"""
     edam_data = 'data_2968'
@@ -42,9 +43,9 @@ class Image(data.Data):
             dataset.peek = 'file does not exist'
             dataset.blurb = 'file purged from disk'
 
-    def sniff(self, filename):
+    def sniff_prefix(self, file_prefix):
         """Determine if the file is in this format"""
-        return check_image_type(filename, self.image_formats)
+        return file_prefix.image_type in self.image_formats
 
     def handle_dataset_as_image(self, hda):
         dataset = hda.dataset
@@ -163,10 +164,9 @@ class Pdf(Image):
     edam_format = "format_3508"
     file_ext = "pdf"
 
-    def sniff(self, filename):
+    def sniff_prefix(self, file_prefix):
         """Determine if the file is in pdf format."""
-        with open(filename, 'rb') as fh:
-            return fh.read(4) == b"%PDF"
+        return file_prefix.contents_header_bytes.startswith(b"%PDF")
 
 
 def create_applet_tag_peek(class_name, archive, params):
@@ -95,6 +95,7 @@ class Smat(Text):
 #            log.warning("set_meta fname: %s %s" % (dataset.file_name if dataset and dataset.file_name else 'Unkwown', str(e)))
 
 
+@build_sniff_from_prefix
 class PlantTribesKsComponents(Tabular):
     file_ext = "ptkscmp"
     MetadataElement(name="number_comp", default=0, desc="Number of significant components in the Ks distribution", readonly=True, visible=True, no_value=0)
@@ -138,7 +139,7 @@ class PlantTribesKsComponents(Tabular):
             dataset.peek = 'file does not exist'
             dataset.blurb = 'file purged from disk'
 
-    def sniff(self, filename):
+    def sniff_prefix(self, file_prefix):
         """
         >>> from galaxy.datatypes.sniff import get_test_fname
         >>> fname = get_test_fname('test_tab.bed')
@@ -149,7 +150,7 @@ class PlantTribesKsComponents(Tabular):
         True
         """
         try:
-            line_item_str = get_headers(filename, '\\t', 1)[0][0]
+            line_item_str = get_headers(file_prefix, '\\t', 1)[0][0]
             return line_item_str == 'species\tn\tnumber_comp\tlnL\tAIC\tBIC\tmean\tvariance\tporportion'
         except Exception:
             return False
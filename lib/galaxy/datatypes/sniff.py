@@ -6,14 +6,17 @@ import bz2
 import codecs
 import gzip
 import io
+import itertools
 import logging
 import os
 import re
 import shutil
 import sys
+import tarfile
 import tempfile
 import urllib.request
 import zipfile
+from collections import defaultdict
 
 from galaxy import util
 from galaxy.util import compression_utils
@@ -25,10 +28,16 @@ from galaxy.util.checkers import (
     check_zip,
     is_tar,
 )
+from galaxy.util.image_util import image_type
 
 log = logging.getLogger(__name__)
 
 SNIFF_PREFIX_BYTES = int(os.environ.get("GALAXY_SNIFF_PREFIX_BYTES", None) or 2 ** 20)
+CONVERSION_BLOCK_SIZE = 2 ** 20
+SEP2TABS_PATTERN = br"[^\S\n]+"
+# Fast path for SEP2TABS_PATTERN: map the whitespace to tabs, then collapse runs of tabs.
+_WHITESPACE_TO_TAB = bytes.maketrans(b" \r\x0b\x0c", b"\t\t\t\t")
+_TAB_RUNS = re.compile(b"\t\t+")
 
 
 def get_test_fname(fname):
@@ -112,45 +121,135 @@ def handle_composite_file(datatype, src_path, extra_files, name, is_binary, tmp_
         datatype.groom_dataset_content(file_output_path)
 
 
-def convert_newlines(fname, in_place=True, tmp_dir=None, tmp_prefix="gxupload", block_size=128 * 1024, regexp=None):
+def _iter_converted_blocks(blocks, regexp=None):
+    """
+    Yield ``(block, converted_block)`` pairs for the byte blocks of a file,
+    where the converted block has universal line endings replaced by Posix
+    line endings and, with ``regexp``, its matches replaced by tabs.
+
+    ``regexp`` must not match newlines. Bytes that may combine with the next
+    block (a trailing carriage return, or a trailing match of ``regexp``) are
+    held back and yielded with the next block. If a block needs no conversion
+    the block itself is yielded as converted block.
+    """
+    pending = b""
+    for block in blocks:
+        data = pending + block if pending else block
+        pending = b""
+        if data.endswith(b"\r"):
+            pending = b"\r"
+            data = data[:-1]
+        if b"\r" in data:
+            converted = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        else:
+            converted = data
+        if regexp is not None and converted:
+            if _is_sep2tabs(regexp):
+                trailing = converted[-1:] in b" \t\x0b\x0c"
+            else:
+                trailing = regexp.match(converted, len(converted) - 1)
+            if trailing:
+                # No carriage returns follow the last newline, so the raw and converted tails are the same.
+                tail_length = len(converted) - converted.rfind(b"\n") - 1
+                pending = data[len(data) - tail_length:] + pending
+                data = data[:len(data) - tail_length]
+                converted = converted[:len(converted) - tail_length]
+            replaced = _sep2tabs(converted, regexp)
+            if replaced != converted or converted is not data:
+                converted = replaced
+            else:
+                converted = data
+        if data:
+            yield data, converted
+    if pending:
+        converted = pending.replace(b"\r", b"\n")
+        if regexp is not None:
+            converted = _sep2tabs(converted, regexp)
+        yield pending, pending if converted == pending else converted
+
+
+def _is_sep2tabs(regexp):
+    return regexp.pattern == SEP2TABS_PATTERN and not regexp.flags
+
+
+def _sep2tabs(block, regexp):
+    if _is_sep2tabs(regexp):
+        block = block.translate(_WHITESPACE_TO_TAB)
+        if b"\t\t" in block:
+            block = _TAB_RUNS.sub(b"\t", block)
+        return block
+    return regexp.sub(b"\t", block)
+
+
+def _iter_blocks(fileobj, block_size):
+    return iter(lambda: fileobj.read(block_size), b"")
+
+
+def _copy_file_prefix(fname, fp, length, block_size):
+    with open(fname, mode="rb") as fi:
+        while length > 0:
+            chunk = fi.read(min(block_size, length))
+            if not chunk:
+                break
+            fp.write(chunk)
+            length -= len(chunk)
+
+
+def convert_newlines(fname, in_place=True, tmp_dir=None, tmp_prefix="gxupload", block_size=CONVERSION_BLOCK_SIZE, regexp=None):
     """
     Converts in place a file from universal line endings
     to Posix line endings.
+
+    The file is converted in a single streaming pass. Nothing is written until
+    the first block that needs converting is found, so a file that is already
+    normalized is only read. If ``in_place`` is False the path of the converted
+    file is returned, which is ``fname`` itself if nothing needed converting.
     """
-    fd, temp_name = tempfile.mkstemp(prefix=tmp_prefix, dir=tmp_dir)
     i = 0
-    NEWLINE_BYTE = 10
-    CR_BYTE = 13
-    with open(fd, mode="wb") as fp, open(fname, mode="rb") as fi:
-        last_char = None
-        block = fi.read(block_size)
-        last_block = b""
-        while block:
-            if last_char == CR_BYTE and block.startswith(b"\n"):
-                # Last block ended with CR, new block startswith newline.
-                # Since we replace CR with newline in the previous iteration we skip the first byte
-                block = block[1:]
-            if block:
-                last_char = block[-1]
-                block = block.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
-                if regexp:
-                    block = b"\t".join(regexp.split(block))
-                fp.write(block)
-                i += block.count(b"\n")
-                last_block = block
-                block = fi.read(block_size)
-        if last_block and last_block[-1] != NEWLINE_BYTE:
+    offset = 0
+    last_char = b""
+    fp = None
+    temp_name = None
+    try:
+        with open(fname, mode="rb") as fi:
+            for block, converted in _iter_converted_blocks(_iter_blocks(fi, block_size), regexp=regexp):
+                if fp is None and converted is not block:
+                    fd, temp_name = tempfile.mkstemp(prefix=tmp_prefix, dir=tmp_dir)
+                    fp = open(fd, mode="wb")
+                    _copy_file_prefix(fname, fp, offset, block_size)
+                if fp is not None:
+                    fp.write(converted)
+                offset += len(block)
+                i += converted.count(b"\n")
+                last_char = converted[-1:]
+        if last_char and last_char != b"\n":
             i += 1
-            fp.write(b"\n")
+            if fp is None and in_place:
+                with open(fname, mode="ab") as fa:
+                    fa.write(b"\n")
+            else:
+                if fp is None:
+                    fd, temp_name = tempfile.mkstemp(prefix=tmp_prefix, dir=tmp_dir)
+                    fp = open(fd, mode="wb")
+                    _copy_file_prefix(fname, fp, offset, block_size)
+                fp.write(b"\n")
+    except Exception:
+        if fp is not None:
+            fp.close()
+            os.remove(temp_name)
+        raise
+    if fp is not None:
+        fp.close()
     if in_place:
-        shutil.move(temp_name, fname)
+        if temp_name:
+            shutil.move(temp_name, fname)
         # Return number of lines in file.
         return (i, None)
     else:
-        return (i, temp_name)
+        return (i, temp_name or fname)
 
 
-def convert_newlines_sep2tabs(fname, in_place=True, patt=br"[^\S\n]+", tmp_dir=None, tmp_prefix="gxupload"):
+def convert_newlines_sep2tabs(fname, in_place=True, patt=SEP2TABS_PATTERN, tmp_dir=None, tmp_prefix="gxupload"):
     """
     Converts newlines in a file to posix newlines and replaces spaces with tabs.
 
@@ -475,6 +574,79 @@ def guess_ext(fname, sniff_order, is_binary=False):
     return 'txt'  # default text data type file extension
 
 
+class TarMagic:
+    """
+    ``sniff_magic`` of tar archives, plain or compressed: without a fixed magic
+    the first block of a plain archive is checked to be a valid tar header.
+    """
+    compressed_magic = (util.gzip_magic, util.bz2_magic, b"\xfd7zXZ\x00")
+
+    def __call__(self, header):
+        if header.startswith(self.compressed_magic):
+            return True
+        try:
+            tarfile.TarInfo.frombuf(header[:tarfile.BLOCKSIZE], tarfile.ENCODING, "surrogateescape")
+        except tarfile.EOFHeaderError:
+            # An empty archive
+            return True
+        except tarfile.HeaderError:
+            return False
+        return True
+
+
+TAR_MAGIC = TarMagic()
+
+
+class SniffPrefilter:
+    """
+    Table of the datatypes of a sniff order declaring ``sniff_magic``, the
+    bytes files of the datatype start with, indexed by the first byte of the
+    magic. Sniffers of these datatypes are only called for files starting with
+    their magic.
+
+    ``sniff_magic`` may also be a callable testing the first bytes of a file,
+    like :data:`TAR_MAGIC`, it is called once per file.
+    """
+
+    def __init__(self, sniff_order):
+        self.sniff_order = list(sniff_order)
+        self.has_magic = []
+        self.magic_by_first_byte = defaultdict(list)
+        self.magic_checks = defaultdict(list)
+        for index, datatype in enumerate(self.sniff_order):
+            sniff_magic = getattr(datatype, "sniff_magic", None)
+            self.has_magic.append(bool(sniff_magic))
+            if callable(sniff_magic):
+                self.magic_checks[sniff_magic].append(index)
+                continue
+            if isinstance(sniff_magic, bytes):
+                sniff_magic = (sniff_magic,)
+            for magic in sniff_magic or ():
+                self.magic_by_first_byte[magic[:1]].append((magic, index))
+
+    def plausible(self, header):
+        """Return the indices of the datatypes whose magic ``header`` matches."""
+        rval = {index for magic, index in self.magic_by_first_byte.get(header[:1], ()) if header.startswith(magic)}
+        for check, indices in self.magic_checks.items():
+            if check(header):
+                rval.update(indices)
+        return rval
+
+
+_sniff_prefilters = {}
+
+
+def get_sniff_prefilter(sniff_order):
+    key = tuple(map(id, sniff_order))
+    prefilter = _sniff_prefilters.get(key)
+    if prefilter is None:
+        if len(_sniff_prefilters) > 8:
+            _sniff_prefilters.clear()
+        # The prefilter keeps references to the datatypes, so their ids stay valid
+        prefilter = _sniff_prefilters[key] = SniffPrefilter(sniff_order)
+    return prefilter
+
+
 def run_sniffers_raw(filename_or_file_prefix, sniff_order, is_binary=False):
     """Run through sniffers specified by sniff_order, return None of None match.
     """
@@ -485,8 +657,11 @@ def run_sniffers_raw(filename_or_file_prefix, sniff_order, is_binary=False):
         fname = filename_or_file_prefix
         file_prefix = FilePrefix(filename_or_file_prefix)
 
+    prefilter = get_sniff_prefilter(sniff_order)
+    compressed_format = file_prefix.compressed_format
+    plausible = prefilter.plausible(file_prefix.raw_header_bytes)
     file_ext = None
-    for datatype in sniff_order:
+    for index, datatype in enumerate(prefilter.sniff_order):
         """
         Some classes may not have a sniff function, which is ok.  In fact,
         Binary, Data, Tabular and Text are examples of classes that should never
@@ -495,17 +670,19 @@ def run_sniffers_raw(filename_or_file_prefix, sniff_order, is_binary=False):
         from this function after all other datatypes in sniff_order have not been
         successfully discovered.
         """
+        if prefilter.has_magic[index] and index not in plausible:
+            continue
         try:
             if hasattr(datatype, "sniff_prefix"):
                 datatype_compressed = getattr(datatype, "compressed", False)
-                if datatype_compressed and not file_prefix.compressed_format:
+                if datatype_compressed and not compressed_format:
                     continue
-                if not datatype_compressed and file_prefix.compressed_format:
+                if not datatype_compressed and compressed_format:
                     continue
-                if file_prefix.compressed_format and getattr(datatype, "compressed_format", None):
+                if compressed_format and getattr(datatype, "compressed_format", None):
                     # In this case go a step further and compare the compressed format detected
                     # to the expected.
-                    if file_prefix.compressed_format != datatype.compressed_format:
+                    if compressed_format != datatype.compressed_format:
                         continue
                 if datatype.sniff_prefix(file_prefix):
                     file_ext = datatype.file_ext
@@ -529,37 +706,87 @@ def zip_single_fileobj(path):
 
 
 class FilePrefix:
+    """
+    The first ``SNIFF_PREFIX_BYTES`` of a file (after decompression) for
+    sniffing. The file is read once, when the prefix is first used, and decoded
+    once, when it is first used as text.
+    """
 
     def __init__(self, filename):
-        non_utf8_error = None
+        self.filename = filename
+        self._file_size = None
+        self._loaded = False
+        self._decoded = False
+        self._image_type = None
+
+    def _load(self):
+        if self._loaded:
+            return
+        with open(self.filename, "rb") as f:
+            raw_header_bytes = f.read(SNIFF_PREFIX_BYTES)
         compressed_format = None
-        contents_header_bytes = None
-        contents_header = None  # First MAX_BYTES of the file.
-        truncated = False
-        # A future direction to optimize sniffing even more for sniffers at the top of the list
-        # is to lazy load contents_header based on what interface is requested. For instance instead
-        # of returning a StringIO directly in string_io() return an object that reads the contents and
-        # populates contents_header while providing a StringIO-like interface until the file is read
-        # but then would fallback to native string_io()
-        try:
-            compressed_format, f = compression_utils.get_fileobj_raw(filename, "rb")
+        contents_header_bytes = raw_header_bytes
+        if raw_header_bytes.startswith((util.gzip_magic, util.bz2_magic, b"PK")):
+            # Possibly compressed, let compression_utils check and decompress
+            compressed_format, f = compression_utils.get_fileobj_raw(self.filename, "rb")
             try:
-                contents_header_bytes = f.read(SNIFF_PREFIX_BYTES)
-                truncated = len(contents_header_bytes) == SNIFF_PREFIX_BYTES
-                contents_header = contents_header_bytes.decode("utf-8")
+                if compressed_format:
+                    contents_header_bytes = f.read(SNIFF_PREFIX_BYTES)
             finally:
                 f.close()
+        self._raw_header_bytes = raw_header_bytes
+        self._compressed_format = compressed_format
+        self._contents_header_bytes = contents_header_bytes
+        self._truncated = len(contents_header_bytes) == SNIFF_PREFIX_BYTES
+        self._loaded = True
+
+    def _decode(self):
+        if self._decoded:
+            return
+        contents_header = None
+        non_utf8_error = None
+        try:
+            contents_header = self.contents_header_bytes.decode("utf-8")
         except UnicodeDecodeError as e:
             non_utf8_error = e
+        self._contents_header = contents_header
+        self._non_utf8_error = non_utf8_error
+        self._decoded = True
 
-        self.truncated = truncated
-        self.filename = filename
-        self.non_utf8_error = non_utf8_error
-        self.binary = non_utf8_error is not None  # obviously wrong
-        self.compressed_format = compressed_format
-        self.contents_header = contents_header
-        self.contents_header_bytes = contents_header_bytes
-        self._file_size = None
+    @property
+    def raw_header_bytes(self):
+        """The first bytes of the file as stored, compressed or not."""
+        self._load()
+        return self._raw_header_bytes
+
+    @property
+    def compressed_format(self):
+        self._load()
+        return self._compressed_format
+
+    @property
+    def contents_header_bytes(self):
+        self._load()
+        return self._contents_header_bytes
+
+    @property
+    def truncated(self):
+        self._load()
+        return self._truncated
+
+    @property
+    def contents_header(self):
+        self._decode()
+        return self._contents_header
+
+    @property
+    def non_utf8_error(self):
+        self._decode()
+        return self._non_utf8_error
+
+    @property
+    def binary(self):
+        return self.non_utf8_error is not None  # obviously wrong
 
     @property
     def file_size(self):
@@ -567,6 +794,13 @@ class FilePrefix:
             self._file_size = os.path.getsize(self.filename)
         return self._file_size
 
+    @property
+    def image_type(self):
+        """The image format of the file as detected by :func:`galaxy.util.image_util.image_type`."""
+        if self._image_type is None:
+            self._image_type = image_type(self.filename)
+        return self._image_type
+
     def string_io(self):
         if self.non_utf8_error is not None:
             raise self.non_utf8_error
@@ -649,12 +883,44 @@ def handle_compressed_file(
     in the case of a zip file), this is so lengthy decompression can be bypassed if there is invalid content in the
     first 32KB. Otherwise the caller should be checking content.
     """
+    is_valid, ext, uncompressed, compressed_type, _ = _handle_compressed_file(
+        filename,
+        datatypes_registry,
+        ext=ext,
+        tmp_prefix=tmp_prefix,
+        tmp_dir=tmp_dir,
+        in_place=in_place,
+        check_content=check_content,
+        auto_decompress=auto_decompress,
+    )
+    return is_valid, ext, uncompressed, compressed_type
+
+
+def _handle_compressed_file(
+        filename,
+        datatypes_registry,
+        ext='auto',
+        tmp_prefix='sniff_uncompress_',
+        tmp_dir=None,
+        in_place=False,
+        check_content=True,
+        auto_decompress=True,
+        convert_to_posix_lines=False,
+        convert_spaces_to_tabs=False,
+):
+    """
+    Like :func:`handle_compressed_file`, but if the datatype is known and not
+    binary, line endings (and spaces, if requested) are converted while
+    decompressing. The number of lines is returned as fifth element if the
+    file was converted, otherwise None.
+    """
     CHUNK_SIZE = 2 ** 20  # 1Mb
     is_compressed = False
     compressed_type = None
     keep_compressed = False
     is_valid = False
     uncompressed = filename
+    line_count = None
     tmp_dir = tmp_dir or os.path.dirname(filename)
     for key, check_compressed_function in COMPRESSION_CHECK_FUNCTIONS:
         is_compressed, is_valid = check_compressed_function(filename, check_content=check_content)
@@ -676,27 +942,42 @@ def handle_compressed_file(
     if is_compressed and is_valid and auto_decompress and not keep_compressed:
         fd, uncompressed = tempfile.mkstemp(prefix=tmp_prefix, dir=tmp_dir)
         compressed_file = DECOMPRESSION_FUNCTIONS[compressed_type](filename)
-        # TODO: it'd be ideal to convert to posix newlines and space-to-tab here as well
-        while True:
-            try:
-                chunk = compressed_file.read(CHUNK_SIZE)
-            except OSError as e:
-                os.close(fd)
-                os.remove(uncompressed)
-                compressed_file.close()
-                raise OSError('Problem uncompressing {} data, please try retrieving the data uncompressed: {}'.format(compressed_type, util.unicodify(e)))
-            if not chunk:
-                break
-            os.write(fd, chunk)
-        os.close(fd)
-        compressed_file.close()
+        convert = (convert_to_posix_lines or convert_spaces_to_tabs) and ext not in AUTO_DETECT_EXTENSIONS
+        if convert:
+            datatype = datatypes_registry.get_datatype_by_extension(ext)
+            convert = datatype is not None and not datatype.is_binary
+        try:
+            with open(fd, mode="wb") as fp:
+                blocks = _iter_blocks(compressed_file, CHUNK_SIZE)
+                first_block = next(blocks, b"")
+                # Same check as check_binary() on the uncompressed file
+                if convert and not util.is_binary(first_block[:1024]):
+                    regexp = re.compile(SEP2TABS_PATTERN) if convert_spaces_to_tabs else None
+                    line_count = 0
+                    last_char = b""
+                    for _, converted in _iter_converted_blocks(itertools.chain([first_block], blocks), regexp=regexp):
+                        fp.write(converted)
+                        line_count += converted.count(b"\n")
+                        last_char = converted[-1:]
+                    if last_char and last_char != b"\n":
+                        line_count += 1
+                        fp.write(b"\n")
+                else:
+                    fp.write(first_block)
+                    for chunk in blocks:
+                        fp.write(chunk)
+        except OSError as e:
+            os.remove(uncompressed)
+            raise OSError('Problem uncompressing {} data, please try retrieving the data uncompressed: {}'.format(compressed_type, util.unicodify(e)))
+        finally:
+            compressed_file.close()
         if in_place:
             # Replace the compressed file with the uncompressed file
             shutil.move(uncompressed, filename)
             uncompressed = filename
     elif not is_compressed or not check_content:
         is_valid = True
-    return is_valid, ext, uncompressed, compressed_type
+    return is_valid, ext, uncompressed, compressed_type, line_count
 
 
 def handle_uploaded_dataset_file(*args, **kwds):
@@ -718,7 +999,7 @@ def handle_uploaded_dataset_file_internal(
         convert_to_posix_lines=None,
         convert_spaces_to_tabs=None,
 ):
-    is_valid, ext, converted_path, compressed_type = handle_compressed_file(
+    is_valid, ext, converted_path, compressed_type, converted_line_count = _handle_compressed_file(
         filename,
         datatypes_registry,
         ext=ext,
@@ -727,6 +1008,8 @@ def handle_uploaded_dataset_file_internal(
         in_place=in_place,
         check_content=check_content,
         auto_decompress=auto_decompress,
+        convert_to_posix_lines=convert_to_posix_lines,
+        convert_spaces_to_tabs=convert_spaces_to_tabs,
     )
     try:
         if not is_valid:
@@ -745,14 +1028,17 @@ def handle_uploaded_dataset_file_internal(
                 # so check_binary might return a false negative. This is for instance true for PDF files
                 is_binary = True
 
-        if not is_binary and (convert_to_posix_lines or convert_spaces_to_tabs):
+        if converted_line_count is not None:
+            # Converted while decompressing
+            ext = guessed_ext
+        elif not is_binary and (convert_to_posix_lines or convert_spaces_to_tabs):
             # Convert universal line endings to Posix line endings, spaces to tabs (if desired)
             if convert_spaces_to_tabs:
                 convert_fxn = convert_newlines_sep2tabs
             else:
                 convert_fxn = convert_newlines
             line_count, _converted_path = convert_fxn(converted_path, in_place=in_place, tmp_dir=tmp_dir, tmp_prefix=tmp_prefix)
-            if not in_place:
+            if not in_place and _converted_path != converted_path:
                 if converted_path and filename != converted_path:
                     os.unlink(converted_path)
                 converted_path = _converted_path
@@ -1,5 +1,5 @@
 from galaxy.datatypes.metadata import ListParameter, MetadataElement
-from galaxy.datatypes.sniff import get_headers
+from galaxy.datatypes.sniff import build_sniff_from_prefix, get_headers
 from galaxy.datatypes.text import Text
 
 
@@ -30,6 +30,7 @@ class TextGrid(Text):
             return text == self.header
 
 
+@build_sniff_from_prefix
 class BPF(Text):
     """Munich BPF annotation format
     https://www.phonetik.uni-muenchen.de/Bas/BasFormatseng.html#Partitur
@@ -70,11 +71,11 @@ class BPF(Text):
 
         dataset.metadata.annotations = list(types)
 
-    def sniff(self, filename):
+    def sniff_prefix(self, file_prefix):
         # We loop over 30 as there are 9 mandatory headers (the last should be
         # `LBD:`), while there are 21 optional headers that can be
         # interspersed.
-        seen_headers = [line[0] for line in get_headers(filename, sep=':', count=40)]
+        seen_headers = [line[0] for line in get_headers(file_prefix, sep=':', count=40)]
 
         # We cut everything after LBD, where the headers end and contents
         # start. We choose not to validate contents.
@@ -5,11 +5,12 @@ Tabular datatype
 import abc
 import binascii
 import csv
+import itertools
 import logging
 import os
 import re
-import shutil
 import subprocess
+import sys
 import tempfile
 from json import dumps
 
@@ -25,11 +26,143 @@ from galaxy.datatypes.sniff import (
     iter_headers,
     validate_tabular,
 )
+from galaxy.datatypes.util.line_index import (
+    LineIndex,
+    open_indexing_text_reader,
+)
+from galaxy.datatypes.util.merge import (
+    concatenate_files,
+    header_length,
+    merge_sorted_files,
+)
 from galaxy.util import compression_utils
 from . import dataproviders
 
 log = logging.getLogger(__name__)
 
+COLUMN_TYPE_SET_ORDER = ['int', 'float', 'list', 'str']  # Order to set column types in
+# Rank of each column type, a column gets the type of highest rank of its values
+_COLUMN_TYPE_RANK = {None: 0, 'int': 1, 'float': 2, 'list': 3, 'str': 4}
+_RANKED_COLUMN_TYPES = [None, 'int', 'float', 'list', 'str']
+# Columns of values (joined by newlines) that certainly are ints or ints and floats.
+# Values not matching these are classified one by one with guess_column_type().
+# int() refuses strings of more than sys.get_int_max_str_digits() digits (if set), these are floats.
+_INT_MAX_STR_DIGITS = getattr(sys, "get_int_max_str_digits", lambda: 0)()
+_INT_VALUE = r"[+-]?[0-9]{}".format("{1,%d}" % _INT_MAX_STR_DIGITS if _INT_MAX_STR_DIGITS else "+")
+_INT_COLUMN = re.compile(r"(?:{value})?(?:\n(?:{value})?)*".format(value=_INT_VALUE))
+# Every value must match in only one way, or failing to match a long column backtracks exponentially
+_FLOAT_VALUE = r"[+-]?(?:(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?|(?i:nan|inf|infinity))|[Nn][Aa]"
+_FLOAT_COLUMN = re.compile(r"(?:{value})?(?:\n(?:{value})?)*".format(value=_FLOAT_VALUE))
+
+
+def is_int(column_text):
+    # Don't allow underscores in numeric literals (PEP 515)
+    if '_' in column_text:
+        return False
+    try:
+        int(column_text)
+        return True
+    except ValueError:
+        return False
+
+
+def is_float(column_text):
+    # Don't allow underscores in numeric literals (PEP 515)
+    if '_' in column_text:
+        return False
+    try:
+        float(column_text)
+        return True
+    except ValueError:
+        if column_text.strip().lower() == 'na':
+            return True  # na is special cased to be a float
+        return False
+
+
+def is_list(column_text):
+    return "," in column_text
+
+
+def is_str(column_text):
+    # anything, except an empty string, is True
+    if column_text == "":
+        return False
+    return True
+
+
+_IS_COLUMN_TYPE = {'int': is_int, 'float': is_float, 'list': is_list, 'str': is_str}
+
+
+def guess_column_type(column_text):
+    for column_type in COLUMN_TYPE_SET_ORDER:
+        if _IS_COLUMN_TYPE[column_type](column_text):
+            return column_type
+    return None
+
+
+class ColumnTypeGuesser:
+    """
+    Guess the types of the columns of rows of fields.
+
+    Rows are collected in blocks, and the values of each column of a block are
+    classified together: a column of plain integers or floats is recognized by
+    matching a single regular expression against all its values, only other
+    columns are classified value by value. Columns that are already of type
+    'str' are not checked any further. The column types are the same as
+    combining guess_column_type() of all values.
+    """
+
+    def __init__(self, columns=0, block_size=1000):
+        self.block_size = block_size
+        self._ranks = [0] * columns
+        self._rows = []
+
+    def add_row(self, fields):
+        self._rows.append(fields)
+        if len(self._rows) >= self.block_size:
+            self._flush()
+
+    @property
+    def column_types(self):
+        self._flush()
+        return [_RANKED_COLUMN_TYPES[rank] for rank in self._ranks]
+
+    def _flush(self):
+        rows = self._rows
+        if not rows:
+            return
+        self._rows = []
+        columns = max(len(fields) for fields in rows)
+        if columns > len(self._ranks):
+            self._ranks.extend([0] * (columns - len(self._ranks)))
+        str_rank = _COLUMN_TYPE_RANK['str']
+        for i, values in enumerate(itertools.zip_longest(*rows, fillvalue="")):
+            rank = self._ranks[i]
+            if rank == str_rank:
+                continue
+            column_text = "\n".join(values)
+            if len(column_text) == len(values) - 1:
+                # Only empty values
+                continue
+            if _INT_COLUMN.fullmatch(column_text):
+                block_rank = _COLUMN_TYPE_RANK['int']
+            elif _FLOAT_COLUMN.fullmatch(column_text):
+                block_rank = _COLUMN_TYPE_RANK['float']
+            else:
+                block_rank = 0
+                if "," in column_text:
+                    # Values containing a comma are lists, only the others can be strings
+                    block_rank = _COLUMN_TYPE_RANK['list']
+                    values = [value for value in values if "," not in value]
+                    if _FLOAT_COLUMN.fullmatch("\n".join(values)):
+                        values = ()
+                for value in set(values):
+                    block_rank = max(block_rank, _COLUMN_TYPE_RANK[guess_column_type(value)])
+                    if block_rank == str_rank:
+                        break
+            if block_rank > rank:
+                self._ranks[i] = block_rank
+
 
 @dataproviders.decorators.has_dataproviders
 class TabularData(data.Text):
@@ -38,6 +171,8 @@ class TabularData(data.Text):
     # All tabular data is chunkable.
     CHUNKABLE = True
     data_line_offset = 0
+    # Uncompressed datasets of at least this size get a line index when setting metadata
+    line_index_min_size = 2 ** 24
 
     """Add metadata elements"""
     MetadataElement(name="comment_lines", default=0, desc="Number of comment lines", readonly=False, optional=True, no_value=0)
@@ -46,6 +181,7 @@ class TabularData(data.Text):
     MetadataElement(name="column_types", default=[], desc="Column types", param=metadata.ColumnTypesParameter, readonly=True, visible=False, no_value=[])
     MetadataElement(name="column_names", default=[], desc="Column names", readonly=True, visible=False, optional=True, no_value=[])
     MetadataElement(name="delimiter", default='\t', desc="Data delimiter", readonly=True, visible=False, optional=True, no_value=[])
+    MetadataElement(name="line_index", desc="Line index", param=metadata.FileParameter, file_ext="json", readonly=True, no_value=None, visible=False, optional=True)
 
     @abc.abstractmethod
     def set_meta(self, dataset, **kwd):
@@ -65,15 +201,73 @@ class TabularData(data.Text):
         except Exception:
             return False
 
+    def get_line_index(self, dataset):
+        """
+        Return the :class:`LineIndex` of the dataset, or None if it has none
+        or it does not match the dataset's file.
+        """
+        index_file = dataset.metadata.line_index
+        if not index_file:
+            return None
+        try:
+            line_index = LineIndex.load(index_file.file_name)
+            if line_index.size != os.path.getsize(dataset.file_name):
+                return None
+            return line_index
+        except Exception:
+            log.warning("Failed to load line index of dataset %s", dataset.id, exc_info=True)
+            return None
+
+    def _should_index_lines(self, dataset):
+        try:
+            if os.path.getsize(dataset.file_name) < self.line_index_min_size:
+                return False
+            compressed_format, fh = compression_utils.get_fileobj_raw(dataset.file_name, "rb")
+            fh.close()
+            return compressed_format is None
+        except OSError:
+            return False
+
+    def _set_line_index(self, dataset, line_index):
+        if line_index is None:
+            dataset.metadata.line_index = None
+            return
+        try:
+            index_file = dataset.metadata.line_index
+            if not index_file:
+                index_file = dataset.metadata.spec['line_index'].param.new_file(dataset=dataset)
+            line_index.write(index_file.file_name)
+            dataset.metadata.line_index = index_file
+        except Exception:
+            log.warning("Failed to write line index of dataset %s", dataset.id, exc_info=True)
+            dataset.metadata.line_index = None
+
+    def count_data_lines(self, dataset):
+        line_index = self.get_line_index(dataset)
+        if line_index is not None:
+            return line_index.data_lines
+        return super().count_data_lines(dataset)
+
+    def get_line_offset(self, dataset, line):
+        """Return the byte offset of the start of line ``line`` (0-based) of the dataset."""
+        with compression_utils.get_fileobj(dataset.file_name, 'rb') as fh:
+            line_index = self.get_line_index(dataset)
+            if line_index is not None:
+                return line_index.line_offset(fh, line)
+            offset = 0
+            for _ in range(line):
+                line_bytes = fh.readline()
+                if not line_bytes:
+                    break
+                offset += len(line_bytes)
+            return offset
+
     def get_chunk(self, trans, dataset, offset=0, ck_size=None):
         with compression_utils.get_fileobj(dataset.file_name) as f:
             f.seek(offset)
             ck_data = f.read(ck_size or trans.app.config.display_chunk_size)
             if ck_data and ck_data[-1] != '\n':
-                cursor = f.read(1)
-                while cursor and cursor != '\n':
-                    ck_data += cursor
-                    cursor = f.read(1)
+                ck_data += f.readline()
             last_read = f.tell()
         return dumps({'ck_data': util.unicodify(ck_data),
                       'offset': last_read,
@@ -82,6 +276,10 @@ class TabularData(data.Text):
 
     def display_data(self, trans, dataset, preview=False, filename=None, to_ext=None, offset=None, ck_size=None, **kwd):
         preview = util.string_as_bool(preview)
+        line = kwd.get('line')
+        if line is not None and offset is None:
+            # Go to line: start the chunk at the given line
+            offset = self.get_line_offset(dataset, max(int(line), 0))
         if offset is not None:
             return self.get_chunk(trans, dataset, offset, ck_size)
         elif to_ext or not preview:
@@ -289,73 +487,27 @@ class Tabular(TabularData):
         requested_skip = skip
         if skip is None:
             skip = 0
-        column_type_set_order = ['int', 'float', 'list', 'str']  # Order to set column types in
-        default_column_type = column_type_set_order[-1]  # Default column type is lowest in list
-        column_type_compare_order = list(column_type_set_order)  # Order to compare column types
-        column_type_compare_order.reverse()
-
-        def type_overrules_type(column_type1, column_type2):
-            if column_type1 is None or column_type1 == column_type2:
-                return False
-            if column_type2 is None:
-                return True
-            for column_type in column_type_compare_order:
-                if column_type1 == column_type:
-                    return True
-                if column_type2 == column_type:
-                    return False
-            # neither column type was found in our ordered list, this cannot happen
-            raise ValueError(f"Tried to compare unknown column types: {column_type1} and {column_type2}")
-
-        def is_int(column_text):
-            # Don't allow underscores in numeric literals (PEP 515)
-            if '_' in column_text:
-                return False
-            try:
-                int(column_text)
-                return True
-            except ValueError:
-                return False
-
-        def is_float(column_text):
-            # Don't allow underscores in numeric literals (PEP 515)
-            if '_' in column_text:
-                return False
-            try:
-                float(column_text)
-                return True
-            except ValueError:
-                if column_text.strip().lower() == 'na':
-                    return True  # na is special cased to be a float
-                return False
-
-        def is_list(column_text):
-            return "," in column_text
-
-        def is_str(column_text):
-            # anything, except an empty string, is True
-            if column_text == "":
-                return False
-            return True
-
-        is_column_type = {}  # Dict to store column type string to checking function
-        for column_type in column_type_set_order:
-            is_column_type[column_type] = locals()["is_%s" % (column_type)]
-
-        def guess_column_type(column_text):
-            for column_type in column_type_set_order:
-                if is_column_type[column_type](column_text):
-                    return column_type
-            return None
+        default_column_type = COLUMN_TYPE_SET_ORDER[-1]  # Default column type is lowest in list
+        guesser = ColumnTypeGuesser()
 
         data_lines = 0
         comment_lines = 0
+        # Data lines counted as comments because they are skipped
+        skipped_data_lines = 0
         column_names = None
         column_types = []
         first_line_column_types = [default_column_type]  # default value is one column of type str
+        line_index = None
         if dataset.has_data():
+            # Large files are indexed while reading them, the index then also provides
+            # the number of lines if we stop reading after max_data_lines
+            index_reader = None
+            if self._should_index_lines(dataset):
+                dataset_fh, index_reader = open_indexing_text_reader(dataset.file_name)
+            else:
+                dataset_fh = compression_utils.get_fileobj(dataset.file_name)
             # NOTE: if skip > num_check_lines, we won't detect any metadata, and will use default
-            with compression_utils.get_fileobj(dataset.file_name) as dataset_fh:
+            with dataset_fh:
                 i = 0
                 while True:
                     line = dataset_fh.readline()
@@ -367,16 +519,12 @@ class Tabular(TabularData):
                     if i < skip or not line or line.startswith('#'):
                         # We'll call blank lines comments
                         comment_lines += 1
+                        if line and not line.startswith('#'):
+                            skipped_data_lines += 1
                     else:
                         data_lines += 1
                         if max_guess_type_data_lines is None or data_lines <= max_guess_type_data_lines:
-                            fields = line.split('\t')
-                            for field_count, field in enumerate(fields):
-                                if field_count >= len(column_types):  # found a previously unknown column, we append None
-                                    column_types.append(None)
-                                column_type = guess_column_type(field)
-                                if type_overrules_type(column_type, column_types[field_count]):
-                                    column_types[field_count] = column_type
+                            guesser.add_row(line.split('\t'))
                         if i == 0 and requested_skip is None:
                             # This is our first line, people seem to like to upload files that have a header line, but do not
                             # start with '#' (i.e. all column types would then most likely be detected as str).  We will assume
@@ -391,14 +539,20 @@ class Tabular(TabularData):
                             # "column_types": ["list", "float", "float", "str"]  *** would seem to be the 'Truth' by manual
                             # observation that the first line should be included as data.  The old method would have detected as
                             # "column_types": ["int", "int", "str", "list"]
-                            first_line_column_types = column_types
-                            column_types = [None for col in first_line_column_types]
+                            first_line_column_types = guesser.column_types
+                            guesser = ColumnTypeGuesser(columns=len(first_line_column_types))
                     if max_data_lines is not None and data_lines >= max_data_lines:
                         if dataset_fh.tell() != dataset.get_size():
                             data_lines = None  # Clear optional data_lines metadata value
                             comment_lines = None  # Clear optional comment_lines metadata value; additional comment lines could appear below this point
                         break
                     i += 1
+                column_types = guesser.column_types
+                if index_reader is not None:
+                    line_index = index_reader.drain()
+            if line_index is not None and data_lines is None:
+                data_lines = line_index.data_lines - skipped_data_lines
+                comment_lines = line_index.comment_lines + skipped_data_lines
 
         # we error on the larger number of columns
         # first we pad our column_types by using data from first line
@@ -420,6 +574,7 @@ class Tabular(TabularData):
         dataset.metadata.delimiter = '\t'
         if column_names is not None:
             dataset.metadata.column_names = column_names
+        self._set_line_index(dataset, line_index)
 
     def as_gbrowse_display_file(self, dataset, **kwd):
         return open(dataset.file_name, 'rb')
@@ -558,13 +713,33 @@ class Sam(Tabular):
     def merge(split_files, output_file):
         """
         Multiple SAM files may each have headers. Since the headers should all be the same, remove
-        the headers from files 1-n, keeping them in the first file only
+        the headers from files 1-n, keeping them in the first file only.
+        If the header declares the parts coordinate sorted (``@HD ... SO:coordinate``) the
+        alignments are merged keeping that order, otherwise the parts are concatenated.
         """
-        shutil.move(split_files[0], output_file)
-
-        if len(split_files) > 1:
-            cmd = ['egrep', '-v', '-h', '^@'] + split_files[1:] + ['>>', output_file]
-            subprocess.check_call(cmd, shell=True)
+        header = []
+        with open(split_files[0], 'rb') as fh:
+            for line in fh:
+                if not line.startswith(b'@'):
+                    break
+                header.append(line)
+        if header and header[0].startswith(b'@HD') and b'SO:coordinate' in header[0].rstrip(b'\r\n').split(b'\t'):
+            references = {}
+            for line in header:
+                if line.startswith(b'@SQ'):
+                    for field in line.rstrip(b'\r\n').split(b'\t'):
+                        if field.startswith(b'SN:'):
+                            references.setdefault(field[3:], len(references))
+
+            def alignment_position(line):
+                fields = line.split(b'\t', 4)
+                # Unmapped alignments without a reference go last
+                return references.get(fields[2], len(references)), int(fields[3])
+
+            merge_sorted_files(split_files, output_file, key=alignment_position, header_prefix=b'@')
+        else:
+            offsets = [0] + [header_length(f, b'@') for f in split_files[1:]]
+            concatenate_files(split_files, output_file, offsets=offsets)
 
     merge = staticmethod(merge)
 
@@ -800,6 +975,7 @@ class Vcf(BaseVcf):
 class VcfGz(BaseVcf, binary.Binary):
     # This class name is a misnomer, should be VcfBgzip
     file_ext = 'vcf_bgzip'
+    sniff_magic = util.gzip_magic  # BGZF
     compressed = True
     compressed_format = "gzip"
 
@@ -175,6 +175,7 @@ class HDT(binary.Binary, Triples):
     """
     edam_format = "format_2376"
     file_ext = "hdt"
+    sniff_magic = b"$HDT"
 
     def sniff(self, filename):
         with open(filename, "rb") as f:
@@ -0,0 +1,235 @@
+"""
+Sparse line index of (uncompressed) text files.
+
+A :class:`LineIndex` records the number of lines, data lines and comment lines
+(blank lines and lines starting with ``#``) of a file, and checkpoints - the
+byte offset of the start of a line together with its line number - about every
+``checkpoint_interval`` bytes. With it the byte offset of any line is found by
+reading at most ``checkpoint_interval`` bytes.
+
+The index is built from the blocks of the file as they are read, either by
+:func:`build_line_index` or while the file is read as text through
+:class:`IndexingReader`, so metadata setting can build it in the same pass.
+Lines are terminated by ``\\n`` only; files with carriage returns used as line
+terminators are not indexed.
+"""
+import bisect
+import io
+import json
+import re
+
+DEFAULT_CHECKPOINT_INTERVAL = 2 ** 20
+INDEX_VERSION = 1
+READ_BLOCK_SIZE = 2 ** 20
+
+# Line starts (except the first of a block) of blank and comment lines
+_COMMENT_LINE_STARTS = re.compile(br"\n(?=#|\r?\n)")
+
+
+class LineIndex:
+
+    def __init__(self, size, lines, comment_lines, checkpoints, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+        self.size = size
+        self.lines = lines
+        self.comment_lines = comment_lines
+        # Sorted list of [line, offset] pairs, starting with [0, 0]
+        self.checkpoints = checkpoints
+        self.checkpoint_interval = checkpoint_interval
+        self._checkpoint_lines = [line for line, _ in checkpoints]
+
+    @property
+    def data_lines(self):
+        return self.lines - self.comment_lines
+
+    def checkpoint_for_line(self, line):
+        """Return ``(line, offset)`` of the last checkpoint at or before ``line``."""
+        i = bisect.bisect_right(self._checkpoint_lines, line) - 1
+        return tuple(self.checkpoints[max(i, 0)])
+
+    def line_offset(self, fh, line):
+        """
+        Return the byte offset of the start of ``line`` (0-based) in the binary
+        file object ``fh``, or the size of the file if it has fewer lines.
+        """
+        if line >= self.lines:
+            return self.size
+        checkpoint_line, offset = self.checkpoint_for_line(line)
+        fh.seek(offset)
+        for _ in range(line - checkpoint_line):
+            offset += len(fh.readline())
+        return offset
+
+    def to_dict(self):
+        return {
+            "version": INDEX_VERSION,
+            "size": self.size,
+            "lines": self.lines,
+            "comment_lines": self.comment_lines,
+            "checkpoint_interval": self.checkpoint_interval,
+            "checkpoints": self.checkpoints,
+        }
+
+    @classmethod
+    def from_dict(cls, as_dict):
+        if as_dict.get("version") != INDEX_VERSION:
+            raise ValueError("Unsupported line index version [%s]" % as_dict.get("version"))
+        return cls(
+            size=as_dict["size"],
+            lines=as_dict["lines"],
+            comment_lines=as_dict["comment_lines"],
+            checkpoints=as_dict["checkpoints"],
+            checkpoint_interval=as_dict["checkpoint_interval"],
+        )
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+class LineIndexBuilder:
+    """Build a :class:`LineIndex` from consecutive blocks of a file."""
+
+    def __init__(self, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+        self.checkpoint_interval = checkpoint_interval
+        self.offset = 0
+        self.lines = 0
+        self.comment_lines = 0
+        self.checkpoints = [[0, 0]]
+        # Set if the file uses carriage returns as line terminators or was not read sequentially
+        self.unindexable = False
+        # Bytes of the last, incomplete line read so far
+        self._tail = b""
+
+    def update(self, block):
+        if not block:
+            return
+        data = self._tail + block if self._tail else block
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            self._tail = data
+            return
+        self._tail = data[end:]
+        self._add_lines(data[:end] if self._tail else data)
+
+    def _add_lines(self, data):
+        # data starts at a line start and ends with a newline
+        has_carriage_returns = b"\r" in data
+        if has_carriage_returns and data.count(b"\r") != data.count(b"\r\n"):
+            self.unindexable = True
+        lines = data.count(b"\n")
+        # Searching for single bytes is much faster than counting patterns, skip what cannot occur
+        comment_lines = data.count(b"\n#") if b"#" in data else 0
+        blank_lines = data.count(b"\n\n")
+        if has_carriage_returns:
+            blank_lines += data.count(b"\n\r\n")
+        if (blank_lines and b"\n\n\n" in data) or (has_carriage_returns and b"\n\r\n\r\n" in data):
+            # Consecutive blank lines overlap, count them one by one
+            comment_lines = len(_COMMENT_LINE_STARTS.findall(data))
+        else:
+            comment_lines += blank_lines
+        if data[:1] in (b"#", b"\n") or data[:2] == b"\r\n":
+            comment_lines += 1
+        # Checkpoint the first line starting at least checkpoint_interval bytes after the last checkpoint
+        line, start = self.lines, 0
+        next_checkpoint = self.checkpoints[-1][1] + self.checkpoint_interval - self.offset
+        while next_checkpoint < len(data):
+            position = data.find(b"\n", next_checkpoint - 1) + 1 if next_checkpoint > 0 else 0
+            if position >= len(data):
+                break
+            line += data.count(b"\n", start, position)
+            start = position
+            self.checkpoints.append([line, self.offset + position])
+            next_checkpoint = position + self.checkpoint_interval
+        self.lines += lines
+        self.comment_lines += comment_lines
+        self.offset += len(data)
+
+    def finish(self):
+        """
+        Return the :class:`LineIndex` of the blocks read, or None if the file
+        cannot be indexed.
+        """
+        if self._tail:
+            tail = self._tail + b"\n"
+            self._tail = b""
+            self._add_lines(tail)
+            self.offset -= 1
+        if self.unindexable:
+            return None
+        return LineIndex(self.offset, self.lines, self.comment_lines, self.checkpoints, self.checkpoint_interval)
+
+
+class IndexingReader(io.RawIOBase):
+    """
+    Raw reader of the binary file object ``fh`` feeding every byte read to
+    ``builder``. Wrap it in :class:`io.BufferedReader` and
+    :class:`io.TextIOWrapper` to read the file as text while indexing it.
+    """
+
+    def __init__(self, fh, builder):
+        self.fh = fh
+        self.builder = builder
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.fh.tell()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        position = self.fh.tell()
+        new_position = self.fh.seek(offset, whence)
+        if new_position != position:
+            # The blocks read are no longer consecutive
+            self.builder.unindexable = True
+        return new_position
+
+    def readinto(self, b):
+        data = self.fh.read(len(b))
+        n = len(data)
+        b[:n] = data
+        self.builder.update(data)
+        return n
+
+    def drain(self):
+        """Index the rest of the file, return the :class:`LineIndex`."""
+        while True:
+            data = self.fh.read(READ_BLOCK_SIZE)
+            if not data:
+                break
+            self.builder.update(data)
+        return self.builder.finish()
+
+    def close(self):
+        self.fh.close()
+        super().close()
+
+
+def open_indexing_text_reader(path, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+    """
+    Open the text file ``path`` for reading like ``open(path, encoding="utf-8")``,
+    but index it while reading. Return the text file object and the
+    :class:`IndexingReader`, whose ``drain()`` returns the index.
+    """
+    reader = IndexingReader(open(path, "rb"), LineIndexBuilder(checkpoint_interval))
+    return io.TextIOWrapper(io.BufferedReader(reader, READ_BLOCK_SIZE), encoding="utf-8"), reader
+
+
+def build_line_index(path, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+    """Return the :class:`LineIndex` of the file ``path`` (None if it cannot be indexed)."""
+    builder = LineIndexBuilder(checkpoint_interval)
+    with open(path, "rb") as fh:
+        while True:
+            data = fh.read(READ_BLOCK_SIZE)
+            if not data:
+                break
+            builder.update(data)
+    return builder.finish()
@@ -0,0 +1,160 @@
+"""
+Helpers to merge the outputs of split (parallelized) jobs.
+
+Parts are concatenated without copying the data through Python where the
+platform allows it - with ``os.copy_file_range`` (Linux, Python 3.8+) or
+``os.sendfile`` (Linux) and with :func:`shutil.copyfileobj` otherwise. Parts
+of sorted line based formats are merged with a streaming k-way merge
+(:func:`merge_sorted_files`), holding one line of every part at a time.
+"""
+import errno
+import heapq
+import itertools
+import logging
+import os
+import shutil
+
+log = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 2 ** 30
+# Errors meaning the system call is not supported for the files at hand
+_UNSUPPORTED_ERRNOS = {errno.EINVAL, errno.ENOSYS, errno.EXDEV, errno.EBADF, errno.ENOTSOCK, errno.EOPNOTSUPP}
+
+
+def _copy_with(copy, in_fd, out_fd, offset, count):
+    """
+    Copy ``count`` bytes of ``in_fd`` from ``offset`` to the current position of
+    ``out_fd`` with ``copy(in_fd, out_fd, offset, count)``, return the number
+    of bytes copied before ``copy`` turned out to be unsupported.
+    """
+    copied = 0
+    while copied < count:
+        try:
+            n = copy(in_fd, out_fd, offset + copied, min(count - copied, COPY_CHUNK_SIZE))
+        except OSError as e:
+            if e.errno in _UNSUPPORTED_ERRNOS:
+                break
+            raise
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _copy_file_range(in_fd, out_fd, offset, count):
+    return os.copy_file_range(in_fd, out_fd, count, offset)
+
+
+def _sendfile(in_fd, out_fd, offset, count):
+    return os.sendfile(out_fd, in_fd, offset, count)
+
+
+_ZERO_COPY_FUNCTIONS = []
+if hasattr(os, "copy_file_range"):
+    _ZERO_COPY_FUNCTIONS.append(_copy_file_range)
+if hasattr(os, "sendfile"):
+    _ZERO_COPY_FUNCTIONS.append(_sendfile)
+
+
+def append_file(src, fdst, offset=0):
+    """
+    Append the file ``src`` from byte ``offset`` on to the binary file object
+    ``fdst``, which must be positioned at its end. Return the number of bytes
+    appended.
+
+    The data is copied through Python if ``fdst`` was opened in append mode
+    (``"ab"``), the zero-copy system calls don't write to such files.
+    """
+    with open(src, "rb") as fsrc:
+        count = os.fstat(fsrc.fileno()).st_size - offset
+        if count <= 0:
+            return 0
+        fdst.flush()
+        copied = 0
+        try:
+            in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+        except (AttributeError, OSError):
+            # Not a real file
+            zero_copy_functions = []
+        else:
+            zero_copy_functions = _ZERO_COPY_FUNCTIONS
+        for copy in zero_copy_functions:
+            copied += _copy_with(copy, in_fd, out_fd, offset + copied, count - copied)
+            if copied >= count:
+                break
+        if copied:
+            # The descriptor moved, let a buffered file object catch up
+            fdst.seek(0, os.SEEK_END)
+        if copied < count:
+            fsrc.seek(offset + copied)
+            shutil.copyfileobj(fsrc, fdst)
+        return count
+
+
+def concatenate_files(split_files, output_file, offsets=None, append=False):
+    """
+    Concatenate the files ``split_files`` into ``output_file``, skipping the
+    first ``offsets[i]`` bytes of ``split_files[i]`` if ``offsets`` is given.
+    Gzip and bzip2 files concatenate into valid (multi-member) files.
+    """
+    if append:
+        # Not in append mode (O_APPEND), copy_file_range and sendfile refuse
+        # to write to such files.
+        fdst = os.fdopen(os.open(output_file, os.O_WRONLY | os.O_CREAT, 0o666), "wb")
+        fdst.seek(0, os.SEEK_END)
+    else:
+        fdst = open(output_file, "wb")
+    with fdst:
+        for i, fsrc in enumerate(split_files):
+            append_file(fsrc, fdst, offsets[i] if offsets else 0)
+
+
+def header_length(path, prefix):
+    """Return the length in bytes of the leading lines of ``path`` starting with ``prefix``."""
+    length = 0
+    with open(path, "rb") as fh:
+        for line in fh:
+            if not line.startswith(prefix):
+                break
+            length += len(line)
+    return length
+
+
+def _iter_lines(fh):
+    for line in fh:
+        if not line.endswith(b"\n"):
+            # The last line of the part, it must not be joined with the next one
+            line += b"\n"
+        yield line
+
+
+def merge_sorted_files(split_files, output_file, key, header_prefix=None):
+    """
+    Merge the line based files ``split_files``, each sorted by ``key`` (a
+    function of the line as bytes), into ``output_file`` keeping the sort
+    order. Lines comparing equal are written in the order of the parts.
+
+    If ``header_prefix`` is given, the leading lines starting with it are taken
+    from the first part and skipped in the others.
+    """
+    handles = []
+    try:
+        parts = []
+        for i, path in enumerate(split_files):
+            fh = open(path, "rb")
+            handles.append(fh)
+            header = []
+            line = fh.readline()
+            while header_prefix is not None and line.startswith(header_prefix):
+                header.append(line)
+                line = fh.readline()
+            if i == 0:
+                first_header = header
+            parts.append(_iter_lines(itertools.chain([line] if line else [], fh)))
+        with open(output_file, "wb") as out:
+            if handles:
+                out.writelines(first_header)
+            out.writelines(heapq.merge(*parts, key=key))
+    finally:
+        for fh in handles:
+            fh.close()
@@ -49,6 +49,7 @@ from galaxy.jobs.mapper import (
 from galaxy.jobs.runners import BaseJobRunner, JobState
 from galaxy.metadata import get_metadata_compute_strategy
 from galaxy.model import store
+from galaxy.model.job_equivalence import job_equivalence_hash
 from galaxy.objectstore import ObjectStorePopulator
 from galaxy.tool_util.deps import requirements
 from galaxy.tool_util.output_checker import (
@@ -302,6 +303,8 @@ class JobConfiguration(ConfiguresHandlers):
         self.handler_assignment_methods = None
         self.handler_assignment_methods_configured = False
         self.handler_max_grab = None
+        self.handler_grab_batch_size = None
+        self.handler_shard_grab = False
         self.destinations = {}
         self.destination_tags = {}
         self.default_destination_id = None
@@ -1314,6 +1317,7 @@ class JobWrapper(HasResourceParameters):
                 self.sa_session.add(dataset)
                 self.sa_session.flush()
             job.set_final_state(job.states.ERROR)
+            self._decrease_running_job_count()
             job.command_line = unicodify(self.command_line)
             job.info = message
             # TODO: Put setting the stdout, stderr, and exit code in one place
@@ -1345,6 +1349,12 @@ class JobWrapper(HasResourceParameters):
         delete_files = cleanup_job == 'always' or (cleanup_job == 'onsuccess' and job.state == job.states.DELETED)
         self.cleanup(delete_files=delete_files)
 
+    def _decrease_running_job_count(self):
+        # Only the job handler queues maintain job counts
+        decrease_running_job_count = getattr(self.queue, 'decrease_running_job_count', None)
+        if decrease_running_job_count is not None:
+            decrease_running_job_count(self.job_id)
+
     def pause(self, job=None, message=None):
         if job is None:
             job = self.get_job()
@@ -1757,9 +1767,13 @@ class JobWrapper(HasResourceParameters):
 
         self._fix_output_permissions()
 
+        if final_job_state == job.states.OK:
+            self._set_equivalence_hash(job)
+
         # Finally set the job state.  This should only happen *after* all
         # dataset creation, and will allow us to eliminate force_history_refresh.
         job.set_final_state(final_job_state)
+        self._decrease_running_job_count()
         if not job.tasks:
             # If job was composed of tasks, don't attempt to recollect statistics
             self._collect_metrics(job, job_metrics_directory)
@@ -1771,6 +1785,13 @@ class JobWrapper(HasResourceParameters):
         self.cleanup(delete_files=delete_files)
         log.debug(finish_timer.to_str(job_id=self.job_id, tool_id=job.tool_id))
 
+    def _set_equivalence_hash(self, job):
+        # Lets use_cached_job find this job with an indexed query
+        try:
+            job.equivalence_hash = job_equivalence_hash(self.sa_session, job)
+        except Exception:
+            log.exception("(%s) Failed to compute the equivalence hash of the job", self.get_id_tag())
+
     def discover_outputs(self, job, inp_data, out_data, out_collections, final_job_state):
         # Try to just recover input_ext and dbkey from job parameters (used and set in
         # galaxy.tools.actions). Old jobs may have not set these in the job parameters
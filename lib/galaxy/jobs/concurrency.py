@@ -0,0 +1,108 @@
+"""
+Incrementally maintained job counts used to enforce job concurrency limits.
+
+The job handler queue normally recomputes the number of queued and running
+jobs per user and destination with ``GROUP BY`` queries on every iteration.
+:class:`JobConcurrencyCounters` instead keeps these counts up to date as jobs
+are dispatched and reach terminal states, and is only periodically reconciled
+against the database (which also accounts for jobs dispatched or finished by
+other handlers).
+"""
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class JobConcurrencyCounters:
+    """
+    Counts of active (queued, running or resubmitted) jobs.
+
+    ``user_job_count`` maps user ids to the number of active jobs,
+    ``user_job_count_per_destination`` maps user ids to a dictionary of
+    destination ids to the number of queued or running jobs and
+    ``total_job_count_per_destination`` maps destination ids to the number of
+    queued or running jobs of all users. Jobs are tracked by id so that
+    decrementing is idempotent and jobs that were never counted are ignored.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # job id -> (user id, destination id, counted per destination)
+        self._jobs = {}
+        self.user_job_count = {}
+        self.user_job_count_per_destination = {}
+        self.total_job_count_per_destination = {}
+        self.last_reconcile = None
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def needs_reconcile(self, interval):
+        return self.last_reconcile is None or time.time() - self.last_reconcile >= interval
+
+    def increment(self, job_id, user_id, destination_id, per_destination=True):
+        """
+        Count ``job_id`` as active for ``user_id`` and ``destination_id``. Jobs
+        in the resubmitted state are counted against the user only
+        (``per_destination=False``). Counting an already counted job replaces
+        its previous entry.
+        """
+        with self._lock:
+            self._remove(job_id)
+            self._add(job_id, user_id, destination_id, per_destination)
+
+    def decrement(self, job_id):
+        """Stop counting ``job_id``, e.g. because it reached a terminal state."""
+        with self._lock:
+            self._remove(job_id)
+
+    def reconcile(self, active_jobs):
+        """
+        Replace all counts with ``active_jobs``, an iterable of ``(job id, user
+        id, destination id, per destination)`` tuples describing all active jobs
+        in the database.
+        """
+        with self._lock:
+            previous_count = len(self._jobs)
+            self._jobs = {}
+            self.user_job_count.clear()
+            self.user_job_count_per_destination.clear()
+            self.total_job_count_per_destination.clear()
+            for job_id, user_id, destination_id, per_destination in active_jobs:
+                self._add(job_id, user_id, destination_id, per_destination)
+            self.last_reconcile = time.time()
+            log.debug("Reconciled job concurrency counters: %d active job(s), previously %d", len(self._jobs), previous_count)
+
+    def _add(self, job_id, user_id, destination_id, per_destination):
+        self._jobs[job_id] = (user_id, destination_id, per_destination)
+        if user_id is not None:
+            self.user_job_count[user_id] = self.user_job_count.get(user_id, 0) + 1
+        if per_destination:
+            user_counts = self.user_job_count_per_destination.setdefault(user_id, {})
+            user_counts[destination_id] = user_counts.get(destination_id, 0) + 1
+            self.total_job_count_per_destination[destination_id] = self.total_job_count_per_destination.get(destination_id, 0) + 1
+
+    def _remove(self, job_id):
+        entry = self._jobs.pop(job_id, None)
+        if entry is None:
+            return
+        user_id, destination_id, per_destination = entry
+        if user_id is not None:
+            _decrement(self.user_job_count, user_id)
+        if per_destination:
+            user_counts = self.user_job_count_per_destination.get(user_id)
+            if user_counts is not None:
+                _decrement(user_counts, destination_id)
+                if not user_counts:
+                    del self.user_job_count_per_destination[user_id]
+            _decrement(self.total_job_count_per_destination, destination_id)
+
+
+def _decrement(counts, key):
+    count = counts.get(key, 0) - 1
+    if count > 0:
+        counts[key] = count
+    else:
+        counts.pop(key, None)
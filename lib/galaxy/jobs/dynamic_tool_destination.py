@@ -47,6 +47,12 @@ List of valid categories that can be expected in the configuration.
 valid_categories = ['verbose', 'tools', 'default_destination',
                     'users', 'default_priority']
 
+"""
+The last validated config returned by load_config(), together with the key it
+was loaded for and the values of the globals set while validating it.
+"""
+config_cache = None
+
 # --- destination validation error messages --- #
 dest_err_default_dest = "Default destination '%s' does not appear in the job configuration."  # destination
 dest_err_tool_default_dest = "Default destination for '%s': '%s' does not appear in the job configuration."  # tool, destination
@@ -767,6 +773,45 @@ def parse_yaml(path="/config/tool_destinations.yml",
         return config
 
 
+def config_file_signature(path):
+    """
+    Return a tuple identifying the current version of the file at path, or
+    None if the file cannot be accessed.
+    """
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+
+def load_config(path, job_conf_path, app=None):
+    """
+    Return the validated config from parse_yaml(), reusing the config validated
+    during the previous call as long as the tool destinations config file, the
+    job config file and the app are unchanged.
+
+    @type path: str
+    @param path: the path to the tool destinations config file
+
+    @type job_conf_path: str
+    @param job_conf_path: the path to the job config file
+
+    @rtype: dict
+    @return: validated config
+    """
+    global config_cache, priority_list, verbose
+    key = (config_file_signature(path), config_file_signature(job_conf_path))
+    if key[0] is None:
+        return parse_yaml(path, job_conf_path, app)
+    if config_cache is not None and config_cache[0] == key and config_cache[1] is app:
+        _, _, config, priority_list, verbose = config_cache
+        return config
+    config = parse_yaml(path, job_conf_path, app)
+    config_cache = (key, app, config, priority_list, verbose)
+    return config
+
+
 def validate_destination(app, destination, err_message, err_message_contents,
                          return_bool=True):
     """
@@ -1335,7 +1380,10 @@ def map_tool_to_destination(
         job_conf_path = app.config.job_config_file
 
     try:
-        config = parse_yaml(path, job_conf_path, app)
+        if test:
+            config = parse_yaml(path, job_conf_path, app)
+        else:
+            config = load_config(path, job_conf_path, app)
     except MalformedYMLException as e:
         raise JobMappingException(e)
 
@@ -1574,7 +1622,8 @@ def map_tool_to_destination(
                     log.debug(error)
 
             if matched_rule is None:
-                if "default_destination" in config[str(tool.old_id)]:
+                # use get() to not add the tool to the (possibly cached) config
+                if "default_destination" in config.get(str(tool.old_id), {}):
                     default_tool_destination = (config[str(tool.old_id)]['default_destination'])
                     if isinstance(default_tool_destination, str):
                         destination = default_tool_destination
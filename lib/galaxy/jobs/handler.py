@@ -13,6 +13,7 @@ from queue import (
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.sql.expression import (
     and_,
+    bindparam,
     func,
     null,
     or_,
@@ -26,7 +27,9 @@ from galaxy.jobs import (
     JobWrapper,
     TaskWrapper
 )
+from galaxy.jobs.concurrency import JobConcurrencyCounters
 from galaxy.jobs.mapper import JobNotReadyException
+from galaxy.jobs.readiness import JobReadinessTracker
 from galaxy.util import unicodify
 from galaxy.util.custom_logging import get_logger
 from galaxy.util.monitors import Monitors
@@ -38,6 +41,10 @@ log = get_logger(__name__)
 # States for running a job. These are NOT the same as data states
 JOB_WAIT, JOB_ERROR, JOB_INPUT_ERROR, JOB_INPUT_DELETED, JOB_READY, JOB_DELETED, JOB_ADMIN_DELETED, JOB_USER_OVER_QUOTA, JOB_USER_OVER_TOTAL_WALLTIME = 'wait', 'error', 'input_error', 'input_deleted', 'ready', 'deleted', 'admin_deleted', 'user_over_quota', 'user_over_total_walltime'
 DEFAULT_JOB_PUT_FAILURE_MESSAGE = 'Unable to run job due to a misconfiguration of the Galaxy job running system.  Please contact a site administrator.'
+# Maximum number of ids in a single IN clause issued by the readiness tracker
+JOB_READINESS_QUERY_CHUNK_SIZE = 1000
+# Seconds subtracted from the previous poll time when looking for updated datasets
+JOB_READINESS_EVENT_SLACK = 5
 
 
 class JobHandler:
@@ -51,7 +58,7 @@ class JobHandler:
         self.dispatcher = DefaultJobDispatcher(app)
         # Queues for starting and stopping jobs
         self.job_queue = JobHandlerQueue(app, self.dispatcher)
-        self.job_stop_queue = JobHandlerStopQueue(app, self.dispatcher)
+        self.job_stop_queue = JobHandlerStopQueue(app, self.dispatcher, job_counters=self.job_queue.job_counters)
 
     def start(self):
         self.job_queue.start()
@@ -64,31 +71,54 @@ class JobHandler:
 
 class ItemGrabber:
 
-    def __init__(self, app, grab_type='Job', handler_assignment_method=None, max_grab=None, self_handler_tags=None, handler_tags=None):
+    def __init__(self, app, grab_type='Job', handler_assignment_method=None, max_grab=None, self_handler_tags=None, handler_tags=None,
+                 grab_batch_size=None, shard=None):
         self.app = app
         self.sa_session = app.model.context
         self.grab_this = getattr(model, grab_type)
         self.grab_type = grab_type
+        self.max_grab = max_grab
+        # Without a batch size, grab up to max_grab items with a single statement
+        self.grab_batch_size = grab_batch_size or max_grab
+        self.self_handler_tags = list(self_handler_tags)
         self._grab_conn_opts = {'autocommit': False}
+        self._grab_queries = []
+        if shard is not None:
+            # Prefer items in this handler's shard so that handlers sharing tags don't compete for the same rows, items
+            # in other shards are grabbed only once this handler's shard is exhausted.
+            shard_index, shard_count = shard
+            self._grab_queries.append(self.__grab_queries(handler_assignment_method, (self.grab_this.table.c.id % shard_count) == shard_index))
+        self._grab_queries.append(self.__grab_queries(handler_assignment_method))
+        if handler_assignment_method == HANDLER_ASSIGNMENT_METHODS.DB_TRANSACTION_ISOLATION:
+            self._grab_conn_opts['isolation_level'] = 'SERIALIZABLE'
+        log.info(
+            "Handler job grabber initialized with '%s' assignment method for handler '%s', tag(s): %s%s", handler_assignment_method,
+            self.app.config.server_name, ', '.join(str(x) for x in handler_tags),
+            ", shard %s of %s" % (shard[0] + 1, shard[1]) if shard is not None else ''
+        )
+
+    def __grab_queries(self, handler_assignment_method, *criteria):
+        """
+        Build the select of grabbable item ids and the statement assigning them to this handler. Returns the select
+        (used on databases without UPDATE ... RETURNING) and the update statement.
+        """
         subq = select([self.grab_this.id]) \
             .where(and_(
-                self.grab_this.table.c.handler.in_(self_handler_tags),
-                self.grab_this.table.c.state == self.grab_this.states.NEW)) \
+                self.grab_this.table.c.handler.in_(self.self_handler_tags),
+                self.grab_this.table.c.state == self.grab_this.states.NEW,
+                *criteria)) \
             .order_by(self.grab_this.table.c.id)
-        if max_grab:
-            subq = subq.limit(max_grab)
+        if self.grab_batch_size:
+            # Bound when grabbing, so that the last batch doesn't grab more than max_grab items overall
+            subq = subq.limit(bindparam('grab_limit'))
         if handler_assignment_method == HANDLER_ASSIGNMENT_METHODS.DB_SKIP_LOCKED:
+            # Ignored on SQLite, where writes are serialized by the database lock anyway
             subq = subq.with_for_update(skip_locked=True)
-        self._grab_query = self.grab_this.table.update() \
+        update = self.grab_this.table.update() \
             .returning(self.grab_this.table.c.id) \
             .where(self.grab_this.table.c.id.in_(subq)) \
             .values(handler=self.app.config.server_name)
-        if handler_assignment_method == HANDLER_ASSIGNMENT_METHODS.DB_TRANSACTION_ISOLATION:
-            self._grab_conn_opts['isolation_level'] = 'SERIALIZABLE'
-        log.info(
-            "Handler job grabber initialized with '%s' assignment method for handler '%s', tag(s): %s", handler_assignment_method,
-            self.app.config.server_name, ', '.join(str(x) for x in handler_tags)
-        )
+        return subq, update
 
     @staticmethod
     def get_grabbable_handler_assignment_method(handler_assignment_methods):
@@ -107,19 +137,47 @@ class ItemGrabber:
         Attempts to assign unassigned jobs or invocaions to itself using DB serialization methods, if enabled. This
         simply sets `Job.handler` or `WorkflowInvocation.handler` to the current server name, which causes the job to be picked up by
         the appropriate handler.
+
+        If a batch size is set, items are grabbed in batches (each in its own short transaction) until ``max_grab`` items
+        have been grabbed or no more items are available. Returns the ids of the grabbed items.
         """
         # an excellent discussion on PostgreSQL concurrency safety:
         # https://blog.2ndquadrant.com/what-is-select-skip-locked-for-in-postgresql-9-5/
         self.sa_session.expunge_all()
         conn = self.sa_session.connection(execution_options=self._grab_conn_opts)
+        grabbed = []
+        for grab_select, grab_update in self._grab_queries:
+            while self.max_grab is None or len(grabbed) < self.max_grab:
+                limit = self.grab_batch_size
+                if limit and self.max_grab is not None:
+                    limit = min(limit, self.max_grab - len(grabbed))
+                ids = self.__grab_batch(conn, grab_select, grab_update, limit)
+                if ids is None:
+                    # Serialization failure or error, try again on the next iteration
+                    return grabbed
+                grabbed.extend(ids)
+                if not limit or len(ids) < limit:
+                    break
+            if grabbed:
+                # Items in other shards are only grabbed if this handler's shard is empty
+                break
+        if grabbed:
+            log.debug('Grabbed %s(s): %s', self.grab_type, ', '.join(str(x) for x in grabbed))
+        return grabbed
+
+    def __grab_batch(self, conn, grab_select, grab_update, limit):
+        params = {'grab_limit': limit} if limit else {}
         with conn.begin() as trans:
             try:
-                rows = conn.execute(self._grab_query).fetchall()
-                if rows:
-                    log.debug('Grabbed %s(s): %s', self.grab_type, ', '.join(str(row[0]) for row in rows))
+                if conn.dialect.name == 'postgresql':
+                    ids = [row[0] for row in conn.execute(grab_update, params)]
+                else:
+                    ids = self.__grab_batch_without_returning(conn, grab_select, params)
+                if ids:
                     trans.commit()
                 else:
                     trans.rollback()
+                return ids
             except OperationalError as e:
                 # If this is a serialization failure on PostgreSQL, then e.orig is a psycopg2 TransactionRollbackError
                 # and should have attribute `code`. Other engines should just report the message and move on.
@@ -127,6 +185,26 @@ class ItemGrabber:
                     log.debug('Grabbing %s failed (serialization failures are ok): %s', self.grab_type, unicodify(e))
                 trans.rollback()
 
+    def __grab_batch_without_returning(self, conn, grab_select, params):
+        """
+        Fallback for databases that do not support UPDATE ... RETURNING (SQLite, MySQL). The candidate rows are
+        selected (and locked, where supported), assigned if they are still unhandled and then read back to determine
+        which of them were actually assigned to this handler.
+        """
+        table = self.grab_this.table
+        ids = [row[0] for row in conn.execute(grab_select, params)]
+        if not ids:
+            return ids
+        conn.execute(table.update()
+                     .where(and_(table.c.id.in_(ids),
+                                 table.c.handler.in_(self.self_handler_tags),
+                                 table.c.state == self.grab_this.states.NEW))
+                     .values(handler=self.app.config.server_name))
+        return [row[0] for row in conn.execute(select([table.c.id])
+                                               .where(and_(table.c.id.in_(ids),
+                                                           table.c.handler == self.app.config.server_name))
+                                               .order_by(table.c.id))]
+
 
 class JobHandlerQueue(Monitors):
     """
@@ -144,6 +222,11 @@ class JobHandlerQueue(Monitors):
         self.track_jobs_in_database = self.app.config.track_jobs_in_database
 
         # Initialize structures for handling job limits
+        self.job_counters = None
+        if self.app.config.job_count_reconcile_interval:
+            # Job counts are maintained as jobs are dispatched and finished
+            # and only periodically reconciled against the database
+            self.job_counters = JobConcurrencyCounters()
         self.__clear_job_count()
 
         # Keep track of the pid that started the job manager, only it
@@ -155,6 +238,13 @@ class JobHandlerQueue(Monitors):
         self.waiting_jobs = []
         # Contains wrappers of jobs that are limited or ready (so they aren't created unnecessarily/multiple times)
         self.job_wrappers = {}
+        # Incrementally tracks input readiness of new jobs (only used if track_jobs_in_database is True)
+        self.readiness_tracker = None
+        if self.track_jobs_in_database and self.app.config.track_job_readiness_incrementally:
+            self.readiness_tracker = JobReadinessTracker()
+        self._readiness_last_reconcile = None
+        self._readiness_last_event_poll = None
+        self._readiness_max_job_id = None
         name = "JobHandlerQueue.monitor_thread"
         self._init_monitor_thread(name, target=self.__monitor, config=app.config)
         self.job_grabber = None
@@ -167,6 +257,8 @@ class JobHandlerQueue(Monitors):
                 max_grab=self.app.job_config.handler_max_grab,
                 self_handler_tags=self.app.job_config.self_handler_tags,
                 handler_tags=self.app.job_config.handler_tags,
+                grab_batch_size=self.app.job_config.handler_grab_batch_size,
+                shard=self.app.job_config.get_handler_shard() if self.app.job_config.handler_shard_grab else None,
             )
 
     def start(self):
@@ -308,7 +400,14 @@ class JobHandlerQueue(Monitors):
         # Pull all new jobs from the queue at once
         jobs_to_check = []
         resubmit_jobs = []
-        if self.track_jobs_in_database:
+        if self.track_jobs_in_database and self.readiness_tracker is not None:
+            # Clear the session so we get fresh states for job and all datasets
+            self.sa_session.expunge_all()
+            jobs_to_check = self.__get_ready_jobs_from_tracker()
+            # Filter jobs with invalid input states
+            jobs_to_check = self.__filter_jobs_with_invalid_input_states(jobs_to_check)
+            resubmit_jobs = self.__get_resubmit_jobs()
+        elif self.track_jobs_in_database:
             # Clear the session so we get fresh states for job and all datasets
             self.sa_session.expunge_all()
             # Fetch all new jobs
@@ -343,10 +442,7 @@ class JobHandlerQueue(Monitors):
             # Filter jobs with invalid input states
             jobs_to_check = self.__filter_jobs_with_invalid_input_states(jobs_to_check)
             # Fetch all "resubmit" jobs
-            resubmit_jobs = self.sa_session.query(model.Job).enable_eagerloads(False) \
-                .filter(and_((model.Job.state == model.Job.states.RESUBMITTED),
-                             (model.Job.handler == self.app.config.server_name))) \
-                .order_by(model.Job.id).all()
+            resubmit_jobs = self.__get_resubmit_jobs()
         else:
             # Get job objects and append to watch queue for any which were
             # previously waiting
@@ -371,8 +467,11 @@ class JobHandlerQueue(Monitors):
             # Reassemble resubmit job destination from persisted value
             jw = self.__recover_job_wrapper(job)
             if jw.is_ready_for_resubmission(job):
-                self.increase_running_job_count(job.user_id, jw.job_destination.id)
+                self.increase_running_job_count(job.user_id, jw.job_destination.id, job_id=job.id)
                 self.dispatcher.put(jw)
+        if self.app.config.enable_quotas and getattr(self.app.quota_agent, 'cache_ttl', 0) > 0:
+            # Calculate and cache the quotas of the users of all jobs with a single query
+            self.app.quota_agent.get_quotas({job.user_id for job in jobs_to_check if job and job.user_id})
         # Iterate over new and waiting jobs and look for any that are
         # ready to run
         new_waiting_jobs = []
@@ -434,6 +533,11 @@ class JobHandlerQueue(Monitors):
         # Update the waiting list
         if not self.track_jobs_in_database:
             self.waiting_jobs = new_waiting_jobs
+        elif self.readiness_tracker is not None:
+            # Inputs of these jobs are ready but they are held back (e.g. by
+            # concurrency limits), check them again on the next iteration
+            for job_id in new_waiting_jobs:
+                self.readiness_tracker.track(job_id)
         # Remove cached wrappers for any jobs that are no longer being tracked
         for id in list(self.job_wrappers.keys()):
             if id not in new_waiting_jobs:
@@ -443,6 +547,104 @@ class JobHandlerQueue(Monitors):
         # Done with the session
         self.sa_session.remove()
 
+    def __get_resubmit_jobs(self):
+        return self.sa_session.query(model.Job).enable_eagerloads(False) \
+            .filter(and_((model.Job.state == model.Job.states.RESUBMITTED),
+                         (model.Job.handler == self.app.config.server_name))) \
+            .order_by(model.Job.id).all()
+
+    def __new_job_ids_query(self):
+        query = self.sa_session.query(model.Job.id).enable_eagerloads(False)
+        if self.app.config.user_activation_on:
+            query = query.outerjoin(model.User) \
+                .filter(or_((model.Job.user_id == null()), (model.User.active == true())))
+        return query.filter(and_((model.Job.state == model.Job.states.NEW),
+                                 (model.Job.handler == self.app.config.server_name)))
+
+    def __get_ready_jobs_from_tracker(self):
+        """
+        Incremental replacement for the "not ready" subqueries: only jobs that
+        the tracker has not seen yet have their inputs inspected, and dataset
+        state changes since the last iteration are applied as events. Returns
+        the jobs whose inputs are all ready.
+        """
+        tracker = self.readiness_tracker
+        now = datetime.datetime.utcnow()
+        reconcile_interval = datetime.timedelta(seconds=self.app.config.job_readiness_reconcile_interval)
+        if self._readiness_last_reconcile is None or now - self._readiness_last_reconcile >= reconcile_interval:
+            # Periodically compare against the database to pick up jobs returned
+            # to the new state (e.g. resumed jobs) and to drop deleted jobs.
+            new_job_ids = tracker.reconcile(row[0] for row in self.__new_job_ids_query())
+            self._readiness_last_reconcile = now
+            reconciled = True
+        else:
+            reconciled = False
+            # In between, only look at jobs created since the newest job seen
+            query = self.__new_job_ids_query()
+            if self._readiness_max_job_id is not None:
+                query = query.filter(model.Job.id > self._readiness_max_job_id)
+            new_job_ids = [row[0] for row in query]
+        if new_job_ids:
+            self.__track_new_jobs(new_job_ids)
+            self._readiness_max_job_id = max(self._readiness_max_job_id or 0, max(new_job_ids))
+        if tracker.watched_dataset_ids:
+            # On reconciliation, also recover events missed by the update_time
+            # window (late commits, bulk updates not setting update_time)
+            self.__apply_dataset_state_events(now, recheck_watched=reconciled)
+        self._readiness_last_event_poll = now
+        ready_job_ids = tracker.pop_ready()
+        if not ready_job_ids:
+            return []
+        jobs = []
+        for chunk_start in range(0, len(ready_job_ids), JOB_READINESS_QUERY_CHUNK_SIZE):
+            chunk = ready_job_ids[chunk_start:chunk_start + JOB_READINESS_QUERY_CHUNK_SIZE]
+            jobs.extend(self.sa_session.query(model.Job).enable_eagerloads(False)
+                        .filter(and_((model.Job.state == model.Job.states.NEW),
+                                     (model.Job.handler == self.app.config.server_name),
+                                     model.Job.id.in_(chunk))))
+        return sorted(jobs, key=lambda job: job.id)
+
+    def __track_new_jobs(self, job_ids):
+        """Start tracking ``job_ids`` with the input datasets that are not ready yet."""
+        unmet = defaultdict(set)
+        for chunk_start in range(0, len(job_ids), JOB_READINESS_QUERY_CHUNK_SIZE):
+            chunk = job_ids[chunk_start:chunk_start + JOB_READINESS_QUERY_CHUNK_SIZE]
+            for job_to_input, input_association in [(model.JobToInputDatasetAssociation, model.HistoryDatasetAssociation),
+                                                    (model.JobToInputLibraryDatasetAssociation, model.LibraryDatasetDatasetAssociation)]:
+                rows = self.sa_session.query(job_to_input.job_id, model.Dataset.id).enable_eagerloads(False) \
+                    .select_from(job_to_input) \
+                    .join(input_association) \
+                    .join(model.Dataset) \
+                    .filter(and_(job_to_input.job_id.in_(chunk),
+                                 model.Dataset.state.in_(model.Dataset.non_ready_states)))
+                for job_id, dataset_id in rows:
+                    unmet[job_id].add(dataset_id)
+        for job_id in job_ids:
+            self.readiness_tracker.track(job_id, unmet.get(job_id, ()))
+        log.debug("Readiness tracker started tracking %d job(s), %d waiting on inputs", len(job_ids), len(unmet))
+
+    def __apply_dataset_state_events(self, now, recheck_watched=False):
+        """
+        Feed state changes of datasets updated since the last poll to the
+        readiness tracker. If ``recheck_watched`` is set, or on the first poll,
+        the current state of every watched dataset is checked instead.
+        """
+        query = self.sa_session.query(model.Dataset.id, model.Dataset.state).enable_eagerloads(False) \
+            .filter(~model.Dataset.state.in_(model.Dataset.non_ready_states))
+        if self._readiness_last_event_poll is not None and not recheck_watched:
+            # Allow for a bit of clock skew between Galaxy processes
+            since = self._readiness_last_event_poll - datetime.timedelta(seconds=JOB_READINESS_EVENT_SLACK)
+            query = query.filter(model.Dataset.update_time >= since)
+            rows = query.all()
+        else:
+            watched = sorted(self.readiness_tracker.watched_dataset_ids)
+            rows = []
+            for chunk_start in range(0, len(watched), JOB_READINESS_QUERY_CHUNK_SIZE):
+                chunk = watched[chunk_start:chunk_start + JOB_READINESS_QUERY_CHUNK_SIZE]
+                rows.extend(query.filter(model.Dataset.id.in_(chunk)))
+        for dataset_id, state in rows:
+            self.readiness_tracker.dataset_state_changed(dataset_id, state, model.Dataset.non_ready_states)
+
     def __filter_jobs_with_invalid_input_states(self, jobs):
         """
         Takes  list of jobs and filters out jobs whose input datasets are in invalid state and
@@ -503,6 +705,12 @@ class JobHandlerQueue(Monitors):
                 job_wrapper.fail(fail_message)
             except Exception:
                 log.exception("(%s) Caught exception while attempting to fail job.", job_id)
+        if self.readiness_tracker is not None:
+            # These jobs stay new, wait on their inputs again rather than until
+            # the next reconciliation
+            job_ids_to_retrack = [job_id for job_id in sorted(jobs_to_ignore) if job_id not in jobs_to_pause and job_id not in jobs_to_fail]
+            if job_ids_to_retrack:
+                self.__track_new_jobs(job_ids_to_retrack)
         jobs_to_ignore.update(jobs_to_pause)
         jobs_to_ignore.update(jobs_to_fail)
         return [j for j in jobs if j.id not in jobs_to_ignore]
@@ -539,7 +747,7 @@ class JobHandlerQueue(Monitors):
 
         if state == JOB_READY:
             # PASS.  increase usage by one job (if caching) so that multiple jobs aren't dispatched on this queue iteration
-            self.increase_running_job_count(job.user_id, job_destination.id)
+            self.increase_running_job_count(job.user_id, job_destination.id, job_id=job.id)
             for job_to_input_dataset_association in job.input_datasets:
                 # We record the input dataset version, now that we know the inputs are ready
                 if job_to_input_dataset_association.dataset:
@@ -649,15 +857,34 @@ class JobHandlerQueue(Monitors):
         return None
 
     def __clear_job_count(self):
+        if self.job_counters is not None:
+            if self.job_counters.needs_reconcile(self.app.config.job_count_reconcile_interval):
+                self.__reconcile_job_counters()
+            self.user_job_count = self.job_counters.user_job_count
+            self.user_job_count_per_destination = self.job_counters.user_job_count_per_destination
+            self.total_job_count_per_destination = self.job_counters.total_job_count_per_destination
+            return
         self.user_job_count = None
         self.user_job_count_per_destination = None
         self.total_job_count_per_destination = None
 
+    def __reconcile_job_counters(self):
+        result = self.sa_session.execute(select([model.Job.table.c.id,
+                                                 model.Job.table.c.user_id,
+                                                 model.Job.table.c.destination_id,
+                                                 model.Job.table.c.state])
+                                         .where(model.Job.table.c.state.in_((model.Job.states.QUEUED,
+                                                                             model.Job.states.RUNNING,
+                                                                             model.Job.states.RESUBMITTED))))
+        self.job_counters.reconcile(
+            (row[0], row[1], row[2], row[3] != model.Job.states.RESUBMITTED) for row in result
+        )
+
     def get_user_job_count(self, user_id):
         self.__cache_user_job_count()
         # This could have been incremented by a previous job dispatched on this iteration, even if we're not caching
         rval = self.user_job_count.get(user_id, 0)
-        if not self.app.config.cache_user_job_count:
+        if not self.app.config.cache_user_job_count and self.job_counters is None:
             result = self.sa_session.execute(select([func.count(model.Job.table.c.id)])
                                              .where(and_(model.Job.table.c.state.in_((model.Job.states.QUEUED,
                                                          model.Job.states.RUNNING,
@@ -686,7 +913,7 @@ class JobHandlerQueue(Monitors):
     def get_user_job_count_per_destination(self, user_id):
         self.__cache_user_job_count_per_destination()
         cached = self.user_job_count_per_destination.get(user_id, {})
-        if self.app.config.cache_user_job_count:
+        if self.app.config.cache_user_job_count or self.job_counters is not None:
             rval = cached
         else:
             # The cached count is still used even when we're not caching, it is
@@ -717,7 +944,10 @@ class JobHandlerQueue(Monitors):
         elif self.user_job_count_per_destination is None:
             self.user_job_count_per_destination = {}
 
-    def increase_running_job_count(self, user_id, destination_id):
+    def increase_running_job_count(self, user_id, destination_id, job_id=None):
+        if self.job_counters is not None and job_id is not None:
+            self.job_counters.increment(job_id, user_id, destination_id)
+            return
         if self.app.job_config.limits.registered_user_concurrent_jobs or \
            self.app.job_config.limits.anonymous_user_concurrent_jobs or \
            self.app.job_config.limits.destination_user_concurrent_jobs:
@@ -734,6 +964,11 @@ class JobHandlerQueue(Monitors):
                 self.total_job_count_per_destination = {}
             self.total_job_count_per_destination[destination_id] = self.total_job_count_per_destination.get(destination_id, 0) + 1
 
+    def decrease_running_job_count(self, job_id):
+        """Called when a job reaches a terminal state, only used when job counts are maintained incrementally."""
+        if self.job_counters is not None:
+            self.job_counters.decrement(job_id)
+
     def __check_user_jobs(self, job, job_wrapper):
         # TODO: Update output datasets' _state = LIMITED or some such new
         # state, so the UI can reflect what jobs are waiting due to concurrency
@@ -859,9 +1094,10 @@ class JobHandlerStopQueue(Monitors):
     """
     STOP_SIGNAL = object()
 
-    def __init__(self, app, dispatcher):
+    def __init__(self, app, dispatcher, job_counters=None):
         self.app = app
         self.dispatcher = dispatcher
+        self.job_counters = job_counters
 
         self.sa_session = app.model.context
 
@@ -927,6 +1163,7 @@ class JobHandlerStopQueue(Monitors):
                 jobs_to_check.append((self.sa_session.query(model.Job).get(job_id), error_msg))
         except Empty:
             pass
+        stopped_jobs = []
         for job, error_msg in jobs_to_check:
             if (job.state not in
                     (job.states.DELETED_NEW,
@@ -941,16 +1178,25 @@ class JobHandlerStopQueue(Monitors):
                 job.info = error_msg
             job.set_final_state(final_state)
             self.sa_session.add(job)
-            self.sa_session.flush()
-            if job.job_runner_name is not None:
-                # tell the dispatcher to stop the job
-                job_wrapper = JobWrapper(job, self, use_persisted_destination=True)
-                self.dispatcher.stop(job, job_wrapper)
+            stopped_jobs.append(job)
+        if not stopped_jobs:
+            return
+        # Update the states of all jobs at once
+        self.sa_session.flush()
+        for job in stopped_jobs:
+            self.decrease_running_job_count(job.id)
+        # tell the dispatcher to stop the jobs that were dispatched to a runner
+        self.dispatcher.stop_jobs([(job, JobWrapper(job, self, use_persisted_destination=True))
+                                   for job in stopped_jobs if job.job_runner_name is not None])
 
     def put(self, job_id, error_msg=None):
         if not self.app.config.track_jobs_in_database:
             self.queue.put((job_id, error_msg))
 
+    def decrease_running_job_count(self, job_id):
+        if self.job_counters is not None:
+            self.job_counters.decrement(job_id)
+
     def shutdown(self):
         """Attempts to gracefully shut down the worker thread"""
         if self.parent_pid != os.getpid():
@@ -1031,6 +1277,31 @@ class DefaultJobDispatcher:
                 log.error(f'stop(): ({job_wrapper.get_id_tag()}) Invalid job runner: {runner_name}')
                 # Job and output dataset states have already been updated, so nothing is done here.
 
+    def stop_jobs(self, jobs_and_wrappers):
+        """
+        Stop several jobs (or tasks) at once, grouped by runner so that each
+        runner can stop its jobs in bulk. Takes a list of (job, job_wrapper)
+        tuples.
+        """
+        wrappers_by_runner = defaultdict(list)
+        for job, job_wrapper in jobs_and_wrappers:
+            job_runner_name = job.get_job_runner_name()
+            if job_runner_name is not None:
+                wrappers_by_runner[job_runner_name.split(":", 1)[0]].append(job_wrapper)
+        for runner_name, job_wrappers in wrappers_by_runner.items():
+            log.debug("Stopping %d job(s) in %s runner: %s", len(job_wrappers), runner_name,
+                      ', '.join(job_wrapper.get_id_tag() for job_wrapper in job_wrappers))
+            try:
+                runner = self.job_runners[runner_name]
+            except KeyError:
+                log.error(f'stop_jobs(): Invalid job runner: {runner_name}')
+                # Job and output dataset states have already been updated, so nothing is done here.
+                continue
+            try:
+                runner.stop_jobs(job_wrappers)
+            except Exception:
+                log.exception("Failed to stop jobs in %s runner", runner_name)
+
     def recover(self, job, job_wrapper):
         runner_name = (job.job_runner_name.split(":", 1))[0]
         log.debug("recovering job %d in %s runner" % (job.id, runner_name))
@@ -1,9 +1,15 @@
+import copy
 import importlib
+import json
 import logging
+import os
+import threading
+from collections import OrderedDict
 
 import galaxy.jobs.rules
 from galaxy.jobs import stock_rules
 from galaxy.jobs.dynamic_tool_destination import map_tool_to_destination
+from galaxy.util import asbool
 from galaxy.util.getargspec import getfullargspec
 from galaxy.util.submodules import import_submodules
 from .rule_helper import RuleHelper
@@ -17,6 +23,11 @@ ERROR_MESSAGE_NO_RULE_FUNCTION = "Galaxy misconfigured - cannot find dynamic rul
 ERROR_MESSAGE_RULE_FUNCTION_NOT_FOUND = "Galaxy misconfigured - no rule function named %s found in dynamic rule modules."
 ERROR_MESSAGE_RULE_EXCEPTION = "Encountered an unhandled exception while caching job destination dynamic rule."
 
+# Rule function arguments that identify a specific job or give access to
+# arbitrary state, the results of rules using them are never memoized.
+NON_MEMOIZABLE_RULE_ARGS = frozenset(["job_id", "job_wrapper", "job", "app", "rule_helper"])
+MAX_MEMOIZED_DESTINATIONS = 10000
+
 
 class JobMappingConfigurationException(Exception):
     pass
@@ -43,6 +54,54 @@ STOCK_RULES = dict(
 )
 
 
+class DestinationMappingCache:
+    """
+    Caches shared by all job runner mappers: the rule modules found in a
+    rules package (until a module is added to or removed from the package)
+    and the results of memoized dynamic rules (bounded, least recently used
+    results are evicted first).
+    """
+
+    def __init__(self, max_destinations=MAX_MEMOIZED_DESTINATIONS):
+        self.max_destinations = max_destinations
+        self._lock = threading.Lock()
+        self._rule_modules = {}
+        self._destinations = OrderedDict()
+
+    def rule_modules(self, rules_module, load):
+        try:
+            signature = tuple(os.stat(path).st_mtime_ns for path in rules_module.__path__)
+        except (AttributeError, OSError):
+            return load(rules_module)
+        cached = self._rule_modules.get(rules_module.__name__)
+        if cached is None or cached[0] != signature:
+            cached = (signature, load(rules_module))
+            self._rule_modules[rules_module.__name__] = cached
+        return cached[1]
+
+    def get_destination(self, key):
+        with self._lock:
+            if key not in self._destinations:
+                return None
+            self._destinations.move_to_end(key)
+            return self._destinations[key]
+
+    def set_destination(self, key, destination):
+        with self._lock:
+            self._destinations[key] = destination
+            self._destinations.move_to_end(key)
+            while len(self._destinations) > self.max_destinations:
+                self._destinations.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._rule_modules.clear()
+            self._destinations.clear()
+
+
+destination_mapping_cache = DestinationMappingCache()
+
+
 class JobRunnerMapper:
     """
     This class is responsible to managing the mapping of jobs
@@ -118,8 +177,51 @@ class JobRunnerMapper:
                 workflow_resource_params = param_values.get("__workflow_resource_params__", None)
                 actual_args["workflow_resource_params"] = workflow_resource_params
 
+        if asbool(destination.params.get("memoize", False)):
+            return self.__invoke_memoized_expand_function(expand_function, destination, actual_args)
         return expand_function(**actual_args)
 
+    def __invoke_memoized_expand_function(self, expand_function, destination, actual_args):
+        """
+        Return the result of a previous call of ``expand_function`` with the
+        same arguments if there is one. Rules are only memoized if enabled on
+        the dynamic destination (``memoize``), which declares that the result
+        depends on nothing but the arguments the rule function accepts.
+        """
+        key = self.__memoization_key(expand_function, destination, actual_args)
+        if key is None:
+            return expand_function(**actual_args)
+        job_destination = destination_mapping_cache.get_destination(key)
+        if job_destination is None:
+            job_destination = expand_function(**actual_args)
+            destination_mapping_cache.set_destination(key, job_destination)
+        # Destinations are modified per job, e.g. by resubmission and dynamic chaining
+        return copy.deepcopy(job_destination)
+
+    def __memoization_key(self, expand_function, destination, actual_args):
+        non_memoizable_args = NON_MEMOIZABLE_RULE_ARGS.intersection(actual_args)
+        if non_memoizable_args:
+            log.debug("Not memoizing dynamic rule %s, it depends on: %s", expand_function.__name__, ", ".join(sorted(non_memoizable_args)))
+            return None
+        key = [expand_function, destination.id]
+        for name, value in sorted(actual_args.items()):
+            if name == "referrer":
+                value = json.dumps(value.params, sort_keys=True, default=str)
+            elif name == "tool":
+                value = (value.id, getattr(value, "version", None))
+            elif name == "user":
+                value = value and value.id
+            elif name in ("resource_params", "workflow_resource_params"):
+                value = json.dumps(value, sort_keys=True, default=str)
+            key.append((name, value))
+        key = tuple(key)
+        try:
+            hash(key)
+        except TypeError:
+            log.debug("Not memoizing dynamic rule %s, its arguments are not hashable", expand_function.__name__)
+            return None
+        return key
+
     def __job_params(self, job):
         app = self.job_wrapper.app
         param_values = job.get_param_values(app, ignore_errors=True)
@@ -179,7 +281,7 @@ class JobRunnerMapper:
             rules_module = importlib.import_module(rules_module_name)
         else:
             rules_module = self.rules_module
-        return import_submodules(rules_module, ordered=True)
+        return destination_mapping_cache.rule_modules(rules_module, lambda module: import_submodules(module, ordered=True))
 
     def __last_matching_function_in_modules(self, rule_modules, function_name):
         # self.rule_modules is sorted in reverse order, so find first
@@ -0,0 +1,127 @@
+"""
+Incremental tracking of job input readiness for the job handler queue.
+
+Rather than re-evaluating the input datasets of every new job on every
+iteration of the handler queue, a :class:`JobReadinessTracker` remembers which
+input datasets each waiting job still depends on. Dataset state changes are
+fed to the tracker as events and only jobs whose set of unmet dependencies has
+become empty are handed back to the handler for dispatch.
+"""
+import logging
+from collections import defaultdict
+
+log = logging.getLogger(__name__)
+
+
+class JobReadinessTracker:
+    """
+    Track unmet input dataset dependencies of waiting jobs.
+
+    The tracker is not thread safe and is meant to be used exclusively from
+    the job handler queue's monitor thread.
+    """
+
+    def __init__(self):
+        # job id -> set of dataset ids the job is still waiting on
+        self._unmet = {}
+        # dataset id -> set of job ids waiting on that dataset
+        self._waiters = defaultdict(set)
+        # job ids with no unmet dependencies that have not been popped yet
+        self._ready = set()
+
+    def __len__(self):
+        return len(self._unmet)
+
+    def __contains__(self, job_id):
+        return job_id in self._unmet
+
+    @property
+    def job_ids(self):
+        return set(self._unmet)
+
+    @property
+    def watched_dataset_ids(self):
+        return set(self._waiters)
+
+    @property
+    def ready_count(self):
+        return len(self._ready)
+
+    def unmet_count(self, job_id):
+        """Return the number of input datasets ``job_id`` is still waiting on."""
+        return len(self._unmet.get(job_id, ()))
+
+    def track(self, job_id, unmet_dataset_ids=()):
+        """
+        Start (or restart) tracking ``job_id``, which is waiting on the datasets
+        in ``unmet_dataset_ids``. A job without unmet datasets is immediately
+        ready.
+        """
+        self.forget(job_id)
+        unmet = set(unmet_dataset_ids)
+        self._unmet[job_id] = unmet
+        for dataset_id in unmet:
+            self._waiters[dataset_id].add(job_id)
+        if not unmet:
+            self._ready.add(job_id)
+
+    def forget(self, job_id):
+        """Stop tracking ``job_id``, e.g. because it was deleted or dispatched."""
+        unmet = self._unmet.pop(job_id, None)
+        if unmet is None:
+            return
+        self._ready.discard(job_id)
+        for dataset_id in unmet:
+            waiters = self._waiters.get(dataset_id)
+            if waiters is not None:
+                waiters.discard(job_id)
+                if not waiters:
+                    del self._waiters[dataset_id]
+
+    def dataset_ready(self, dataset_id):
+        """
+        Record that ``dataset_id`` left the non-ready states and release it from
+        the jobs waiting on it. Returns the ids of jobs that became ready.
+        """
+        waiters = self._waiters.pop(dataset_id, None)
+        if not waiters:
+            return []
+        now_ready = []
+        for job_id in waiters:
+            unmet = self._unmet[job_id]
+            unmet.discard(dataset_id)
+            if not unmet:
+                self._ready.add(job_id)
+                now_ready.append(job_id)
+        return now_ready
+
+    def dataset_state_changed(self, dataset_id, state, non_ready_states):
+        """Process a dataset state change event."""
+        if state in non_ready_states:
+            return []
+        return self.dataset_ready(dataset_id)
+
+    def pop_ready(self):
+        """
+        Return the ids of all jobs without unmet dependencies in ascending order
+        and stop tracking them. Jobs that still cannot be dispatched (e.g.
+        because of concurrency limits) should be re-added with :meth:`track`.
+        """
+        ready = sorted(self._ready)
+        for job_id in ready:
+            self.forget(job_id)
+        return ready
+
+    def reconcile(self, new_job_ids):
+        """
+        Drop tracked jobs that are no longer in ``new_job_ids`` (the complete set
+        of jobs currently in the ``new`` state for this handler) and return the
+        ids of jobs that are not tracked yet.
+        """
+        new_job_ids = set(new_job_ids)
+        stale = [job_id for job_id in self._unmet if job_id not in new_job_ids]
+        for job_id in stale:
+            self.forget(job_id)
+        if stale:
+            log.debug("Readiness tracker dropped %d job(s) no longer in new state", len(stale))
+        return sorted(new_job_ids - set(self._unmet))
@@ -40,6 +40,11 @@ from galaxy.util.bunch import Bunch
 from galaxy.util.custom_logging import get_logger
 from galaxy.util.monitors import Monitors
 from .state_handler_factory import build_state_handlers
+from .work_queues import (
+    FINISH_STAGE,
+    QUEUE_STAGE,
+    RunnerWorkQueues,
+)
 
 log = get_logger(__name__)
 
@@ -85,16 +90,35 @@ class BaseJobRunner:
         self.runner_state_handlers = build_state_handlers()
 
     def _init_worker_threads(self):
-        """Start ``nworkers`` worker threads.
+        """Start ``nworkers`` worker threads, plus ``job_runner_finish_workers``
+        threads dedicated to finishing jobs if that option is set.
         """
-        self.work_queue = Queue()
+        finish_workers = self.app.config.job_runner_finish_workers
+        self.work_queue = RunnerWorkQueues(
+            separate_finish_stage=finish_workers > 0,
+            finish_priority=self.app.config.job_runner_finish_priority,
+            statsd_client=getattr(self.app.execution_timer_factory, 'galaxy_statsd_client', None),
+            metric_prefix=f'internals.galaxy.jobs.runners.{self.__class__.__name__.lower()}.work_queue',
+        )
         self.work_threads = []
-        log.debug(f'Starting {self.nworkers} {self.runner_name} workers')
-        for i in range(self.nworkers):
-            worker = threading.Thread(name="%s.work_thread-%d" % (self.runner_name, i), target=self.run_next)
-            worker.daemon = True
-            self.app.application_stack.register_postfork_function(worker.start)
-            self.work_threads.append(worker)
+        self.work_threads_per_stage = {QUEUE_STAGE: self.nworkers}
+        if finish_workers > 0:
+            self.work_threads_per_stage[FINISH_STAGE] = finish_workers
+        for stage, nworkers in self.work_threads_per_stage.items():
+            log.debug(f'Starting {nworkers} {self.runner_name} {stage} workers')
+            for i in range(nworkers):
+                name = "%s.work_thread-%d" % (self.runner_name, i) if stage == QUEUE_STAGE else "%s.%s_thread-%d" % (self.runner_name, stage, i)
+                worker = threading.Thread(name=name, target=self.run_next, args=(stage,))
+                worker.daemon = True
+                self.app.application_stack.register_postfork_function(worker.start)
+                self.work_threads.append(worker)
+
+    def work_queue_stats(self):
+        """Return the depth of and wait times (in seconds) in the work queue of each worker stage."""
+        stats = self.work_queue.stats()
+        for stage, stage_stats in stats.items():
+            stage_stats['workers'] = self.work_threads_per_stage.get(stage, 0)
+        return stats
 
     def _alive_worker_threads(self, cycle=False):
         # yield endlessly as long as there are alive threads if cycle is True
@@ -107,11 +131,11 @@ class BaseJobRunner:
                         alive = True
                     yield thread
 
-    def run_next(self):
+    def run_next(self, stage=QUEUE_STAGE):
         """Run the next item in the work queue (a job waiting to run)
         """
         while True:
-            (method, arg) = self.work_queue.get()
+            (method, arg) = self.work_queue.get(stage)
             if method is STOP_SIGNAL:
                 return
             # id and name are collected first so that the call of method() is the last exception.
@@ -159,8 +183,10 @@ class BaseJobRunner:
         """Attempts to gracefully shut down the worker threads
         """
         log.info("%s: Sending stop signal to %s job worker threads", self.runner_name, len(self.work_threads))
-        for _ in range(len(self.work_threads)):
-            self.work_queue.put((STOP_SIGNAL, None))
+        log.debug("%s: Work queue stats: %s", self.runner_name, self.work_queue_stats())
+        for stage, nworkers in self.work_threads_per_stage.items():
+            for _ in range(nworkers):
+                self.work_queue.put_stop_signal(stage, STOP_SIGNAL)
 
         join_timeout = self.app.config.monitor_thread_join_timeout
         if join_timeout > 0:
@@ -259,6 +285,18 @@ class BaseJobRunner:
     def stop_job(self, job_wrapper):
         raise NotImplementedError()
 
+    def stop_jobs(self, job_wrappers):
+        """Stop several dispatched jobs at once.
+
+        Runners that are able to remove many jobs from the DRM with a single call should override this, by default
+        each job is stopped individually with :meth:`stop_job`.
+        """
+        for job_wrapper in job_wrappers:
+            try:
+                self.stop_job(job_wrapper)
+            except Exception:
+                log.exception("(%s) Failed to stop job", job_wrapper.get_id_tag())
+
     def recover(self, job, job_wrapper):
         raise NotImplementedError()
 
@@ -2,8 +2,10 @@
 Job control via a command line interface (e.g. qsub/qstat), possibly over a remote connection (e.g. ssh).
 """
 
+import json
 import logging
 import time
+from collections import defaultdict
 
 from galaxy import model
 from galaxy.jobs import JobDestination
@@ -20,6 +22,8 @@ __all__ = ('ShellJobRunner', )
 
 DEFAULT_EMBED_METADATA_IN_JOB = True
 MAX_SUBMIT_RETRY = 3
+# Maximum number of job ids passed to a single delete command
+MAX_DELETE_BATCH = 100
 
 
 class ShellJobRunner(AsynchronousJobRunner):
@@ -209,21 +213,26 @@ class ShellJobRunner(AsynchronousJobRunner):
     def __get_job_states(self):
         job_destinations = {}
         job_states = {}
-        # unique the list of destinations
+        # unique the list of destinations, destinations that use the same
+        # shell and job plugin but differ in job submission parameters share
+        # one status call
         for ajs in self.watched:
-            if ajs.job_destination.id not in job_destinations:
-                job_destinations[ajs.job_destination.id] = dict(job_destination=ajs.job_destination, job_ids=[ajs.job_id])
+            plugin_params = self.parse_destination_params(ajs.job_destination.params)
+            shell_params, job_params = plugin_params
+            key = json.dumps([shell_params, job_params.get('plugin')], sort_keys=True, default=str)
+            if key not in job_destinations:
+                job_destinations[key] = dict(plugin_params=plugin_params, job_ids=[ajs.job_id])
             else:
-                job_destinations[ajs.job_destination.id]['job_ids'].append(ajs.job_id)
+                job_destinations[key]['job_ids'].append(ajs.job_id)
         # check each destination for the listed job ids
         for v in job_destinations.values():
-            job_destination = v['job_destination']
             job_ids = v['job_ids']
-            shell_params, job_params = self.parse_destination_params(job_destination.params)
+            shell_params, job_params = v['plugin_params']
             shell, job_interface = self.get_cli_plugins(shell_params, job_params)
             cmd_out = shell.execute(job_interface.get_status(job_ids))
             assert cmd_out.returncode == 0, cmd_out.stderr
-            job_states.update(job_interface.parse_status(cmd_out.stdout, job_ids))
+            # parse_status() checks every line of the status output for membership in job_ids
+            job_states.update(job_interface.parse_status(cmd_out.stdout, set(job_ids)))
         return job_states
 
     def stop_job(self, job_wrapper):
@@ -238,6 +247,28 @@ class ShellJobRunner(AsynchronousJobRunner):
         except Exception as e:
             log.debug(f"({job.id}/{job.job_runner_external_id}) User killed running job, but error encountered during termination: {e}")
 
+    def stop_jobs(self, job_wrappers):
+        """Attempts to delete dispatched jobs, issuing one delete command per destination"""
+        jobs_by_params = defaultdict(list)
+        for job_wrapper in job_wrappers:
+            job = job_wrapper.get_job()
+            if job.job_runner_external_id is None:
+                continue
+            jobs_by_params[json.dumps(job.destination_params, sort_keys=True)].append(job)
+        for params, jobs in jobs_by_params.items():
+            for i in range(0, len(jobs), MAX_DELETE_BATCH):
+                batch = jobs[i:i + MAX_DELETE_BATCH]
+                job_tags = ', '.join(f"{job.id}/{job.job_runner_external_id}" for job in batch)
+                try:
+                    shell_params, job_params = self.parse_destination_params(json.loads(params))
+                    shell, job_interface = self.get_cli_plugins(shell_params, job_params)
+                    cmd_out = shell.execute(job_interface.delete_all([job.job_runner_external_id for job in batch]))
+                    assert cmd_out.returncode == 0, cmd_out.stderr
+                    log.debug(f"({job_tags}) Terminated at user's request")
+                except Exception as e:
+                    # Some of the jobs may have finished already, which causes the delete command to fail
+                    log.debug(f"({job_tags}) User killed running jobs, but error encountered during termination: {e}")
+
     def recover(self, job, job_wrapper):
         """Recovers jobs stuck in the queued/running state when Galaxy started"""
         job_id = job.get_job_runner_external_id()
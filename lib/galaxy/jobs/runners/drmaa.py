@@ -313,19 +313,36 @@ class DRMAAJobRunner(AsynchronousJobRunner):
             return None
         return state
 
+    def _get_batch_job_states(self, watched):
+        """
+        Return a dictionary mapping external job ids of the ``watched`` job
+        states to their DRMAA state, determined with as few calls to the DRM as
+        possible. Jobs missing from the dictionary are checked individually
+        with ``check_watched_item()``. The DRMAA API has no bulk status call,
+        subclasses for DRMs that provide one should override this.
+        """
+        return {}
+
     def check_watched_items(self):
         """
         Called by the monitor thread to look at each watched job and deal
         with state changes.
         """
         new_watched = []
+        try:
+            batch_states = self._get_batch_job_states(self.watched)
+        except Exception:
+            log.exception("Unable to check the state of watched jobs in batch, checking jobs individually")
+            batch_states = {}
         for ajs in self.watched:
             external_job_id = ajs.job_id
             galaxy_id_tag = ajs.job_wrapper.get_id_tag()
             old_state = ajs.old_state
-            state = self.check_watched_item(ajs, new_watched)
+            state = batch_states.get(external_job_id)
             if state is None:
-                continue
+                state = self.check_watched_item(ajs, new_watched)
+                if state is None:
+                    continue
             if state != old_state:
                 log.debug("({}/{}) state change: {}".format(galaxy_id_tag, external_job_id, self.drmaa_job_state_strings[state]))
             if state == drmaa.JobState.RUNNING and not ajs.running:
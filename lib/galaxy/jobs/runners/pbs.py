@@ -2,6 +2,7 @@ import logging
 import os
 import time
 import traceback
+from collections import defaultdict
 from datetime import timedelta
 
 try:
@@ -532,6 +533,41 @@ class PBSJobRunner(AsynchronousJobRunner):
             if (None is not c):
                 pbs.pbs_disconnect(c)
 
+    def stop_jobs(self, job_wrappers):
+        """Attempts to delete jobs from the PBS queue, using one connection per PBS server"""
+        jobs_by_server = defaultdict(list)
+        for job_wrapper in job_wrappers:
+            job = job_wrapper.get_job()
+            pbs_server_name = self.__get_pbs_server(job.destination_params)
+            if pbs_server_name is None:
+                log.debug("(%s/%s) Job queued but no destination stored in job params, cannot delete"
+                          % (job.get_id_tag(), job.get_job_runner_external_id()))
+                continue
+            jobs_by_server[pbs_server_name].append(job)
+        for pbs_server_name, jobs in jobs_by_server.items():
+            c = None
+            try:
+                c = pbs.pbs_connect(util.smart_str(pbs_server_name))
+                if c <= 0:
+                    log.debug("Connection to PBS server %s for deleting %d job(s) failed" % (pbs_server_name, len(jobs)))
+                    continue
+                for job in jobs:
+                    job_tag = f"({job.get_id_tag()}/{job.get_job_runner_external_id()})"
+                    try:
+                        job_id = job.get_job_runner_external_id().encode('utf-8')
+                        pbs.pbs_deljob(c, job_id, '')
+                        log.debug("%s Removed from PBS queue before job completion" % job_tag)
+                    except Exception:
+                        e = traceback.format_exc()
+                        log.debug(f"{job_tag} Unable to stop job: {e}")
+            except Exception:
+                e = traceback.format_exc()
+                log.debug(f"Unable to stop jobs on PBS server {pbs_server_name}: {e}")
+            finally:
+                # Cleanup: disconnect from the server.
+                if (None is not c):
+                    pbs.pbs_disconnect(c)
+
     def recover(self, job, job_wrapper):
         """Recovers jobs stuck in the queued/running state when Galaxy started"""
         job_id = job.get_job_runner_external_id()
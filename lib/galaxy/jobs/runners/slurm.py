@@ -6,10 +6,14 @@ import re
 import shutil
 import tempfile
 import time
+from collections import defaultdict
 
 from galaxy import model
 from galaxy.jobs.runners.drmaa import DRMAAJobRunner
-from galaxy.util import commands
+from galaxy.util import (
+    commands,
+    specs,
+)
 from galaxy.util.custom_logging import get_logger
 
 log = get_logger(__name__)
@@ -33,6 +37,16 @@ SLURM_TOP_WARNING_RES = (
     SLURM_CGROUP_RE,
 )
 
+# Maximum number of job ids passed to a single scancel command
+MAX_SCANCEL_BATCH = 100
+# Maximum number of job ids passed to a single squeue command
+MAX_SQUEUE_BATCH = 1000
+# SLURM job states (as reported by squeue) that are mapped to DRMAA states
+# when checking job states in batch, jobs in any other state (in particular
+# COMPLETING and all terminal states) are checked individually via DRMAA.
+SLURM_PENDING_STATES = ('PENDING', 'CONFIGURING')
+SLURM_RUNNING_STATES = ('RUNNING', )
+
 # These messages are returned to the user
 OUT_OF_MEMORY_MSG = 'This job was terminated because it used more memory than it was allocated.'
 PROBABLY_OUT_OF_MEMORY_MSG = 'This job was cancelled probably because it used more memory than it was allocated.'
@@ -42,6 +56,92 @@ class SlurmJobRunner(DRMAAJobRunner):
     runner_name = "SlurmRunner"
     restrict_job_name_length = False
 
+    def __init__(self, app, nworkers, **kwargs):
+        runner_param_specs = dict(
+            batch_job_status=dict(map=specs.to_bool, default=False))
+        if 'runner_param_specs' not in kwargs:
+            kwargs['runner_param_specs'] = dict()
+        kwargs['runner_param_specs'].update(runner_param_specs)
+        super().__init__(app, nworkers, **kwargs)
+
+    def _get_batch_job_states(self, watched):
+        """
+        If the ``batch_job_status`` runner parameter is set, query the state of
+        the watched jobs with one ``squeue`` call per cluster (and batch of
+        ``MAX_SQUEUE_BATCH`` jobs) instead of one DRMAA call per job. Only
+        pending and running jobs are returned, finished jobs are left to be
+        checked (and post-mortemed) individually.
+        """
+        if not self.runner_params.batch_job_status:
+            return {}
+        jobs_by_cluster = defaultdict(dict)
+        for ajs in watched:
+            external_job_id = ajs.job_id
+            if external_job_id in (None, 'None'):
+                continue
+            if '.' in external_job_id:
+                # custom slurm-drmaa-with-cluster-support job id syntax
+                job_id, cluster = external_job_id.split('.', 1)
+            else:
+                job_id, cluster = external_job_id, None
+            jobs_by_cluster[cluster][job_id] = external_job_id
+        states = {}
+        for cluster, external_job_ids in jobs_by_cluster.items():
+            job_ids = list(external_job_ids)
+            for i in range(0, len(job_ids), MAX_SQUEUE_BATCH):
+                cmd = ['squeue', '--noheader', '--format=%i %T']
+                if cluster:
+                    cmd.extend(['-M', cluster])
+                cmd.append('--jobs=%s' % ','.join(job_ids[i:i + MAX_SQUEUE_BATCH]))
+                try:
+                    stdout = commands.execute(cmd)
+                except commands.CommandLineException as e:
+                    # e.g. all jobs of the batch have already been purged from the controller
+                    log.debug('Batch job state check with squeue failed, checking jobs individually: %s', e)
+                    continue
+                for job_id, slurm_state in _parse_squeue_states(stdout).items():
+                    if job_id not in external_job_ids:
+                        continue
+                    if slurm_state in SLURM_PENDING_STATES:
+                        states[external_job_ids[job_id]] = self.drmaa_job_states.QUEUED_ACTIVE
+                    elif slurm_state in SLURM_RUNNING_STATES:
+                        states[external_job_ids[job_id]] = self.drmaa_job_states.RUNNING
+        return states
+
+    def stop_jobs(self, job_wrappers):
+        """Cancel jobs with one ``scancel`` call per cluster, jobs using an external kill script are stopped individually"""
+        jobs_by_cluster = defaultdict(list)
+        individually = []
+        for job_wrapper in job_wrappers:
+            if job_wrapper.get_destination_configuration("drmaa_external_killjob_script") is not None:
+                individually.append(job_wrapper)
+                continue
+            job = job_wrapper.get_job()
+            ext_id = job.get_job_runner_external_id()
+            if ext_id in (None, 'None'):
+                continue
+            if '.' in ext_id:
+                # custom slurm-drmaa-with-cluster-support job id syntax
+                ext_id, cluster = ext_id.split('.', 1)
+            else:
+                cluster = None
+            jobs_by_cluster[cluster].append((job.id, ext_id))
+        for cluster, jobs in jobs_by_cluster.items():
+            for i in range(0, len(jobs), MAX_SCANCEL_BATCH):
+                batch = jobs[i:i + MAX_SCANCEL_BATCH]
+                cmd = ['scancel']
+                if cluster:
+                    cmd.extend(['-M', cluster])
+                cmd.extend(ext_id for _, ext_id in batch)
+                job_tags = ', '.join(f"{job_id}/{ext_id}" for job_id, ext_id in batch)
+                try:
+                    commands.execute(cmd)
+                    log.info(f"({job_tags}) Removed from DRM queue at user's request")
+                except commands.CommandLineException as e:
+                    # scancel fails if some of the jobs have already finished, the other jobs are cancelled anyway
+                    log.error(f"({job_tags}) User killed running jobs, but scancel reported an error: {e}")
+        super().stop_jobs(individually)
+
     def _complete_terminal_job(self, ajs, drmaa_state, **kwargs):
         def _get_slurm_state_with_sacct(job_id, cluster):
             cmd = ['sacct', '-n', '-o', 'state%-32']
@@ -224,3 +324,18 @@ def _remove_spurious_top_lines(rfh, ajs, maxlines=3):
         shutil.move(wf_name, ajs.error_file)
         for line in bad:
             log.debug('(%s/%s) Job completed, removing SLURM spurious warning: "%s"', ajs.job_wrapper.get_id_tag(), ajs.job_id, line)
+
+
+def _parse_squeue_states(stdout):
+    """
+    Parse the output of ``squeue --noheader --format='%i %T'`` into a
+    dictionary mapping job ids to SLURM job states. The ``CLUSTER: <name>``
+    line printed when using ``-M`` is ignored.
+    """
+    states = {}
+    for line in stdout.splitlines():
+        fields = line.split()
+        if len(fields) != 2 or fields[0] == 'CLUSTER:':
+            continue
+        states[fields[0]] = fields[1]
+    return states
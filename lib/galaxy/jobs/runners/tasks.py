@@ -70,6 +70,8 @@ class TaskedJobRunner(BaseJobRunner):
                 tw = TaskWrapper(task, job_wrapper.queue)
                 task_wrappers.append(tw)
                 self.app.job_manager.job_handler.dispatcher.put(tw)
+            # Merge outputs of finished tasks while the others are still running
+            merger = splitter.IncrementalMerger(job_wrapper) if hasattr(splitter, 'IncrementalMerger') else None
             tasks_complete = False
             count_complete = 0
             sleep_time = 1
@@ -107,12 +109,17 @@ class TaskedJobRunner(BaseJobRunner):
                         job_exit_code = tw.get_exit_code()
                         count_complete = count_complete + 1
                 if tasks_complete is False:
+                    if merger:
+                        merger.update(task_wrappers)
                     sleep(sleep_time)
                     if sleep_time < 8:
                         sleep_time *= 2
             job_wrapper.reclaim_ownership()      # if running as the actual user, change ownership before merging.
             log.debug('execution finished - beginning merge: %s' % command_line)
-            stdout, stderr = splitter.do_merge(job_wrapper, task_wrappers)
+            if merger:
+                stdout, stderr = splitter.do_merge(job_wrapper, task_wrappers, merger=merger)
+            else:
+                stdout, stderr = splitter.do_merge(job_wrapper, task_wrappers)
         except Exception:
             job_wrapper.fail("failure running job", exception=True)
             log.exception("failure running job %d", job_wrapper.job_id)
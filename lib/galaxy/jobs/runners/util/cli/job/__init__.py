@@ -35,6 +35,14 @@ class BaseJobExec(metaclass=ABCMeta):
         job.
         """
 
+    def delete_all(self, job_ids):
+        """
+        Given a list of job ids, return command to stop execution or dequeue
+        all of the specified jobs. Plugins for job managers that accept
+        multiple job ids in a single delete command should override this.
+        """
+        return '; '.join(self.delete(job_id) for job_id in job_ids)
+
     @abstractmethod
     def get_status(self, job_ids=None):
         """
@@ -65,6 +65,9 @@ class LSF(BaseJobExec):
     def delete(self, job_id):
         return 'bkill %s' % job_id
 
+    def delete_all(self, job_ids):
+        return 'bkill %s' % ' '.join(job_ids)
+
     def get_status(self, job_ids=None):
         return "bjobs -a -o \"id stat\" -noheader"  # check this
 
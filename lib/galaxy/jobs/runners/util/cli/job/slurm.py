@@ -56,6 +56,9 @@ class Slurm(BaseJobExec):
     def delete(self, job_id):
         return 'scancel %s' % job_id
 
+    def delete_all(self, job_ids):
+        return 'scancel %s' % ' '.join(job_ids)
+
     def get_status(self, job_ids=None):
         return "squeue -a -o '%A %t'"
 
@@ -68,6 +68,9 @@ class Torque(BaseJobExec):
     def delete(self, job_id):
         return 'qdel %s' % job_id
 
+    def delete_all(self, job_ids):
+        return 'qdel %s' % ' '.join(job_ids)
+
     def get_status(self, job_ids=None):
         return 'qstat -x'
 
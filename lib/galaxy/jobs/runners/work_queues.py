@@ -0,0 +1,177 @@
+"""
+Work queues feeding the worker threads of job runners.
+
+By default all work of a runner (preparing and submitting jobs as well as
+finishing them) is processed by a single pool of worker threads in FIFO
+order. :class:`RunnerWorkQueues` routes work items to separate stages,
+each served by its own pool of threads, so that a burst of expensive job
+finishing (collecting outputs, setting metadata, pushing to object stores)
+cannot starve the submission of new jobs. Work in the finish stage can be
+ordered by priority.
+
+If a statsd client is given, the time each work item waited in its stage
+queue and the depth of the queue are sent to statsd as items are taken from
+the queue.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from queue import (
+    PriorityQueue,
+    Queue,
+)
+
+log = logging.getLogger(__name__)
+
+QUEUE_STAGE = "queue"
+FINISH_STAGE = "finish"
+# Names of runner methods that are dispatched to the finish stage
+FINISH_METHOD_NAMES = frozenset(("finish_job", "fail_job", "mark_as_failed", "handle_metadata_externally"))
+
+FINISH_PRIORITY_FIFO = "fifo"
+FINISH_PRIORITY_SMALLEST_OUTPUTS_FIRST = "smallest_outputs_first"
+FINISH_PRIORITY_FEWEST_OUTPUTS_FIRST = "fewest_outputs_first"
+FINISH_PRIORITIES = (FINISH_PRIORITY_FIFO, FINISH_PRIORITY_SMALLEST_OUTPUTS_FIRST, FINISH_PRIORITY_FEWEST_OUTPUTS_FIRST)
+
+# Stop signals are processed after all pending work
+LOWEST_PRIORITY = float("inf")
+
+
+class StageQueue:
+    """A priority queue (FIFO among equal priorities) that records wait times."""
+
+    def __init__(self, name, statsd_client=None, metric_prefix=None):
+        self.name = name
+        self._queue = PriorityQueue()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.statsd_client = statsd_client
+        self.metric_prefix = f"{metric_prefix}.{name}" if metric_prefix else name
+
+    def put(self, item, priority=0, enqueue_time=None):
+        if enqueue_time is None:
+            enqueue_time = time.time()
+        self._queue.put((priority, next(self._counter), enqueue_time, item))
+
+    def get(self):
+        _, _, enqueue_time, item = self._queue.get()
+        wait = time.time() - enqueue_time
+        with self._lock:
+            self.processed += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        if self.statsd_client is not None:
+            self.statsd_client.timing(f"{self.metric_prefix}.wait", wait * 1000.)
+            self.statsd_client.gauge(f"{self.metric_prefix}.depth", self.qsize())
+        return item
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                depth=self.qsize(),
+                processed=self.processed,
+                mean_wait=self.total_wait / self.processed if self.processed else 0.0,
+                max_wait=self.max_wait,
+            )
+
+
+class RunnerWorkQueues:
+    """
+    Route ``(method, arg)`` work items of a job runner to stage queues.
+
+    If ``separate_finish_stage`` is False, all work goes to the queue stage
+    (the historical single work queue). The object implements ``put`` and
+    ``get`` so it can be used wherever runners expect ``self.work_queue``.
+
+    Work is usually put by a runner's monitor thread, so output sizes for the
+    ``smallest_outputs_first`` priority are determined in a separate thread
+    before the work is added to the finish stage.
+    """
+
+    def __init__(self, separate_finish_stage=False, finish_priority=FINISH_PRIORITY_FIFO, statsd_client=None, metric_prefix=None):
+        if finish_priority not in FINISH_PRIORITIES:
+            raise Exception("Invalid job finish priority '{}', must be one of: {}".format(finish_priority, ", ".join(FINISH_PRIORITIES)))
+        self.finish_priority = finish_priority
+        self.stages = {QUEUE_STAGE: StageQueue(QUEUE_STAGE, statsd_client, metric_prefix)}
+        if separate_finish_stage:
+            self.stages[FINISH_STAGE] = StageQueue(FINISH_STAGE, statsd_client, metric_prefix)
+        self._prioritize_queue = None
+        if separate_finish_stage and finish_priority == FINISH_PRIORITY_SMALLEST_OUTPUTS_FIRST:
+            self._prioritize_queue = Queue()
+            self._prioritize_thread = None
+            self._prioritize_lock = threading.Lock()
+
+    def stage_for(self, method):
+        if FINISH_STAGE in self.stages and getattr(method, "__name__", None) in FINISH_METHOD_NAMES:
+            return FINISH_STAGE
+        return QUEUE_STAGE
+
+    def put(self, item):
+        method, arg = item
+        stage = self.stage_for(method)
+        priority = 0
+        if stage == FINISH_STAGE:
+            if self._prioritize_queue is not None:
+                self._start_prioritize_thread()
+                self._prioritize_queue.put((item, time.time()))
+                return
+            priority = self._finish_priority(arg)
+        self.stages[stage].put(item, priority=priority)
+
+    def put_stop_signal(self, stage, stop_signal):
+        self.stages[stage].put((stop_signal, None), priority=LOWEST_PRIORITY)
+
+    def get(self, stage=QUEUE_STAGE):
+        return self.stages[stage].get()
+
+    def qsize(self):
+        size = sum(stage.qsize() for stage in self.stages.values())
+        if self._prioritize_queue is not None:
+            size += self._prioritize_queue.qsize()
+        return size
+
+    def stats(self):
+        """Return queue depth, number of processed items and wait times (in seconds) per stage."""
+        return {name: stage.stats() for name, stage in self.stages.items()}
+
+    def _start_prioritize_thread(self):
+        with self._prioritize_lock:
+            # (Re)start the thread lazily, so that it runs in the process using the queues after forking
+            if self._prioritize_thread is None or not self._prioritize_thread.is_alive():
+                self._prioritize_thread = threading.Thread(name="RunnerWorkQueues.prioritize_thread", target=self._prioritize)
+                self._prioritize_thread.daemon = True
+                self._prioritize_thread.start()
+
+    def _prioritize(self):
+        while True:
+            item, enqueue_time = self._prioritize_queue.get()
+            try:
+                self.stages[FINISH_STAGE].put(item, priority=self._finish_priority(item[1]), enqueue_time=enqueue_time)
+            finally:
+                self._prioritize_queue.task_done()
+
+    def _finish_priority(self, job_state):
+        if self.finish_priority == FINISH_PRIORITY_FIFO:
+            return 0
+        try:
+            job_wrapper = job_state.job_wrapper
+            if self.finish_priority == FINISH_PRIORITY_FEWEST_OUTPUTS_FIRST:
+                return len(job_wrapper.get_output_fnames())
+            size = 0
+            for dataset_path in job_wrapper.get_output_fnames():
+                for path in (dataset_path.false_path, dataset_path.real_path):
+                    if path and os.path.exists(path):
+                        size += os.path.getsize(path)
+                        break
+            return size
+        except Exception:
+            log.debug("Unable to determine finish priority, using default priority", exc_info=True)
+            return 0
@@ -21,7 +21,15 @@ def do_split(job_wrapper):
     return multi.do_split(job_wrapper)
 
 
-def do_merge(job_wrapper, task_wrappers):
+class IncrementalMerger(multi.IncrementalMerger):
+
+    def __init__(self, job_wrapper):
+        # add in the missing information for merging the one output
+        set_basic_defaults(job_wrapper)
+        super().__init__(job_wrapper)
+
+
+def do_merge(job_wrapper, task_wrappers, merger=None):
     # add in the missing information for splitting the one input and merging the one output
     set_basic_defaults(job_wrapper)
-    return multi.do_merge(job_wrapper, task_wrappers)
+    return multi.do_merge(job_wrapper, task_wrappers, merger=merger)
@@ -3,6 +3,8 @@ import os
 import shutil
 
 from galaxy import model, util
+from galaxy.datatypes.data import Data
+from galaxy.datatypes.util.merge import concatenate_files
 from galaxy.util.getargspec import getfullargspec
 
 
@@ -108,7 +110,7 @@ def do_split(job_wrapper):
     return tasks
 
 
-def do_merge(job_wrapper, task_wrappers):
+def _get_merge_outputs(job_wrapper):
     parallel_settings = job_wrapper.get_parallelism().attributes
     # Syntax: merge_outputs="export" pickone_outputs="genomesize"
     # Designates outputs to be merged, or selected from as a representative
@@ -122,6 +124,69 @@ def do_merge(job_wrapper, task_wrappers):
         pickone_outputs = []
     else:
         pickone_outputs = [x.strip() for x in pickone_outputs.split(",")]
+    return merge_outputs, pickone_outputs
+
+
+class IncrementalMerger:
+    """
+    Merge the outputs of tasks while later tasks are still running.
+
+    Outputs whose datatype merges by concatenation (the default
+    ``Data.merge``) are appended to, in task order, as soon as a task and all
+    tasks before it finished. ``do_merge`` merges the remaining parts and the
+    outputs of all other datatypes once all tasks are complete.
+    """
+
+    def __init__(self, job_wrapper):
+        self.job_wrapper = job_wrapper
+        # Task outputs are only readable once ownership of the working directory is reclaimed
+        self.enabled = job_wrapper.get_destination_configuration("external_chown_script", None) is None
+        self.merged_tasks = 0
+        # Output name -> absolute paths of the parts appended so far
+        self.merged_files = {}
+        self._outputs = None
+
+    def _get_outputs(self):
+        if self._outputs is None:
+            merge_outputs, pickone_outputs = _get_merge_outputs(self.job_wrapper)
+            outputs = self.job_wrapper.get_output_hdas_and_fnames()
+            output_paths = self.job_wrapper.get_output_fnames()
+            self._outputs = []
+            for index, output in enumerate(outputs):
+                if output in merge_outputs and output not in pickone_outputs:
+                    if outputs[output][0].datatype.merge is Data.merge:
+                        self._outputs.append((output, str(output_paths[index])))
+        return self._outputs
+
+    def update(self, task_wrappers):
+        """Merge the outputs of the tasks finished (in order) since the last update."""
+        if not self.enabled:
+            return
+        finished = self.merged_tasks
+        while finished < len(task_wrappers) and task_wrappers[finished].get_state() == model.Task.states.OK:
+            finished += 1
+        if finished == self.merged_tasks:
+            return
+        try:
+            for output, output_file_name in self._get_outputs():
+                base_output_name = os.path.basename(output_file_name)
+                parts = [os.path.abspath(os.path.join(tw.working_directory, base_output_name)) for tw in task_wrappers[self.merged_tasks:finished]]
+                parts = [f for f in parts if os.path.exists(f)]
+                if parts:
+                    merged_files = self.merged_files.setdefault(output, [])
+                    concatenate_files(parts, output_file_name, append=bool(merged_files))
+                    merged_files.extend(parts)
+        except Exception:
+            log.exception("Merging outputs of finished tasks failed, merging all outputs once the job is complete")
+            self.enabled = False
+            self.merged_files = {}
+            return
+        log.debug('merged outputs of tasks %d to %d' % (self.merged_tasks, finished - 1))
+        self.merged_tasks = finished
+
+
+def do_merge(job_wrapper, task_wrappers, merger=None):
+    merge_outputs, pickone_outputs = _get_merge_outputs(job_wrapper)
 
     illegal_outputs = [x for x in merge_outputs if x in pickone_outputs]
     if len(illegal_outputs) > 0:
@@ -150,18 +215,24 @@ def do_merge(job_wrapper, task_wrappers):
                 # Just include those files f in the output list for which the
                 # file f exists; some files may not exist if a task fails.
                 output_files = [f for f in output_files if os.path.exists(f)]
+                merged_files = merger.merged_files.get(output, []) if merger and merger.enabled else []
                 if output_files:
                     log.debug('files %s ' % output_files)
                     if len(output_files) < len(task_dirs):
                         log.debug('merging only %i out of expected %i files for %s'
                                   % (len(output_files), len(task_dirs), output_file_name))
-                    # First two args to merge always output_files and path of dataset. More
-                    # complicated merge methods may require more parameters. Set those up here.
-                    extra_merge_arg_names = getfullargspec(output_type.merge).args[2:]
-                    extra_merge_args = {}
-                    if "output_dataset" in extra_merge_arg_names:
-                        extra_merge_args["output_dataset"] = output_dataset
-                    output_type.merge(output_files, output_file_name, **extra_merge_args)
+                    if merged_files:
+                        # Append the parts not merged while the tasks were running
+                        output_files = [f for f in output_files if os.path.abspath(f) not in merged_files]
+                        concatenate_files(output_files, output_file_name, append=True)
+                    else:
+                        # First two args to merge always output_files and path of dataset. More
+                        # complicated merge methods may require more parameters. Set those up here.
+                        extra_merge_arg_names = getfullargspec(output_type.merge).args[2:]
+                        extra_merge_args = {}
+                        if "output_dataset" in extra_merge_arg_names:
+                            extra_merge_args["output_dataset"] = output_dataset
+                        output_type.merge(output_files, output_file_name, **extra_merge_args)
                     log.debug('merge finished: %s' % output_file_name)
                 else:
                     msg = 'nothing to merge for %s (expected %i files)' \
@@ -16,6 +16,7 @@ from galaxy.managers.collections import DatasetCollectionManager
 from galaxy.managers.datasets import DatasetManager
 from galaxy.managers.hdas import HDAManager
 from galaxy.managers.lddas import LDDAManager
+from galaxy.model.job_equivalence import equivalence_hash
 from galaxy.util import (
     defaultdict,
     ExecutionTimer,
@@ -113,6 +114,14 @@ class JobSearch:
             return key, value
 
         wildcard_param_dump = remap(param_dump, visit=populate_input_data_input_id)
+        job_hash = self.__equivalence_hash(tool_id, tool_version, param_dump, input_data)
+        if job_hash is not None:
+            job = self.__search_by_hash(job_hash, user, job_state)
+            if job is not None:
+                return job
+        # Jobs without a hash (e.g. jobs still running) and jobs whose stored hash
+        # is computed from parameters that differ from the request in form only
+        # are found by their parameters and inputs.
         return self.__search(tool_id=tool_id,
                              tool_version=tool_version,
                              user=user,
@@ -121,29 +130,23 @@ class JobSearch:
                              param_dump=param_dump,
                              wildcard_param_dump=wildcard_param_dump)
 
-    def __search(self, tool_id, tool_version, user, input_data, job_state=None, param_dump=None, wildcard_param_dump=None):
-        search_timer = ExecutionTimer()
-
-        def replace_dataset_ids(path, key, value):
-            """Exchanges dataset_ids (HDA, LDA, HDCA, not Dataset) in param_dump with dataset ids used in job."""
-            if key == 'id':
-                current_case = param_dump
-                for p in path:
-                    current_case = current_case[p]
-                src = current_case['src']
-                value = job_input_ids[src][value]
-                return key, value
-            return key, value
-
+    def __equivalence_hash(self, tool_id, tool_version, param_dump, input_data):
+        identifiers = {}
+        for path_key, input_list in input_data.items():
+            input_identifiers = [type_values['identifier'] for type_values in input_list if type_values['identifier'] is not None]
+            if len(input_identifiers) > 1:
+                # Can't tell which job parameter the identifiers of a multiple input are recorded as
+                return None
+            elif input_identifiers:
+                identifiers[path_key] = input_identifiers[0]
+        return equivalence_hash(self.sa_session, tool_id, tool_version, param_dump, identifiers)
+
+    def __job_conditions(self, user, job_state):
         job_conditions = [and_(
-            model.Job.tool_id == tool_id,
             model.Job.user == user,
             model.Job.copied_from_job_id.is_(None)  # Always pick original job
         )]
 
-        if tool_version:
-            job_conditions.append(model.Job.tool_version == str(tool_version))
-
         if job_state is None:
             job_conditions.append(
                 model.Job.state.in_([model.Job.states.NEW,
@@ -162,6 +165,40 @@ class JobSearch:
                 job_conditions.append(
                     or_(*o)
                 )
+        return job_conditions
+
+    def __search_by_hash(self, job_hash, user, job_state=None):
+        search_timer = ExecutionTimer()
+        job_conditions = self.__job_conditions(user, job_state)
+        job_conditions.extend([
+            model.Job.equivalence_hash == job_hash,
+            model.Job.any_output_dataset_collection_instances_deleted == false(),
+            model.Job.any_output_dataset_deleted == false(),
+        ])
+        job = self.sa_session.query(model.Job).filter(*job_conditions).order_by(model.Job.id.desc()).first()
+        if job is not None:
+            log.info("Found equivalent job by hash %s", search_timer)
+        return job
+
+    def __search(self, tool_id, tool_version, user, input_data, job_state=None, param_dump=None, wildcard_param_dump=None):
+        search_timer = ExecutionTimer()
+
+        def replace_dataset_ids(path, key, value):
+            """Exchanges dataset_ids (HDA, LDA, HDCA, not Dataset) in param_dump with dataset ids used in job."""
+            if key == 'id':
+                current_case = param_dump
+                for p in path:
+                    current_case = current_case[p]
+                src = current_case['src']
+                value = job_input_ids[src][value]
+                return key, value
+            return key, value
+
+        job_conditions = self.__job_conditions(user, job_state)
+        job_conditions.append(model.Job.tool_id == tool_id)
+
+        if tool_version:
+            job_conditions.append(model.Job.tool_version == str(tool_version))
 
         for k, v in wildcard_param_dump.items():
             wildcard_value = None
@@ -355,6 +355,7 @@ class JobLike:
 
 class User(Dictifiable, RepresentById):
     use_pbkdf2 = True
+    use_disk_usage_ledger = False
     """
     Data for a Galaxy user or admin and relations to their
     histories, credentials, and roles.
@@ -489,10 +490,25 @@ class User(Dictifiable, RepresentById):
         rval = 0
         if self.disk_usage is not None:
             rval = self.disk_usage
+        if self.use_disk_usage_ledger:
+            rval += self.get_pending_disk_usage()
         if nice_size:
             rval = galaxy.util.nice_size(rval)
         return rval
 
+    def get_pending_disk_usage(self):
+        """
+        Return the sum of the changes of the disk usage recorded in the disk
+        usage ledger that have not been applied yet.
+        """
+        sa_session = object_session(self)
+        if sa_session is None or self.id is None:
+            return 0
+        delta_table = UserDiskUsageDelta.table
+        return int(sa_session.scalar(
+            select([func.coalesce(func.sum(delta_table.c.delta), 0)]).where(delta_table.c.user_id == self.id)
+        ))
+
     def set_disk_usage(self, bytes):
         """
         Manually set the disk space used by a user to `bytes`.
@@ -503,6 +519,12 @@ class User(Dictifiable, RepresentById):
 
     def adjust_total_disk_usage(self, amount):
         if amount != 0:
+            if self.use_disk_usage_ledger:
+                sa_session = object_session(self)
+                if sa_session is not None:
+                    # Applied in batches by galaxy.model.disk_usage.DiskUsageLedger
+                    sa_session.add(UserDiskUsageDelta(self, amount))
+                    return
             self.disk_usage = func.coalesce(self.table.c.disk_usage, 0) + amount
 
     @property
@@ -552,9 +574,15 @@ class User(Dictifiable, RepresentById):
                 AND library_dataset_dataset_association.id IS NULL
         """
         sa_session = object_session(self)
+        delta_table = UserDiskUsageDelta.table
+        if not dryrun and self.use_disk_usage_ledger:
+            max_delta_id = sa_session.scalar(select([func.max(delta_table.c.id)]).where(delta_table.c.user_id == self.id))
         usage = sa_session.scalar(sql_calc, {'id': self.id})
         if not dryrun:
             self.set_disk_usage(usage)
+            if self.use_disk_usage_ledger and max_delta_id is not None:
+                # The changes recorded so far are part of the new value
+                sa_session.execute(delta_table.delete().where(and_(delta_table.c.user_id == self.id, delta_table.c.id <= max_delta_id)))
             sa_session.flush()
         return usage
 
@@ -612,6 +640,14 @@ class User(Dictifiable, RepresentById):
         return True
 
 
+class UserDiskUsageDelta:
+    """A change of the disk usage of a user not yet applied to the user's disk usage."""
+
+    def __init__(self, user, delta):
+        self.user = user
+        self.delta = delta
+
+
 class PasswordResetToken:
     def __init__(self, user, token=None):
         if token:
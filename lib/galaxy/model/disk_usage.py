@@ -0,0 +1,269 @@
+"""
+Accounting of the disk usage of users.
+
+With the disk usage ledger enabled (``enable_disk_usage_ledger``), changes of
+a user's disk usage (new, copied and purged datasets) are recorded as rows of
+``user_disk_usage_delta`` instead of updating the ``galaxy_user`` row, and
+applied to ``galaxy_user.disk_usage`` in batches by :class:`DiskUsageLedger`.
+
+The disk usage of all users can be recalculated from the datasets they own
+with :func:`recalculate_disk_usage`, a batch of users per query, and
+recorded usage checked against the datasets for a sample of users with
+:func:`find_disk_usage_drift`.
+"""
+import logging
+import threading
+from collections import defaultdict
+
+from sqlalchemy import (
+    bindparam,
+    column,
+    func,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.exc import OperationalError
+
+log = logging.getLogger(__name__)
+
+DEFAULT_APPLY_INTERVAL = 30
+DEFAULT_BATCH_SIZE = 1000
+# Attempts to recalculate a batch of users whose deltas are applied concurrently
+RECALCULATE_ATTEMPTS = 3
+
+# Disk usage of the users with :user_ids (users without datasets are missing),
+# counting each dataset once per user and leaving out datasets in libraries -
+# the set based variant of the query in User._calculate_or_set_disk_usage.
+CALCULATE_DISK_USAGE_SQL = text("""
+    WITH per_user_datasets AS
+    (
+        SELECT DISTINCT history.user_id AS user_id, history_dataset_association.dataset_id AS dataset_id
+        FROM history
+        JOIN history_dataset_association ON history_dataset_association.history_id = history.id
+        WHERE history.user_id IN :user_ids
+            AND NOT history.purged
+            AND NOT history_dataset_association.purged
+    )
+    SELECT per_user_datasets.user_id, SUM(COALESCE(dataset.total_size, dataset.file_size, 0))
+    FROM per_user_datasets
+    JOIN dataset ON dataset.id = per_user_datasets.dataset_id
+    LEFT OUTER JOIN library_dataset_dataset_association ON dataset.id = library_dataset_dataset_association.dataset_id
+    WHERE library_dataset_dataset_association.id IS NULL
+    GROUP BY per_user_datasets.user_id
+""").bindparams(bindparam('user_ids', expanding=True))
+PENDING_DELTAS_SQL = text("""
+    SELECT user_id, SUM(delta)
+    FROM user_disk_usage_delta
+    WHERE user_id IN :user_ids
+    GROUP BY user_id
+""").bindparams(bindparam('user_ids', expanding=True))
+PENDING_DELTA_IDS_SQL = text("""
+    SELECT id FROM user_disk_usage_delta WHERE user_id IN :user_ids
+""").bindparams(bindparam('user_ids', expanding=True))
+DELETE_DELTAS_SQL = text("""
+    DELETE FROM user_disk_usage_delta WHERE id IN :ids
+""").bindparams(bindparam('ids', expanding=True))
+ADJUST_DISK_USAGE_SQL = text("""
+    UPDATE galaxy_user SET disk_usage = COALESCE(disk_usage, 0) + :delta WHERE id = :user_id
+""")
+SET_DISK_USAGE_SQL = text("""
+    UPDATE galaxy_user SET disk_usage = :usage WHERE id = :user_id
+""")
+
+
+def apply_disk_usage_deltas(engine, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Apply the oldest ``batch_size`` deltas of the ledger to the disk usage of
+    their users. Return the number of deltas applied.
+
+    Deltas are deleted and applied in one transaction. If another process
+    applies the same deltas concurrently, the deletion removes fewer rows than
+    selected and the transaction is rolled back, so every delta is applied
+    exactly once.
+    """
+    with engine.connect() as connection:
+        with connection.begin() as transaction:
+            rows = connection.execute(
+                text("SELECT id, user_id, delta FROM user_disk_usage_delta ORDER BY id LIMIT :limit"), limit=batch_size
+            ).fetchall()
+            if not rows:
+                return 0
+            deleted = connection.execute(DELETE_DELTAS_SQL, ids=[row[0] for row in rows]).rowcount
+            if deleted != len(rows):
+                log.debug("Disk usage deltas applied concurrently, retrying")
+                transaction.rollback()
+                return 0
+            per_user = defaultdict(int)
+            for _, user_id, delta in rows:
+                per_user[user_id] += delta
+            connection.execute(ADJUST_DISK_USAGE_SQL, [{'user_id': user_id, 'delta': delta} for user_id, delta in per_user.items() if delta])
+    return len(rows)
+
+
+def _user_batches(connection, user_ids, commit_size):
+    """Yield lists of (user id, recorded disk usage) of at most ``commit_size`` users, in order of their ids."""
+    if user_ids is not None:
+        user_ids = sorted(user_ids)
+        for i in range(0, len(user_ids), commit_size):
+            chunk = user_ids[i:i + commit_size]
+            yield connection.execute(
+                text("SELECT id, disk_usage FROM galaxy_user WHERE id IN :ids ORDER BY id").bindparams(bindparam('ids', expanding=True)),
+                ids=chunk,
+            ).fetchall()
+        return
+    last_id = 0
+    while True:
+        users = connection.execute(
+            text("SELECT id, disk_usage FROM galaxy_user WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            last_id=last_id, limit=commit_size,
+        ).fetchall()
+        if not users:
+            return
+        yield users
+        last_id = users[-1][0]
+
+
+def _usage(connection, users):
+    rows = connection.execute(CALCULATE_DISK_USAGE_SQL, user_ids=[user_id for user_id, _ in users])
+    return {user_id: int(usage or 0) for user_id, usage in rows}
+
+
+def _pending(connection, user_ids):
+    return {user_id: int(delta) for user_id, delta in connection.execute(PENDING_DELTAS_SQL, user_ids=user_ids)}
+
+
+def _snapshot_connection(connection):
+    """
+    Return ``connection`` reading all statements of a transaction from one
+    snapshot of the database. In READ COMMITTED, the default of PostgreSQL,
+    every statement reads from a new snapshot.
+    """
+    if connection.dialect.name in ('postgresql', 'mysql'):
+        return connection.execution_options(isolation_level='REPEATABLE READ')
+    return connection
+
+
+def _recalculate_batch(connection, users, dryrun):
+    """
+    Recalculate the disk usage of ``users`` in one transaction, return the
+    list of changes or None if deltas of the users were applied concurrently.
+
+    The datasets and the pending deltas are read from the same snapshot, so the
+    deltas dropped are exactly the ones already counted in the new usage.
+    Deltas recorded after the snapshot stay in the ledger.
+    """
+    with connection.begin() as transaction:
+        usage = _usage(connection, users)
+        delta_ids = [row[0] for row in connection.execute(PENDING_DELTA_IDS_SQL, user_ids=[user_id for user_id, _ in users])]
+        changed = []
+        for user_id, old_usage in users:
+            new_usage = usage.get(user_id, 0)
+            if old_usage is None or int(old_usage) != new_usage:
+                changed.append((user_id, int(old_usage or 0), new_usage))
+        if not dryrun:
+            if delta_ids and connection.execute(DELETE_DELTAS_SQL, ids=delta_ids).rowcount != len(delta_ids):
+                transaction.rollback()
+                return None
+            if changed:
+                connection.execute(SET_DISK_USAGE_SQL, [{'user_id': user_id, 'usage': new_usage} for user_id, _, new_usage in changed])
+    return changed
+
+
+def recalculate_disk_usage(engine, user_ids=None, commit_size=DEFAULT_BATCH_SIZE, dryrun=False):
+    """
+    Recalculate the disk usage of the users with ``user_ids`` (all users if
+    None) from their datasets, ``commit_size`` users per query and transaction.
+    Pending deltas of the ledger are dropped for the users recalculated.
+
+    Yield ``(user_id, old_usage, new_usage)`` for every user whose recorded
+    disk usage changes.
+    """
+    with engine.connect() as connection:
+        connection = _snapshot_connection(connection)
+        for users in _user_batches(connection, user_ids, commit_size):
+            if not users:
+                continue
+            for attempt in range(RECALCULATE_ATTEMPTS):
+                try:
+                    changed = _recalculate_batch(connection, users, dryrun)
+                except OperationalError:
+                    # A serialization failure, deltas or the users were updated concurrently
+                    if attempt == RECALCULATE_ATTEMPTS - 1:
+                        raise
+                    changed = None
+                if changed is not None:
+                    break
+                log.debug("Disk usage deltas applied concurrently, retrying")
+                users = next(_user_batches(connection, [user_id for user_id, _ in users], len(users)))
+            else:
+                raise Exception("Disk usage deltas of users %s applied concurrently" % [user_id for user_id, _ in users])
+            yield from changed
+
+
+def find_disk_usage_drift(engine, user_ids=None, sample_size=100):
+    """
+    Compare the recorded disk usage (including pending deltas) of the users
+    with ``user_ids``, or of ``sample_size`` randomly chosen users, with the
+    disk usage calculated from their datasets. Return a list of
+    ``(user_id, recorded_usage, actual_usage)`` for the users that differ.
+    """
+    with engine.connect() as connection:
+        if user_ids is None:
+            # func.random() is rendered as rand() on MySQL
+            user_ids = [row[0] for row in connection.execute(
+                select([column('id')]).select_from(table('galaxy_user')).order_by(func.random()).limit(sample_size))]
+        drift = []
+        for users in _user_batches(connection, user_ids, DEFAULT_BATCH_SIZE):
+            if not users:
+                continue
+            usage = _usage(connection, users)
+            pending = _pending(connection, [user_id for user_id, _ in users])
+            for user_id, recorded in users:
+                recorded = int(recorded or 0) + pending.get(user_id, 0)
+                actual = usage.get(user_id, 0)
+                if recorded != actual:
+                    drift.append((user_id, recorded, actual))
+    return drift
+
+
+class DiskUsageLedger:
+    """Apply the deltas of the disk usage ledger every ``apply_interval`` seconds."""
+
+    def __init__(self, model, apply_interval=DEFAULT_APPLY_INTERVAL, batch_size=DEFAULT_BATCH_SIZE):
+        self.model = model
+        self.apply_interval = apply_interval
+        self.batch_size = batch_size
+        self.exit = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.monitor, name="DiskUsageLedger.monitor_thread")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def apply(self):
+        """Apply all deltas recorded so far, return the number of deltas applied."""
+        applied = 0
+        while True:
+            count = apply_disk_usage_deltas(self.model.engine, batch_size=self.batch_size)
+            applied += count
+            if count < self.batch_size:
+                return applied
+
+    def monitor(self):
+        while not self.exit.is_set():
+            try:
+                applied = self.apply()
+                if applied:
+                    log.debug("Applied %d disk usage deltas", applied)
+            except Exception:
+                log.exception("Failed to apply disk usage deltas")
+            self.exit.wait(self.apply_interval)
+
+    def shutdown(self):
+        self.exit.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
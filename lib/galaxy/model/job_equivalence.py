@@ -0,0 +1,123 @@
+"""
+Hashes identifying equivalent jobs, to find jobs to reuse with ``use_cached_job``.
+
+When a job finishes successfully, a hash of its tool, tool version,
+parameters and inputs is recorded in ``job.equivalence_hash``. Running the
+same tool with the same parameters on the same data gives the same hash, so
+an equivalent job is found with an indexed equality query (see
+:class:`galaxy.managers.jobs.JobSearch`).
+
+Inputs are hashed by content rather than by id: a dataset by its underlying
+dataset, name, extension and metadata, so that copies of the inputs (e.g. in
+another history) match. Parameters that don't change the outputs of a job
+(``chromInfo``, ``dbkey`` and those starting with ``__``) are left out.
+
+Jobs run before the hash was introduced can be hashed with
+``scripts/set_job_equivalence_hashes.py``.
+"""
+import hashlib
+import json
+import logging
+
+from galaxy import model
+from galaxy.model.metadata import FileParameter
+
+log = logging.getLogger(__name__)
+
+IDENTIFIER_SUFFIX = "|__identifier__"
+# Set by tool actions rather than by users and not affecting outputs, see JobSearch
+IGNORED_PARAMETERS = {"chromInfo", "dbkey"}
+RUNTIME_VALUE = {"__class__": "RuntimeValue"}
+
+
+class UnhashableJob(Exception):
+    """Raised for parameters or inputs an equivalence hash can't be computed for."""
+
+
+def _metadata_key(hda):
+    """
+    The metadata of ``hda`` with default values filled in. Metadata files are
+    left out, they are derived from the dataset and copied with new ids.
+    """
+    metadata = hda._metadata or {}
+    return {name: metadata.get(name, spec.default) for name, spec in hda.datatype.metadata_spec.items()
+            if not isinstance(spec.param, FileParameter)}
+
+
+def _input_key(sa_session, src, id):
+    """Describe the content of the input ``src`` (hda, ldda, hdca or dce) with ``id``."""
+    if src == "hda":
+        hda = sa_session.query(model.HistoryDatasetAssociation).get(id)
+        if hda is not None:
+            return [src, hda.dataset_id, hda.name, hda.extension, _metadata_key(hda)]
+    elif src == "ldda":
+        return [src, id]
+    elif src == "hdca":
+        hdca = sa_session.query(model.HistoryDatasetCollectionAssociation).get(id)
+        if hdca is not None:
+            return [src, hdca.collection_id, hdca.name]
+    elif src == "dce":
+        dce = sa_session.query(model.DatasetCollectionElement).get(id)
+        if dce is not None and dce.child_collection_id is not None:
+            return [src, dce.child_collection_id, dce.element_identifier]
+    raise UnhashableJob(f"Cannot hash input {src} {id}")
+
+
+def _normalize(sa_session, value):
+    if value == RUNTIME_VALUE:
+        return None
+    if isinstance(value, dict):
+        if "src" in value and "id" in value:
+            value = dict(value, id=_input_key(sa_session, value["src"], value["id"]))
+        return {k: _normalize(sa_session, v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize(sa_session, v) for v in value]
+    return value
+
+
+def equivalence_hash(sa_session, tool_id, tool_version, params, identifiers=None):
+    """
+    Return the equivalence hash of jobs of ``tool_id`` at ``tool_version`` run
+    with ``params``, a dictionary of JSON decoded parameter values as
+    produced by ``params_to_strings(..., nested=True)``, and with the
+    ``identifiers`` of the collection elements used as inputs, a dictionary
+    of input names to element identifiers. Return None if the parameters or
+    inputs can't be hashed.
+    """
+    try:
+        parameters = {}
+        for name, value in params.items():
+            if name.startswith("__") or name in IGNORED_PARAMETERS or name.endswith(IDENTIFIER_SUFFIX):
+                continue
+            parameters[name] = _normalize(sa_session, value)
+        description = json.dumps({
+            "tool_id": tool_id,
+            "tool_version": str(tool_version),
+            "parameters": parameters,
+            "identifiers": identifiers or {},
+        }, sort_keys=True, default=str)
+    except UnhashableJob as e:
+        log.debug("Not hashing job of tool %s: %s", tool_id, e)
+        return None
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+
+def job_equivalence_hash(sa_session, job):
+    """Return the equivalence hash of the finished ``job``, or None if it can't be hashed."""
+    for assoc in job.input_datasets:
+        dataset = assoc.dataset
+        if dataset is not None and assoc.dataset_version not in (0, dataset.version):
+            # The input changed since the job was run
+            return None
+    params = {}
+    identifiers = {}
+    for parameter in job.parameters:
+        try:
+            value = json.loads(parameter.value)
+        except (TypeError, ValueError):
+            return None
+        if parameter.name.endswith(IDENTIFIER_SUFFIX):
+            identifiers[parameter.name[:-len(IDENTIFIER_SUFFIX)]] = value
+        else:
+            params[parameter.name] = value
+    return equivalence_hash(sa_session, job.tool_id, job.tool_version, params, identifiers)
@@ -79,6 +79,13 @@ model.User.table = Table(
     Column("active", Boolean, index=True, default=True, nullable=False),
     Column("activation_token", TrimmedString(64), nullable=True, index=True))
 
+model.UserDiskUsageDelta.table = Table(
+    "user_disk_usage_delta", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("create_time", DateTime, default=now),
+    Column("user_id", Integer, ForeignKey("galaxy_user.id"), index=True, nullable=False),
+    Column("delta", Numeric(15, 0), nullable=False))
+
 model.UserAddress.table = Table(
     "user_address", metadata,
     Column("id", Integer, primary_key=True),
@@ -623,7 +630,8 @@ model.Job.table = Table(
     Column("object_store_id", TrimmedString(255), index=True),
     Column("imported", Boolean, default=False, index=True),
     Column("params", TrimmedString(255), index=True),
-    Column("handler", TrimmedString(255), index=True))
+    Column("handler", TrimmedString(255), index=True),
+    Column("equivalence_hash", String(64), index=True))
 
 model.JobStateHistory.table = Table(
     "job_state_history", metadata,
@@ -1918,6 +1926,9 @@ mapper(model.User, model.User.table, properties=dict(
 mapper(model.PasswordResetToken, model.PasswordResetToken.table,
        properties=dict(user=relation(model.User, backref="reset_tokens")))
 
+mapper(model.UserDiskUsageDelta, model.UserDiskUsageDelta.table,
+       properties=dict(user=relation(model.User)))
+
 
 # Set up proxy so that this syntax is possible:
 # <user_obj>.preferences[pref_name] = pref_value
@@ -2821,19 +2832,23 @@ def db_next_hid(self, n=1):
     """
     session = object_session(self)
     table = self.table
-    trans = session.begin()
+    # The counter is updated in a transaction of its own, on a connection rather
+    # than with session.begin(), which would flush every pending object of the
+    # session - notably datasets waiting for the hids being allocated here.
+    in_transaction = session.transaction is not None
+    conn = session.connection()
     try:
-        if "postgres" not in session.bind.dialect.name:
-            next_hid = select([table.c.hid_counter], table.c.id == model.cached_id(self)).with_for_update().scalar()
-            table.update(table.c.id == self.id).execute(hid_counter=(next_hid + n))
-        else:
-            stmt = table.update().where(table.c.id == model.cached_id(self)).values(hid_counter=(table.c.hid_counter + n)).returning(table.c.hid_counter)
-            next_hid = session.execute(stmt).scalar() - n
-        trans.commit()
+        with conn.begin():
+            if "postgres" not in session.bind.dialect.name:
+                next_hid = conn.execute(select([table.c.hid_counter], table.c.id == model.cached_id(self)).with_for_update()).scalar()
+                conn.execute(table.update().where(table.c.id == self.id).values(hid_counter=(next_hid + n)))
+            else:
+                stmt = table.update().where(table.c.id == model.cached_id(self)).values(hid_counter=(table.c.hid_counter + n)).returning(table.c.hid_counter)
+                next_hid = conn.execute(stmt).scalar() - n
         return next_hid
-    except Exception:
-        trans.rollback()
-        raise
+    finally:
+        if not in_transaction:
+            conn.close()
 
 
 model.History._next_hid = db_next_hid
@@ -2852,7 +2867,7 @@ model.WorkflowInvocation.update = _workflow_invocation_update
 
 def init(file_path, url, engine_options=None, create_tables=False, map_install_models=False,
         database_query_profiling_proxy=False, object_store=None, trace_logger=None, use_pbkdf2=True,
-        slow_query_log_threshold=0, thread_local_log=None, log_query_counts=False):
+        slow_query_log_threshold=0, thread_local_log=None, log_query_counts=False, use_disk_usage_ledger=False):
     """Connect mappings to the database"""
     if engine_options is None:
         engine_options = {}
@@ -2862,6 +2877,8 @@ def init(file_path, url, engine_options=None, create_tables=False, map_install_m
     model.Dataset.object_store = object_store
     # Use PBKDF2 password hashing?
     model.User.use_pbkdf2 = use_pbkdf2
+    # Record changes of disk usage in the ledger?
+    model.User.use_disk_usage_ledger = use_disk_usage_ledger
     # Load the appropriate db module
     engine = build_engine(url, engine_options, database_query_profiling_proxy, trace_logger, slow_query_log_threshold, thread_local_log=thread_local_log, log_query_counts=log_query_counts)
 
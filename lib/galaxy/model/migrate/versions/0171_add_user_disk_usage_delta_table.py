@@ -0,0 +1,49 @@
+"""
+Add table for the disk usage ledger recording changes of users' disk usage
+"""
+
+import logging
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    MetaData,
+    Numeric,
+    Table,
+)
+
+from galaxy.model.migrate.versions.util import (
+    create_table,
+    drop_table
+)
+from galaxy.model.orm.now import now
+
+log = logging.getLogger(__name__)
+metadata = MetaData()
+
+
+UserDiskUsageDelta_table = Table(
+    'user_disk_usage_delta',
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("create_time", DateTime, default=now),
+    Column("user_id", Integer, ForeignKey("galaxy_user.id"), index=True, nullable=False),
+    Column("delta", Numeric(15, 0), nullable=False),
+)
+
+
+def upgrade(migrate_engine):
+    print(__doc__)
+    metadata.bind = migrate_engine
+    metadata.reflect()
+
+    create_table(UserDiskUsageDelta_table)
+
+
+def downgrade(migrate_engine):
+    metadata.bind = migrate_engine
+    metadata.reflect()
+
+    drop_table(UserDiskUsageDelta_table)
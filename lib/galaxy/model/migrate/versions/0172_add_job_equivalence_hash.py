@@ -0,0 +1,35 @@
+"""
+Migration script to add an indexed 'equivalence_hash' column to the 'job' table,
+used to find equivalent jobs when running tools with use_cached_job.
+"""
+
+import logging
+
+from sqlalchemy import Column, MetaData, String
+
+from galaxy.model.migrate.versions.util import (
+    add_column,
+    add_index,
+    drop_column,
+    drop_index
+)
+
+log = logging.getLogger(__name__)
+metadata = MetaData()
+
+
+def upgrade(migrate_engine):
+    print(__doc__)
+    metadata.bind = migrate_engine
+    metadata.reflect()
+
+    add_column(Column("equivalence_hash", String(64)), "job", metadata)
+    add_index("ix_job_equivalence_hash", "job", "equivalence_hash", metadata)
+
+
+def downgrade(migrate_engine):
+    metadata.bind = migrate_engine
+    metadata.reflect()
+
+    drop_index("ix_job_equivalence_hash", "job", "equivalence_hash", metadata)
+    drop_column("equivalence_hash", "job", metadata)
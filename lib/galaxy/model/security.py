@@ -807,22 +807,22 @@ class GalaxyRBACAgent(RBACAgent):
                 permissions[action] = [dhp.role]
         return permissions
 
+    def _has_dataset_manage_permissions(self, permissions):
+        for action, roles in permissions.items():
+            if isinstance(action, Action):
+                if action == self.permitted_actions.DATASET_MANAGE_PERMISSIONS and roles:
+                    return True
+            elif action == self.permitted_actions.DATASET_MANAGE_PERMISSIONS.action and roles:
+                return True
+        return False
+
     def set_all_dataset_permissions(self, dataset, permissions={}, new=False, flush=True):
         """
         Set new full permissions on a dataset, eliminating all current permissions.
         Permission looks like: { Action : [ Role, Role ] }
         """
         # Make sure that DATASET_MANAGE_PERMISSIONS is associated with at least 1 role
-        has_dataset_manage_permissions = False
-        for action, roles in permissions.items():
-            if isinstance(action, Action):
-                if action == self.permitted_actions.DATASET_MANAGE_PERMISSIONS and roles:
-                    has_dataset_manage_permissions = True
-                    break
-            elif action == self.permitted_actions.DATASET_MANAGE_PERMISSIONS.action and roles:
-                has_dataset_manage_permissions = True
-                break
-        if not has_dataset_manage_permissions:
+        if not self._has_dataset_manage_permissions(permissions):
             return "At least 1 role must be associated with manage permissions on this dataset."
         flush_needed = False
         # Delete all of the current permissions on the dataset
@@ -846,6 +846,29 @@ class GalaxyRBACAgent(RBACAgent):
             self.sa_session.flush()
         return ""
 
+    def set_new_datasets_permissions(self, datasets_and_permissions):
+        """
+        Set the permissions of many new, flushed datasets with a single multi-row
+        insert. ``datasets_and_permissions`` is a list of (dataset, permissions)
+        pairs, permissions look like: { Action : [ Role, Role ] }. As with
+        set_all_dataset_permissions(), permissions without a role for
+        DATASET_MANAGE_PERMISSIONS are not set.
+        """
+        rows = []
+        for dataset, permissions in datasets_and_permissions:
+            if not self._has_dataset_manage_permissions(permissions):
+                continue
+            # The permissions are not added through the ORM, make sure they are loaded from the database if needed
+            self.sa_session.expire(dataset, ["actions"])
+            for action, roles in permissions.items():
+                if isinstance(action, Action):
+                    action = action.action
+                for role in roles:
+                    role_id = role.id if hasattr(role, "id") else role
+                    rows.append(dict(action=action, dataset_id=galaxy.model.cached_id(dataset), role_id=role_id))
+        if rows:
+            self.sa_session.execute(self.model.DatasetPermissions.table.insert(), rows)
+
     def set_dataset_permission(self, dataset, permission={}):
         """
         Set a specific permission on a dataset, leaving all other current permissions on the dataset alone.
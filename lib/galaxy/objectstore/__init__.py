@@ -21,6 +21,7 @@ from galaxy.util import (
     directory_hash_id,
     force_symlink,
     parse_xml,
+    size_to_bytes,
     umask_fix_perms,
 )
 from galaxy.util.bunch import Bunch
@@ -29,6 +30,13 @@ from galaxy.util.path import (
     safe_relpath,
 )
 from galaxy.util.sleeper import Sleeper
+from .locations import LocationIndex
+from .placement import (
+    DEFAULT_REFRESH_INTERVAL,
+    DEFAULT_RESERVATION_TTL,
+    DEFAULT_RESERVE_SIZE,
+    PlacementEngine,
+)
 
 NO_SESSION_ERROR_MESSAGE = "Attempted to 'create' object store entity in configuration with no database session present."
 
@@ -299,6 +307,10 @@ class BaseObjectStore(ObjectStore):
     def get_store_usage_percent(self):
         return self._invoke('get_store_usage_percent')
 
+    def get_store_capacity(self):
+        """Return the total and free bytes of the store, or None if the store can't tell."""
+        return None
+
     def get_store_by(self, obj, **kwargs):
         return self._invoke('get_store_by', obj, **kwargs)
 
@@ -600,6 +612,10 @@ class DiskObjectStore(ConcreteObjectStore):
         st = os.statvfs(self.file_path)
         return (float(st.f_blocks - st.f_bavail) / st.f_blocks) * 100
 
+    def get_store_capacity(self):
+        st = os.statvfs(self.file_path)
+        return st.f_blocks * st.f_frsize, st.f_bavail * st.f_frsize
+
 
 class NestedObjectStore(BaseObjectStore):
 
@@ -613,13 +629,68 @@ class NestedObjectStore(BaseObjectStore):
         """Extend `ObjectStore`'s constructor."""
         super().__init__(config)
         self.backends = {}
+        self.location_index = None
+        location_index_path = config_xml.get("location_index") if config_xml else None
+        if location_index_path:
+            self.location_index = LocationIndex(location_index_path)
 
     def shutdown(self):
         """For each backend, shuts them down."""
         for store in self.backends.values():
             store.shutdown()
+        if self.location_index is not None:
+            self.location_index.close()
         super().shutdown()
 
+    def to_dict(self):
+        as_dict = super().to_dict()
+        if self.location_index is not None:
+            as_dict["location_index"] = self.location_index.path
+        return as_dict
+
+    def location_key(self, obj):
+        return (obj.__class__.__name__, obj.id)
+
+    def _uses_location_index(self, kwargs):
+        # Files below other base directories (job working directories,
+        # temporary files) are located by asking the backends, as are extra
+        # files and files with another name, which would share the key of
+        # their object
+        return (self.location_index is not None and not kwargs.get('base_dir')
+                and not kwargs.get('extra_dir') and not kwargs.get('alt_name'))
+
+    def _record_location(self, obj, backend_id, **kwargs):
+        if self._uses_location_index(kwargs):
+            self.location_index.record(self.location_key(obj), backend_id)
+
+    def locate(self, obj, record=True, exclude=None, **kwargs):
+        """
+        Return the id of the first backend having `obj` by asking each
+        backend but `exclude`, recording it in the location index if `record`
+        is True.
+        """
+        for backend_id, store in self.backends.items():
+            if backend_id == exclude:
+                continue
+            if store.exists(obj, **kwargs):
+                if record:
+                    self._record_location(obj, backend_id, **kwargs)
+                return backend_id
+        return None
+
+    def _locate(self, obj, **kwargs):
+        """Return the id of the backend having `obj`, asking the backend in the location index first."""
+        checked_id = None
+        if self._uses_location_index(kwargs):
+            indexed_id = self.location_index.lookup(self.location_key(obj))
+            for backend_id, store in self.backends.items():
+                if str(backend_id) == indexed_id:
+                    if store.exists(obj, **kwargs):
+                        return backend_id
+                    checked_id = backend_id
+                    break
+        return self.locate(obj, exclude=checked_id, **kwargs)
+
     def _exists(self, obj, **kwargs):
         """Determine if the `obj` exists in any of the backends."""
         return self._call_method('_exists', obj, False, False, **kwargs)
@@ -642,7 +713,10 @@ class NestedObjectStore(BaseObjectStore):
 
     def _delete(self, obj, **kwargs):
         """For the first backend that has this `obj`, delete it."""
-        return self._call_method('_delete', obj, False, False, **kwargs)
+        deleted = self._call_method('_delete', obj, False, False, **kwargs)
+        if deleted and self._uses_location_index(kwargs):
+            self.location_index.forget(self.location_key(obj))
+        return deleted
 
     def _get_data(self, obj, **kwargs):
         """For the first backend that has this `obj`, get data from it."""
@@ -677,9 +751,9 @@ class NestedObjectStore(BaseObjectStore):
     def _call_method(self, method, obj, default, default_is_exception,
             **kwargs):
         """Check all children object stores for the first one with the dataset."""
-        for store in self.backends.values():
-            if store.exists(obj, **kwargs):
-                return store.__getattribute__(method)(obj, **kwargs)
+        backend_id = self._locate(obj, **kwargs)
+        if backend_id is not None:
+            return self.backends[backend_id].__getattribute__(method)(obj, **kwargs)
         if default_is_exception:
             raise default('objectstore, _call_method failed: %s on %s, kwargs: %s'
                           % (method, self._repr_object_for_exception(obj), str(kwargs)))
@@ -694,7 +768,8 @@ class DistributedObjectStore(NestedObjectStore):
 
     When getting objects the first store where the object exists is used.
     When creating objects they are created in a store selected randomly, but
-    with weighting.
+    with weighting by the configured weights, the free space of the stores and
+    their recent write throughput (see :mod:`galaxy.objectstore.placement`).
     """
     store_type = 'distributed'
 
@@ -711,16 +786,20 @@ class DistributedObjectStore(NestedObjectStore):
 
         :type fsmon: bool
         :param fsmon: If True, monitor the file system for free space,
-            removing backends when they get too full.
+            preferring backends with more space left and removing backends
+            when they get too full.
         """
         super().__init__(config, config_dict)
 
         self.backends = {}
-        self.weighted_backend_ids = []
-        self.original_weighted_backend_ids = []
+        self.weights = {}
         self.max_percent_full = {}
         self.global_max_percent_full = config_dict.get("global_max_percent_full", 0)
-        random.seed()
+        self.refresh_interval = config_dict.get("refresh_interval", DEFAULT_REFRESH_INTERVAL)
+        self.reserve_size = config_dict.get("reserve_size", DEFAULT_RESERVE_SIZE)
+        if isinstance(self.reserve_size, str):
+            self.reserve_size = size_to_bytes(self.reserve_size)
+        self.reservation_ttl = config_dict.get("reservation_ttl", DEFAULT_RESERVATION_TTL)
 
         for backend_def in config_dict["backends"]:
             backened_id = backend_def["id"]
@@ -731,17 +810,18 @@ class DistributedObjectStore(NestedObjectStore):
 
             self.backends[backened_id] = backend
             self.max_percent_full[backened_id] = maxpctfull
+            self.weights[backened_id] = weight
 
-            for _ in range(0, weight):
-                # The simplest way to do weighting: add backend ids to a
-                # sequence the number of times equalling weight, then randomly
-                # choose a backend from that sequence at creation
-                self.weighted_backend_ids.append(backened_id)
-
-        self.original_weighted_backend_ids = self.weighted_backend_ids
+        self.placement = PlacementEngine(
+            [(backend_id, self.weights[backend_id], self.max_percent_full[backend_id]) for backend_id in self.backends],
+            self._probe_backend,
+            global_max_percent_full=self.global_max_percent_full,
+            reserve_size=self.reserve_size,
+            reservation_ttl=self.reservation_ttl,
+        )
 
         self.sleeper = None
-        if fsmon and (self.global_max_percent_full or [_ for _ in self.max_percent_full.values() if _ != 0.0]):
+        if fsmon:
             self.sleeper = Sleeper()
             self.filesystem_monitor_thread = threading.Thread(target=self.__filesystem_monitor)
             self.filesystem_monitor_thread.setDaemon(True)
@@ -757,7 +837,11 @@ class DistributedObjectStore(NestedObjectStore):
 
         backends = []
         config_dict = {
+            'location_index': config_xml.get('location_index'),
             'global_max_percent_full': float(backends_root.get('maxpctfull', 0)),
+            'refresh_interval': int(backends_root.get('refresh_interval', DEFAULT_REFRESH_INTERVAL)),
+            'reserve_size': size_to_bytes(backends_root.get('reserve_size', str(DEFAULT_RESERVE_SIZE))),
+            'reservation_ttl': int(backends_root.get('reservation_ttl', DEFAULT_RESERVATION_TTL)),
             'backends': backends,
         }
 
@@ -802,12 +886,15 @@ class DistributedObjectStore(NestedObjectStore):
     def to_dict(self):
         as_dict = super().to_dict()
         as_dict["global_max_percent_full"] = self.global_max_percent_full
+        as_dict["refresh_interval"] = self.refresh_interval
+        as_dict["reserve_size"] = self.reserve_size
+        as_dict["reservation_ttl"] = self.reservation_ttl
         backends = []
         for backend_id, backend in self.backends.items():
             backend_as_dict = backend.to_dict()
             backend_as_dict["id"] = backend_id
             backend_as_dict["max_percent_full"] = self.max_percent_full[backend_id]
-            backend_as_dict["weight"] = len([i for i in self.original_weighted_backend_ids if i == backend_id])
+            backend_as_dict["weight"] = self.weights[backend_id]
             backends.append(backend_as_dict)
         as_dict["backends"] = backends
         return as_dict
@@ -818,33 +905,52 @@ class DistributedObjectStore(NestedObjectStore):
         if self.sleeper is not None:
             self.sleeper.wake()
 
+    def get_placement_metrics(self):
+        """Return the free space, reservations, write rate and placements of the backends."""
+        return self.placement.metrics()
+
+    def _probe_backend(self, backend_id):
+        backend = self.backends[backend_id]
+        capacity = backend.get_store_capacity()
+        if capacity:
+            total, free = capacity
+            return (float(total - free) / total) * 100 if total else 0.0, total, free
+        return backend.get_store_usage_percent(), None, None
+
     def __filesystem_monitor(self):
         while self.running:
-            new_weighted_backend_ids = self.original_weighted_backend_ids
-            for id, backend in self.backends.items():
-                maxpct = self.max_percent_full[id] or self.global_max_percent_full
-                pct = backend.get_store_usage_percent()
-                if pct > maxpct:
-                    new_weighted_backend_ids = [_ for _ in new_weighted_backend_ids if _ != id]
-            self.weighted_backend_ids = new_weighted_backend_ids
-            self.sleeper.sleep(120)  # Test free space every 2 minutes
+            self.placement.refresh()
+            self.sleeper.sleep(self.refresh_interval)
 
     def _create(self, obj, **kwargs):
         """The only method in which obj.object_store_id may be None."""
         if obj.object_store_id is None or not self._exists(obj, **kwargs):
+            if kwargs.get('dir_only', False) or kwargs.get('extra_dir'):
+                # Directories and extra files don't reserve space of their own
+                size = 0
+            else:
+                size = getattr(obj, 'file_size', None) or None
             if obj.object_store_id is None or obj.object_store_id not in self.backends:
-                try:
-                    obj.object_store_id = random.choice(self.weighted_backend_ids)
-                except IndexError:
+                object_store_id = self.placement.choose(self.location_key(obj), size=size)
+                if object_store_id is None:
                     raise ObjectInvalid('objectstore.create, could not generate '
                                         'obj.object_store_id: %s, kwargs: %s'
                                         % (str(obj), str(kwargs)))
+                obj.object_store_id = object_store_id
                 log.debug("Selected backend '%s' for creation of %s %s"
                           % (obj.object_store_id, obj.__class__.__name__, obj.id))
             else:
+                self.placement.reserve(obj.object_store_id, self.location_key(obj), size=size)
                 log.debug("Using preferred backend '%s' for creation of %s %s"
                           % (obj.object_store_id, obj.__class__.__name__, obj.id))
             self.backends[obj.object_store_id].create(obj, **kwargs)
+            self._record_location(obj, obj.object_store_id, **kwargs)
+
+    def _update_from_file(self, obj, file_name=None, **kwargs):
+        rval = super()._update_from_file(obj, file_name=file_name, **kwargs)
+        if file_name and not kwargs.get('extra_dir') and os.path.exists(file_name):
+            self.placement.written(obj.object_store_id, self.location_key(obj), os.path.getsize(file_name))
+        return rval
 
     def _call_method(self, method, obj, default, default_is_exception, **kwargs):
         object_store_id = self.__get_store_id_for(obj, **kwargs)
@@ -866,13 +972,12 @@ class DistributedObjectStore(NestedObjectStore):
         # if this instance has been switched from a non-distributed to a
         # distributed object store, or if the object's store id is invalid,
         # try to locate the object
-        for id, store in self.backends.items():
-            if store.exists(obj, **kwargs):
-                log.warning('%s object with ID %s found in backend object store with ID %s'
-                            % (obj.__class__.__name__, obj.id, id))
-                obj.object_store_id = id
-                return id
-        return None
+        id = self._locate(obj, **kwargs)
+        if id is not None:
+            log.warning('%s object with ID %s found in backend object store with ID %s'
+                        % (obj.__class__.__name__, obj.id, id))
+            obj.object_store_id = id
+        return id
 
 
 class HierarchicalObjectStore(NestedObjectStore):
@@ -905,7 +1010,7 @@ class HierarchicalObjectStore(NestedObjectStore):
             backend_config_dict["type"] = store_type
             backends_list.append(backend_config_dict)
 
-        return {"backends": backends_list}
+        return {"backends": backends_list, "location_index": config_xml.get('location_index')}
 
     def to_dict(self):
         as_dict = super().to_dict()
@@ -918,14 +1023,12 @@ class HierarchicalObjectStore(NestedObjectStore):
 
     def _exists(self, obj, **kwargs):
         """Check all child object stores."""
-        for store in self.backends.values():
-            if store.exists(obj, **kwargs):
-                return True
-        return False
+        return self._locate(obj, **kwargs) is not None
 
     def _create(self, obj, **kwargs):
         """Call the primary object store."""
         self.backends[0].create(obj, **kwargs)
+        self._record_location(obj, 0, **kwargs)
 
 
 def type_to_object_store_class(store, fsmon=False):
@@ -933,6 +1036,9 @@ def type_to_object_store_class(store, fsmon=False):
     objectstore_constructor_kwds = {}
     if store == 'disk':
         objectstore_class = DiskObjectStore
+    elif store == 'deduplicating_disk':
+        from .deduplicating import DeduplicatingDiskObjectStore
+        objectstore_class = DeduplicatingDiskObjectStore
     elif store == 's3':
         from .s3 import S3ObjectStore
         objectstore_class = S3ObjectStore
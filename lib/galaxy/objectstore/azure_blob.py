@@ -5,15 +5,14 @@ Object Store plugin for the Microsoft Azure Block Blob Storage system
 import logging
 import os
 import shutil
-import threading
-import time
 from datetime import datetime
+from functools import partial
 
 try:
     from azure.common import AzureHttpError
     from azure.storage import CloudStorageAccount
     from azure.storage.blob import BlockBlobService
-    from azure.storage.blob.models import Blob
+    from azure.storage.blob.models import Blob, BlobBlock
 except ImportError:
     BlockBlobService = None
 
@@ -23,14 +22,20 @@ from galaxy.exceptions import (
 )
 from galaxy.util import (
     directory_hash_id,
-    umask_fix_perms
+    umask_fix_perms,
+    unicodify,
 )
 from galaxy.util.path import safe_relpath
-from galaxy.util.sleeper import Sleeper
-from ..objectstore import (
-    ConcreteObjectStore,
-    convert_bytes,
+from .caching import (
+    parse_cache_xml,
+    StagingCacheMixin,
 )
+from .transfer import (
+    parse_transfer_xml,
+    TransferError,
+    TransferManager,
+)
+from ..objectstore import ConcreteObjectStore
 
 NO_BLOBSERVICE_ERROR_MESSAGE = ("ObjectStore configured, but no azure.storage.blob dependency available."
                                 "Please install and properly configure azure.storage.blob or modify Object Store configuration.")
@@ -50,8 +55,9 @@ def parse_config_xml(config_xml):
         max_chunk_size = int(container_xml.get('max_chunk_size', 250))  # currently unused
 
         c_xml = config_xml.findall('cache')[0]
-        cache_size = float(c_xml.get('size', -1))
-        staging_path = c_xml.get('path', None)
+        cache_dict = parse_cache_xml(c_xml)
+
+        transfer_dict = parse_transfer_xml(config_xml)
 
         tag, attrs = 'extra_dir', ('type', 'path')
         extra_dirs = config_xml.findall(tag)
@@ -69,10 +75,8 @@ def parse_config_xml(config_xml):
                 'name': container_name,
                 'max_chunk_size': max_chunk_size,
             },
-            'cache': {
-                'size': cache_size,
-                'path': staging_path,
-            },
+            'cache': cache_dict,
+            'transfer': transfer_dict,
             'extra_dirs': extra_dirs,
         }
     except Exception:
@@ -81,7 +85,7 @@ def parse_config_xml(config_xml):
         raise
 
 
-class AzureBlobObjectStore(ConcreteObjectStore):
+class AzureBlobObjectStore(ConcreteObjectStore, StagingCacheMixin):
     """
     Object store that stores objects as blobs in an Azure Blob Container. A local
     cache exists that is used as an intermediate location for files between
@@ -104,8 +108,8 @@ class AzureBlobObjectStore(ConcreteObjectStore):
         self.container_name = container_dict.get('name')
         self.max_chunk_size = container_dict.get('max_chunk_size', 250)  # currently unused
 
-        self.cache_size = cache_dict.get('size', -1)
-        self.staging_path = cache_dict.get('path') or self.config.object_store_cache_path
+        self._parse_cache_dict(cache_dict)
+        self.transfer_config = config_dict.get('transfer') or {}
 
         self._initialize()
 
@@ -116,14 +120,9 @@ class AzureBlobObjectStore(ConcreteObjectStore):
         self._configure_connection()
 
         # Clean cache only if value is set in galaxy.ini
-        if self.cache_size != -1:
-            # Convert GBs to bytes for comparison
-            self.cache_size = self.cache_size * 1073741824
-            # Helper for interruptable sleep
-            self.sleeper = Sleeper()
-            self.cache_monitor_thread = threading.Thread(target=self.__cache_monitor)
-            self.cache_monitor_thread.start()
-            log.info("Cache cleaner manager started")
+        self._start_staging_cache()
+        # Concurrent block uploads and ranged downloads
+        self.transfer = TransferManager(**self.transfer_config)
 
     def to_dict(self):
         as_dict = super().to_dict()
@@ -136,10 +135,8 @@ class AzureBlobObjectStore(ConcreteObjectStore):
                 'name': self.container_name,
                 'max_chunk_size': self.max_chunk_size,
             },
-            'cache': {
-                'size': self.cache_size,
-                'path': self.staging_path,
-            }
+            'cache': self._cache_config_to_dict(),
+            'transfer': self.transfer_config,
         })
         return as_dict
 
@@ -249,6 +246,8 @@ class AzureBlobObjectStore(ConcreteObjectStore):
         # Now pull in the file
         file_ok = self._download(rel_path)
         self._fix_permissions(self._get_cache_path(rel_path_dir))
+        if file_ok:
+            self.cache.added(rel_path, pin=True)
         return file_ok
 
     def _transfer_cb(self, complete, total):
@@ -258,18 +257,37 @@ class AzureBlobObjectStore(ConcreteObjectStore):
         local_destination = self._get_cache_path(rel_path)
         try:
             log.debug("Pulling '%s' into cache to %s", rel_path, local_destination)
-            if self.cache_size > 0 and self._get_size_in_azure(rel_path) > self.cache_size:
+            size = self._get_size_in_azure(rel_path)
+            if not self.cache.fits(size):
                 log.critical("File %s is larger (%s) than the cache size (%s). Cannot download.",
-                             rel_path, self._get_size_in_azure(rel_path), self.cache_size)
+                             rel_path, size, self.cache.limit)
                 return False
+            elif size > self.transfer.part_size:
+                self.transfer.download(size, partial(self._read_range, rel_path), local_destination)
+                return True
             else:
                 self.transfer_progress = 0  # Reset transfer progress counter
                 self.service.get_blob_to_path(self.container_name, rel_path, local_destination, progress_callback=self._transfer_cb)
                 return True
-        except AzureHttpError:
+        except (AzureHttpError, TransferError):
             log.exception("Problem downloading '%s' from Azure", rel_path)
         return False
 
+    def _read_range(self, rel_path, offset, length):
+        blob = self.service.get_blob_to_bytes(self.container_name, rel_path, start_range=offset, end_range=offset + length - 1)
+        return blob.content
+
+    def _upload_blocks(self, rel_path, source_file):
+        def put_block(part_number, data, md5):
+            block_id = "%06d" % part_number
+            # validate_content sends the Content-MD5 of the block
+            self.service.put_block(self.container_name, rel_path, data, block_id, validate_content=True)
+            return BlobBlock(id=block_id)
+
+        # Blocks not committed by a block list are discarded by Azure
+        blocks = self.transfer.upload(source_file, put_block)
+        self.service.put_block_list(self.container_name, rel_path, blocks)
+
     def _push_to_os(self, rel_path, source_file=None, from_string=None):
         """
         Push the file pointed to by ``rel_path`` to the object store naming the blob
@@ -296,7 +314,10 @@ class AzureBlobObjectStore(ConcreteObjectStore):
                 start_time = datetime.now()
                 log.debug("Pushing cache file '%s' of size %s bytes to '%s'", source_file, os.path.getsize(source_file), rel_path)
                 self.transfer_progress = 0  # Reset transfer progress counter
-                self.service.create_blob_from_path(self.container_name, rel_path, source_file, progress_callback=self._transfer_cb)
+                if os.path.getsize(source_file) > self.transfer.part_size:
+                    self._upload_blocks(rel_path, source_file)
+                else:
+                    self.service.create_blob_from_path(self.container_name, rel_path, source_file, progress_callback=self._transfer_cb)
                 end_time = datetime.now()
                 log.debug("Pushed cache file '%s' to blob '%s' (%s bytes transfered in %s sec)",
                           source_file, rel_path, os.path.getsize(source_file), end_time - start_time)
@@ -391,6 +412,7 @@ class AzureBlobObjectStore(ConcreteObjectStore):
             if not dir_only:
                 rel_path = os.path.join(rel_path, alt_name if alt_name else "dataset_%s.dat" % self._get_object_id(obj))
                 open(os.path.join(self.staging_path, rel_path), 'w').close()
+                self.cache.added(rel_path)
                 self._push_to_os(rel_path, from_string='')
 
     def _empty(self, obj, **kwargs):
@@ -429,6 +451,7 @@ class AzureBlobObjectStore(ConcreteObjectStore):
             # but requires iterating through each individual blob in Azure and deleing it.
             if entire_dir and extra_dir:
                 shutil.rmtree(self._get_cache_path(rel_path))
+                self.cache.removed_tree(rel_path)
                 blobs = self.service.list_blobs(self.container_name, prefix=rel_path)
                 for blob in blobs:
                     log.debug("Deleting from Azure: %s", blob)
@@ -437,6 +460,7 @@ class AzureBlobObjectStore(ConcreteObjectStore):
             else:
                 # Delete from cache first
                 os.unlink(self._get_cache_path(rel_path))
+                self.cache.removed(rel_path)
                 # Delete from S3 as well
                 if self._in_azure(rel_path):
                     log.debug("Deleting from Azure: %s", rel_path)
@@ -451,7 +475,10 @@ class AzureBlobObjectStore(ConcreteObjectStore):
     def _get_data(self, obj, start=0, count=-1, **kwargs):
         rel_path = self._construct_path(obj, **kwargs)
         # Check cache first and get file if not there
-        if not self._in_cache(rel_path):
+        if not self.cache.lookup(rel_path):
+            if count >= 0:
+                # Fetch only the requested range, without staging the whole object
+                return unicodify(self.transfer.read(partial(self._read_range, rel_path), start, count, size=self._get_size_in_azure(rel_path)))
             self._pull_into_cache(rel_path)
         # Read the file content from cache
         data_file = open(self._get_cache_path(rel_path))
@@ -480,7 +507,7 @@ class AzureBlobObjectStore(ConcreteObjectStore):
         #         os.makedirs(cache_path)
         #     return cache_path
         # Check if the file exists in the cache first
-        if self._in_cache(rel_path):
+        if self.cache.lookup(rel_path, pin=True):
             return cache_path
         # Check if the file exists in persistent storage and, if it does, pull it into cache
         elif self._exists(obj, **kwargs):
@@ -510,6 +537,7 @@ class AzureBlobObjectStore(ConcreteObjectStore):
                         # FIXME? Should this be a `move`?
                         shutil.copy2(source_file, cache_file)
                     self._fix_permissions(cache_file)
+                    self.cache.added(rel_path)
                 except OSError:
                     log.exception("Trouble copying source file '%s' to cache '%s'", source_file, cache_file)
             else:
@@ -533,53 +561,9 @@ class AzureBlobObjectStore(ConcreteObjectStore):
     def _get_store_usage_percent(self):
         return 0.0
 
-    ##################
-    # Secret Methods #
-    ##################
-
-    def __cache_monitor(self):
-        time.sleep(2)  # Wait for things to load before starting the monitor
-        while self.running:
-            total_size = 0
-            # Is this going to be too expensive of an operation to be done frequently?
-            file_list = []
-            for dirpath, _, filenames in os.walk(self.staging_path):
-                for filename in filenames:
-                    filepath = os.path.join(dirpath, filename)
-                    file_size = os.path.getsize(filepath)
-                    total_size += file_size
-                    # Get the time given file was last accessed
-                    last_access_time = time.localtime(os.stat(filepath)[7])
-                    # Compose a tuple of the access time and the file path
-                    file_tuple = last_access_time, filepath, file_size
-                    file_list.append(file_tuple)
-            # Sort the file list (based on access time)
-            file_list.sort()
-            # Initiate cleaning once within 10% of the defined cache size?
-            cache_limit = self.cache_size * 0.9
-            if total_size > cache_limit:
-                log.info("Initiating cache cleaning: current cache size: %s; clean until smaller than: %s",
-                         convert_bytes(total_size), convert_bytes(cache_limit))
-                # How much to delete? If simply deleting up to the cache-10% limit,
-                # is likely to be deleting frequently and may run the risk of hitting
-                # the limit - maybe delete additional #%?
-                # For now, delete enough to leave at least 10% of the total cache free
-                delete_this_much = total_size - cache_limit
-                # Keep deleting datasets from file_list until deleted_amount does not
-                # exceed delete_this_much; start deleting from the front of the file list,
-                # which assumes the oldest files come first on the list.
-                deleted_amount = 0
-                for entry in enumerate(file_list):
-                    if deleted_amount < delete_this_much:
-                        deleted_amount += entry[2]
-                        os.remove(entry[1])
-                        # Debugging code for printing deleted files' stats
-                        # folder, file_name = os.path.split(f[1])
-                        # file_date = time.strftime("%m/%d/%y %H:%M:%S", f[0])
-                        # log.debug("%s. %-25s %s, size %s (deleted %s/%s)" \
-                        #     % (i, file_name, convert_bytes(f[2]), file_date, \
-                        #     convert_bytes(deleted_amount), convert_bytes(delete_this_much)))
-                    else:
-                        log.debug("Cache cleaning done. Total space freed: %s", convert_bytes(deleted_amount))
-
-            self.sleeper.sleep(30)  # Test cache size every 30 seconds?
+    def shutdown(self):
+        self.running = False
+        self._shutdown_staging_cache()
+        transfer = getattr(self, 'transfer', None)
+        if transfer:
+            transfer.shutdown()
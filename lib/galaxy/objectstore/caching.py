@@ -0,0 +1,415 @@
+"""
+Local staging cache of the object stores keeping copies of remote objects on
+disk (S3, cloud, Azure and iRODS).
+
+The files in the cache are recorded in an SQLite index next to them, so the
+size of the cache is known without walking the cache directory and eviction
+picks its victims with an indexed query.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from galaxy.util import nice_size
+from galaxy.util.sleeper import Sleeper
+
+log = logging.getLogger(__name__)
+
+CACHE_INDEX_FILENAME = ".galaxy_cache_index.sqlite"
+# Start evicting at this fraction of the cache size, evict until below it
+CACHE_LIMIT_FRACTION = 0.9
+CACHE_MONITOR_INTERVAL = 30
+# Walk the cache directory to pick up files not recorded in the index
+# (e.g. written by another process without an index) this often
+CACHE_RECONCILE_INTERVAL = 24 * 60 * 60
+# Don't record accesses of the same file more often than this
+ACCESS_RESOLUTION = 60
+EVICTION_BATCH_SIZE = 1000
+DEFAULT_EVICTION_POLICY = "lru"
+EVICTION_POLICIES = {
+    # least recently used first
+    "lru": "last_access ASC",
+    # largest and least recently used first
+    "size": "size * (:now - last_access) DESC",
+}
+GIGABYTE = 1073741824
+
+
+def parse_cache_xml(c_xml):
+    """Parse the ``cache`` element of an object store XML configuration."""
+    return {
+        'size': float(c_xml.get('size', -1)),
+        'path': c_xml.get('path', None),
+        'eviction_policy': c_xml.get('eviction_policy', DEFAULT_EVICTION_POLICY),
+        'pin_seconds': int(c_xml.get('pin_seconds', 0)),
+    }
+
+
+class CacheIndex:
+    """
+    SQLite index of the files in a cache directory, with their size, time of
+    last access and the time until which they are pinned. The total size and
+    number of files are maintained in the same transactions, so accounting is
+    O(1) and consistent across processes sharing the cache.
+    """
+
+    def __init__(self, cache_path, index_path=None):
+        self.cache_path = cache_path
+        self.index_path = index_path or os.path.join(cache_path, CACHE_INDEX_FILENAME)
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        self._conn = sqlite3.connect(self.index_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_file ("
+                         "path TEXT PRIMARY KEY, "
+                         "size INTEGER NOT NULL, "
+                         "last_access REAL NOT NULL, "
+                         "pinned_until REAL NOT NULL DEFAULT 0)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_file_last_access ON cache_file (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_total ("
+                         "id INTEGER PRIMARY KEY CHECK (id = 0), "
+                         "size INTEGER NOT NULL, "
+                         "files INTEGER NOT NULL, "
+                         "reconciled REAL)")
+            conn.execute("INSERT OR IGNORE INTO cache_total (id, size, files, reconciled) VALUES (0, 0, 0, NULL)")
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql, parameters=()):
+        with self._lock:
+            return self._conn.execute(sql, parameters).fetchall()
+
+    def _add(self, conn, rel_path, size, now):
+        row = conn.execute("SELECT size FROM cache_file WHERE path = ?", (rel_path,)).fetchone()
+        if row is None:
+            conn.execute("INSERT INTO cache_file (path, size, last_access) VALUES (?, ?, ?)", (rel_path, size, now))
+            conn.execute("UPDATE cache_total SET size = size + ?, files = files + 1 WHERE id = 0", (size,))
+        else:
+            conn.execute("UPDATE cache_file SET size = ?, last_access = ? WHERE path = ?", (size, now, rel_path))
+            conn.execute("UPDATE cache_total SET size = size + ? WHERE id = 0", (size - row[0],))
+
+    def add(self, rel_path, size):
+        """Record the file ``rel_path`` of ``size`` bytes as just accessed."""
+        with self._transaction() as conn:
+            self._add(conn, rel_path, size, time.time())
+
+    def touch(self, rel_path, size=None):
+        """
+        Record an access to ``rel_path``. If the file is not recorded yet and
+        ``size`` is given, record it.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            updated = conn.execute("UPDATE cache_file SET last_access = ? WHERE path = ? AND last_access < ?",
+                                   (now, rel_path, now - ACCESS_RESOLUTION)).rowcount
+            if not updated and size is not None:
+                if conn.execute("SELECT 1 FROM cache_file WHERE path = ?", (rel_path,)).fetchone() is None:
+                    self._add(conn, rel_path, size, now)
+
+    def remove(self, rel_path):
+        """Forget the file ``rel_path``, return its recorded size."""
+        with self._transaction() as conn:
+            return self._remove(conn, rel_path)
+
+    def _remove(self, conn, rel_path):
+        row = conn.execute("SELECT size FROM cache_file WHERE path = ?", (rel_path,)).fetchone()
+        if row is None:
+            return 0
+        conn.execute("DELETE FROM cache_file WHERE path = ?", (rel_path,))
+        conn.execute("UPDATE cache_total SET size = size - ?, files = files - 1 WHERE id = 0", (row[0],))
+        return row[0]
+
+    def remove_tree(self, rel_path):
+        """Forget all files below the directory ``rel_path``."""
+        # Every path starting with 'rel_path/' sorts between 'rel_path/' and 'rel_path0'
+        prefix = rel_path.rstrip(os.sep) + os.sep
+        bounds = (prefix, prefix[:-1] + chr(ord(os.sep) + 1))
+        with self._transaction() as conn:
+            size, files = conn.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM cache_file WHERE path >= ? AND path < ?",
+                                       bounds).fetchone()
+            conn.execute("DELETE FROM cache_file WHERE path >= ? AND path < ?", bounds)
+            conn.execute("UPDATE cache_total SET size = size - ?, files = files - ? WHERE id = 0", (size, files))
+
+    def pin(self, rel_path, seconds):
+        """Protect ``rel_path`` from eviction for the next ``seconds``."""
+        with self._transaction() as conn:
+            conn.execute("UPDATE cache_file SET pinned_until = MAX(pinned_until, ?) WHERE path = ?",
+                         (time.time() + seconds, rel_path))
+
+    def unpin(self, rel_path):
+        with self._transaction() as conn:
+            conn.execute("UPDATE cache_file SET pinned_until = 0 WHERE path = ?", (rel_path,))
+
+    def total(self):
+        """Return the total size in bytes and the number of files recorded."""
+        return tuple(self._query("SELECT size, files FROM cache_total WHERE id = 0")[0])
+
+    def candidates(self, policy=DEFAULT_EVICTION_POLICY, limit=EVICTION_BATCH_SIZE, exclude=()):
+        """Return up to ``limit`` (path, size) tuples of unpinned files in eviction order."""
+        now = time.time()
+        sql = "SELECT path, size FROM cache_file WHERE pinned_until < :now ORDER BY %s LIMIT :limit" % EVICTION_POLICIES[policy]
+        # Files that could not be removed are excluded by the caller, fetch enough to skip them
+        rows = self._query(sql, {"now": now, "limit": limit + len(exclude)})
+        return [row for row in rows if row[0] not in exclude][:limit]
+
+    @property
+    def last_reconciled(self):
+        return self._query("SELECT reconciled FROM cache_total WHERE id = 0")[0][0]
+
+    def reconcile(self):
+        """
+        Walk the cache directory once and make the index match the files on
+        disk, return the total size and number of files.
+        """
+        on_disk = {}
+        for dirpath, _, filenames in os.walk(self.cache_path):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if path.startswith(self.index_path):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                on_disk[os.path.relpath(path, self.cache_path)] = (st.st_size, st.st_atime)
+        with self._transaction() as conn:
+            indexed = dict(conn.execute("SELECT path, size FROM cache_file").fetchall())
+            for rel_path in set(indexed) - set(on_disk):
+                conn.execute("DELETE FROM cache_file WHERE path = ?", (rel_path,))
+            for rel_path, (size, atime) in on_disk.items():
+                if rel_path not in indexed:
+                    conn.execute("INSERT INTO cache_file (path, size, last_access) VALUES (?, ?, ?)", (rel_path, size, atime))
+                elif indexed[rel_path] != size:
+                    conn.execute("UPDATE cache_file SET size = ? WHERE path = ?", (size, rel_path))
+            conn.execute("UPDATE cache_total SET size = (SELECT COALESCE(SUM(size), 0) FROM cache_file), "
+                         "files = (SELECT COUNT(*) FROM cache_file), reconciled = ? WHERE id = 0", (time.time(),))
+        return self.total()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class StagingCache:
+    """
+    The staging cache of an object store: the files in ``staging_path``, kept
+    under ``size`` GB (no limit if -1) by evicting files according to
+    ``eviction_policy`` (``lru`` or ``size``). Files handed out for use (see
+    :meth:`lookup`) are pinned for ``pin_seconds``.
+
+    Object stores record the files they add and remove, so that the size of
+    the cache is maintained without walking the cache directory. Processes
+    not managing the cache (``managed=False``), e.g. on compute nodes, only
+    count hits and misses and leave the index alone.
+    """
+
+    def __init__(self, staging_path, size=-1, eviction_policy=DEFAULT_EVICTION_POLICY, pin_seconds=0, managed=True, index_path=None):
+        if eviction_policy not in EVICTION_POLICIES:
+            raise Exception("Unknown cache eviction policy [{}], must be one of {}".format(eviction_policy, ", ".join(EVICTION_POLICIES)))
+        self.staging_path = staging_path
+        self.limit = size * GIGABYTE if size and size > 0 else -1
+        self.eviction_policy = eviction_policy
+        self.pin_seconds = pin_seconds
+        self.index = CacheIndex(staging_path, index_path=index_path) if managed else None
+        self.running = True
+        self.sleeper = Sleeper()
+        self.monitor_thread = None
+        self._counter_lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.evicted_bytes = 0
+
+    def _cache_path(self, rel_path):
+        return os.path.join(self.staging_path, rel_path)
+
+    def _count(self, **increments):
+        with self._counter_lock:
+            for name, increment in increments.items():
+                setattr(self, name, getattr(self, name) + increment)
+
+    def fits(self, size):
+        """Whether a file of ``size`` bytes can be stored in the cache at all."""
+        return self.limit <= 0 or size <= self.limit
+
+    def lookup(self, rel_path, pin=False):
+        """
+        Return True and record the access if ``rel_path`` is in the cache,
+        return False otherwise. If ``pin`` is True, protect the file from
+        eviction for ``pin_seconds``.
+        """
+        try:
+            size = os.path.getsize(self._cache_path(rel_path))
+        except OSError:
+            self._count(misses=1)
+            return False
+        self._count(hits=1)
+        if self.index:
+            self.index.touch(rel_path, size=size)
+            if pin and self.pin_seconds:
+                self.index.pin(rel_path, self.pin_seconds)
+        return True
+
+    def added(self, rel_path, pin=False):
+        """Record the file ``rel_path`` just written to the cache."""
+        if not self.index:
+            return
+        try:
+            size = os.path.getsize(self._cache_path(rel_path))
+        except OSError:
+            return
+        self.index.add(rel_path, size)
+        if pin and self.pin_seconds:
+            self.index.pin(rel_path, self.pin_seconds)
+
+    def removed(self, rel_path):
+        """Record that the file ``rel_path`` was removed from the cache."""
+        if self.index:
+            self.index.remove(rel_path)
+
+    def removed_tree(self, rel_path):
+        """Record that the directory ``rel_path`` was removed from the cache."""
+        if self.index:
+            self.index.remove_tree(rel_path)
+
+    def pin(self, rel_path, seconds=None):
+        if self.index:
+            self.index.pin(rel_path, self.pin_seconds if seconds is None else seconds)
+
+    def unpin(self, rel_path):
+        if self.index:
+            self.index.unpin(rel_path)
+
+    def clean(self):
+        """
+        If the cache is above :data:`CACHE_LIMIT_FRACTION` of its size, evict
+        files until it is below. Return the number of bytes freed.
+        """
+        if self.limit <= 0 or not self.index:
+            return 0
+        total_size, _ = self.index.total()
+        cache_limit = self.limit * CACHE_LIMIT_FRACTION
+        if total_size <= cache_limit:
+            return 0
+        log.info("Initiating cache cleaning: current cache size: %s; clean until smaller than: %s",
+                 nice_size(total_size), nice_size(cache_limit))
+        delete_this_much = total_size - cache_limit
+        freed = 0
+        failed = set()
+        while freed < delete_this_much and self.running:
+            candidates = self.index.candidates(self.eviction_policy, exclude=failed)
+            if not candidates:
+                break
+            for rel_path, size in candidates:
+                try:
+                    os.remove(self._cache_path(rel_path))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    log.exception("Failed to evict '%s' from cache", rel_path)
+                    failed.add(rel_path)
+                    continue
+                self.index.remove(rel_path)
+                freed += size
+                self._count(evictions=1, evicted_bytes=size)
+                if freed >= delete_this_much:
+                    break
+        log.debug("Cache cleaning done. Total space freed: %s", nice_size(freed))
+        return freed
+
+    def stats(self):
+        """Return the size of the cache and the hit, miss and eviction counters of this process."""
+        total_size, files = self.index.total() if self.index else (None, None)
+        return dict(
+            size=total_size,
+            files=files,
+            limit=self.limit,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            evicted_bytes=self.evicted_bytes,
+        )
+
+    def start_monitor(self):
+        """Start evicting files in the background if the cache is managed and limited."""
+        if self.limit <= 0 or not self.index:
+            return
+        self.monitor_thread = threading.Thread(target=self._monitor, name="StagingCacheMonitor")
+        self.monitor_thread.daemon = True
+        self.monitor_thread.start()
+        log.info("Cache cleaner manager started")
+
+    def _monitor(self):
+        while self.running:
+            try:
+                last_reconciled = self.index.last_reconciled
+                if last_reconciled is None or time.time() - last_reconciled > CACHE_RECONCILE_INTERVAL:
+                    self.index.reconcile()
+                self.clean()
+            except Exception:
+                log.exception("Failure cleaning cache %s", self.staging_path)
+            self.sleeper.sleep(CACHE_MONITOR_INTERVAL)
+
+    def shutdown(self):
+        self.running = False
+        if self.monitor_thread:
+            log.debug("Shutting down thread")
+            self.sleeper.wake()
+            self.monitor_thread.join(5)
+        if self.index:
+            self.index.close()
+
+
+class StagingCacheMixin:
+    """
+    Configuration and setup of the :class:`StagingCache` of object stores
+    keeping a local copy of remote objects in ``staging_path``.
+    """
+
+    def _parse_cache_dict(self, cache_dict):
+        self.cache_size = cache_dict.get('size', -1)
+        self.staging_path = cache_dict.get('path') or self.config.object_store_cache_path
+        self.cache_eviction_policy = cache_dict.get('eviction_policy', DEFAULT_EVICTION_POLICY)
+        self.cache_pin_seconds = cache_dict.get('pin_seconds', 0)
+
+    def _cache_config_to_dict(self):
+        return {
+            'size': self.cache_size,
+            'path': self.staging_path,
+            'eviction_policy': self.cache_eviction_policy,
+            'pin_seconds': self.cache_pin_seconds,
+        }
+
+    def _start_staging_cache(self, managed=True):
+        """
+        Set up the staging cache. If ``managed`` and a cache size is set, keep
+        the cache below the size in the background.
+        """
+        self.cache = StagingCache(
+            self.staging_path,
+            size=self.cache_size,
+            eviction_policy=self.cache_eviction_policy,
+            pin_seconds=self.cache_pin_seconds,
+            managed=managed and self.cache_size != -1,
+        )
+        self.cache.start_monitor()
+
+    def _shutdown_staging_cache(self):
+        cache = getattr(self, 'cache', None)
+        if cache:
+            cache.shutdown()
+
+    def get_cache_stats(self):
+        """Return the size of the staging cache and its hit, miss and eviction counters."""
+        return self.cache.stats()
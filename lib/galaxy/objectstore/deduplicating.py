@@ -0,0 +1,290 @@
+"""
+Content-addressed variant of the disk object store that stores identical
+dataset contents only once.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import stat
+import threading
+import uuid
+
+from galaxy.util import umask_fix_perms
+from galaxy.util.path import safe_makedirs
+from . import DiskObjectStore
+
+log = logging.getLogger(__name__)
+
+BLOBS_EXTRA_DIR_TYPE = "blobs"
+DEFAULT_BLOBS_DIR_NAME = "_blobs"
+HASH_ALGORITHM = "sha256"
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """Return the hex digest of the contents of the file at ``path``."""
+    digest = hashlib.new(HASH_ALGORITHM)
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """
+    Blobs named after the digest of their content, referenced by hard links.
+
+    The reference count of a blob is the link count of its file minus one (the
+    blob itself), so references need no bookkeeping and stay consistent with
+    the files on disk. Blobs are read-only, so that modifying the file of one
+    dataset in place fails instead of silently changing all datasets sharing
+    its content. Blobs must be on the same file system as the files linking
+    to them.
+    """
+
+    def __init__(self, blobs_dir, umask=0o022):
+        self.blobs_dir = blobs_dir
+        self.umask = umask
+        self._lock = threading.Lock()
+        # Counters since the store was created
+        self.deduplicated = 0
+        self.bytes_saved = 0
+
+    def blob_path(self, digest):
+        return os.path.join(self.blobs_dir, digest[0:2], digest[2:4], digest)
+
+    def link(self, source, path, source_is_path=False):
+        """
+        Replace ``path`` with a link to the blob with the content of ``source``,
+        creating the blob from a copy of ``source`` if it does not exist yet.
+        If ``source_is_path`` is True, ``source`` is the file to deduplicate
+        itself and a new blob is created by linking instead of copying it.
+
+        Return the number of bytes saved by reusing an existing blob.
+        """
+        digest = hash_file(source)
+        blob_path = self.blob_path(digest)
+        for _ in range(2):
+            saved = 0
+            if os.path.exists(blob_path):
+                saved = os.path.getsize(blob_path)
+            else:
+                self._create_blob(source, blob_path, source_is_path)
+            try:
+                self._replace_with_link(blob_path, path)
+                break
+            except FileNotFoundError:
+                # The blob has been garbage collected in the meantime, create it again
+                continue
+        else:
+            raise Exception(f"Unable to link {path} to blob {blob_path}")
+        if saved:
+            with self._lock:
+                self.deduplicated += 1
+                self.bytes_saved += saved
+        return saved
+
+    def release(self, path):
+        """
+        Remove ``path`` and the blob it links to if ``path`` was the last
+        reference to it.
+        """
+        blob_path = self.blob_for(path)
+        os.remove(path)
+        if blob_path is not None:
+            self.remove_if_unreferenced(blob_path)
+
+    def blob_for(self, path):
+        """
+        Return the path of the blob if ``path`` is the last reference to it,
+        None otherwise. Only the last reference is hashed to find its blob.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if st.st_nlink != 2:
+            return None
+        blob_path = self.blob_path(hash_file(path))
+        try:
+            if os.stat(blob_path).st_ino == st.st_ino:
+                return blob_path
+        except OSError:
+            pass
+        return None
+
+    def collect_garbage(self):
+        """Remove all unreferenced blobs, return the number of bytes freed."""
+        freed = 0
+        for blob_path, st in self._blobs():
+            if st.st_nlink == 1 and self.remove_if_unreferenced(blob_path):
+                freed += st.st_size
+        return freed
+
+    def stats(self):
+        """
+        Return the number of blobs and references, the number of bytes stored
+        in blobs, the number of bytes the referencing files would use without
+        deduplication and the number of bytes saved.
+        """
+        blobs = references = stored_bytes = logical_bytes = 0
+        for _, st in self._blobs():
+            blobs += 1
+            refs = st.st_nlink - 1
+            references += refs
+            stored_bytes += st.st_size
+            logical_bytes += st.st_size * refs
+        return dict(
+            blobs=blobs,
+            references=references,
+            stored_bytes=stored_bytes,
+            logical_bytes=logical_bytes,
+            saved_bytes=max(logical_bytes - stored_bytes, 0),
+        )
+
+    def _blobs(self):
+        for dirpath, _, filenames in os.walk(self.blobs_dir):
+            for filename in filenames:
+                if filename.startswith("."):
+                    # blob being created
+                    continue
+                blob_path = os.path.join(dirpath, filename)
+                try:
+                    yield blob_path, os.stat(blob_path)
+                except OSError:
+                    continue
+
+    def _create_blob(self, source, blob_path, source_is_path):
+        blob_dir = os.path.dirname(blob_path)
+        safe_makedirs(blob_dir)
+        if source_is_path:
+            umask_fix_perms(source, self.umask, 0o444)
+            try:
+                os.link(source, blob_path)
+            except FileExistsError:
+                pass
+            return
+        tmp_path = os.path.join(blob_dir, ".%s" % uuid.uuid4().hex)
+        try:
+            shutil.copyfile(source, tmp_path)
+            umask_fix_perms(tmp_path, self.umask, 0o444)
+            try:
+                os.link(tmp_path, blob_path)
+            except FileExistsError:
+                # created concurrently with the same content
+                pass
+        finally:
+            os.remove(tmp_path)
+
+    def _replace_with_link(self, blob_path, path):
+        if os.path.exists(path) and os.path.samefile(blob_path, path):
+            return
+        previous_blob_path = self.blob_for(path)
+        tmp_link = os.path.join(os.path.dirname(path), ".{}.{}".format(os.path.basename(path), uuid.uuid4().hex))
+        os.link(blob_path, tmp_link)
+        os.replace(tmp_link, path)
+        if previous_blob_path is not None:
+            self.remove_if_unreferenced(previous_blob_path)
+
+    def deduplicate(self, path):
+        """
+        Replace an existing regular file by a link to its blob, return the
+        number of bytes saved. Files already linked and empty files are left
+        untouched.
+        """
+        st = os.lstat(path)
+        if not stat.S_ISREG(st.st_mode) or st.st_nlink > 1 or st.st_size == 0:
+            return 0
+        return self.link(path, path, source_is_path=True)
+
+    def remove_if_unreferenced(self, blob_path):
+        with self._lock:
+            try:
+                if os.stat(blob_path).st_nlink == 1:
+                    os.remove(blob_path)
+                    return True
+            except OSError:
+                pass
+        return False
+
+
+class DeduplicatingDiskObjectStore(DiskObjectStore):
+    """
+    Disk object store that stores identical dataset contents only once.
+
+    Datasets are stored at the same paths as in the :class:`DiskObjectStore`
+    (so ``exists``, ``size``, ``get_data`` and ``get_filename`` behave the
+    same), but when a dataset is updated from a file its path becomes a hard
+    link to a blob named after the SHA-256 digest of the content. Blobs are
+    stored in the ``blobs`` extra dir, which defaults to ``_blobs`` in the
+    files dir and must be on the same file system.
+
+    Blobs referenced only by extra files directories deleted with
+    ``entire_dir`` are left behind and removed by :meth:`collect_garbage`.
+    """
+    store_type = 'deduplicating_disk'
+
+    def __init__(self, config, config_dict):
+        super().__init__(config, config_dict)
+        blobs_dir = self.extra_dirs.get(BLOBS_EXTRA_DIR_TYPE) or os.path.join(self.file_path, DEFAULT_BLOBS_DIR_NAME)
+        self.blobs = BlobStore(os.path.abspath(blobs_dir), umask=config.umask)
+        safe_makedirs(self.blobs.blobs_dir)
+
+    def _update_from_file(self, obj, file_name=None, create=False, **kwargs):
+        preserve_symlinks = kwargs.pop('preserve_symlinks', False)
+        if create:
+            self._create(obj, **kwargs)
+        if not file_name or not self._exists(obj, **kwargs):
+            return
+        path = self._get_filename(obj, **kwargs)
+        if (kwargs.get('base_dir') is not None
+                or (preserve_symlinks and os.path.islink(file_name))
+                or os.path.getsize(file_name) == 0):
+            if os.path.exists(path) and os.stat(path).st_nlink > 1:
+                # Don't modify the shared blob in place
+                self.blobs.release(path)
+                self._create(obj, **kwargs)
+            return super()._update_from_file(obj, file_name=file_name, preserve_symlinks=preserve_symlinks, **kwargs)
+        try:
+            saved = self.blobs.link(file_name, path)
+        except OSError as ex:
+            log.critical('Error storing {} as {}: {}'.format(file_name, path, ex))
+            raise ex
+        if saved:
+            log.debug("Deduplicated content of %s, saved %d bytes", path, saved)
+
+    def _delete(self, obj, entire_dir=False, **kwargs):
+        extra_dir = kwargs.get('extra_dir', None)
+        obj_dir = kwargs.get('obj_dir', False)
+        if entire_dir and (extra_dir or obj_dir):
+            return super()._delete(obj, entire_dir=entire_dir, **kwargs)
+        try:
+            blob_path = self.blobs.blob_for(self._get_filename(obj, **kwargs))
+        except Exception:
+            blob_path = None
+        deleted = super()._delete(obj, entire_dir=entire_dir, **kwargs)
+        if deleted and blob_path is not None:
+            self.blobs.remove_if_unreferenced(blob_path)
+        return deleted
+
+    def collect_garbage(self):
+        """Remove blobs no longer referenced by any dataset, return the number of bytes freed."""
+        return self.blobs.collect_garbage()
+
+    def get_deduplication_stats(self):
+        """Return statistics on blobs, references and bytes saved by deduplication."""
+        stats = self.blobs.stats()
+        stats.update(
+            deduplicated_since_start=self.blobs.deduplicated,
+            saved_bytes_since_start=self.blobs.bytes_saved,
+        )
+        return stats
+
+    def deduplicate_existing(self, path):
+        """
+        Deduplicate a file stored before this store was used (e.g. by a
+        :class:`DiskObjectStore` with the same files dir), return the number of
+        bytes saved.
+        """
+        return self.blobs.deduplicate(path)
@@ -25,6 +25,7 @@ except ImportError:
 from galaxy.exceptions import ObjectInvalid, ObjectNotFound
 from galaxy.util import directory_hash_id, ExecutionTimer, umask_fix_perms
 from galaxy.util.path import safe_relpath
+from .caching import parse_cache_xml, StagingCacheMixin
 from ..objectstore import DiskObjectStore
 
 IRODS_IMPORT_MESSAGE = ('The Python irods package is required to use this feature, please install it')
@@ -72,8 +73,7 @@ def parse_config_xml(config_xml):
         c_xml = config_xml.findall('cache')
         if not c_xml:
             _config_xml_error('cache')
-        cache_size = float(c_xml[0].get('size', -1))
-        staging_path = c_xml[0].get('path', None)
+        cache_dict = parse_cache_xml(c_xml[0])
 
         attrs = ('type', 'path')
         e_xml = config_xml.findall('extra_dir')
@@ -98,10 +98,7 @@ def parse_config_xml(config_xml):
                 'timeout': timeout,
                 'poolsize': poolsize
             },
-            'cache': {
-                'size': cache_size,
-                'path': staging_path,
-            },
+            'cache': cache_dict,
             'extra_dirs': extra_dirs,
         }
     except Exception:
@@ -130,14 +127,11 @@ class CloudConfigMixin:
                 'timeout': self.timeout,
                 'poolsize': self.poolsize,
             },
-            'cache': {
-                'size': self.cache_size,
-                'path': self.staging_path,
-            }
+            'cache': self._cache_config_to_dict(),
         }
 
 
-class IRODSObjectStore(DiskObjectStore, CloudConfigMixin):
+class IRODSObjectStore(DiskObjectStore, CloudConfigMixin, StagingCacheMixin):
     """
     Object store that stores files as data objects in an iRODS Zone. A local cache
     exists that is used as an intermediate location for files between Galaxy and iRODS.
@@ -193,10 +187,9 @@ class IRODSObjectStore(DiskObjectStore, CloudConfigMixin):
         cache_dict = config_dict['cache']
         if cache_dict is None:
             _config_dict_error('cache')
-        self.cache_size = cache_dict.get('size', -1)
+        self._parse_cache_dict(cache_dict)
         if self.cache_size is None:
             _config_dict_error('cache->size')
-        self.staging_path = cache_dict.get('path') or self.config.object_store_cache_path
         if self.staging_path is None:
             _config_dict_error('cache->path')
 
@@ -216,9 +209,11 @@ class IRODSObjectStore(DiskObjectStore, CloudConfigMixin):
         self.session = iRODSSession(host=self.host, port=self.port, user=self.username, password=self.password, zone=self.zone)
         # Set connection timeout
         self.session.connection_timeout = self.timeout
+        self._start_staging_cache()
         log.debug("irods __init__ %s", reload_timer)
 
     def shutdown(self):
+        self._shutdown_staging_cache()
         # This call will cleanup all the connections in the connection pool
         # OSError sometimes happens on GitHub Actions, after the test has successfully completed. Ignore it if it happens.
         try:
@@ -333,6 +328,8 @@ class IRODSObjectStore(DiskObjectStore, CloudConfigMixin):
         # Now pull in the file
         file_ok = self._download(rel_path)
         self._fix_permissions(self._get_cache_path(rel_path_dir))
+        if file_ok:
+            self.cache.added(rel_path, pin=True)
         return file_ok
 
     def _download(self, rel_path):
@@ -355,9 +352,9 @@ class IRODSObjectStore(DiskObjectStore, CloudConfigMixin):
             log.exception(e)
             return False
 
-        if self.cache_size > 0 and data_obj.__sizeof__() > self.cache_size:
+        if not self.cache.fits(data_obj.__sizeof__()):
             log.critical("File %s is larger (%s) than the cache size (%s). Cannot download.",
-                        rel_path, data_obj.__sizeof__(), self.cache_size)
+                         rel_path, data_obj.__sizeof__(), self.cache.limit)
             return False
 
         log.debug("Pulled data object '%s' into cache to %s", rel_path, self._get_cache_path(rel_path))
@@ -481,6 +478,7 @@ class IRODSObjectStore(DiskObjectStore, CloudConfigMixin):
             if not dir_only:
                 rel_path = os.path.join(rel_path, alt_name if alt_name else "dataset_%s.dat" % self._get_object_id(obj))
                 open(os.path.join(self.staging_path, rel_path), 'w').close()
+                self.cache.added(rel_path)
                 self._push_to_irods(rel_path, from_string='')
 
     def _empty(self, obj, **kwargs):
@@ -521,6 +519,7 @@ class IRODSObjectStore(DiskObjectStore, CloudConfigMixin):
             # but requires iterating through each individual key in irods and deleing it.
             if entire_dir and extra_dir:
                 shutil.rmtree(self._get_cache_path(rel_path))
+                self.cache.removed_tree(rel_path)
 
                 col_path = self.home + "/" + str(rel_path)
                 col = None
@@ -548,6 +547,7 @@ class IRODSObjectStore(DiskObjectStore, CloudConfigMixin):
             else:
                 # Delete from cache first
                 os.unlink(self._get_cache_path(rel_path))
+                self.cache.removed(rel_path)
                 # Delete from irods as well
                 p = Path(rel_path)
                 data_object_name = p.stem + p.suffix
@@ -576,7 +576,7 @@ class IRODSObjectStore(DiskObjectStore, CloudConfigMixin):
     def _get_data(self, obj, start=0, count=-1, **kwargs):
         rel_path = self._construct_path(obj, **kwargs)
         # Check cache first and get file if not there
-        if not self._in_cache(rel_path):
+        if not self.cache.lookup(rel_path):
             self._pull_into_cache(rel_path)
         # Read the file content from cache
         data_file = open(self._get_cache_path(rel_path))
@@ -605,7 +605,7 @@ class IRODSObjectStore(DiskObjectStore, CloudConfigMixin):
         #         os.makedirs(cache_path)
         #     return cache_path
         # Check if the file exists in the cache first
-        if self._in_cache(rel_path):
+        if self.cache.lookup(rel_path, pin=True):
             return cache_path
         # Check if the file exists in persistent storage and, if it does, pull it into cache
         elif self._exists(obj, **kwargs):
@@ -637,6 +637,7 @@ class IRODSObjectStore(DiskObjectStore, CloudConfigMixin):
                         # FIXME? Should this be a `move`?
                         shutil.copy2(source_file, cache_file)
                     self._fix_permissions(cache_file)
+                    self.cache.added(rel_path)
                 except OSError:
                     log.exception("Trouble copying source file '%s' to cache '%s'", source_file, cache_file)
             else:
@@ -0,0 +1,94 @@
+"""
+Persistent index of the backends holding the objects of nested (distributed
+and hierarchical) object stores.
+
+Without the index, finding an object whose backend is unknown means asking
+every backend whether it has the object. The index is filled when objects are
+created and when probing finds them, emptied when they are deleted, and can
+be built for existing objects with ``scripts/objectstore/build_location_index.py``.
+"""
+import logging
+import os
+import sqlite3
+import threading
+
+log = logging.getLogger(__name__)
+
+BUSY_TIMEOUT = 30
+
+
+class LocationIndex:
+    """
+    SQLite table mapping ``(object type, object id)`` keys to backend ids.
+
+    The database is best kept on a local file system, SQLite locking is not
+    reliable on all network file systems.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = self.misses = 0
+        self._local = threading.local()
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS location (
+                object_type TEXT NOT NULL,
+                object_id TEXT NOT NULL,
+                backend_id TEXT NOT NULL,
+                PRIMARY KEY (object_type, object_id)
+            ) WITHOUT ROWID""")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, key):
+        """Return the backend id recorded for ``key`` or None."""
+        row = self._connection().execute(
+            "SELECT backend_id FROM location WHERE object_type = ? AND object_id = ?", (key[0], str(key[1]))
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def record(self, key, backend_id):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO location VALUES (?, ?, ?)", (key[0], str(key[1]), str(backend_id)))
+
+    def record_many(self, locations):
+        """Record an iterable of ``(key, backend_id)`` in a single transaction."""
+        with self._connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO location VALUES (?, ?, ?)",
+                             ((key[0], str(key[1]), str(backend_id)) for key, backend_id in locations))
+
+    def forget(self, key):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM location WHERE object_type = ? AND object_id = ?", (key[0], str(key[1])))
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM location")
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM location").fetchone()[0]
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'locations': self.count(),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,212 @@
+"""
+Placement of new objects on the backends of a distributed object store.
+
+Backends are chosen randomly, with a probability proportional to a score
+combining the configured weight, the free space left below the backend's
+``max_percent_full`` limit and the write throughput recently observed on the
+backend. Space is reserved for every object placed, so a burst of creations
+counts against the free space of a backend before the next measurement of the
+free space reflects it.
+
+Objects written by jobs don't release their reservation, so reservations are
+dropped by the next measurement after them. If reservations alone keep every
+backend from taking an object, the object is placed as if there were none.
+"""
+import logging
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = 30
+DEFAULT_RESERVATION_TTL = 60 * 60
+DEFAULT_RESERVE_SIZE = 100 * 1024 * 1024
+# Half-life (in seconds) of the write throughput estimate of the backends
+THROUGHPUT_HALF_LIFE = 120
+
+
+class BackendState:
+    """Placement related state of a single backend."""
+
+    def __init__(self, backend_id, weight, max_percent_full):
+        self.backend_id = backend_id
+        self.weight = weight
+        self.max_percent_full = max_percent_full
+        # Last measurement, total and free are None if the backend can't tell
+        self.usage_percent = 0.0
+        self.total = None
+        self.free = None
+        self.measured = None
+        # object key -> (bytes, reservation time, expiration time) of objects placed but not written
+        self.reservations = {}
+        # bytes written since the last measurement
+        self.written = 0
+        self.write_rate = 0.0
+        self.placements = 0
+
+    def reserved(self, now):
+        expired = [key for key, (_, _, expires) in self.reservations.items() if expires <= now]
+        for key in expired:
+            del self.reservations[key]
+        return sum(size for size, _, _ in self.reservations.values()) + self.written
+
+    def release_reservations(self, before):
+        """Drop reservations made before ``before``, e.g. the start of a measurement."""
+        self.reservations = {key: reservation for key, reservation in self.reservations.items() if reservation[1] > before}
+
+    def headroom(self, now, size, global_max_percent_full, count_reserved=True):
+        """
+        Return the fraction of the space the backend may use that is still
+        available after placing ``size`` bytes, or None if it may not take it.
+        Reserved space is left out unless ``count_reserved`` is set.
+        """
+        max_percent_full = self.max_percent_full or global_max_percent_full or 100.0
+        if self.total is None:
+            # Free space in bytes unknown, only the usage percent to go by
+            if self.usage_percent > max_percent_full:
+                return None
+            return 1.0 - self.usage_percent / max_percent_full
+        allowed = self.total * max_percent_full / 100.0
+        used = self.total - self.free + size
+        if count_reserved:
+            used += self.reserved(now)
+        if used > allowed:
+            return None
+        return 1.0 - used / allowed
+
+    def to_dict(self, now):
+        return {
+            'weight': self.weight,
+            'max_percent_full': self.max_percent_full,
+            'usage_percent': self.usage_percent,
+            'total_bytes': self.total,
+            'free_bytes': self.free,
+            'reserved_bytes': self.reserved(now),
+            'reservations': len(self.reservations),
+            'write_rate': self.write_rate,
+            'placements': self.placements,
+        }
+
+
+class PlacementEngine:
+    """
+    Choose backends for new objects.
+
+    ``probe(backend_id)`` returns ``(usage_percent, total_bytes, free_bytes)``
+    for a backend, with ``total_bytes`` and ``free_bytes`` None when the
+    backend only reports the percentage used. Backends are probed by
+    :meth:`refresh`, objects placed between two probes reserve
+    ``reserve_size`` bytes (or their size, if known) until they are written,
+    the next probe of their backend or for at most ``reservation_ttl``
+    seconds (if probes fail).
+    """
+
+    def __init__(self, backends, probe, global_max_percent_full=0, reserve_size=DEFAULT_RESERVE_SIZE,
+                 reservation_ttl=DEFAULT_RESERVATION_TTL, clock=time.time, rng=None):
+        """
+        :param backends: iterable of ``(backend_id, weight, max_percent_full)``
+        """
+        self.backends = {backend_id: BackendState(backend_id, weight, max_percent_full) for backend_id, weight, max_percent_full in backends}
+        self.probe = probe
+        self.global_max_percent_full = global_max_percent_full
+        self.reserve_size = reserve_size
+        self.reservation_ttl = reservation_ttl
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.rejections = 0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Measure the free space of all backends, estimating their write throughput."""
+        for backend_id, state in self.backends.items():
+            probe_started = self.clock()
+            try:
+                usage_percent, total, free = self.probe(backend_id)
+            except Exception:
+                log.exception("Failed to determine the free space of object store backend '%s'", backend_id)
+                continue
+            now = self.clock()
+            with self._lock:
+                if state.measured is not None and now > state.measured:
+                    written = state.written
+                    if state.free is not None and free is not None:
+                        # Also counts writes by jobs and other processes
+                        written = max(written, state.free - free)
+                    decay = 0.5 ** ((now - state.measured) / THROUGHPUT_HALF_LIFE)
+                    state.write_rate = decay * state.write_rate + (1 - decay) * written / (now - state.measured)
+                state.usage_percent, state.total, state.free = usage_percent, total, free
+                state.measured = now
+                # The measurement includes what has been written since the last one
+                state.written = 0
+                # Objects written by jobs don't release their reservations, they are part of
+                # the measurement too or are no longer expected to be written soon
+                state.release_reservations(probe_started)
+
+    def choose(self, key, size=None):
+        """
+        Choose a backend for the object identified by ``key`` and reserve
+        ``size`` bytes (``reserve_size`` if None) on it. Return None if no
+        backend can take the object.
+        """
+        size = self.reserve_size if size is None else size
+        now = self.clock()
+        with self._lock:
+            candidates = self._candidates(now, size)
+            if not candidates:
+                # Space reserved for objects that may have been written already (and so be part of the
+                # measured free space) should not make placement fail while there is actual space left
+                candidates = self._candidates(now, size, count_reserved=False)
+            if not candidates:
+                self.rejections += 1
+                return None
+            mean_rate = sum(state.write_rate for state, _ in candidates) / len(candidates)
+            scores = []
+            for state, headroom in candidates:
+                score = state.weight * headroom
+                if mean_rate > 0:
+                    # Steer writes away from backends busier than average
+                    score *= 2.0 / (1.0 + state.write_rate / mean_rate)
+                # A full backend scores 0, but is still allowed to take objects
+                scores.append(max(score, 1e-9))
+            state = self.rng.choices([state for state, _ in candidates], weights=scores)[0]
+            self._reserve(state, key, size, now)
+            state.placements += 1
+            return state.backend_id
+
+    def _candidates(self, now, size, count_reserved=True):
+        candidates = []
+        for state in self.backends.values():
+            if state.weight <= 0:
+                continue
+            headroom = state.headroom(now, size, self.global_max_percent_full, count_reserved=count_reserved)
+            if headroom is not None:
+                candidates.append((state, headroom))
+        return candidates
+
+    def reserve(self, backend_id, key, size=None):
+        """Reserve space for an object placed on a backend without :meth:`choose`."""
+        size = self.reserve_size if size is None else size
+        with self._lock:
+            self._reserve(self.backends[backend_id], key, size, self.clock())
+
+    def _reserve(self, state, key, size, now):
+        if size:
+            state.reservations[key] = (size, now, now + self.reservation_ttl)
+
+    def written(self, backend_id, key, size):
+        """Record ``size`` bytes written for the object ``key``, releasing its reservation."""
+        state = self.backends.get(backend_id)
+        if state is None:
+            return
+        with self._lock:
+            state.reservations.pop(key, None)
+            state.written += size
+
+    def metrics(self):
+        now = self.clock()
+        with self._lock:
+            return {
+                'rejections': self.rejections,
+                'backends': {backend_id: state.to_dict(now) for backend_id, state in self.backends.items()},
+            }
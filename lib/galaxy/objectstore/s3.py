@@ -1,14 +1,15 @@
 """
 Object Store plugin for the Amazon Simple Storage Service (S3)
 """
+import base64
 import logging
-import multiprocessing
 import os
 import shutil
-import subprocess
 import threading
 import time
 from datetime import datetime
+from functools import partial
+from io import BytesIO
 
 try:
     # Imports are done this way to allow objectstore code to be used outside of Galaxy.
@@ -16,6 +17,7 @@ try:
     from boto.exception import S3ResponseError
     from boto.s3.connection import S3Connection
     from boto.s3.key import Key
+    from boto.s3.multipart import MultiPartUpload
 except ImportError:
     boto = None
 
@@ -24,12 +26,12 @@ from galaxy.util import (
     directory_hash_id,
     string_as_bool,
     umask_fix_perms,
-    which,
+    unicodify,
 )
 from galaxy.util.path import safe_relpath
-from galaxy.util.sleeper import Sleeper
-from .s3_multipart_upload import multipart_upload
-from ..objectstore import ConcreteObjectStore, convert_bytes
+from .caching import parse_cache_xml, StagingCacheMixin
+from .transfer import parse_transfer_xml, TransferError, TransferManager
+from ..objectstore import ConcreteObjectStore
 
 NO_BOTO_ERROR_MESSAGE = ("S3/Swift object store configured, but no boto dependency available."
                          "Please install and properly configure boto or modify object store configuration.")
@@ -62,9 +64,9 @@ def parse_config_xml(config_xml):
         conn_path = cn_xml.get('conn_path', '/')
 
         c_xml = config_xml.findall('cache')[0]
-        cache_size = float(c_xml.get('size', -1))
+        cache_dict = parse_cache_xml(c_xml)
 
-        staging_path = c_xml.get('path', None)
+        transfer_dict = parse_transfer_xml(config_xml)
 
         tag, attrs = 'extra_dir', ('type', 'path')
         extra_dirs = config_xml.findall(tag)
@@ -91,10 +93,8 @@ def parse_config_xml(config_xml):
                 'is_secure': is_secure,
                 'conn_path': conn_path,
             },
-            'cache': {
-                'size': cache_size,
-                'path': staging_path,
-            },
+            'cache': cache_dict,
+            'transfer': transfer_dict,
             'extra_dirs': extra_dirs,
         }
     except Exception:
@@ -103,6 +103,17 @@ def parse_config_xml(config_xml):
         raise
 
 
+def _key_md5(key):
+    """
+    Return the MD5 of the content of a key if its ETag is one, i.e. it was not
+    uploaded in parts or encrypted with a customer or KMS key.
+    """
+    etag = (key.etag or '').strip('"')
+    if '-' in etag or getattr(key, 'encrypted', None) not in (None, 'AES256'):
+        return None
+    return etag or None
+
+
 class CloudConfigMixin:
 
     def _config_to_dict(self):
@@ -122,15 +133,13 @@ class CloudConfigMixin:
                 'is_secure': self.is_secure,
                 'conn_path': self.conn_path,
             },
-            'cache': {
-                'size': self.cache_size,
-                'path': self.staging_path,
-            },
+            'cache': self._cache_config_to_dict(),
+            'transfer': self.transfer_config,
             'enable_cache_monitor': False,
         }
 
 
-class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
+class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin, StagingCacheMixin):
     """
     Object store that stores objects as items in an AWS S3 bucket. A local
     cache exists that is used as an intermediate location for files between
@@ -162,8 +171,8 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
         self.is_secure = connection_dict.get('is_secure', True)
         self.conn_path = connection_dict.get('conn_path', '/')
 
-        self.cache_size = cache_dict.get('size', -1)
-        self.staging_path = cache_dict.get('path') or self.config.object_store_cache_path
+        self._parse_cache_dict(cache_dict)
+        self.transfer_config = config_dict.get('transfer') or {}
 
         extra_dirs = {
             e['type']: e['path'] for e in config_dict.get('extra_dirs', [])}
@@ -175,39 +184,30 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
         if boto is None:
             raise Exception(NO_BOTO_ERROR_MESSAGE)
 
-        # for multipart upload
-        self.s3server = {'access_key': self.access_key,
-                         'secret_key': self.secret_key,
-                         'is_secure': self.is_secure,
-                         'max_chunk_size': self.max_chunk_size,
-                         'host': self.host,
-                         'port': self.port,
-                         'use_rr': self.use_rr,
-                         'conn_path': self.conn_path}
-
         self._configure_connection()
         self._bucket = self._get_bucket(self.bucket)
+        # Concurrent part uploads and ranged downloads, with a connection per thread
+        self.transfer = TransferManager(**self.transfer_config)
+        self._thread_local = threading.local()
         self.start_cache_monitor()
-        # Test if 'axel' is available for parallel download and pull the key into cache
-        if which('axel'):
-            self.use_axel = True
-        else:
-            self.use_axel = False
 
     def start_cache_monitor(self):
         # Clean cache only if value is set in galaxy.ini
-        if self.cache_size != -1 and self.enable_cache_monitor:
-            # Convert GBs to bytes for comparison
-            self.cache_size = self.cache_size * 1073741824
-            # Helper for interruptable sleep
-            self.sleeper = Sleeper()
-            self.cache_monitor_thread = threading.Thread(target=self.__cache_monitor)
-            self.cache_monitor_thread.start()
-            log.info("Cache cleaner manager started")
+        self._start_staging_cache(managed=self.enable_cache_monitor)
 
     def _configure_connection(self):
         log.debug("Configuring S3 Connection")
-        self.conn = S3Connection(self.access_key, self.secret_key)
+        self.conn = self._connect()
+
+    def _connect(self):
+        return S3Connection(self.access_key, self.secret_key)
+
+    def _thread_bucket(self):
+        """boto connections are not thread safe, return a bucket with a connection of the calling thread."""
+        bucket = getattr(self._thread_local, 'bucket', None)
+        if bucket is None:
+            bucket = self._thread_local.bucket = self._connect().get_bucket(self.bucket, validate=False)
+        return bucket
 
     @classmethod
     def parse_xml(clazz, config_xml):
@@ -218,70 +218,6 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
         as_dict.update(self._config_to_dict())
         return as_dict
 
-    def __cache_monitor(self):
-        time.sleep(2)  # Wait for things to load before starting the monitor
-        while self.running:
-            total_size = 0
-            # Is this going to be too expensive of an operation to be done frequently?
-            file_list = []
-            for dirpath, _, filenames in os.walk(self.staging_path):
-                for filename in filenames:
-                    filepath = os.path.join(dirpath, filename)
-                    file_size = os.path.getsize(filepath)
-                    total_size += file_size
-                    # Get the time given file was last accessed
-                    last_access_time = time.localtime(os.stat(filepath)[7])
-                    # Compose a tuple of the access time and the file path
-                    file_tuple = last_access_time, filepath, file_size
-                    file_list.append(file_tuple)
-            # Sort the file list (based on access time)
-            file_list.sort()
-            # Initiate cleaning once within 10% of the defined cache size?
-            cache_limit = self.cache_size * 0.9
-            if total_size > cache_limit:
-                log.info("Initiating cache cleaning: current cache size: %s; clean until smaller than: %s",
-                         convert_bytes(total_size), convert_bytes(cache_limit))
-                # How much to delete? If simply deleting up to the cache-10% limit,
-                # is likely to be deleting frequently and may run the risk of hitting
-                # the limit - maybe delete additional #%?
-                # For now, delete enough to leave at least 10% of the total cache free
-                delete_this_much = total_size - cache_limit
-                self.__clean_cache(file_list, delete_this_much)
-            self.sleeper.sleep(30)  # Test cache size every 30 seconds?
-
-    def __clean_cache(self, file_list, delete_this_much):
-        """ Keep deleting files from the file_list until the size of the deleted
-        files is greater than the value in delete_this_much parameter.
-
-        :type file_list: list
-        :param file_list: List of candidate files that can be deleted. This method
-            will start deleting files from the beginning of the list so the list
-            should be sorted accordingly. The list must contains 3-element tuples,
-            positioned as follows: position 0 holds file last accessed timestamp
-            (as time.struct_time), position 1 holds file path, and position 2 has
-            file size (e.g., (<access time>, /mnt/data/dataset_1.dat), 472394)
-
-        :type delete_this_much: int
-        :param delete_this_much: Total size of files, in bytes, that should be deleted.
-        """
-        # Keep deleting datasets from file_list until deleted_amount does not
-        # exceed delete_this_much; start deleting from the front of the file list,
-        # which assumes the oldest files come first on the list.
-        deleted_amount = 0
-        for entry in file_list:
-            if deleted_amount < delete_this_much:
-                deleted_amount += entry[2]
-                os.remove(entry[1])
-                # Debugging code for printing deleted files' stats
-                # folder, file_name = os.path.split(f[1])
-                # file_date = time.strftime("%m/%d/%y %H:%M:%S", f[0])
-                # log.debug("%s. %-25s %s, size %s (deleted %s/%s)" \
-                #     % (i, file_name, convert_bytes(f[2]), file_date, \
-                #     convert_bytes(deleted_amount), convert_bytes(delete_this_much)))
-            else:
-                log.debug("Cache cleaning done. Total space freed: %s", convert_bytes(deleted_amount))
-                return
-
     def _get_bucket(self, bucket_name):
         """ Sometimes a handle to a bucket is not established right away so try
         it a few times. Raise error is connection is not established. """
@@ -419,6 +355,8 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
         # Now pull in the file
         file_ok = self._download(rel_path)
         self._fix_permissions(self._get_cache_path(rel_path_dir))
+        if file_ok:
+            self.cache.added(rel_path, pin=True)
         return file_ok
 
     def _transfer_cb(self, complete, total):
@@ -429,26 +367,45 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
             log.debug("Pulling key '%s' into cache to %s", rel_path, self._get_cache_path(rel_path))
             key = self._bucket.get_key(rel_path)
             # Test if cache is large enough to hold the new file
-            if self.cache_size > 0 and key.size > self.cache_size:
+            if not self.cache.fits(key.size):
                 log.critical("File %s is larger (%s) than the cache size (%s). Cannot download.",
-                             rel_path, key.size, self.cache_size)
+                             rel_path, key.size, self.cache.limit)
                 return False
-            if self.use_axel:
+            if key.size > self.transfer.part_size:
                 log.debug("Parallel pulled key '%s' into cache to %s", rel_path, self._get_cache_path(rel_path))
-                ncores = multiprocessing.cpu_count()
-                url = key.generate_url(7200)
-                ret_code = subprocess.call(['axel', '-a', '-n', ncores, url])
-                if ret_code == 0:
-                    return True
+                self.transfer.download(key.size, partial(self._read_range, rel_path), self._get_cache_path(rel_path),
+                                       expected_md5=_key_md5(key))
             else:
                 log.debug("Pulled key '%s' into cache to %s", rel_path, self._get_cache_path(rel_path))
                 self.transfer_progress = 0  # Reset transfer progress counter
                 key.get_contents_to_filename(self._get_cache_path(rel_path), cb=self._transfer_cb, num_cb=10)
-                return True
-        except S3ResponseError:
+            return True
+        except (S3ResponseError, TransferError):
             log.exception("Problem downloading key '%s' from S3 bucket '%s'", rel_path, self._bucket.name)
         return False
 
+    def _read_range(self, rel_path, offset, length):
+        key = Key(self._thread_bucket(), rel_path)
+        return key.get_contents_as_string(headers={'Range': 'bytes=%d-%d' % (offset, offset + length - 1)})
+
+    def _multipart_upload(self, rel_path, source_file):
+        mp = self._bucket.initiate_multipart_upload(rel_path, reduced_redundancy=self.use_rr)
+
+        def upload_part(part_number, data, md5):
+            part_mp = MultiPartUpload(self._thread_bucket())
+            part_mp.key_name = mp.key_name
+            part_mp.id = mp.id
+            # S3 rejects parts not matching their Content-MD5
+            part_mp.upload_part_from_file(BytesIO(data), part_number, size=len(data),
+                                          md5=(md5.hexdigest(), base64.b64encode(md5.digest()).decode()))
+
+        try:
+            self.transfer.upload(source_file, upload_part)
+        except Exception:
+            mp.cancel_upload()
+            raise
+        mp.complete_upload()
+
     def _push_to_os(self, rel_path, source_file=None, from_string=None):
         """
         Push the file pointed to by ``rel_path`` to the object store naming the key
@@ -470,15 +427,14 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
                 else:
                     start_time = datetime.now()
                     log.debug("Pushing cache file '%s' of size %s bytes to key '%s'", source_file, os.path.getsize(source_file), rel_path)
-                    mb_size = os.path.getsize(source_file) / 1e6
-                    if mb_size < 10 or (not self.multipart):
+                    if os.path.getsize(source_file) <= self.transfer.part_size or (not self.multipart):
                         self.transfer_progress = 0  # Reset transfer progress counter
                         key.set_contents_from_filename(source_file,
                                                        reduced_redundancy=self.use_rr,
                                                        cb=self._transfer_cb,
                                                        num_cb=10)
                     else:
-                        multipart_upload(self.s3server, self._bucket, key.name, source_file, mb_size)
+                        self._multipart_upload(key.name, source_file)
                     end_time = datetime.now()
                     log.debug("Pushed cache file '%s' to key '%s' (%s bytes transfered in %s sec)",
                               source_file, rel_path, os.path.getsize(source_file), end_time - start_time)
@@ -486,7 +442,7 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
             else:
                 log.error("Tried updating key '%s' from source file '%s', but source file does not exist.",
                           rel_path, source_file)
-        except S3ResponseError:
+        except (S3ResponseError, TransferError):
             log.exception("Trouble pushing S3 key '%s' from file '%s'", rel_path, source_file)
         return False
 
@@ -570,6 +526,7 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
             if not dir_only:
                 rel_path = os.path.join(rel_path, alt_name if alt_name else "dataset_%s.dat" % self._get_object_id(obj))
                 open(os.path.join(self.staging_path, rel_path), 'w').close()
+                self.cache.added(rel_path)
                 self._push_to_os(rel_path, from_string='')
 
     def _empty(self, obj, **kwargs):
@@ -609,6 +566,7 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
             # but requires iterating through each individual key in S3 and deleing it.
             if entire_dir and extra_dir:
                 shutil.rmtree(self._get_cache_path(rel_path))
+                self.cache.removed_tree(rel_path)
                 results = self._bucket.get_all_keys(prefix=rel_path)
                 for key in results:
                     log.debug("Deleting key %s", key.name)
@@ -617,6 +575,7 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
             else:
                 # Delete from cache first
                 os.unlink(self._get_cache_path(rel_path))
+                self.cache.removed(rel_path)
                 # Delete from S3 as well
                 if self._key_exists(rel_path):
                     key = Key(self._bucket, rel_path)
@@ -632,7 +591,10 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
     def _get_data(self, obj, start=0, count=-1, **kwargs):
         rel_path = self._construct_path(obj, **kwargs)
         # Check cache first and get file if not there
-        if not self._in_cache(rel_path):
+        if not self.cache.lookup(rel_path):
+            if count >= 0:
+                # Fetch only the requested range, without staging the whole object
+                return unicodify(self.transfer.read(partial(self._read_range, rel_path), start, count, size=self._get_size_in_s3(rel_path)))
             self._pull_into_cache(rel_path)
         # Read the file content from cache
         data_file = open(self._get_cache_path(rel_path))
@@ -661,7 +623,7 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
         #         os.makedirs(cache_path)
         #     return cache_path
         # Check if the file exists in the cache first
-        if self._in_cache(rel_path):
+        if self.cache.lookup(rel_path, pin=True):
             return cache_path
         # Check if the file exists in persistent storage and, if it does, pull it into cache
         elif self._exists(obj, **kwargs):
@@ -693,6 +655,7 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
                         # FIXME? Should this be a `move`?
                         shutil.copy2(source_file, cache_file)
                     self._fix_permissions(cache_file)
+                    self.cache.added(rel_path)
                 except OSError:
                     log.exception("Trouble copying source file '%s' to cache '%s'", source_file, cache_file)
             else:
@@ -718,11 +681,10 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
 
     def shutdown(self):
         self.running = False
-        thread = getattr(self, 'cache_monitor_thread', None)
-        if thread:
-            log.debug("Shutting down thread")
-            self.sleeper.wake()
-            thread.join(5)
+        self._shutdown_staging_cache()
+        transfer = getattr(self, 'transfer', None)
+        if transfer:
+            transfer.shutdown()
 
 
 class SwiftObjectStore(S3ObjectStore):
@@ -735,10 +697,13 @@ class SwiftObjectStore(S3ObjectStore):
 
     def _configure_connection(self):
         log.debug("Configuring Swift Connection")
-        self.conn = boto.connect_s3(aws_access_key_id=self.access_key,
-                                    aws_secret_access_key=self.secret_key,
-                                    is_secure=self.is_secure,
-                                    host=self.host,
-                                    port=self.port,
-                                    calling_format=boto.s3.connection.OrdinaryCallingFormat(),
-                                    path=self.conn_path)
+        self.conn = self._connect()
+
+    def _connect(self):
+        return boto.connect_s3(aws_access_key_id=self.access_key,
+                               aws_secret_access_key=self.secret_key,
+                               is_secure=self.is_secure,
+                               host=self.host,
+                               port=self.port,
+                               calling_format=boto.s3.connection.OrdinaryCallingFormat(),
+                               path=self.conn_path)
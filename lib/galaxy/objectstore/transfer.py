@@ -0,0 +1,170 @@
+"""
+Concurrent transfers between object stores and local files.
+
+Objects are uploaded in parts and downloaded in byte ranges by a bounded pool
+of threads, retrying failed parts. The object store specific operations
+(uploading a part, reading a range) are passed in as callables, so the same
+engine serves the S3, cloud and Azure object stores.
+"""
+import hashlib
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import (
+    FIRST_EXCEPTION,
+    ThreadPoolExecutor,
+    wait,
+)
+
+log = logging.getLogger(__name__)
+
+MEGABYTE = 1024 * 1024
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_PART_SIZE = 16  # in MB
+# S3 rejects multipart uploads with parts (but the last) smaller than 5 MB
+MIN_PART_SIZE = 5
+DEFAULT_MAX_RETRIES = 3
+RETRY_DELAY = 1
+HASH_CHUNK_SIZE = MEGABYTE
+
+
+class TransferError(Exception):
+    pass
+
+
+def parse_transfer_xml(config_xml):
+    """Parse the optional ``transfer`` element of an object store XML configuration."""
+    t_xml = config_xml.find('transfer')
+    if t_xml is None:
+        return {}
+    return {
+        'max_workers': int(t_xml.get('max_workers', DEFAULT_MAX_WORKERS)),
+        'part_size': int(t_xml.get('part_size', DEFAULT_PART_SIZE)),
+        'max_retries': int(t_xml.get('max_retries', DEFAULT_MAX_RETRIES)),
+    }
+
+
+def md5_file(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class TransferManager:
+    """
+    Runs the parts of uploads and downloads in a pool of ``max_workers``
+    threads, in parts of ``part_size`` MB. At most ``max_workers`` parts are
+    held in memory at any time. Each part is tried ``max_retries`` + 1 times.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, part_size=DEFAULT_PART_SIZE, max_retries=DEFAULT_MAX_RETRIES):
+        self.max_workers = max_workers
+        self.part_size = max(part_size, MIN_PART_SIZE) * MEGABYTE
+        self.max_retries = max_retries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ObjectStoreTransfer")
+
+    def to_dict(self):
+        return {
+            'max_workers': self.max_workers,
+            'part_size': self.part_size // MEGABYTE,
+            'max_retries': self.max_retries,
+        }
+
+    def parts(self, size, offset=0):
+        """Return the (offset, length) tuples splitting ``size`` bytes starting at ``offset``."""
+        return [(start, min(self.part_size, offset + size - start)) for start in range(offset, offset + size, self.part_size)]
+
+    def _retry(self, description, func, *args):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return func(*args)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                log.warning("Failed to transfer %s, retrying (%d/%d)", description, attempt + 1, self.max_retries, exc_info=True)
+                time.sleep(RETRY_DELAY * 2 ** attempt)
+
+    def _run(self, tasks):
+        """Run ``(func, args)`` tasks concurrently, return their results in order."""
+        futures = [self._executor.submit(func, *args) for func, args in tasks]
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in not_done:
+            future.cancel()
+        for future in futures:
+            if future in done and future.exception():
+                # Wait for running parts before the caller cleans up after them
+                wait(not_done)
+                raise future.exception()
+        return [future.result() for future in futures]
+
+    def download(self, size, read_range, destination, expected_md5=None):
+        """
+        Download an object of ``size`` bytes to ``destination`` by fetching its
+        parts concurrently with ``read_range(offset, length)``, which must
+        return the bytes of the range. The object is written to a temporary
+        file that replaces ``destination`` once complete (and matching
+        ``expected_md5`` if given).
+        """
+        tmp_path = os.path.join(os.path.dirname(destination), ".{}.{}".format(os.path.basename(destination), uuid.uuid4().hex))
+
+        def fetch(offset, length):
+            data = self._retry("bytes %d-%d to %s" % (offset, offset + length - 1, destination), read_range, offset, length)
+            if len(data) != length:
+                raise TransferError("Expected %d bytes at offset %d of %s, got %d" % (length, offset, destination, len(data)))
+            with open(tmp_path, 'r+b') as fh:
+                fh.seek(offset)
+                fh.write(data)
+
+        with open(tmp_path, 'wb') as fh:
+            fh.truncate(size)
+        try:
+            self._run([(fetch, part) for part in self.parts(size)])
+            if expected_md5 is not None:
+                md5 = md5_file(tmp_path)
+                if md5 != expected_md5:
+                    raise TransferError(f"Checksum mismatch downloading {destination}: expected {expected_md5}, got {md5}")
+            os.replace(tmp_path, destination)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def upload(self, source, upload_part):
+        """
+        Upload ``source`` in parts concurrently with
+        ``upload_part(part_number, data, md5)``, where ``part_number`` starts
+        at 1 and ``md5`` is the hashlib object of ``data`` (e.g. to set a
+        Content-MD5 header). Return the results of ``upload_part`` in order
+        of the parts, so the caller can complete or abort the upload.
+        """
+        def send(part_number, offset, length):
+            with open(source, 'rb') as fh:
+                fh.seek(offset)
+                data = fh.read(length)
+            md5 = hashlib.md5(data)
+            return self._retry("part %d of %s" % (part_number, source), upload_part, part_number, data, md5)
+
+        parts = self.parts(os.path.getsize(source))
+        return self._run([(send, (i + 1, offset, length)) for i, (offset, length) in enumerate(parts)])
+
+    def read(self, read_range, offset, length, size=None):
+        """
+        Return ``length`` bytes at ``offset`` of an object, fetching large
+        ranges in parts concurrently with ``read_range(offset, length)``.
+        Less data is returned if the object ends before. If the ``size`` of
+        the object is known, the range is clamped to it, ranges starting at
+        or past the end of an object are rejected by object stores.
+        """
+        if size is not None and size >= 0:
+            length = min(length, size - offset)
+        if length <= 0:
+            return b''
+        parts = self.parts(length, offset=offset)
+        if len(parts) == 1:
+            return self._retry("bytes %d-%d" % (offset, offset + length - 1), read_range, offset, length)
+        return b''.join(self._run([(self._retry, ("bytes %d-%d" % (o, o + n - 1), read_range, o, n)) for o, n in parts]))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -263,6 +263,8 @@ def reload_job_rules(app, **kwargs):
                     and ismodule(module)):
                 log.debug("Reloading job rules module: %s", name)
                 importlib.reload(module)
+    from galaxy.jobs.mapper import destination_mapping_cache
+    destination_mapping_cache.clear()
     log.debug("Job rules reloaded %s", reload_timer)
 
 
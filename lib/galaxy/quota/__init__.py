@@ -2,11 +2,62 @@
 Galaxy Quotas
 """
 import logging
+import threading
+import time
+import weakref
+
+from sqlalchemy import (
+    and_,
+    case,
+    event,
+    false,
+    func,
+    select,
+    union,
+)
+from sqlalchemy.orm import Session
 
 import galaxy.util
 
 log = logging.getLogger(__name__)
 
+DEFAULT_CACHE_TTL = 60
+# Changes of rows of these classes change the quota of users
+INVALIDATING_CLASSES = frozenset((
+    'Quota',
+    'UserQuotaAssociation',
+    'GroupQuotaAssociation',
+    'DefaultQuotaAssociation',
+    'UserGroupAssociation',
+))
+# Quota agents of this process, their caches are invalidated when a session
+# commits changes of quotas.
+_quota_agents = weakref.WeakSet()
+
+
+def _after_flush(session, flush_context):
+    for obj in session.new | session.dirty | session.deleted:
+        if type(obj).__name__ in INVALIDATING_CLASSES:
+            session.info['quotas_changed'] = True
+            return
+
+
+def _after_commit(session):
+    # Invalidating at flush time would let concurrent requests cache
+    # quotas calculated before the changes are committed.
+    if session.info.pop('quotas_changed', False):
+        for agent in list(_quota_agents):
+            agent.invalidate()
+
+
+def _after_rollback(session):
+    session.info.pop('quotas_changed', None)
+
+
+event.listen(Session, 'after_flush', _after_flush)
+event.listen(Session, 'after_commit', _after_commit)
+event.listen(Session, 'after_rollback', _after_rollback)
+
 
 class NoQuotaAgent:
     """Base quota agent, always returns no quota"""
@@ -18,6 +69,12 @@ class NoQuotaAgent:
     def get_quota(self, user, nice_size=False):
         return None
 
+    def get_quotas(self, user_ids, nice_size=False):
+        return {user_id: None for user_id in user_ids}
+
+    def invalidate(self):
+        pass
+
     @property
     def default_quota(self):
         return None
@@ -44,6 +101,34 @@ class NoQuotaAgent:
 class QuotaAgent(NoQuotaAgent):
     """Class that handles galaxy quotas"""
 
+    def __init__(self, model, cache_ttl=DEFAULT_CACHE_TTL):
+        super().__init__(model)
+        self.cache_ttl = cache_ttl
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        # Changes committed by this process invalidate the cache right away,
+        # changes made by other processes once the entries expire.
+        _quota_agents.add(self)
+
+    def invalidate(self):
+        """Drop all cached quotas."""
+        with self._cache_lock:
+            self._cache.clear()
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > time.time():
+            return True, entry[1]
+        return False, None
+
+    def _cache_values(self, values):
+        if self.cache_ttl <= 0:
+            return
+        expires = time.time() + self.cache_ttl
+        with self._cache_lock:
+            for key, value in values.items():
+                self._cache[key] = (expires, value)
+
     def get_quota(self, user, nice_size=False):
         """
         Calculated like so:
@@ -57,46 +142,81 @@ class QuotaAgent(NoQuotaAgent):
                quotas.
         """
         if not user:
-            return self.default_unregistered_quota
-        quotas = []
-        for group in [uga.group for uga in user.groups]:
-            for quota in [gqa.quota for gqa in group.quotas]:
-                if quota not in quotas:
-                    quotas.append(quota)
-        for quota in [uqa.quota for uqa in user.quotas]:
-            if quota not in quotas:
-                quotas.append(quota)
-        use_default = True
-        max = 0
-        adjustment = 0
-        rval = 0
-        for quota in quotas:
-            if quota.deleted:
-                continue
-            if quota.operation == '=' and quota.bytes == -1:
-                rval = None
-                break
-            elif quota.operation == '=':
-                use_default = False
-                if quota.bytes > max:
-                    max = quota.bytes
-            elif quota.operation == '+':
-                adjustment += quota.bytes
-            elif quota.operation == '-':
-                adjustment -= quota.bytes
-        if use_default:
-            max = self.default_registered_quota
-            if max is None:
-                rval = None
-        if rval is not None:
-            rval = max + adjustment
-            if rval <= 0:
-                rval = 0
+            rval = self.default_unregistered_quota
+        else:
+            rval = self.get_quotas([user.id])[user.id]
+        if nice_size:
+            rval = self._nice_size(rval)
+        return rval
+
+    def get_quotas(self, user_ids, nice_size=False):
+        """
+        Return a dictionary mapping the ids of users to their quota in bytes
+        (None for unlimited), calculated as described in :meth:`get_quota`.
+        The quotas of users not cached are calculated with a single query.
+        """
+        rval = {}
+        missing = []
+        for user_id in set(user_ids):
+            cached, quota = self._cached(('user', user_id))
+            if cached:
+                rval[user_id] = quota
+            else:
+                missing.append(user_id)
+        if missing:
+            calculated = self._calculate_quotas(missing)
+            self._cache_values({('user', user_id): quota for user_id, quota in calculated.items()})
+            rval.update(calculated)
         if nice_size:
-            if rval is not None:
-                rval = galaxy.util.nice_size(rval)
+            rval = {user_id: self._nice_size(quota) for user_id, quota in rval.items()}
+        return rval
+
+    def _nice_size(self, quota):
+        if quota is None:
+            return 'unlimited'
+        return galaxy.util.nice_size(quota)
+
+    def _calculate_quotas(self, user_ids):
+        quota_table = self.model.Quota.table
+        uqa = self.model.UserQuotaAssociation.table
+        gqa = self.model.GroupQuotaAssociation.table
+        uga = self.model.UserGroupAssociation.table
+        # The quotas of each user, directly or through groups, counted once
+        user_quota = union(
+            select([uqa.c.user_id, uqa.c.quota_id]).where(uqa.c.user_id.in_(user_ids)),
+            select([uga.c.user_id, gqa.c.quota_id]).select_from(
+                uga.join(gqa, gqa.c.group_id == uga.c.group_id)
+            ).where(uga.c.user_id.in_(user_ids)),
+        ).alias('user_quota')
+        is_set = quota_table.c.operation == '='
+        query = select([
+            user_quota.c.user_id,
+            func.max(case([(and_(is_set, quota_table.c.bytes == -1), 1)], else_=0)),
+            func.max(case([(and_(is_set, quota_table.c.bytes >= 0), quota_table.c.bytes)])),
+            func.sum(case([
+                (quota_table.c.operation == '+', quota_table.c.bytes),
+                (quota_table.c.operation == '-', -quota_table.c.bytes),
+            ], else_=0)),
+        ]).select_from(
+            user_quota.join(quota_table, quota_table.c.id == user_quota.c.quota_id)
+        ).where(
+            quota_table.c.deleted == false()
+        ).group_by(user_quota.c.user_id)
+        default = self.default_registered_quota
+        rval = {user_id: default for user_id in user_ids}
+        for user_id, unlimited, set_bytes, adjustment in self.sa_session.execute(query):
+            if unlimited:
+                rval[user_id] = None
+                continue
+            if set_bytes is not None:
+                base = set_bytes
+            elif default is not None:
+                base = default
             else:
-                rval = 'unlimited'
+                # No '=' quota and an unlimited default
+                rval[user_id] = None
+                continue
+            rval[user_id] = max(int(base) + int(adjustment or 0), 0)
         return rval
 
     @property
@@ -108,6 +228,14 @@ class QuotaAgent(NoQuotaAgent):
         return self._default_quota(self.model.DefaultQuotaAssociation.types.REGISTERED)
 
     def _default_quota(self, default_type):
+        cached, quota = self._cached(('default', default_type))
+        if cached:
+            return quota
+        quota = self._calculate_default_quota(default_type)
+        self._cache_values({('default', default_type): quota})
+        return quota
+
+    def _calculate_default_quota(self, default_type):
         dqa = self.sa_session.query(self.model.DefaultQuotaAssociation).filter(self.model.DefaultQuotaAssociation.table.c.type == default_type).first()
         if not dqa:
             return None
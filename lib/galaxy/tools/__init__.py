@@ -10,8 +10,11 @@ import re
 import tarfile
 import tempfile
 import threading
+import time
 from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
+from functools import wraps
 from pathlib import Path
 from urllib.parse import unquote_plus
 
@@ -119,6 +122,8 @@ REQUIRES_JS_RUNTIME_MESSAGE = ("The tool [%s] requires a nodejs runtime to execu
                                "but node or nodejs could not be found. Please contact the Galaxy adminstrator")
 
 HELP_UNINITIALIZED = threading.Lock()
+# Serializes parsing the inputs and outputs of (delayed) tools
+TOOL_FINALIZE_LOCK = threading.RLock()
 MODEL_TOOLS_PATH = os.path.abspath(os.path.dirname(__file__))
 # Tools that require Galaxy's Python environment to be preserved.
 GALAXY_LIB_TOOLS_UNVERSIONED = [
@@ -223,6 +228,15 @@ class ToolNotFoundException(Exception):
     pass
 
 
+def _in_use(method):
+    """Pin the tool while ``method`` runs, see :meth:`Tool.in_use`."""
+    @wraps(method)
+    def wrapper(self, *args, **kwds):
+        with self.in_use():
+            return method(self, *args, **kwds)
+    return wrapper
+
+
 def create_tool_from_source(app, tool_source, config_file=None, **kwds):
     # Allow specifying a different tool subclass to instantiate
     tool_module = tool_source.parse_tool_module()
@@ -250,6 +264,10 @@ class ToolBox(BaseGalaxyToolBox):
         self._reload_count = 0
         self.tool_location_fetcher = ToolLocationFetcher()
         self.cache_regions = {}
+        self._cache_regions_lock = threading.Lock()
+        # Finalized tools, least recently used first
+        self._finalized_tools = OrderedDict()
+        self._finalized_tools_lock = threading.Lock()
         # This is here to deal with the old default value, which doesn't make
         # sense in an "installed Galaxy" world.
         # FIXME: ./
@@ -302,12 +320,47 @@ class ToolBox(BaseGalaxyToolBox):
         # Deprecated method, TODO - eliminate calls to this in test/.
         return self._tools_by_id
 
+    @property
+    def tool_loading_threads(self):
+        return getattr(self.app.config, "tool_loading_threads", 0) or 0
+
+    def touch_finalized_tool(self, tool):
+        """
+        Record the use of the finalized ``tool``. With delay_tool_initialization
+        and a finalized_tool_cache_size, the least recently used tools above
+        that number are released, unless they are pinned (see
+        :meth:`Tool.in_use`).
+        """
+        max_finalized_tools = getattr(self.app.config, "finalized_tool_cache_size", 0)
+        if not max_finalized_tools or not getattr(self.app.config, "delay_tool_initialization", False):
+            return
+        released_tools = []
+        with self._finalized_tools_lock:
+            self._finalized_tools[tool] = None
+            self._finalized_tools.move_to_end(tool)
+            excess = len(self._finalized_tools) - max_finalized_tools
+            for finalized_tool in list(self._finalized_tools):
+                if excess <= 0:
+                    break
+                # Tools pinned while in use are kept
+                if finalized_tool is not tool and not finalized_tool.pinned:
+                    del self._finalized_tools[finalized_tool]
+                    released_tools.append(finalized_tool)
+                    excess -= 1
+        for released_tool in released_tools:
+            released_tool.release()
+
     def get_cache_region(self, tool_cache_data_dir):
-        if tool_cache_data_dir not in self.cache_regions:
-            self.cache_regions[tool_cache_data_dir] = ToolDocumentCache(cache_dir=tool_cache_data_dir)
-        return self.cache_regions[tool_cache_data_dir]
+        with self._cache_regions_lock:
+            if tool_cache_data_dir not in self.cache_regions:
+                self.cache_regions[tool_cache_data_dir] = ToolDocumentCache(cache_dir=tool_cache_data_dir)
+            return self.cache_regions[tool_cache_data_dir]
 
-    def create_tool(self, config_file, tool_cache_data_dir=None, **kwds):
+    def _read_tool_source(self, config_file, tool_cache_data_dir=None):
+        """
+        Return the expanded tool source of ``config_file`` and whether it needs
+        to be added to the tool document cache.
+        """
         if config_file.endswith('.xml'):
             cache = self.get_cache_region(tool_cache_data_dir or self.app.config.tool_cache_data_dir)
             tool_document = cache.get(config_file)
@@ -317,14 +370,25 @@ class ToolBox(BaseGalaxyToolBox):
                     xml_tree=etree.ElementTree(etree.fromstring(tool_document['document'].encode('utf-8'))),
                     macro_paths=tool_document['macro_paths']
                 )
-            else:
-                tool_source = self.get_expanded_tool_source(config_file)
-                cache.set(config_file, tool_source)
-        else:
-            tool_source = self.get_expanded_tool_source(config_file)
-        tool = self._create_tool_from_source(tool_source, config_file=config_file, **kwds)
-        if not self.app.config.delay_tool_initialization:
-            tool.assert_finalized(raise_if_invalid=True)
+                return tool_source, False
+            return self.get_expanded_tool_source(config_file), True
+        return self.get_expanded_tool_source(config_file), False
+
+    def create_tool(self, config_file, tool_cache_data_dir=None, **kwds):
+        start = time.time()
+        prefetched = self._get_prefetched_tool_source(config_file)
+        tool_source, cache_tool_source = prefetched or self._read_tool_source(config_file, tool_cache_data_dir)
+        if cache_tool_source:
+            # The document cache is only written to from this thread
+            self.get_cache_region(tool_cache_data_dir or self.app.config.tool_cache_data_dir).set(config_file, tool_source)
+        read = time.time()
+        self._add_tool_load_timing('read', read - start)
+        try:
+            tool = self._create_tool_from_source(tool_source, config_file=config_file, **kwds)
+            if not self.app.config.delay_tool_initialization:
+                tool.assert_finalized(raise_if_invalid=True)
+        finally:
+            self._add_tool_load_timing('create', time.time() - read)
         return tool
 
     def get_expanded_tool_source(self, config_file, **kwargs):
@@ -497,15 +561,8 @@ class Tool(Dictifiable):
         # setup initial attribute values
         self.stdio_exit_codes = list()
         self.stdio_regexes = list()
-        self.inputs_by_page = list()
-        self.display_by_page = list()
-        self.action = '/tool_runner/index'
-        self.target = 'galaxy_main'
-        self.method = 'post'
         self.labels = []
-        self.check_values = True
-        self.nginx_upload = False
-        self.input_required = False
+        self.__init_form_attributes()
         self.display_interface = True
         self.require_login = False
         self.rerun = False
@@ -542,6 +599,7 @@ class Tool(Dictifiable):
         self.tool_source = tool_source
         self._is_workflow_compatible = None
         self.finalized = False
+        self._use_count = 0
         try:
             self.parse(tool_source, guid=guid, dynamic=dynamic)
         except Exception as e:
@@ -556,6 +614,7 @@ class Tool(Dictifiable):
         lazy_attributes = {
             'action',
             'check_values',
+            'display',
             'display_by_page',
             'enctype',
             'has_multiple_pages',
@@ -575,20 +634,74 @@ class Tool(Dictifiable):
             return getattr(self, name)
         raise AttributeError(name)
 
+    def __init_form_attributes(self):
+        self.action = '/tool_runner/index'
+        self.target = 'galaxy_main'
+        self.method = 'post'
+        self.check_values = True
+        self.nginx_upload = False
+        self.input_required = False
+
     def assert_finalized(self, raise_if_invalid=False):
         if self.finalized is False:
-            try:
-                self.parse_inputs(self.tool_source)
-                self.parse_outputs(self.tool_source)
-                self.finalized = True
-            except Exception:
-                toolbox = getattr(self.app, 'toolbox', None)
-                if toolbox:
-                    toolbox.remove_tool_by_id(self.id)
-                if raise_if_invalid:
-                    raise
-                else:
-                    log.warning("An error occured while parsing the tool wrapper xml, the tool is not functional", exc_info=True)
+            with TOOL_FINALIZE_LOCK:
+                if self.finalized is False:
+                    try:
+                        self.parse_inputs(self.tool_source)
+                        self.parse_outputs(self.tool_source)
+                        self.finalized = True
+                    except Exception:
+                        toolbox = getattr(self.app, 'toolbox', None)
+                        if toolbox:
+                            toolbox.remove_tool_by_id(self.id)
+                        if raise_if_invalid:
+                            raise
+                        else:
+                            log.warning("An error occured while parsing the tool wrapper xml, the tool is not functional", exc_info=True)
+                            return
+        toolbox = getattr(self.app, 'toolbox', None)
+        if toolbox and hasattr(toolbox, 'touch_finalized_tool'):
+            toolbox.touch_finalized_tool(self)
+
+    @property
+    def pinned(self):
+        return self._use_count > 0
+
+    @contextmanager
+    def in_use(self):
+        """
+        Finalize the tool and pin it for the duration of the block, pinned
+        tools are not released by the toolbox.
+        """
+        with TOOL_FINALIZE_LOCK:
+            self._use_count += 1
+        try:
+            self.assert_finalized()
+            yield self
+        finally:
+            with TOOL_FINALIZE_LOCK:
+                self._use_count -= 1
+
+    def release(self):
+        """
+        Drop the parsed inputs, outputs, tests and help of a finalized tool to
+        save memory, they are parsed again from the tool source when needed.
+        Pinned tools are not released, returns whether the tool was released.
+        """
+        with TOOL_FINALIZE_LOCK:
+            if self.finalized is not True or self.pinned:
+                return False
+            # Readers holding on to the parsed structures keep using them,
+            # they are replaced rather than modified when parsed again.
+            for name in ('inputs', 'inputs_by_page', 'display_by_page', 'display', 'outputs', 'output_collections', 'template_macro_params'):
+                self.__dict__.pop(name, None)
+            self.__tests_populated = False
+            self.__tests = None
+            self.__help = HELP_UNINITIALIZED
+            self.__help_by_page = HELP_UNINITIALIZED
+            self._is_workflow_compatible = None
+            self.finalized = False
+            return True
 
     def remove_from_cache(self):
         source_path = self.tool_source._source_path
@@ -1113,51 +1226,59 @@ class Tool(Dictifiable):
         """
         Parse the "<inputs>" element and create appropriate `ToolParameter`s.
         This implementation supports multiple pages and grouping constructs.
+
+        The parsed structures are built before being set on the tool, so that
+        threads using the tool while it is parsed again never see them
+        partially filled.
         """
         # Load parameters (optional)
-        self.inputs = OrderedDict()
+        inputs = OrderedDict()
+        inputs_by_page = []
+        display_by_page = []
+        check_values = True
+        nginx_upload = False
+        action = '/tool_runner/index'
+        target = 'galaxy_main'
+        method = 'post'
         pages = tool_source.parse_input_pages()
         enctypes = set()
         if pages.inputs_defined:
             if hasattr(pages, "input_elem"):
                 input_elem = pages.input_elem
                 # Handle properties of the input form
-                self.check_values = string_as_bool(input_elem.get("check_values", self.check_values))
-                self.nginx_upload = string_as_bool(input_elem.get("nginx_upload", self.nginx_upload))
-                self.action = input_elem.get('action', self.action)
+                check_values = string_as_bool(input_elem.get("check_values", check_values))
+                nginx_upload = string_as_bool(input_elem.get("nginx_upload", nginx_upload))
+                action = input_elem.get('action', action)
                 # If we have an nginx upload, save the action as a tuple instead of
                 # a string. The actual action needs to get url_for run to add any
                 # prefixes, and we want to avoid adding the prefix to the
                 # nginx_upload_path.
-                if self.nginx_upload and self.app.config.nginx_upload_path:
-                    if '?' in unquote_plus(self.action):
+                if nginx_upload and self.app.config.nginx_upload_path:
+                    if '?' in unquote_plus(action):
                         raise Exception('URL parameters in a non-default tool action can not be used '
                                         'in conjunction with nginx upload.  Please convert them to '
                                         'hidden POST parameters')
-                    self.action = (self.app.config.nginx_upload_path + '?nginx_redir=',
-                                   unquote_plus(self.action))
-                self.target = input_elem.get("target", self.target)
-                self.method = input_elem.get("method", self.method)
+                    action = (self.app.config.nginx_upload_path + '?nginx_redir=',
+                              unquote_plus(action))
+                target = input_elem.get("target", target)
+                method = input_elem.get("method", method)
                 # Parse the actual parameters
                 # Handle multiple page case
             for page_source in pages.page_sources:
-                inputs = self.parse_input_elem(page_source, enctypes)
+                page_inputs = self.parse_input_elem(page_source, enctypes)
                 display = page_source.parse_display()
-                self.inputs_by_page.append(inputs)
-                self.inputs.update(inputs)
-                self.display_by_page.append(display)
+                inputs_by_page.append(page_inputs)
+                inputs.update(page_inputs)
+                display_by_page.append(display)
         else:
-            self.inputs_by_page.append(self.inputs)
-            self.display_by_page.append(None)
-        self.display = self.display_by_page[0]
-        self.npages = len(self.inputs_by_page)
-        self.last_page = len(self.inputs_by_page) - 1
-        self.has_multiple_pages = bool(self.last_page)
+            inputs_by_page.append(inputs)
+            display_by_page.append(None)
+        self.add_implicit_inputs(inputs, inputs_by_page)
         # Determine the needed enctype for the form
         if len(enctypes) == 0:
-            self.enctype = "application/x-www-form-urlencoded"
+            enctype = "application/x-www-form-urlencoded"
         elif len(enctypes) == 1:
-            self.enctype = enctypes.pop()
+            enctype = enctypes.pop()
         else:
             raise Exception("Conflicting required enctypes: %s" % str(enctypes))
         # Check if the tool either has no parameters or only hidden (and
@@ -1167,11 +1288,32 @@ class Tool(Dictifiable):
         template_macros = {}
         if hasattr(tool_source, 'root'):
             template_macros = template_macro_params(tool_source.root)
-        self.template_macro_params = template_macros
-        for param in self.inputs.values():
+        input_required = False
+        for param in inputs.values():
             if not isinstance(param, (HiddenToolParameter, BaseURLToolParameter)):
-                self.input_required = True
+                input_required = True
                 break
+        self.check_values = check_values
+        self.nginx_upload = nginx_upload
+        self.action = action
+        self.target = target
+        self.method = method
+        self.enctype = enctype
+        self.template_macro_params = template_macros
+        self.input_required = input_required
+        self.npages = len(inputs_by_page)
+        self.last_page = len(inputs_by_page) - 1
+        self.has_multiple_pages = bool(self.last_page)
+        self.display_by_page = display_by_page
+        self.display = display_by_page[0]
+        self.inputs_by_page = inputs_by_page
+        self.inputs = inputs
+
+    def add_implicit_inputs(self, inputs, inputs_by_page):
+        """
+        Add inputs that are not declared in the tool source to the parsed
+        ``inputs`` and ``inputs_by_page``.
+        """
 
     def parse_help(self, tool_source):
         """
@@ -1579,6 +1721,7 @@ class Tool(Dictifiable):
         log.info(validation_timer)
         return all_params, all_errors, rerun_remap_job_id, collection_info
 
+    @_in_use
     def handle_input(self, trans, incoming, history=None, use_cached_job=False):
         """
         Process incoming parameters for this tool from the dict `incoming`,
@@ -2106,6 +2249,7 @@ class Tool(Dictifiable):
 
         return tool_dict
 
+    @_in_use
     def to_json(self, trans, kwd=None, job=None, workflow_building_mode=False):
         """
         Recursively creates a tool dictionary containing repeats, dynamic options and updated states.
@@ -2510,9 +2654,11 @@ class DataSourceTool(OutputParameterJSONTool):
         super().parse_inputs(tool_source)
         # Open all data_source tools in _top.
         self.target = '_top'
-        if 'GALAXY_URL' not in self.inputs:
-            self.inputs['GALAXY_URL'] = self._build_GALAXY_URL_parameter()
-            self.inputs_by_page[0]['GALAXY_URL'] = self.inputs['GALAXY_URL']
+
+    def add_implicit_inputs(self, inputs, inputs_by_page):
+        if 'GALAXY_URL' not in inputs:
+            inputs['GALAXY_URL'] = self._build_GALAXY_URL_parameter()
+            inputs_by_page[0]['GALAXY_URL'] = inputs['GALAXY_URL']
 
     def exec_before_job(self, app, inp_data, out_data, param_dict=None):
         if param_dict is None:
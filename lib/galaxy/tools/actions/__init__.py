@@ -5,6 +5,11 @@ import re
 from collections import OrderedDict
 from json import dumps
 
+from sqlalchemy.orm import (
+    joinedload,
+    selectinload,
+    undefer,
+)
 
 from galaxy import model
 from galaxy.exceptions import ItemAccessibilityException
@@ -22,6 +27,9 @@ from galaxy.web import url_for
 
 log = logging.getLogger(__name__)
 
+# Maximum number of datasets loaded per query when prefetching the inputs of a batch of jobs
+PREFETCH_CHUNK_SIZE = 1000
+
 
 class ToolExecutionCache:
     """ An object mean to cache calculation caused by repeatedly evaluting
@@ -33,6 +41,46 @@ class ToolExecutionCache:
         self.current_user_roles = trans.get_current_user_roles()
         self.chrom_info = {}
         self.cached_collection_elements = {}
+        # Ids of the HDAs loaded by prefetch_datasets(), which need no refresh
+        self.prefetched_hda_ids = set()
+        # (dataset, permissions) pairs of new output datasets. If not None, the
+        # caller sets them with a single insert once the datasets are flushed.
+        self.new_dataset_permissions = None
+
+    def prefetch_datasets(self, param_combinations):
+        """
+        Load the HDAs of ``param_combinations`` (e.g. the elements of mapped over
+        collections), their datasets, tags, conversions and metadata with a query
+        per chunk of datasets, rather than refreshing them one at a time while
+        collecting the inputs of every job.
+        """
+        hdas = {}
+
+        def collect(value):
+            if isinstance(value, dict):
+                for v in value.values():
+                    collect(v)
+            elif isinstance(value, list):
+                for v in value:
+                    collect(v)
+            elif isinstance(value, model.HistoryDatasetAssociation):
+                # Any flush expires the datasets, don't load them one by one to get their id
+                hda_id = model.cached_id(value)
+                if hda_id is not None:
+                    hdas[hda_id] = value
+
+        collect(list(param_combinations))
+        hda_ids = [hda_id for hda_id in hdas if hda_id not in self.prefetched_hda_ids]
+        HDA = model.HistoryDatasetAssociation
+        for i in range(0, len(hda_ids), PREFETCH_CHUNK_SIZE):
+            self.trans.sa_session.query(HDA).filter(HDA.id.in_(hda_ids[i:i + PREFETCH_CHUNK_SIZE])).options(
+                joinedload('dataset'),
+                selectinload('tags'),
+                selectinload('implicitly_converted_datasets'),
+                selectinload('implicitly_converted_parent_datasets'),
+                undefer('_metadata'),
+            ).populate_existing().all()
+        self.prefetched_hda_ids.update(hda_ids)
 
     def get_chrom_info(self, tool_id, input_dbkey):
         genome_builds = self.trans.app.genome_builds
@@ -62,7 +110,7 @@ class DefaultToolAction:
     """Default tool action is to run an external command"""
     produces_real_jobs = True
 
-    def _collect_input_datasets(self, tool, param_values, trans, history, current_user_roles=None, dataset_collection_elements=None, collection_info=None):
+    def _collect_input_datasets(self, tool, param_values, trans, history, current_user_roles=None, dataset_collection_elements=None, collection_info=None, execution_cache=None):
         """
         Collect any dataset inputs from incoming. Returns a mapping from
         parameter name to Dataset instance for each tool parameter that is
@@ -87,7 +135,8 @@ class DefaultToolAction:
                     formats = input.formats
 
                 # Need to refresh in case this conversion just took place, i.e. input above in tool performed the same conversion
-                trans.sa_session.refresh(data)
+                if not (execution_cache and isinstance(data, model.HistoryDatasetAssociation) and data.id in execution_cache.prefetched_hda_ids):
+                    trans.sa_session.refresh(data)
                 direct_match, target_ext, converted_dataset = data.find_conversion_destination(formats)
                 if not direct_match and target_ext:
                     if converted_dataset:
@@ -250,7 +299,7 @@ class DefaultToolAction:
     def _check_access(self, tool, trans):
         assert tool.allow_user_access(trans.user), "User (%s) is not allowed to access this tool." % (trans.user)
 
-    def _collect_inputs(self, tool, trans, incoming, history, current_user_roles, collection_info):
+    def _collect_inputs(self, tool, trans, incoming, history, current_user_roles, collection_info, execution_cache=None):
         """ Collect history as well as input datasets and collections. """
         # Set history.
         if not history:
@@ -260,7 +309,7 @@ class DefaultToolAction:
         # input datasets can process these normally.
         inp_dataset_collections = self.collect_input_dataset_collections(tool, incoming)
         # Collect any input datasets from the incoming parameters
-        inp_data, all_permissions = self._collect_input_datasets(tool, incoming, trans, history=history, current_user_roles=current_user_roles, collection_info=collection_info)
+        inp_data, all_permissions = self._collect_input_datasets(tool, incoming, trans, history=history, current_user_roles=current_user_roles, collection_info=collection_info, execution_cache=execution_cache)
 
         # grap tags from incoming HDAs
         preserved_tags = {}
@@ -293,7 +342,7 @@ class DefaultToolAction:
         if execution_cache is None:
             execution_cache = ToolExecutionCache(trans)
         current_user_roles = execution_cache.current_user_roles
-        history, inp_data, inp_dataset_collections, preserved_tags, all_permissions = self._collect_inputs(tool, trans, incoming, history, current_user_roles, collection_info)
+        history, inp_data, inp_dataset_collections, preserved_tags, all_permissions = self._collect_inputs(tool, trans, incoming, history, current_user_roles, collection_info, execution_cache=execution_cache)
         # Build name for output datasets based on tool name and input names
         on_text = self._get_on_text(inp_data)
 
@@ -412,7 +461,10 @@ class DefaultToolAction:
                     dataset_collection_elements[name].hda = data
                 trans.sa_session.add(data)
                 if not completed_job:
-                    trans.app.security_agent.set_all_dataset_permissions(data.dataset, output_permissions, new=True, flush=False)
+                    if execution_cache.new_dataset_permissions is not None:
+                        execution_cache.new_dataset_permissions.append((data.dataset, output_permissions))
+                    else:
+                        trans.app.security_agent.set_all_dataset_permissions(data.dataset, output_permissions, new=True, flush=False)
             data.copy_tags_to(preserved_tags)
 
             if not completed_job and trans.app.config.legacy_eager_objectstore_initialization:
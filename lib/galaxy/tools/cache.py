@@ -1,9 +1,7 @@
 import json
 import logging
 import os
-import shutil
 import sqlite3
-import tempfile
 import zlib
 from collections import defaultdict
 from threading import Lock
@@ -12,98 +10,154 @@ from sqlalchemy.orm import (
     defer,
     joinedload,
 )
-from sqlitedict import SqliteDict
 
 from galaxy.util import unicodify
 from galaxy.util.hash_util import md5_hash_file
 
 log = logging.getLogger(__name__)
 
-CURRENT_TOOL_CACHE_VERSION = 0
+CURRENT_TOOL_CACHE_VERSION = 1
+# Number of pending cache entries written to the database in one transaction
+TOOL_DOCUMENT_CACHE_FLUSH_SIZE = 1000
+TOOL_DOCUMENT_CACHE_BUSY_TIMEOUT = 30
 
 
-def encoder(obj):
-    return sqlite3.Binary(zlib.compress(json.dumps(obj).encode('utf-8')))
-
-
-def decoder(obj):
-    return json.loads(zlib.decompress(bytes(obj)).decode('utf-8'))
+class ToolDocumentCache:
+    """
+    Cache macro-expanded tool documents in a SQLite database shared by all
+    Galaxy processes.
 
+    The database is used in WAL mode, so that processes read the cache while
+    another one writes to it. Entries are upserted one by one in short
+    transactions, so concurrent writers never overwrite each other's entries.
 
-class ToolDocumentCache:
+    Documents are stored as XML. A cache hit saves reading the tool and macro
+    files and expanding the macros, the document is still parsed when the tool
+    is loaded.
+    """
 
     def __init__(self, cache_dir):
         self.cache_dir = cache_dir
         if not os.path.exists(self.cache_dir):
             os.makedirs(self.cache_dir)
-        self.cache_file = os.path.join(self.cache_dir, 'cache.sqlite')
-        self.writeable_cache_file = None
-        # Create database if necessary using 'c' flag
-        self._cache = SqliteDict(self.cache_file, flag='c', encode=encoder, decode=decoder, autocommit=False)
-        # Switch SqliteDict back to readonly
-        self._cache.flag = 'r'
+        self.cache_file = os.path.join(self.cache_dir, 'tool_document_cache.sqlite')
+        self._lock = Lock()
+        # Entries to write to the database, ``None`` marks entries to delete
+        self._pending = {}
+        self._connection = None
+        self._connect()
+
+    def _connect(self):
+        if os.access(self.cache_dir, os.W_OK):
+            connection = sqlite3.connect(self.cache_file, timeout=TOOL_DOCUMENT_CACHE_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS tool_document ('
+                'config_file TEXT PRIMARY KEY, '
+                'tool_cache_version INTEGER NOT NULL, '
+                'paths_and_modtimes TEXT NOT NULL, '
+                'macro_paths TEXT NOT NULL, '
+                'document BLOB NOT NULL)'
+            )
+        elif os.path.exists(self.cache_file):
+            # WAL mode needs a writable directory, the cache is read-only anyway
+            uri = 'file:%s?immutable=1' % self.cache_file
+            connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            connection = None
+        self._connection = connection
 
     def close(self):
-        self._cache.close()
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
 
     @property
     def cache_file_is_writeable(self):
         return os.access(self.cache_file, os.W_OK)
 
     def reopen_ro(self):
-        self._cache = SqliteDict(self.cache_file, flag='r', encode=encoder, decode=decoder, autocommit=False)
-        self.writeable_cache_file = None
+        """Re-open the database, e.g. after forking."""
+        self.close()
+        with self._lock:
+            self._connect()
 
     def get(self, config_file):
-        tool_document = self._cache.get(config_file)
-        if not tool_document:
-            return None
-        if tool_document.get('tool_cache_version') != CURRENT_TOOL_CACHE_VERSION:
+        with self._lock:
+            if config_file in self._pending:
+                return self._pending[config_file]
+            if self._connection is None:
+                return None
+            row = self._connection.execute(
+                'SELECT tool_cache_version, paths_and_modtimes, macro_paths, document FROM tool_document WHERE config_file = ?',
+                (config_file,)
+            ).fetchone()
+        if not row or row[0] != CURRENT_TOOL_CACHE_VERSION:
             return None
+        paths_and_modtimes = json.loads(row[1])
         if self.cache_file_is_writeable:
-            for path, modtime in tool_document['paths_and_modtimes'].items():
-                if os.path.getmtime(path) != modtime:
+            for path, modtime in paths_and_modtimes.items():
+                try:
+                    if os.path.getmtime(path) != modtime:
+                        return None
+                except OSError:
                     return None
-        return tool_document
-
-    def _make_writable(self):
-        if not self.writeable_cache_file:
-            self.writeable_cache_file = tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix='cache.sqlite.tmp', delete=False)
-            if os.path.exists(self.cache_file):
-                shutil.copy(self.cache_file, self.writeable_cache_file.name)
-            self._cache = SqliteDict(self.writeable_cache_file.name, flag='c', encode=encoder, decode=decoder, autocommit=False)
+        return {
+            'document': zlib.decompress(row[3]).decode('utf-8'),
+            'macro_paths': json.loads(row[2]),
+            'paths_and_modtimes': paths_and_modtimes,
+            'tool_cache_version': row[0],
+        }
 
     def persist(self):
-        if self.writeable_cache_file:
-            self._cache.commit()
-            os.rename(self.writeable_cache_file.name, self.cache_file)
-            self.reopen_ro()
+        """Write the pending entries to the database."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending or self._connection is None:
+            return
+        upserts = []
+        deletes = []
+        for config_file, tool_document in self._pending.items():
+            if tool_document is None:
+                deletes.append((config_file,))
+            else:
+                upserts.append((
+                    config_file,
+                    tool_document['tool_cache_version'],
+                    json.dumps(tool_document['paths_and_modtimes']),
+                    json.dumps(tool_document['macro_paths']),
+                    sqlite3.Binary(zlib.compress(tool_document['document'].encode('utf-8'))),
+                ))
+        try:
+            with self._connection:
+                self._connection.execute('BEGIN IMMEDIATE')
+                self._connection.executemany('DELETE FROM tool_document WHERE config_file = ?', deletes)
+                self._connection.executemany('INSERT OR REPLACE INTO tool_document VALUES (?, ?, ?, ?, ?)', upserts)
+        except sqlite3.Error:
+            log.warning("Failed to write %d entries to the tool document cache %s", len(self._pending), self.cache_file, exc_info=True)
+        self._pending = {}
 
     def set(self, config_file, tool_source):
         if self.cache_file_is_writeable:
-            self._make_writable()
             to_persist = {
                 'document': tool_source.to_string(),
                 'macro_paths': tool_source.macro_paths,
                 'paths_and_modtimes': tool_source.paths_and_modtimes(),
                 'tool_cache_version': CURRENT_TOOL_CACHE_VERSION,
             }
-            self._cache[config_file] = to_persist
+            with self._lock:
+                self._pending[config_file] = to_persist
+                if len(self._pending) >= TOOL_DOCUMENT_CACHE_FLUSH_SIZE:
+                    self._flush()
 
     def delete(self, config_file):
         if self.cache_file_is_writeable:
-            self._make_writable()
-            try:
-                del self._cache[config_file]
-            except KeyError:
-                pass
-
-    def __del__(self):
-        if self.writeable_cache_file:
-            try:
-                os.unlink(self.writeable_cache_file.name)
-            except Exception:
-                pass
+            with self._lock:
+                self._pending[config_file] = None
 
 
 class ToolCache:
@@ -159,7 +213,7 @@ class ToolCache:
                     if tool_id in self._new_tool_ids:
                         self._new_tool_ids.remove(tool_id)
                 if persist_tool_document_cache:
-                    tool.toolbox.persist_tool_document_cache()
+                    tool.app.toolbox.persist_cache()
         except Exception as e:
             log.debug("Exception while checking tools to remove from cache: %s", unicodify(e))
             # If by chance the file is being removed while calculating the hash or modtime
@@ -5,6 +5,9 @@ import os
 import shutil
 import sys
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from io import StringIO
 
 import bdbag.bdbag_api
@@ -38,7 +41,7 @@ def main(argv=None):
 
     working_directory = args.working_directory or os.getcwd()
     allow_failed_collections = request.get("allow_failed_collections", False)
-    upload_config = UploadConfig(request, registry, working_directory, allow_failed_collections)
+    upload_config = UploadConfig(request, registry, working_directory, allow_failed_collections, max_workers=args.max_workers)
     galaxy_json = _request_to_galaxy_json(upload_config, request)
     galaxy_json_path = os.path.join(working_directory, "galaxy.json")
     with open(galaxy_json_path, "w") as f:
@@ -100,6 +103,7 @@ def _fetch_target(upload_config, target):
     destination_type = destination["type"]
     is_collection = destination_type == "hdca"
     failed_elements = []
+    element_timings = {}
 
     if "collection_type" in target:
         fetched_target["collection_type"] = target["collection_type"]
@@ -124,7 +128,7 @@ def _fetch_target(upload_config, target):
             target_metadata["error_message"] = src_item["error_message"]
         return target_metadata
 
-    def _resolve_item(item):
+    def _resolve_item(item, timings):
         # Might be a dataset or a composite upload.
         requested_ext = item.get("ext", None)
         registry = upload_config.registry
@@ -189,19 +193,22 @@ def _fetch_target(upload_config, target):
         else:
             if composite:
                 raise Exception("Non-composite datatype [%s] attempting to be created with composite data." % datatype)
-            return _resolve_item_with_primary(item)
+            return _resolve_item_with_primary(item, timings)
 
-    def _resolve_item_with_primary(item):
+    def _resolve_item_with_primary(item, timings):
         error_message = None
         converted_path = None
 
+        start = time.time()
         name, path = _has_src_to_path(upload_config, item, is_dataset=True)
+        timings["fetch"] = time.time() - start
         sources = []
 
         url = item.get("url")
         if url:
             sources.append({"source_uri": url})
         hashes = item.get("hashes", [])
+        start = time.time()
         for hash_dict in hashes:
             hash_function = hash_dict.get("hash_function")
             hash_value = hash_dict.get("hash_value")
@@ -210,6 +217,8 @@ def _fetch_target(upload_config, target):
             except Exception as e:
                 error_message = str(e)
                 item["error_message"] = error_message
+        if hashes:
+            timings["hash"] = time.time() - start
 
         dbkey = item.get("dbkey", "?")
         link_data_only = upload_config.link_data_only
@@ -230,6 +239,7 @@ def _fetch_target(upload_config, target):
             registry = upload_config.registry
             check_content = upload_config.check_content
 
+            start = time.time()
             stdout, ext, datatype, is_binary, converted_path = handle_upload(
                 registry=registry,
                 path=path,
@@ -244,6 +254,7 @@ def _fetch_target(upload_config, target):
                 convert_to_posix_lines=to_posix_lines,
                 convert_spaces_to_tabs=space_to_tab,
             )
+            timings["upload"] = time.time() - start
 
             if link_data_only:
                 # Never alter a file that will not be copied to Galaxy's local file store.
@@ -293,7 +304,9 @@ def _fetch_target(upload_config, target):
             # in galaxy json add 'extra_files' and point at target derived from extra_files:
             if not link_data_only and datatype and datatype.dataset_content_needs_grooming(path):
                 # Groom the dataset content if necessary
+                start = time.time()
                 datatype.groom_dataset_content(path)
+                timings["groom"] = time.time() - start
 
         rval = {"name": name, "filename": path, "dbkey": dbkey, "ext": ext, "link_data_only": link_data_only, "sources": sources, "hashes": hashes}
         if staged_extra_files:
@@ -301,16 +314,29 @@ def _fetch_target(upload_config, target):
         return _copy_and_validate_simple_attributes(item, rval)
 
     def _resolve_item_capture_error(item):
+        timings = {}
+        start = time.time()
         try:
-            return _resolve_item(item)
+            rval = _resolve_item(item, timings)
         except Exception as e:
             rval = {"error_message": str(e)}
             rval = _copy_and_validate_simple_attributes(item, rval)
             failed_elements.append(rval)
-            return rval
+        timings["total"] = time.time() - start
+        element_timings[id(rval)] = (rval.get("name") or _item_label(item), timings)
+        return rval
 
     if expansion_error is None:
-        elements = elements_tree_map(_resolve_item_capture_error, items)
+        start = time.time()
+        elements = elements_tree_map(_resolve_item_capture_error, items, max_workers=upload_config.max_workers)
+        resolved = list(_leaf_items(elements))
+        # Elements are resolved concurrently, report failures and timings in element order.
+        failed_ids = {id(failed_element) for failed_element in failed_elements}
+        failed_elements = [element for element in resolved if id(element) in failed_ids]
+        for element in resolved:
+            _print_element_timings(element, *element_timings[id(element)])
+        print("Fetched %d element(s) for destination [%s] in %.2fs using %d worker(s)" % (
+            len(resolved), destination_type, time.time() - start, min(upload_config.max_workers, max(len(resolved), 1))))
         if is_collection and not upload_config.allow_failed_collections and len(failed_elements) > 0:
             element_error = "Failed to fetch collection element(s):\n"
             for failed_element in failed_elements:
@@ -345,18 +371,51 @@ def _decompress_target(upload_config, target):
     return result if fuzzy_root else temp_directory
 
 
-def elements_tree_map(f, items):
+def elements_tree_map(f, items, max_workers=1):
+    """Apply f to the leaf items of the elements tree items.
+
+    With max_workers > 1 the leaves are processed by a pool of threads, the
+    returned tree has the same structure and order as items regardless.
+    """
+    leaves = list(_leaf_items(items))
+    if max_workers > 1 and len(leaves) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(leaves)), thread_name_prefix="data_fetch") as executor:
+            results = list(executor.map(f, leaves))
+    else:
+        results = [f(item) for item in leaves]
+    return _replace_leaf_items(items, iter(results))
+
+
+def _leaf_items(items):
+    for item in items:
+        if "elements" in item:
+            yield from _leaf_items(item["elements"])
+        else:
+            yield item
+
+
+def _replace_leaf_items(items, results):
     new_items = []
     for item in items:
         if "elements" in item:
             new_item = item.copy()
-            new_item["elements"] = elements_tree_map(f, item["elements"])
+            new_item["elements"] = _replace_leaf_items(item["elements"], results)
             new_items.append(new_item)
         else:
-            new_items.append(f(item))
+            new_items.append(next(results))
     return new_items
 
 
+def _item_label(item):
+    return item.get("name") or item.get("url") or item.get("path") or item.get("src")
+
+
+def _print_element_timings(element, name, timings):
+    steps = ", ".join("%s %.2fs" % (step, timings[step]) for step in ("fetch", "hash", "upload", "groom") if step in timings)
+    status = "failed" if element.get("error_message") else "fetched"
+    print("Element [%s] %s in %.2fs%s" % (name, status, timings["total"], " (%s)" % steps if steps else ""))
+
+
 def _directory_to_items(directory):
     items = []
     dir_elements = {}
@@ -421,6 +480,8 @@ def _arg_parser():
     parser.add_argument("--request-version")
     parser.add_argument("--request")
     parser.add_argument("--working-directory")
+    parser.add_argument("--max-workers", type=int, default=1,
+                        help="number of elements to fetch, convert and sniff concurrently")
     return parser
 
 
@@ -447,7 +508,7 @@ def get_file_sources(working_directory):
 
 class UploadConfig:
 
-    def __init__(self, request, registry, working_directory, allow_failed_collections):
+    def __init__(self, request, registry, working_directory, allow_failed_collections, max_workers=1):
         self.registry = registry
         self.working_directory = working_directory
         self.allow_failed_collections = allow_failed_collections
@@ -457,9 +518,11 @@ class UploadConfig:
         self.auto_decompress = request.get("auto_decompress", False)
         self.validate_hashes = request.get("validate_hashes", False)
         self.link_data_only = _link_data_only(request)
+        self.max_workers = max(max_workers or 1, 1)
 
         self.__workdir = os.path.abspath(".")
         self.__upload_count = 0
+        self.__upload_count_lock = threading.Lock()
 
     def get_option(self, item, key):
         """Return item[key] if specified otherwise use default from UploadConfig.
@@ -473,8 +536,9 @@ class UploadConfig:
             return getattr(self, key)
 
     def __new_dataset_path(self):
-        path = "gxupload_%d" % self.__upload_count
-        self.__upload_count += 1
+        with self.__upload_count_lock:
+            path = "gxupload_%d" % self.__upload_count
+            self.__upload_count += 1
         return path
 
     def ensure_in_working_directory(self, path, purge_source, in_place):
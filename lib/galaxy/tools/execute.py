@@ -9,7 +9,7 @@ import logging
 from galaxy import model
 from galaxy.model.dataset_collections.structure import get_structure, tool_output_to_structure
 from galaxy.tool_util.parser import ToolOutputCollectionPart
-from galaxy.tools.actions import filter_output, on_text_for_names, ToolExecutionCache
+from galaxy.tools.actions import filter_output, on_text_for_names, PREFETCH_CHUNK_SIZE, ToolExecutionCache
 
 log = logging.getLogger(__name__)
 
@@ -87,6 +87,14 @@ def execute(trans, tool, mapping_params, history, rerun_remap_job_id=None, colle
 
     execution_tracker.ensure_implicit_collections_populated(history, mapping_params.param_template)
     job_count = len(execution_tracker.param_combinations)
+    if collection_info:
+        # Load the datasets mapped over in bulk instead of once per job
+        param_combinations = execution_tracker.param_combinations
+        if max_num_jobs:
+            param_combinations = param_combinations[:max_num_jobs]
+        execution_cache.prefetch_datasets(param_combinations)
+    # Set the permissions of all output datasets at once after they are flushed
+    execution_cache.new_dataset_permissions = []
 
     jobs_executed = 0
     has_remaining_jobs = False
@@ -102,11 +110,12 @@ def execute(trans, tool, mapping_params, history, rerun_remap_job_id=None, colle
             jobs_executed += 1
 
     if execution_slice:
-        # a side effect of adding datasets to a history is a commit within db_next_hid (even with flush=False).
+        # hids are reserved by db_next_hid on its own connection, the datasets are written by the flush below.
         history.add_pending_items()
-    else:
-        # Make sure collections, implicit jobs etc are flushed even if there are no precreated output datasets
-        trans.sa_session.flush()
+    # Make sure collections, implicit jobs etc are flushed even if there are no precreated output datasets
+    trans.sa_session.flush()
+    tool.app.security_agent.set_new_datasets_permissions(execution_cache.new_dataset_permissions)
+    _reload_jobs(trans.sa_session, execution_tracker.successful_jobs)
     for job in execution_tracker.successful_jobs:
         # Put the job in the queue if tracking in memory
         tool.app.job_manager.enqueue(job, tool=tool, flush=False)
@@ -122,6 +131,13 @@ def execute(trans, tool, mapping_params, history, rerun_remap_job_id=None, colle
     return execution_tracker
 
 
+def _reload_jobs(sa_session, jobs):
+    """Load ``jobs``, expired by a flush, a chunk at a time rather than one by one as they are enqueued."""
+    job_ids = [model.cached_id(job) for job in jobs]
+    for i in range(0, len(job_ids), PREFETCH_CHUNK_SIZE):
+        sa_session.query(model.Job).filter(model.Job.id.in_(job_ids[i:i + PREFETCH_CHUNK_SIZE])).all()
+
+
 class ExecutionSlice:
 
     def __init__(self, job_index, param_combination, dataset_collection_elements=None):
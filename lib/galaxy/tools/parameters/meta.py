@@ -3,6 +3,8 @@ import itertools
 import logging
 from collections import namedtuple, OrderedDict
 
+from sqlalchemy.orm import selectinload
+
 from galaxy import (
     exceptions,
     model,
@@ -247,13 +249,28 @@ def __expand_collection_parameter(trans, input_key, incoming_val, collections_to
         return subcollection_elements
     else:
         hdas = []
-        for element in hdc.collection.dataset_elements:
+        collection = __load_dataset_elements(trans, hdc.collection)
+        for element in collection.dataset_elements:
             hda = element.dataset_instance
             hda.element_identifier = element.element_identifier
             hdas.append(hda)
         return hdas
 
 
+def __load_dataset_elements(trans, collection):
+    """
+    Load the elements of ``collection``, of its nested collections and their
+    datasets with one query per level instead of one query per element.
+    """
+    elements_loader = selectinload('elements')
+    for _ in range(collection.collection_type.count(':')):
+        elements_loader = elements_loader.joinedload('child_collection').selectinload('elements')
+    DatasetCollection = model.DatasetCollection
+    return trans.sa_session.query(DatasetCollection).filter(DatasetCollection.id == collection.id).options(
+        elements_loader.joinedload('hda').joinedload('dataset')
+    ).one()
+
+
 def __collection_multirun_parameter(value):
     is_batch = value.get('batch', False)
     if not is_batch:
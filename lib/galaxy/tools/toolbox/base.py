@@ -7,6 +7,7 @@ from collections import (
     namedtuple,
     OrderedDict
 )
+from concurrent.futures import ThreadPoolExecutor
 from errno import ENOENT
 from urllib.parse import urlparse
 
@@ -22,6 +23,7 @@ from galaxy.tool_util.deps import (
     NullDependencyManager
 )
 from galaxy.tool_util.loader_directory import looks_like_a_tool
+from galaxy.tool_util.parser import get_tool_source
 from galaxy.util import (
     etree,
     ExecutionTimer,
@@ -109,6 +111,11 @@ class AbstractToolBox(Dictifiable, ManagesIntegratedToolPanelMixin):
         self._tool_config_watcher = self.app.watchers.tool_config_watcher
         self._filter_factory = FilterFactory(self)
         self._tool_tag_manager = tool_tag_manager(app)
+        # Futures of tool sources read ahead of loading the tools, by tool config file
+        self._prefetched_tool_sources = {}
+        self._tool_source_executor = None
+        # Seconds spent on the phases of loading tools, reported once all config files are read
+        self._tool_load_timings = {}
         self._init_tools_from_configs(config_filenames)
         if self.app.name == 'galaxy' and self._integrated_tool_panel_config_has_contents:
             # Load self._tool_panel based on the order in self._integrated_tool_panel.
@@ -125,11 +132,87 @@ class AbstractToolBox(Dictifiable, ManagesIntegratedToolPanelMixin):
     def can_load_config_file(self, config_filename):
         return True
 
+    @property
+    def tool_loading_threads(self):
+        """
+        Number of threads reading tool sources ahead of loading the tools, 0 to
+        read each tool source when the tool is loaded.
+        """
+        return 0
+
+    def _read_tool_source(self, config_file, tool_cache_data_dir=None):
+        """
+        Return the tool source of ``config_file`` and whether it needs to be
+        added to a tool document cache. Called from the threads reading tool
+        sources ahead if ``tool_loading_threads`` is set.
+        """
+        return get_tool_source(config_file), False
+
+    def _prefetch_tool_sources(self, items, tool_path, tool_cache_data_dir=None):
+        """
+        Start reading the tool sources of the tools of the tool config ``items``
+        (and of their sections) in the background. The tools are still created
+        and added to the tool panel one at a time in the order of the items, by
+        ``create_tool`` picking the tool sources up with ``_get_prefetched_tool_source``.
+        """
+        for item in items:
+            sub_items = item.items if item.type == 'section' else [item]
+            for sub_item in sub_items:
+                if sub_item.type != 'tool':
+                    continue
+                concrete_path = os.path.join(tool_path, self._get_tool_item_path(sub_item))
+                if concrete_path in self._prefetched_tool_sources or not os.path.exists(concrete_path):
+                    continue
+                if self.load_tool_from_cache(concrete_path):
+                    # The tool itself is reused
+                    continue
+                self._prefetched_tool_sources[concrete_path] = self._tool_source_executor.submit(
+                    self._read_tool_source, concrete_path, tool_cache_data_dir
+                )
+
+    def _get_prefetched_tool_source(self, config_file):
+        """
+        Return the tool source of ``config_file`` read in the background (raising
+        the exception reading it raised), or None if it was not prefetched.
+        """
+        future = self._prefetched_tool_sources.pop(config_file, None)
+        if future is None:
+            return None
+        return future.result()
+
+    def _add_tool_load_timing(self, phase, seconds):
+        self._tool_load_timings[phase] = self._tool_load_timings.get(phase, 0.0) + seconds
+
     def _init_tools_from_configs(self, config_filenames):
         """ Read through all tool config files and initialize tools in each
         with init_tools_from_config below.
         """
         execution_timer = ExecutionTimer()
+        self._tool_load_timings = {}
+        if self.tool_loading_threads:
+            self._tool_source_executor = ThreadPoolExecutor(max_workers=self.tool_loading_threads, thread_name_prefix="ToolSourceReader")
+        try:
+            self._init_tools_from_config_files(config_filenames)
+        finally:
+            if self._tool_source_executor:
+                for future in self._prefetched_tool_sources.values():
+                    future.cancel()
+                self._tool_source_executor.shutdown()
+                self._tool_source_executor = None
+                self._prefetched_tool_sources = {}
+        elapsed = execution_timer.elapsed
+        timings = self._tool_load_timings
+        log.debug(
+            "Reading tools from config files finished %s: reading tool sources %0.3f s (%s), creating tools %0.3f s, "
+            "registering tools %0.3f s",
+            execution_timer,
+            timings.get('read', 0.0),
+            "%d threads" % self.tool_loading_threads if self.tool_loading_threads else "serially",
+            timings.get('create', 0.0),
+            max(elapsed - timings.get('read', 0.0) - timings.get('create', 0.0), 0.0),
+        )
+
+    def _init_tools_from_config_files(self, config_filenames):
         self._tool_tag_manager.reset_tags()
         config_filenames = listify(config_filenames)
         for config_filename in config_filenames:
@@ -154,7 +237,6 @@ class AbstractToolBox(Dictifiable, ManagesIntegratedToolPanelMixin):
                     raise
             except Exception:
                 log.exception("Error loading tools defined in config %s", config_filename)
-        log.debug("Reading tools from config files finished %s", execution_timer)
 
     def _init_tools_from_config(self, config_filename):
         """
@@ -201,7 +283,10 @@ class AbstractToolBox(Dictifiable, ManagesIntegratedToolPanelMixin):
         tool_path = self.__resolve_tool_path(tool_path, config_filename)
         # Only load the panel_dict under certain conditions.
         load_panel_dict = not self._integrated_tool_panel_config_has_contents
-        for item in tool_conf_source.parse_items():
+        items = tool_conf_source.parse_items()
+        if self._tool_source_executor:
+            self._prefetch_tool_sources(items, tool_path, tool_cache_data_dir=tool_cache_data_dir)
+        for item in items:
             index = self._index
             self._index += 1
             if parsing_shed_tool_conf:
@@ -631,11 +716,14 @@ class AbstractToolBox(Dictifiable, ManagesIntegratedToolPanelMixin):
     def _path_template_kwds(self):
         return {}
 
+    def _get_tool_item_path(self, item):
+        path_template = item.get("file")
+        template_kwds = self._path_template_kwds()
+        return string.Template(path_template).safe_substitute(**template_kwds)
+
     def _load_tool_tag_set(self, item, panel_dict, integrated_panel_dict, tool_path, load_panel_dict, guid=None, index=None, tool_cache_data_dir=None):
         try:
-            path_template = item.get("file")
-            template_kwds = self._path_template_kwds()
-            path = string.Template(path_template).safe_substitute(**template_kwds)
+            path = self._get_tool_item_path(item)
             concrete_path = os.path.join(tool_path, path)
             if not os.path.exists(concrete_path):
                 # This is a lot faster than attempting to load a non-existing tool
@@ -30,6 +30,10 @@ class GalaxyStatsdClient:
         infix = self._effective_infix(path, tags)
         self.statsd_client.incr(infix + path, n)
 
+    def gauge(self, path, value, tags=None):
+        infix = self._effective_infix(path, tags)
+        self.statsd_client.gauge(infix + path, value)
+
     def _effective_infix(self, path, tags):
         tags = tags or {}
         if self.statsd_influxdb and tags:
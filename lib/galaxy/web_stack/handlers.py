@@ -14,7 +14,8 @@ from sqlalchemy.orm import object_session
 from galaxy.exceptions import HandlerAssignmentError
 from galaxy.util import (
     ExecutionTimer,
-    listify
+    listify,
+    string_as_bool
 )
 
 log = logging.getLogger(__name__)
@@ -79,6 +80,12 @@ class ConfiguresHandlers:
             max_grab_str = config_element.attrib.get('max_grab', None)
             if max_grab_str:
                 handling_config_dict["max_grab"] = int(max_grab_str)
+            grab_batch_size_str = config_element.attrib.get('grab_batch_size', None)
+            if grab_batch_size_str:
+                handling_config_dict["grab_batch_size"] = int(grab_batch_size_str)
+            shard_grab_str = config_element.attrib.get('shard_grab', None)
+            if shard_grab_str:
+                handling_config_dict["shard_grab"] = string_as_bool(shard_grab_str)
 
         return handling_config_dict
 
@@ -125,6 +132,10 @@ class ConfiguresHandlers:
             self.handler_max_grab = handling_config_dict.get('max_grab', self.handler_max_grab)
             if self.handler_max_grab is not None:
                 self.handler_max_grab = int(self.handler_max_grab)
+            self.handler_grab_batch_size = handling_config_dict.get('grab_batch_size', self.handler_grab_batch_size)
+            if self.handler_grab_batch_size is not None:
+                self.handler_grab_batch_size = int(self.handler_grab_batch_size)
+            self.handler_shard_grab = string_as_bool(handling_config_dict.get('shard_grab', self.handler_shard_grab))
 
     def _set_default_handler_assignment_methods(self):
         if not self.handler_assignment_methods_configured:
@@ -276,6 +287,24 @@ class ConfiguresHandlers:
         """
         return filter(lambda k: self.app.config.server_name in self.handlers[k], self.handler_tags)
 
+    def get_handler_shard(self):
+        """Get the shard of self-assignable items for the current process.
+
+        Handlers sharing any of the current process's tags split the items by id, each handler's shard being its position
+        among those handlers (sorted by ID).
+
+        :returns: tuple -- (shard index, shard count), or None if the current process is the only handler for its tags.
+        """
+        handlers = set()
+        for tag in self.self_handler_tags:
+            handlers.update(self.handlers[tag])
+        server_name = self.app.config.server_name
+        if server_name not in handlers or len(handlers) < 2:
+            log.debug("Not sharding item grabbing for handler '%s', no other handlers share its tags", server_name)
+            return None
+        handlers = sorted(handlers)
+        return handlers.index(server_name), len(handlers)
+
     # If these get to be any more complex we should probably modularize them, or at least move to a separate class
 
     def _assign_handler_direct(self, obj, configured, flush=True):
@@ -318,7 +347,7 @@ class ConfiguresHandlers:
             log.warning("(%s) Ignoring handler assignment to '%s' because configured handler assignment method"
                         " '' overrides per-tool handler assignment", obj.log_str(),
                         HANDLER_ASSIGNMENT_METHODS.MEM_SELF, configured)
-        if flush():
+        if flush:
             _timed_flush_obj(obj)
         queue_callback()
         return self.app.config.server_name
@@ -122,8 +122,14 @@ class UserAPIController(BaseAPIController, UsesTagsMixin, CreatesApiKeysMixin, B
                 item = trans.user.to_dict(value_mapper={'id': trans.security.encode_id})
                 return [item]
             query = query.filter(trans.app.model.User.table.c.deleted == false())
-        for user in query:
+        users = query.all()
+        quotas = {}
+        if trans.user_is_admin and trans.app.config.enable_quotas:
+            quotas = trans.app.quota_agent.get_quotas([user.id for user in users], nice_size=True)
+        for user in users:
             item = user.to_dict(value_mapper={'id': trans.security.encode_id})
+            if user.id in quotas:
+                item['quota'] = quotas[user.id]
             # If NOT configured to expose_email, do not expose email UNLESS the user is self, or
             # the user is an admin
             if user is not trans.user and not trans.user_is_admin:
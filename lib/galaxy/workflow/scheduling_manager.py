@@ -49,6 +49,8 @@ class WorkflowSchedulingManager(ConfiguresHandlers):
         self.handler_assignment_methods_configured = False
         self.handler_assignment_methods = None
         self.handler_max_grab = None
+        self.handler_grab_batch_size = None
+        self.handler_shard_grab = False
         self.default_handler_id = None
 
         self.__plugin_classes = self.__plugins_dict()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Build the location index of a distributed or hierarchical object store
+(configured with its ``location_index`` attribute) for existing datasets.
+
+Every backend is asked for each dataset once, afterwards Galaxy finds the
+datasets through the index. For distributed object stores only datasets
+without a valid ``object_store_id`` are indexed, unless ``--all`` is given.
+
+% python scripts/objectstore/build_location_index.py -c config/galaxy.yml
+"""
+import argparse
+import os
+import sys
+
+from sqlalchemy import false
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'lib')))
+
+import galaxy.config
+from galaxy.objectstore import (
+    build_object_store_from_config,
+    DistributedObjectStore,
+    NestedObjectStore,
+)
+from galaxy.util.script import app_properties_from_args, populate_config_args
+
+BATCH_SIZE = 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    populate_config_args(parser)
+    parser.add_argument('--all', action='store_true', help='also index datasets with a valid object_store_id')
+    parser.add_argument('--rebuild', action='store_true', help='clear the index first')
+    args = parser.parse_args(argv)
+
+    app_properties = app_properties_from_args(args)
+    config = galaxy.config.Configuration(**app_properties)
+    object_store = build_object_store_from_config(config)
+    if not isinstance(object_store, NestedObjectStore) or object_store.location_index is None:
+        sys.exit("The object store has no location index, set the location_index attribute of a distributed or hierarchical object store")
+    model = galaxy.config.init_models_from_config(config, object_store=object_store)
+    sa_session = model.context.current
+    index = object_store.location_index
+    if args.rebuild:
+        index.clear()
+
+    skip_valid = isinstance(object_store, DistributedObjectStore) and not args.all
+    query = sa_session.query(model.Dataset).filter(model.Dataset.purged == false()).enable_eagerloads(False)
+    indexed = missing = skipped = 0
+    batch = []
+    for dataset in query.yield_per(BATCH_SIZE):
+        if skip_valid and dataset.object_store_id in object_store.backends:
+            skipped += 1
+            continue
+        backend_id = object_store.locate(dataset, record=False)
+        if backend_id is None:
+            missing += 1
+            continue
+        batch.append((object_store.location_key(dataset), backend_id))
+        indexed += 1
+        if len(batch) >= BATCH_SIZE:
+            index.record_many(batch)
+            batch = []
+    index.record_many(batch)
+    print(f"Indexed {indexed} datasets, {missing} not found in any backend, {skipped} with a valid object_store_id skipped")
+    print(f"{index.count()} locations in {index.path}")
+    object_store.shutdown()
+
+
+if __name__ == '__main__':
+    main()
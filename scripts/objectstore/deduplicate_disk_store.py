@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Deduplicate the files of an existing disk object store in place, so that it
+can be switched to (or continue as) a ``deduplicating_disk`` object store.
+
+Every regular, non-empty file below ``files_dir`` that is not linked yet is
+replaced by a hard link to a blob named after the digest of its content.
+Paths and contents of the datasets do not change.
+
+Stop Galaxy (web and job handler processes) and wait for running jobs to
+finish first. Files are made read-only and replaced by links, so data that
+jobs or uploads are still writing to a dataset would be lost.
+
+% python scripts/objectstore/deduplicate_disk_store.py database/objects
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'lib')))
+
+from galaxy.objectstore.deduplicating import (
+    BlobStore,
+    DEFAULT_BLOBS_DIR_NAME,
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files_dir', help='files_dir of the object store')
+    parser.add_argument('--blobs_dir', help='directory for the blobs, defaults to %s in files_dir' % DEFAULT_BLOBS_DIR_NAME)
+    parser.add_argument('--umask', type=lambda value: int(value, 8), default=0o022, help='umask (octal) applied to the blobs')
+    parser.add_argument('--collect_garbage', action='store_true', help='remove unreferenced blobs afterwards')
+    args = parser.parse_args(argv)
+
+    files_dir = os.path.abspath(args.files_dir)
+    blobs_dir = os.path.abspath(args.blobs_dir or os.path.join(files_dir, DEFAULT_BLOBS_DIR_NAME))
+    blobs = BlobStore(blobs_dir, umask=args.umask)
+    files = saved = 0
+    for dirpath, dirnames, filenames in os.walk(files_dir):
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != blobs_dir]
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                saved += blobs.deduplicate(path)
+            except OSError as e:
+                print(f"Failed to deduplicate {path}: {e}", file=sys.stderr)
+                continue
+            files += 1
+    print(f"Processed {files} files, {blobs.deduplicated} duplicates, saved {saved} bytes")
+    if args.collect_garbage:
+        print(f"Collected {blobs.collect_garbage()} bytes of unreferenced blobs")
+    stats = blobs.stats()
+    print("{blobs} blobs referenced by {references} files, {stored_bytes} bytes stored for {logical_bytes} bytes of content".format(**stats))
+
+
+if __name__ == '__main__':
+    main()
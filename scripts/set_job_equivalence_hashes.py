@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Set the equivalence hash of successful jobs run before Galaxy recorded it
+when jobs finish, so that ``use_cached_job`` finds them with an indexed
+query rather than by searching their parameters and inputs.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, 'lib')))
+
+from sqlalchemy.orm import selectinload
+
+import galaxy.config
+from galaxy.model.job_equivalence import job_equivalence_hash
+from galaxy.objectstore import build_object_store_from_config
+from galaxy.util.script import app_properties_from_args, populate_config_args
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--commit-size', dest='commit_size', type=int, default=1000, help='Number of jobs hashed per query and transaction')
+parser.add_argument('--min-job-id', dest='min_job_id', type=int, default=0, help='Only hash jobs with an id larger than this one, e.g. to resume an interrupted run')
+populate_config_args(parser)
+args = parser.parse_args()
+
+
+def init():
+    app_properties = app_properties_from_args(args)
+    config = galaxy.config.Configuration(**app_properties)
+
+    object_store = build_object_store_from_config(config)
+    model = galaxy.config.init_models_from_config(config, object_store=object_store)
+    return model, object_store
+
+
+def unhashed_jobs(sa_session, model, after_id, limit):
+    Job = model.Job
+    return sa_session.query(Job).filter(
+        Job.id > after_id,
+        Job.state == Job.states.OK,
+        Job.equivalence_hash.is_(None),
+        Job.copied_from_job_id.is_(None),
+    ).options(
+        selectinload('parameters'),
+        selectinload('input_datasets').joinedload('dataset'),
+    ).order_by(Job.id).limit(limit).all()
+
+
+if __name__ == '__main__':
+    print('Loading Galaxy model...')
+    model, object_store = init()
+    sa_session = model.context.current
+
+    last_id = args.min_job_id
+    hashed = unhashable = 0
+    while True:
+        jobs = unhashed_jobs(sa_session, model, last_id, args.commit_size)
+        if not jobs:
+            break
+        for job in jobs:
+            job.equivalence_hash = job_equivalence_hash(sa_session, job)
+            if job.equivalence_hash is None:
+                unhashable += 1
+            else:
+                hashed += 1
+        last_id = jobs[-1].id
+        sa_session.flush()
+        sa_session.expunge_all()
+        print('\rHashed %i jobs (%i could not be hashed), last job id %i' % (hashed, unhashable, last_id), end=' ')
+        sys.stdout.flush()
+    print('\nDone')
+    object_store.shutdown()
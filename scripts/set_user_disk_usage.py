@@ -7,6 +7,11 @@ import sys
 sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, 'lib')))
 
 import galaxy.config
+from galaxy.model.disk_usage import (
+    DEFAULT_BATCH_SIZE,
+    find_disk_usage_drift,
+    recalculate_disk_usage,
+)
 from galaxy.objectstore import build_object_store_from_config
 from galaxy.util import nice_size
 from galaxy.util.script import app_properties_from_args, populate_config_args
@@ -17,6 +22,8 @@ parser = argparse.ArgumentParser()
 parser.add_argument('-u', '--username', dest='username', help='Username of user to update', default='all')
 parser.add_argument('-e', '--email', dest='email', help='Email address of user to update', default='all')
 parser.add_argument('--dry-run', dest='dryrun', help='Dry run (show changes but do not save to database)', action='store_true', default=False)
+parser.add_argument('--commit-size', dest='commit_size', type=int, default=DEFAULT_BATCH_SIZE, help='Number of users recalculated per query and transaction when updating all users')
+parser.add_argument('--check-drift', dest='check_drift', type=int, default=0, metavar='N', help='Only compare the recorded disk usage of N randomly chosen users with their datasets')
 populate_config_args(parser)
 args = parser.parse_args()
 
@@ -35,6 +42,17 @@ def init():
     return galaxy.config.init_models_from_config(config, object_store=object_store), object_store, engine
 
 
+def print_change(current, new):
+    print('old usage:', nice_size(current), 'change:', end=' ')
+    if new in (current, None):
+        print('none')
+    else:
+        if new > current:
+            print('+%s' % (nice_size(new - current)))
+        else:
+            print('-%s' % (nice_size(current - new)))
+
+
 def quotacheck(sa_session, users, engine):
     sa_session.refresh(user)
     current = user.get_disk_usage()
@@ -48,14 +66,7 @@ def quotacheck(sa_session, users, engine):
     else:
         new = user.calculate_disk_usage()
 
-    print('old usage:', nice_size(current), 'change:', end=' ')
-    if new in (current, None):
-        print('none')
-    else:
-        if new > current:
-            print('+%s' % (nice_size(new - current)))
-        else:
-            print('-%s' % (nice_size(current - new)))
+    print_change(current, new)
 
 
 if __name__ == '__main__':
@@ -63,13 +74,22 @@ if __name__ == '__main__':
     model, object_store, engine = init()
     sa_session = model.context.current
 
+    if args.check_drift:
+        drift = find_disk_usage_drift(model.engine, sample_size=args.check_drift)
+        for user_id, recorded, actual in drift:
+            print('user %i: recorded %s, datasets %s' % (user_id, nice_size(recorded), nice_size(actual)))
+        print('%i of %i users checked differ' % (len(drift), args.check_drift))
+        object_store.shutdown()
+        sys.exit(1 if drift else 0)
     if not args.username and not args.email:
         user_count = sa_session.query(model.User).count()
         print('Processing %i users...' % user_count)
-        for i, user in enumerate(sa_session.query(model.User).enable_eagerloads(False).yield_per(1000)):
-            print('%3i%%' % int(float(i) / user_count * 100), end=' ')
-            quotacheck(sa_session, user, engine)
-        print('100% complete')
+        changed = 0
+        for user_id, current, new in recalculate_disk_usage(model.engine, commit_size=args.commit_size, dryrun=args.dryrun):
+            print('user %i:' % user_id, end=' ')
+            print_change(current, new)
+            changed += 1
+        print('100%% complete, %i users changed' % changed)
         object_store.shutdown()
         sys.exit(0)
     elif args.username:
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""Benchmark newline and space-to-tab conversion of uploads.
+
+Tabular files of ``--size`` MB with Posix, Windows and classic Mac line
+endings (plain and gzip compressed) are generated in a temporary directory
+and converted ``--repeat`` times. The throughput in MB/s of the uncompressed
+size is reported for :func:`galaxy.datatypes.sniff.convert_newlines`,
+:func:`galaxy.datatypes.sniff.convert_newlines_sep2tabs` and the complete
+upload path (:func:`galaxy.datatypes.sniff.handle_uploaded_dataset_file_internal`,
+decompression and conversion included).
+
+% python test/manual/convert_newlines_benchmark.py --size 256
+"""
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+galaxy_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+sys.path[1:1] = [os.path.join(galaxy_root, "lib")]
+
+from galaxy.datatypes.registry import example_datatype_registry_for_sample
+from galaxy.datatypes.sniff import (
+    convert_newlines,
+    convert_newlines_sep2tabs,
+    handle_uploaded_dataset_file_internal,
+)
+
+DESCRIPTION = "Benchmark converting line endings and spaces of uploaded files."
+NEWLINES = {"posix": b"\n", "windows": b"\r\n", "mac": b"\r"}
+
+
+def write_file(path, size, newline, compress):
+    line = b"chr1 %d %d feature 0 +" + newline
+    opener = gzip.open if compress else open
+    written = 0
+    with opener(path, "wb") as f:
+        i = 0
+        while written < size:
+            block = b"".join(line % (i + j, i + j + 100) for j in range(10000))
+            f.write(block)
+            written += len(block)
+            i += 10000
+    return written
+
+
+def timed(repeat, setup, run):
+    elapsed = 0
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        run(*args)
+        elapsed += time.perf_counter() - start
+    return elapsed / repeat
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("--size", type=int, default=64, help="uncompressed size of the test files in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--directory", default=None, help="directory to create the test files in")
+    args = parser.parse_args(argv)
+
+    registry = example_datatype_registry_for_sample()
+    directory = tempfile.mkdtemp(dir=args.directory)
+    try:
+        for name, newline in NEWLINES.items():
+            for compress in (False, True):
+                source = os.path.join(directory, "source_%s%s" % (name, ".gz" if compress else ""))
+                size = write_file(source, args.size * 2 ** 20, newline, compress)
+                work = os.path.join(directory, "work")
+
+                def setup():
+                    shutil.copy(source, work)
+                    return ()
+
+                results = []
+                if not compress:
+                    results.append(("convert_newlines", timed(args.repeat, setup, lambda: convert_newlines(work, tmp_dir=directory))))
+                    results.append(("convert_newlines_sep2tabs", timed(args.repeat, setup, lambda: convert_newlines_sep2tabs(work, tmp_dir=directory))))
+                for ext in ("auto", "tabular"):
+                    def upload():
+                        handle_uploaded_dataset_file_internal(
+                            work, registry, ext=ext, tmp_dir=directory, in_place=True,
+                            convert_to_posix_lines=True, convert_spaces_to_tabs=True,
+                        )
+                    results.append(("upload (ext=%s)" % ext, timed(args.repeat, setup, upload)))
+                for label, duration in results:
+                    print("%-8s %-5s %-28s %8.1f MB/s" % (name, "gz" if compress else "plain", label, size / 2 ** 20 / duration))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
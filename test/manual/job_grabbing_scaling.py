@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""Benchmark job self-assignment by concurrently running handlers.
+
+Creates ``--jobs`` unassigned jobs in the database at ``--database_connection``
+and starts ``--handlers`` processes that each self-assign jobs with the
+ItemGrabber used by Galaxy's job handlers until no unassigned jobs remain. The
+number of jobs grabbed per second by each handler is reported.
+
+Use a PostgreSQL database to benchmark the db-skip-locked method, e.g.:
+
+% python test/manual/job_grabbing_scaling.py --database_connection postgresql:///galaxy_grab_bench --handlers 10 --grab_batch_size 50 --shard_grab
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+galaxy_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+sys.path[1:1] = [os.path.join(galaxy_root, "lib")]
+
+from galaxy import model
+from galaxy.jobs.handler import ItemGrabber
+from galaxy.model import mapping
+from galaxy.util.bunch import Bunch
+from galaxy.web_stack.handlers import HANDLER_ASSIGNMENT_METHODS
+
+DESCRIPTION = "Benchmark concurrent job grabbing by job handlers."
+HANDLER_TAG = "_default_"
+
+
+def main(argv=None):
+    """Entry point for the benchmark."""
+    arg_parser = ArgumentParser(description=DESCRIPTION)
+    arg_parser.add_argument("--database_connection", default=None,
+                            help="database URL, defaults to a temporary SQLite database")
+    arg_parser.add_argument("--jobs", type=int, default=10000)
+    arg_parser.add_argument("--handlers", type=int, default=4)
+    arg_parser.add_argument("--assign_with", default=None,
+                            choices=[HANDLER_ASSIGNMENT_METHODS.DB_SKIP_LOCKED, HANDLER_ASSIGNMENT_METHODS.DB_TRANSACTION_ISOLATION],
+                            help="defaults to db-skip-locked on PostgreSQL and db-transaction-isolation otherwise")
+    arg_parser.add_argument("--max_grab", type=int, default=None)
+    arg_parser.add_argument("--grab_batch_size", type=int, default=None)
+    arg_parser.add_argument("--shard_grab", default=False, action="store_true")
+    args = arg_parser.parse_args(argv)
+
+    url = args.database_connection or "sqlite:///%s" % os.path.join(tempfile.mkdtemp(), "grab_bench.sqlite")
+    if args.assign_with is None:
+        args.assign_with = HANDLER_ASSIGNMENT_METHODS.DB_SKIP_LOCKED if url.startswith("postgres") else HANDLER_ASSIGNMENT_METHODS.DB_TRANSACTION_ISOLATION
+    _create_jobs(url, args.jobs)
+
+    start_event = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_handler, args=(url, args, index, start_event, results)) for index in range(args.handlers)]
+    for process in processes:
+        process.start()
+    start_event.set()
+    handler_results = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    print("%-12s %10s %12s %10s %14s" % ("handler", "grabbed", "elapsed (s)", "cycles", "jobs/s"))
+    total = 0
+    for server_name, grabbed, elapsed, cycles in sorted(handler_results):
+        total += grabbed
+        print("%-12s %10d %12.3f %10d %14.1f" % (server_name, grabbed, elapsed, cycles, grabbed / max(elapsed, 1e-9)))
+    wall = max(r[2] for r in handler_results)
+    print("Total: %d jobs grabbed by %d handlers in %.3f s (%.1f jobs/s)" % (total, args.handlers, wall, total / max(wall, 1e-9)))
+
+
+def _create_jobs(url, count):
+    model_mapping = mapping.init("/tmp", url, create_tables=True)
+    job_table = model.Job.table
+    with model_mapping.engine.begin() as conn:
+        conn.execute(job_table.delete())
+        for chunk_start in range(0, count, 1000):
+            conn.execute(job_table.insert(), [dict(state=model.Job.states.NEW, handler=HANDLER_TAG, tool_id="bench")
+                                              for _ in range(chunk_start, min(chunk_start + 1000, count))])
+
+
+def _handler(url, args, index, start_event, results):
+    server_name = "handler%d" % index
+    model_mapping = mapping.init("/tmp", url)
+    app = Bunch(model=model_mapping, config=Bunch(server_name=server_name))
+    shard = (index, args.handlers) if args.shard_grab and args.handlers > 1 else None
+    grabber = ItemGrabber(
+        app=app,
+        grab_type="Job",
+        handler_assignment_method=args.assign_with,
+        max_grab=args.max_grab,
+        self_handler_tags=[HANDLER_TAG],
+        handler_tags=[HANDLER_TAG],
+        grab_batch_size=args.grab_batch_size,
+        shard=shard,
+    )
+    start_event.wait()
+    grabbed = 0
+    cycles = 0
+    empty_cycles = 0
+    start = time.time()
+    # Stop after a few consecutive empty cycles, other handlers may still hold locks on remaining rows
+    while empty_cycles < 3:
+        cycles += 1
+        count = len(grabber.grab_unhandled_items())
+        grabbed += count
+        empty_cycles = 0 if count else empty_cycles + 1
+        model_mapping.context.remove()
+    elapsed = time.time() - start
+    results.put((server_name, grabbed, elapsed, cycles))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Benchmark job handler readiness checking against queue depth.
+
+Simulates a handler queue holding ``--queue_depth`` new jobs, each with
+``--inputs_per_job`` input datasets. On every cycle a fraction of the input
+datasets become ready and the cycle time of a full rescan of all queued jobs
+(what the handler does without ``track_job_readiness_incrementally``) is
+compared with the incremental readiness tracker. Only the in-memory
+bookkeeping is measured, database round trips are not simulated.
+
+% python test/manual/job_readiness_scaling.py --queue_depth 1000 10000 50000
+"""
+import os
+import random
+import sys
+import time
+from argparse import ArgumentParser
+
+galaxy_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+sys.path[1:1] = [os.path.join(galaxy_root, "lib")]
+
+from galaxy.jobs.readiness import JobReadinessTracker
+
+DESCRIPTION = "Benchmark job readiness checking against queue depth."
+NON_READY_STATES = ("new", "upload", "queued", "running", "setting_metadata")
+
+
+def main(argv=None):
+    """Entry point for the benchmark."""
+    arg_parser = ArgumentParser(description=DESCRIPTION)
+    arg_parser.add_argument("--queue_depth", type=int, nargs="+", default=[1000, 10000, 50000])
+    arg_parser.add_argument("--inputs_per_job", type=int, default=3)
+    arg_parser.add_argument("--ready_fraction", type=float, default=0.01,
+                            help="fraction of waiting input datasets becoming ready per cycle")
+    arg_parser.add_argument("--cycles", type=int, default=20)
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args(argv)
+
+    print("%12s %18s %18s %10s" % ("queue depth", "full rescan (ms)", "incremental (ms)", "speedup"))
+    for depth in args.queue_depth:
+        rescan, incremental = _run(depth, args)
+        print("%12d %18.3f %18.3f %9.1fx" % (depth, rescan * 1000, incremental * 1000, rescan / max(incremental, 1e-9)))
+
+
+def _jobs(depth, args):
+    rng = random.Random(args.seed)
+    dataset_count = max(depth * args.inputs_per_job // 2, 1)
+    jobs = {job_id: rng.sample(range(dataset_count), min(args.inputs_per_job, dataset_count)) for job_id in range(depth)}
+    return jobs, dataset_count
+
+
+def _run(depth, args):
+    jobs, dataset_count = _jobs(depth, args)
+    rng = random.Random(args.seed)
+    events = []
+    waiting = list(range(dataset_count))
+    rng.shuffle(waiting)
+    per_cycle = max(int(dataset_count * args.ready_fraction), 1)
+    for _ in range(args.cycles):
+        events.append(waiting[:per_cycle])
+        waiting = waiting[per_cycle:]
+
+    # Full rescan: every cycle check every input of every queued job.
+    states = dict.fromkeys(range(dataset_count), "queued")
+    queued = dict(jobs)
+    rescan_time = 0.0
+    for cycle_events in events:
+        for dataset_id in cycle_events:
+            states[dataset_id] = "ok"
+        start = time.perf_counter()
+        ready = [job_id for job_id, inputs in queued.items() if all(states[d] not in NON_READY_STATES for d in inputs)]
+        for job_id in ready:
+            del queued[job_id]
+        rescan_time += time.perf_counter() - start
+
+    # Incremental: dependencies are registered once, then only events are processed.
+    tracker = JobReadinessTracker()
+    for job_id, inputs in jobs.items():
+        tracker.track(job_id, inputs)
+    incremental_time = 0.0
+    for cycle_events in events:
+        start = time.perf_counter()
+        for dataset_id in cycle_events:
+            tracker.dataset_state_changed(dataset_id, "ok", NON_READY_STATES)
+        tracker.pop_ready()
+        incremental_time += time.perf_counter() - start
+    return rescan_time / args.cycles, incremental_time / args.cycles
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""Benchmark the state checks of watched jobs by the SLURM job runner.
+
+Runs ``--cycles`` monitor cycles (``check_watched_items()``) of a SLURM job
+runner watching ``--jobs`` jobs against a local fake scheduler, once checking
+each job individually through (fake) DRMAA and once checking all jobs in batch
+with (fake) ``squeue``. Every DRMAA call takes ``--latency`` seconds, the fake
+``squeue`` is a real executable so each call pays the process startup cost.
+Between cycles, ``--change_fraction`` of the jobs switch between queued and
+running. The number of scheduler calls and the time per cycle are reported.
+
+% python test/manual/job_status_polling_scaling.py --jobs 20000 --latency 0.001
+"""
+import json
+import os
+import random
+import stat
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from types import SimpleNamespace
+
+galaxy_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+sys.path[1:1] = [os.path.join(galaxy_root, "lib")]
+
+from galaxy.jobs.runners import (
+    AsynchronousJobState,
+    drmaa as drmaa_runner,
+)
+from galaxy.jobs.runners.slurm import SlurmJobRunner
+from galaxy.util.bunch import Bunch
+
+DESCRIPTION = "Benchmark batched job state checks of the SLURM job runner."
+
+# Stand-in for the drmaa module
+JobState = SimpleNamespace(
+    UNDETERMINED="undetermined",
+    QUEUED_ACTIVE="queued_active",
+    RUNNING="running",
+    DONE="done",
+    FAILED="failed",
+)
+FAKE_DRMAA = SimpleNamespace(
+    JobState=JobState,
+    InternalException=type("InternalException", (Exception,), {}),
+    InvalidJobException=type("InvalidJobException", (Exception,), {}),
+    DrmCommunicationException=type("DrmCommunicationException", (Exception,), {}),
+)
+
+FAKE_SQUEUE = """#!%(python)s
+import json
+import sys
+
+with open(%(calls_path)r, "a") as fh:
+    fh.write("squeue\\n")
+with open(%(state_path)r) as fh:
+    states = json.load(fh)
+job_ids = [arg for arg in sys.argv[1:] if arg.startswith("--jobs=")][0][len("--jobs="):].split(",")
+print("\\n".join("%%s %%s" %% (job_id, states[job_id]) for job_id in job_ids if job_id in states))
+"""
+
+
+class FakeScheduler:
+    """A scheduler answering DRMAA status calls and ``squeue`` from a dictionary of job states."""
+
+    def __init__(self, directory, latency):
+        self.latency = latency
+        self.states = {}
+        self.drmaa_calls = 0
+        self.state_path = os.path.join(directory, "states.json")
+        self.calls_path = os.path.join(directory, "squeue_calls")
+        self.bin_dir = os.path.join(directory, "bin")
+        os.mkdir(self.bin_dir)
+        squeue = os.path.join(self.bin_dir, "squeue")
+        with open(squeue, "w") as fh:
+            fh.write(FAKE_SQUEUE % dict(python=sys.executable, state_path=self.state_path, calls_path=self.calls_path))
+        os.chmod(squeue, os.stat(squeue).st_mode | stat.S_IEXEC)
+
+    def set_states(self, states):
+        self.states = states
+        with open(self.state_path, "w") as fh:
+            json.dump(states, fh)
+
+    @property
+    def squeue_calls(self):
+        if not os.path.exists(self.calls_path):
+            return 0
+        with open(self.calls_path) as fh:
+            return len(fh.readlines())
+
+    def reset_calls(self):
+        self.drmaa_calls = 0
+        if os.path.exists(self.calls_path):
+            os.remove(self.calls_path)
+
+    def job_status(self, job_id):
+        """Implements ``drmaa.Session.jobStatus()``."""
+        self.drmaa_calls += 1
+        time.sleep(self.latency)
+        return {"PENDING": JobState.QUEUED_ACTIVE, "RUNNING": JobState.RUNNING}[self.states[job_id]]
+
+
+def main(argv=None):
+    """Entry point for the benchmark."""
+    arg_parser = ArgumentParser(description=DESCRIPTION)
+    arg_parser.add_argument("--jobs", type=int, default=20000)
+    arg_parser.add_argument("--cycles", type=int, default=5)
+    arg_parser.add_argument("--latency", type=float, default=0.001,
+                            help="seconds per DRMAA status call")
+    arg_parser.add_argument("--change_fraction", type=float, default=0.01)
+    args = arg_parser.parse_args(argv)
+
+    drmaa_runner.drmaa = FAKE_DRMAA
+    directory = tempfile.mkdtemp()
+    scheduler = FakeScheduler(directory, args.latency)
+    os.environ["PATH"] = scheduler.bin_dir + os.pathsep + os.environ["PATH"]
+
+    print("%-12s %12s %16s %14s" % ("mode", "DRMAA calls", "squeue calls", "s/cycle"))
+    for batch_job_status in (False, True):
+        random.seed(0)
+        scheduler.set_states({str(i): "PENDING" for i in range(args.jobs)})
+        scheduler.reset_calls()
+        runner = _runner(scheduler, batch_job_status)
+        elapsed = 0.0
+        for _ in range(args.cycles):
+            states = dict(scheduler.states)
+            for job_id in random.sample(list(states), int(args.jobs * args.change_fraction)):
+                states[job_id] = "RUNNING" if states[job_id] == "PENDING" else "PENDING"
+            scheduler.set_states(states)
+            start = time.time()
+            runner.check_watched_items()
+            elapsed += time.time() - start
+        assert len(runner.watched) == args.jobs
+        print("%-12s %12d %16d %14.3f" % ("batch" if batch_job_status else "individual", scheduler.drmaa_calls, scheduler.squeue_calls, elapsed / args.cycles))
+
+
+def _runner(scheduler, batch_job_status):
+    runner = SlurmJobRunner.__new__(SlurmJobRunner)
+    runner.runner_params = Bunch(batch_job_status=batch_job_status)
+    runner.drmaa_job_states = JobState
+    runner.drmaa_job_state_strings = {state: state for state in vars(JobState).values()}
+    runner.ds = scheduler
+    runner.work_queue = None
+    runner.watched = []
+    for i in range(len(scheduler.states)):
+        job_wrapper = Bunch(
+            get_id_tag=lambda i=i: str(i),
+            change_state=lambda *args, **kwargs: None,
+            check_for_entry_points=lambda: None,
+            has_limits=lambda: False,
+        )
+        ajs = AsynchronousJobState(job_wrapper=job_wrapper, job_id=str(i))
+        ajs.old_state = "new"
+        runner.watched.append(ajs)
+    return runner
+
+
+if __name__ == "__main__":
+    main()
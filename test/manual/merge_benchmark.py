@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Benchmark merging the outputs of split jobs.
+
+``--parts`` SAM files of ``--size`` MB in total are generated in a temporary
+directory and merged ``--repeat`` times with
+:meth:`galaxy.datatypes.data.Data.merge` (concatenation, with and without the
+zero-copy system calls) and :meth:`galaxy.datatypes.tabular.Sam.merge`
+(unsorted parts are concatenated, coordinate sorted parts merged k-way).
+
+% python test/manual/merge_benchmark.py --parts 500 --size 1024
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+galaxy_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+sys.path[1:1] = [os.path.join(galaxy_root, "lib")]
+
+from galaxy.datatypes.data import Data
+from galaxy.datatypes.tabular import Sam
+from galaxy.datatypes.util import merge
+
+DESCRIPTION = "Benchmark merging the outputs of split jobs."
+SAM_HEADER = b"@HD\tVN:1.6\tSO:%s\n@SQ\tSN:chr1\tLN:248956422\n@SQ\tSN:chr2\tLN:242193529\n"
+SAM_LINE = b"read%d\t0\tchr%d\t%d\t60\t50M\t*\t0\t0\t" + b"A" * 50 + b"\t" + b"I" * 50 + b"\n"
+
+
+def write_parts(directory, parts, size, sort_order):
+    lines_per_part = max(size // parts // len(SAM_LINE % (0, 1, 0)), 1)
+    paths = []
+    for part in range(parts):
+        path = os.path.join(directory, "part_%d.sam" % part)
+        with open(path, "wb") as f:
+            f.write(SAM_HEADER % sort_order)
+            for i in range(lines_per_part):
+                # Every part covers both references, interleaved with the other parts
+                chromosome = 1 if i < lines_per_part // 2 else 2
+                f.write(SAM_LINE % (part * lines_per_part + i, chromosome, i * parts + part + 1))
+        paths.append(path)
+    return paths
+
+
+def timed(repeat, run):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("--parts", type=int, default=200)
+    parser.add_argument("--size", type=int, default=256, help="total size of the parts in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--directory", default=None, help="directory to create the test files in")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(dir=args.directory)
+    try:
+        output = os.path.join(directory, "merged")
+        for sort_order in (b"unsorted", b"coordinate"):
+            parts = write_parts(directory, args.parts, args.size * 2 ** 20, sort_order)
+            size = sum(os.path.getsize(p) for p in parts)
+            results = []
+            if sort_order == b"unsorted":
+                results.append(("Data.merge", timed(args.repeat, lambda: Data.merge(parts, output))))
+                zero_copy_functions = merge._ZERO_COPY_FUNCTIONS
+                merge._ZERO_COPY_FUNCTIONS = []
+                try:
+                    results.append(("Data.merge (copyfileobj)", timed(args.repeat, lambda: Data.merge(parts, output))))
+                finally:
+                    merge._ZERO_COPY_FUNCTIONS = zero_copy_functions
+            results.append(("Sam.merge", timed(args.repeat, lambda: Sam.merge(parts, output))))
+            for label, duration in results:
+                print("%-10s %4d parts %-26s %8.3f s %8.1f MB/s" % (sort_order.decode(), args.parts, label, duration, size / 2 ** 20 / duration))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""Simulate the placement of datasets on the backends of a distributed object store.
+
+Datasets are created on ``--backends`` synthetic disk backends of different
+size, fill level and write bandwidth for ``--duration`` simulated seconds:
+``--rate`` datasets per second on average plus a burst of ``--burst_size``
+datasets every ``--burst_interval`` seconds. Dataset sizes are log-normally
+distributed around ``--median_size`` GB. Each backend writes its datasets
+concurrently, sharing its bandwidth.
+
+Two placement policies are compared:
+
+- weighted: the former placement, choosing backends randomly by weight and
+  dropping backends above ``--max_percent_full`` when checking the free space
+  every 120 seconds.
+- placement: :class:`galaxy.objectstore.placement.PlacementEngine`, checking
+  the free space every ``--refresh_interval`` seconds and reserving
+  ``--reserve_size`` GB per dataset in between.
+
+For each policy the datasets rejected, the peak usage and the data written
+beyond ``--max_percent_full`` of each backend, how evenly the writes were
+spread over the bandwidth of the backends and the time to write the
+datasets are reported.
+
+% python test/manual/objectstore_placement_simulation.py --equal_weights --burst_size 1000
+"""
+import math
+import os
+import random
+import sys
+from argparse import ArgumentParser
+
+galaxy_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+sys.path[1:1] = [os.path.join(galaxy_root, "lib")]
+
+from galaxy.objectstore.placement import PlacementEngine
+
+DESCRIPTION = "Simulate placement of datasets on the backends of a distributed object store."
+GB = 1024 ** 3
+LEGACY_MONITOR_INTERVAL = 120
+
+
+class SimulatedBackend:
+
+    def __init__(self, backend_id, capacity, used, bandwidth, weight):
+        self.backend_id = backend_id
+        self.capacity = capacity
+        self.used = used
+        self.bandwidth = bandwidth
+        self.weight = weight
+        self.peak_used = used
+        self.written = 0
+        # [dataset key, remaining bytes, size, start time]
+        self.writes = []
+
+    def usage_percent(self):
+        return self.used * 100.0 / self.capacity
+
+    def step(self, now, dt, on_done):
+        if not self.writes:
+            return
+        share = self.bandwidth * dt / len(self.writes)
+        active = []
+        for write in self.writes:
+            amount = min(share, write[1])
+            write[1] -= amount
+            self.used += amount
+            self.written += amount
+            if write[1] > 0:
+                active.append(write)
+            else:
+                on_done(self, write, now)
+        self.writes = active
+        self.peak_used = max(self.peak_used, self.used)
+
+
+class WeightedPolicy:
+
+    def __init__(self, backends, max_percent_full, rng):
+        self.backends = backends
+        self.max_percent_full = max_percent_full
+        self.rng = rng
+        self.weighted_ids = [b.backend_id for b in backends.values() for _ in range(b.weight)]
+        self.available_ids = self.weighted_ids
+        self.last_check = None
+
+    def tick(self, now):
+        if self.last_check is None or now - self.last_check >= LEGACY_MONITOR_INTERVAL:
+            full = {b.backend_id for b in self.backends.values() if b.usage_percent() > self.max_percent_full}
+            self.available_ids = [i for i in self.weighted_ids if i not in full]
+            self.last_check = now
+
+    def choose(self, key):
+        if not self.available_ids:
+            return None
+        return self.rng.choice(self.available_ids)
+
+    def written(self, backend_id, key, size):
+        pass
+
+
+class EnginePolicy:
+
+    def __init__(self, backends, max_percent_full, rng, refresh_interval, reserve_size):
+        self.backends = backends
+        self.refresh_interval = refresh_interval
+        self.now = 0.0
+        self.last_refresh = None
+        self.engine = PlacementEngine(
+            [(b.backend_id, b.weight, 0) for b in backends.values()],
+            self.probe,
+            global_max_percent_full=max_percent_full,
+            reserve_size=reserve_size,
+            clock=lambda: self.now,
+            rng=rng,
+        )
+
+    def probe(self, backend_id):
+        backend = self.backends[backend_id]
+        return backend.usage_percent(), backend.capacity, backend.capacity - backend.used
+
+    def tick(self, now):
+        self.now = now
+        if self.last_refresh is None or now - self.last_refresh >= self.refresh_interval:
+            self.engine.refresh()
+            self.last_refresh = now
+
+    def choose(self, key):
+        return self.engine.choose(key)
+
+    def written(self, backend_id, key, size):
+        self.engine.written(backend_id, key, size)
+
+
+def make_backends(args):
+    rng = random.Random(args.seed)
+    backends = {}
+    for i in range(args.backends):
+        capacity = rng.choice([10, 20, 40]) * 1024 * GB
+        used = capacity * rng.uniform(0.75, 0.88)
+        bandwidth = rng.choice([0.5, 1.0, 2.0]) * GB
+        weight = 1 if args.equal_weights else int(capacity // (10 * 1024 * GB))
+        backends["files%d" % i] = SimulatedBackend("files%d" % i, capacity, used, bandwidth, weight)
+    return backends
+
+
+def arrivals(args):
+    rng = random.Random(args.seed + 1)
+    sigma = 1.5
+    mu = math.log(args.median_size * GB)
+    per_step = []
+    for t in range(args.duration):
+        count = sum(1 for _ in range(10) if rng.random() < args.rate / 10.0)
+        if args.burst_interval and t % args.burst_interval == args.burst_interval // 2:
+            count += args.burst_size
+        per_step.append([int(rng.lognormvariate(mu, sigma)) for _ in range(count)])
+    return per_step
+
+
+def simulate(args, policy_name):
+    backends = make_backends(args)
+    rng = random.Random(args.seed + 2)
+    if policy_name == "weighted":
+        policy = WeightedPolicy(backends, args.max_percent_full, rng)
+    else:
+        policy = EnginePolicy(backends, args.max_percent_full, rng, args.refresh_interval, int(args.reserve_size * GB))
+    durations = []
+    rejected = 0
+
+    def on_done(backend, write, now):
+        key, _, size, start = write
+        durations.append(now - start)
+        policy.written(backend.backend_id, key, size)
+
+    dataset_id = 0
+    for now, sizes in enumerate(arrivals(args)):
+        policy.tick(now)
+        for size in sizes:
+            dataset_id += 1
+            key = ("Dataset", dataset_id)
+            backend_id = policy.choose(key)
+            if backend_id is None:
+                rejected += 1
+                continue
+            backends[backend_id].writes.append([key, size, size, now])
+        for backend in backends.values():
+            backend.step(now, 1, on_done)
+    unfinished = sum(len(b.writes) for b in backends.values())
+    return backends, durations, rejected, unfinished
+
+
+def report(args, policy_name, backends, durations, rejected, unfinished):
+    print(f"== {policy_name}")
+    print("%-8s %6s %8s %10s %10s %12s %12s" % ("backend", "weight", "bw GB/s", "start %", "peak %", "over GB", "written GB"))
+    overfill = 0
+    for backend in backends.values():
+        limit = backend.capacity * args.max_percent_full / 100.0
+        over = max(0, backend.peak_used - limit)
+        overfill += over
+        start = (backend.used - backend.written) * 100.0 / backend.capacity
+        print("%-8s %6d %8.1f %10.1f %10.1f %12.1f %12.1f" % (
+            backend.backend_id, backend.weight, backend.bandwidth / GB, start,
+            backend.peak_used * 100.0 / backend.capacity, over / GB, backend.written / GB))
+    # Writes relative to bandwidth, 1.0 everywhere means perfectly balanced
+    loads = [b.written / b.bandwidth for b in backends.values()]
+    mean_load = sum(loads) / len(loads)
+    imbalance = math.sqrt(sum((load - mean_load) ** 2 for load in loads) / len(loads)) / mean_load if mean_load else 0
+    durations.sort()
+    mean = sum(durations) / len(durations) if durations else 0
+    p95 = durations[int(len(durations) * 0.95)] if durations else 0
+    print(f"written beyond limit: {overfill / GB:.1f} GB, rejected datasets: {rejected}, unfinished writes: {unfinished}")
+    print(f"write load imbalance (cv of bytes per bandwidth): {imbalance:.2f}")
+    print(f"write time: mean {mean:.1f}s, p95 {p95:.1f}s over {len(durations)} datasets")
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("--backends", type=int, default=6)
+    parser.add_argument("--duration", type=int, default=3600, help="simulated seconds")
+    parser.add_argument("--rate", type=float, default=0.5, help="datasets created per second")
+    parser.add_argument("--burst_size", type=int, default=500)
+    parser.add_argument("--burst_interval", type=int, default=900)
+    parser.add_argument("--median_size", type=float, default=0.5, help="median dataset size in GB")
+    parser.add_argument("--max_percent_full", type=float, default=90)
+    parser.add_argument("--refresh_interval", type=int, default=30)
+    parser.add_argument("--reserve_size", type=float, default=1, help="space reserved per dataset in GB")
+    parser.add_argument("--equal_weights", action="store_true", help="weight backends equally instead of by size")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    for policy_name in ("weighted", "placement"):
+        report(args, policy_name, *simulate(args, policy_name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Benchmark datatype sniffing.
+
+Every file below the given directories (``test-data`` by default) is sniffed
+``--repeat`` times with :func:`galaxy.datatypes.sniff.guess_ext` against the
+sniff order of the sample datatypes configuration. The sniffs per second and
+the number of times files were opened per sniff are reported, the latter
+counted with an audit hook - files opened by C libraries (h5py, sqlite) are
+not included.
+
+% python test/manual/sniff_benchmark.py test-data lib/galaxy/datatypes/test
+"""
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from collections import Counter
+
+galaxy_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+sys.path[1:1] = [os.path.join(galaxy_root, "lib")]
+
+from galaxy.datatypes.registry import example_datatype_registry_for_sample
+from galaxy.datatypes.sniff import guess_ext
+
+DESCRIPTION = "Benchmark sniffing the datatype of files."
+
+
+class OpenCounter:
+
+    def __init__(self):
+        self.active = False
+        self.opens = 0
+        sys.addaudithook(self.hook)
+
+    def hook(self, event, args):
+        if self.active and event == "open":
+            self.opens += 1
+
+
+def collect_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for dirpath, _, filenames in os.walk(path):
+            files.extend(os.path.join(dirpath, filename) for filename in sorted(filenames))
+    return files
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("paths", nargs="*", default=[os.path.join(galaxy_root, "test-data")])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--slowest", type=int, default=10, help="report the slowest files")
+    args = parser.parse_args(argv)
+
+    sniff_order = example_datatype_registry_for_sample().sniff_order
+    files = collect_files(args.paths)
+    counter = OpenCounter()
+    extensions = Counter()
+    per_file = {}
+    start = time.perf_counter()
+    for path in files:
+        file_start = time.perf_counter()
+        for _ in range(args.repeat):
+            counter.active = True
+            try:
+                ext = guess_ext(path, sniff_order)
+            except Exception as e:
+                ext = "error: %s" % type(e).__name__
+            finally:
+                counter.active = False
+        per_file[path] = (time.perf_counter() - file_start) / args.repeat
+        extensions[ext] += 1
+    elapsed = time.perf_counter() - start
+    sniffs = len(files) * args.repeat
+
+    print(f"{len(files)} files, {args.repeat} sniffs each, {len(sniff_order)} datatypes in the sniff order")
+    print(f"{sniffs / elapsed:.1f} sniffs/s, {elapsed / sniffs * 1000:.2f} ms per sniff")
+    print(f"{counter.opens / sniffs:.1f} files opened per sniff")
+    print("slowest files:")
+    for path, duration in sorted(per_file.items(), key=lambda item: -item[1])[:args.slowest]:
+        print(f"  {duration * 1000:8.2f} ms  {os.path.relpath(path, galaxy_root)}")
+    print("sniffed datatypes: %s" % ", ".join(f"{ext}={count}" for ext, count in extensions.most_common()))
+
+
+if __name__ == "__main__":
+    main()
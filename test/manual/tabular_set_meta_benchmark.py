@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Benchmark setting metadata of tabular datasets.
+
+Synthetic tables - a long one with few columns and a wide one with many
+columns, mixing int, float, list, string and empty columns - are written to
+a temporary directory and :meth:`galaxy.datatypes.tabular.Tabular.set_meta`
+is timed on them. Cells per second (of the cells whose types are guessed)
+and the detected column types are reported.
+
+% python test/manual/tabular_set_meta_benchmark.py --rows 200000 --columns 500
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from collections import Counter
+
+galaxy_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+sys.path[1:1] = [os.path.join(galaxy_root, "lib")]
+
+from galaxy.datatypes.tabular import Tabular
+from galaxy.util.bunch import Bunch
+
+DESCRIPTION = "Benchmark guessing the column types of tabular datasets."
+COLUMN_GENERATORS = [
+    lambda r: str(r.randint(-10 ** 6, 10 ** 6)),
+    lambda r: "%.4f" % r.uniform(-100, 100),
+    lambda r: "NA" if r.random() < 0.1 else "%.2e" % r.random(),
+    lambda r: ",".join(str(r.randint(0, 9)) for _ in range(3)),
+    lambda r: r.choice(["chr1", "chr2", "chrX", "+", "-"]),
+    lambda r: "",
+]
+
+
+def write_table(path, rows, columns, seed=1):
+    r = random.Random(seed)
+    generators = [COLUMN_GENERATORS[i % len(COLUMN_GENERATORS)] for i in range(columns)]
+    with open(path, "w") as f:
+        f.write("#" + "\t".join("c%d" % i for i in range(columns)) + "\n")
+        for _ in range(rows):
+            f.write("\t".join(generate(r) for generate in generators) + "\n")
+
+
+def set_meta(path):
+    dataset = Bunch(
+        id=1,
+        file_name=path,
+        has_data=lambda: True,
+        get_size=lambda: os.path.getsize(path),
+        metadata=Bunch(line_index=None),
+    )
+    Tabular().set_meta(dataset)
+    return dataset.metadata
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("--rows", type=int, default=100000, help="rows of the long table")
+    parser.add_argument("--columns", type=int, default=500, help="columns of the wide table")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    try:
+        tables = [
+            ("long", args.rows, 12),
+            ("wide", max(args.rows * 12 // args.columns, 1), args.columns),
+        ]
+        for name, rows, columns in tables:
+            path = os.path.join(directory, "%s.tabular" % name)
+            write_table(path, rows, columns)
+            durations = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                metadata = set_meta(path)
+                durations.append(time.perf_counter() - start)
+            duration = min(durations)
+            cells = min(rows, 100000) * columns
+            print("%-5s %7d rows x %4d columns: %7.3f s, %10.0f cells/s" % (name, rows, columns, duration, cells / duration))
+            print("      column types: %s" % ", ".join("%s=%d" % item for item in sorted(Counter(metadata.column_types).items())))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
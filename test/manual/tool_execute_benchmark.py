@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""Benchmark mapping a tool over a dataset collection.
+
+A list of ``--elements`` datasets is created in a new history and a simple
+tool is mapped over it with :meth:`galaxy.tools.Tool.handle_input`, creating
+a job, an output dataset and an element of the implicit output collection per
+element of the list. The number of jobs created per second and the number of
+SQL statements per job are reported, followed by the most frequent statements.
+
+% python test/manual/tool_execute_benchmark.py --elements 1000 --database-connection postgresql:///galaxy_benchmark
+"""
+import collections
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+galaxy_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+sys.path[1:1] = [os.path.join(galaxy_root, "lib"), os.path.join(galaxy_root, "test", "unit")]
+
+from sqlalchemy import event
+
+from galaxy import model
+from galaxy.managers.collections import DatasetCollectionManager
+from galaxy.tool_util.parser import get_tool_source
+from galaxy.tools import create_tool_from_source
+from galaxy.util.bunch import Bunch
+from unittest_utils.galaxy_mock import MockApp, MockTrans
+
+DESCRIPTION = "Benchmark mapping a tool over a dataset collection."
+TOOL = """<tool id="cat_mapped" name="Concatenate" version="1.0">
+    <command>cat '$input1' > '$out_file1'</command>
+    <inputs>
+        <param name="input1" type="data" format="txt"/>
+    </inputs>
+    <outputs>
+        <data name="out_file1" format_source="input1"/>
+    </outputs>
+</tool>
+"""
+
+
+def create_collection(app, elements):
+    sa_session = app.model.context
+    security_agent = app.security_agent
+    user = model.User(email="benchmark@example.org", password="password")
+    role = model.Role(name=user.email, type=model.Role.types.PRIVATE)
+    sa_session.add_all([user, role, model.UserRoleAssociation(user, role)])
+    history = model.History(user=user)
+    sa_session.add(history)
+    sa_session.flush()
+    permissions = {security_agent.permitted_actions.DATASET_MANAGE_PERMISSIONS: [role]}
+    security_agent.history_set_default_permissions(history, permissions=permissions)
+    collection = model.DatasetCollection(collection_type="list")
+    for i in range(elements):
+        hda = model.HistoryDatasetAssociation(extension="txt", create_dataset=True, sa_session=sa_session)
+        hda.dataset.state = model.Dataset.states.OK
+        history.add_dataset(hda)
+        sa_session.add(hda)
+        security_agent.set_all_dataset_permissions(hda.dataset, permissions, new=True, flush=False)
+        model.DatasetCollectionElement(collection=collection, element=hda, element_identifier="element_%d" % i, element_index=i)
+    hdca = model.HistoryDatasetCollectionAssociation(collection=collection, name="input")
+    history.add_dataset_collection(hdca)
+    sa_session.flush()
+    ids = user.id, history.id, hdca.id
+    # Start from an empty session, as a new request would
+    sa_session.expunge_all()
+    return ids
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("--elements", type=int, default=500)
+    parser.add_argument("--database-connection", default="sqlite:///:memory:", help="database to create the tables in, it should be empty")
+    parser.add_argument("--statements", type=int, default=20, help="number of most frequent SQL statements to list")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    try:
+        app = MockApp(database_connection=args.database_connection)
+        app.config.track_jobs_in_database = True
+        # Galaxy's default, unlike MockApp's
+        app.config.legacy_eager_objectstore_initialization = False
+        app.job_config["get_job_tool_configurations"] = lambda ids: [Bunch(handler=Bunch())]
+        app.dataset_collections_service = DatasetCollectionManager(app)
+        user_id, history_id, hdca_id = create_collection(app, args.elements)
+
+        tool_path = os.path.join(directory, "cat_mapped.xml")
+        with open(tool_path, "w") as f:
+            f.write(TOOL)
+        tool = create_tool_from_source(app, get_tool_source(tool_path), config_file=tool_path)
+        sa_session = app.model.context
+        user = sa_session.query(model.User).get(user_id)
+        history = sa_session.query(model.History).get(history_id)
+        trans = MockTrans(app, user=user, history=history)
+        trans.check_user_activation = lambda: None
+        trans.get_current_user_roles = lambda: user.all_roles()
+        trans.get_galaxy_session = lambda: None
+        trans.log_event = lambda *args, **kwargs: None
+        trans.db_dataset_for = lambda dbkey: None
+
+        statements = collections.Counter()
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements[re.sub(r"\s+", " ", statement)[:100]] += 1
+
+        event.listen(app.model.engine, "before_cursor_execute", count_statement)
+        incoming = {"input1": {"batch": True, "values": [{"src": "hdca", "id": app.security.encode_id(hdca_id)}]}}
+        start = time.perf_counter()
+        rval = tool.handle_input(trans, incoming, history=history)
+        elapsed = time.perf_counter() - start
+        event.remove(app.model.engine, "before_cursor_execute", count_statement)
+
+        jobs = len(rval["jobs"])
+        total = sum(statements.values())
+        print("%d jobs in %.3f s, %.1f jobs/s, %d SQL statements, %.1f per job" % (jobs, elapsed, jobs / elapsed, total, total / max(jobs, 1)))
+        for statement, count in statements.most_common(args.statements):
+            print("%7d %s" % (count, statement))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
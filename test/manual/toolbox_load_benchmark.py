@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""Benchmark loading the toolbox at startup.
+
+A synthetic toolbox of ``--tools`` tools is written to a temporary directory.
+The tools import a shared macro file and are spread over ``--sections``
+sections of a tool configuration file. :class:`galaxy.tools.ToolBox` is
+loaded ``--repeat`` times serially and with every number of
+``tool_loading_threads`` given. The time spent on reading tool sources (XML
+parsing and macro expansion), on creating the tools, and on registering them
+is reported. The tool panel must be the same whatever the number of threads.
+
+% python test/manual/toolbox_load_benchmark.py --tools 9000 --threads 2 4 8
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+galaxy_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+sys.path[1:1] = [os.path.join(galaxy_root, "lib"), os.path.join(galaxy_root, "test", "unit")]
+
+from galaxy.config_watchers import ConfigWatchers
+from galaxy.tools import ToolBox
+from galaxy.tools.cache import ToolCache
+from unittest_utils.galaxy_mock import MockApp
+
+DESCRIPTION = "Benchmark loading a synthetic toolbox."
+MACROS = """<macros>
+    <token name="@VERSION@">1.0.%d</token>
+    <xml name="requirements">
+        <requirements>
+            <requirement type="package" version="1.0">synthetic</requirement>
+        </requirements>
+    </xml>
+    <xml name="inputs">
+        <param name="input" type="data" format="tabular" label="Input"/>
+        <param name="column" type="data_column" data_ref="input" label="Column"/>
+        <conditional name="mode">
+            <param name="select" type="select" label="Mode">
+                <option value="fast">Fast</option>
+                <option value="slow">Slow</option>
+            </param>
+            <when value="fast"><param name="threshold" type="float" value="0.5"/></when>
+            <when value="slow"><param name="iterations" type="integer" value="10"/></when>
+        </conditional>
+    </xml>
+</macros>
+"""
+TOOL = """<tool id="synthetic_%(i)d" name="Synthetic tool %(i)d" version="@VERSION@">
+    <macros>
+        <import>macros.xml</import>
+    </macros>
+    <expand macro="requirements"/>
+    <command>cut -f $column '$input' > '$output'</command>
+    <inputs>
+        <expand macro="inputs"/>
+    </inputs>
+    <outputs>
+        <data name="output" format="tabular"/>
+    </outputs>
+    <help>Synthetic tool number %(i)d.</help>
+</tool>
+"""
+
+
+def write_toolbox(directory, tools, sections):
+    with open(os.path.join(directory, "macros.xml"), "w") as f:
+        f.write(MACROS % 0)
+    lines = ['<toolbox tool_path="%s">' % directory]
+    per_section = -(-tools // sections)
+    for section in range(sections):
+        lines.append('<section id="section_%d" name="Section %d">' % (section, section))
+        for i in range(section * per_section, min((section + 1) * per_section, tools)):
+            with open(os.path.join(directory, "tool_%d.xml" % i), "w") as f:
+                f.write(TOOL % {"i": i})
+            lines.append('<tool file="tool_%d.xml"/>' % i)
+        lines.append('</section>')
+    lines.append('</toolbox>')
+    tool_conf = os.path.join(directory, "tool_conf.xml")
+    with open(tool_conf, "w") as f:
+        f.write("\n".join(lines))
+    return tool_conf
+
+
+def load_toolbox(directory, tool_conf, threads):
+    app = MockApp()
+    app.config.tool_loading_threads = threads
+    app.config.integrated_tool_panel_config = os.path.join(directory, "integrated_tool_panel.xml")
+    app.config.tool_cache_data_dir = tempfile.mkdtemp(dir=directory)
+    app.config.update_integrated_tool_panel = False
+    app.config.schema.defaults = {'tool_dependency_dir': 'dependencies'}
+    app.tool_cache = ToolCache()
+    app.job_config.get_tool_resource_parameters = lambda tool_id: None
+    app.watchers = ConfigWatchers(app)
+    start = time.perf_counter()
+    toolbox = ToolBox([tool_conf], directory, app, save_integrated_tool_panel=False)
+    elapsed = time.perf_counter() - start
+    panel = [(key, [(tool.id, tool.version) for tool in section.elems.values()]) for key, section in toolbox._tool_panel.items()]
+    return elapsed, dict(toolbox._tool_load_timings), panel
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("--tools", type=int, default=2000)
+    parser.add_argument("--sections", type=int, default=50)
+    parser.add_argument("--threads", type=int, nargs="*", default=[2, 4, 8], help="numbers of tool loading threads to compare to loading serially")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--directory", default=None, help="directory to create the synthetic toolbox in")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(dir=args.directory)
+    try:
+        tool_conf = write_toolbox(directory, args.tools, args.sections)
+        serial_panel = None
+        for threads in [0] + args.threads:
+            results = []
+            for _ in range(args.repeat):
+                results.append(load_toolbox(directory, tool_conf, threads))
+            elapsed, timings, panel = min(results, key=lambda result: result[0])
+            if serial_panel is None:
+                serial_panel = panel
+            elif panel != serial_panel:
+                raise Exception("Tool panel loaded with %d threads differs from the one loaded serially" % threads)
+            read, create = timings.get("read", 0.0), timings.get("create", 0.0)
+            print("%-10s %6d tools: %8.3f s total, reading tool sources %8.3f s, creating tools %8.3f s, registering tools %8.3f s, %7.1f tools/s" % (
+                "%d threads" % threads if threads else "serial", args.tools, elapsed, read, create, elapsed - read - create, args.tools / elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
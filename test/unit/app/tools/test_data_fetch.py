@@ -72,6 +72,47 @@ def test_simple_list_path_get():
         assert destination["object_id"] == 76
 
 
+def test_concurrent_nested_list_path_get(capsys):
+    with _execute_context() as execute_context:
+        job_directory = execute_context.job_directory
+        inner_elements = []
+        for i in range(6):
+            example_path = os.path.join(job_directory, "example_file_%d" % i)
+            with open(example_path, "w") as f:
+                f.write("chr1\t%d\t%d\n" % (i, i + 100))
+            inner_elements.append({"src": "path", "path": example_path, "name": "element_%d" % i})
+        missing_path = os.path.join(job_directory, "missing_file")
+        request = {
+            "allow_failed_collections": True,
+            "targets": [
+                {
+                    "destination": {
+                        "type": "hdca",
+                    },
+                    "collection_type": "list:list",
+                    "elements": [
+                        {"name": "outer_0", "elements": inner_elements[:3]},
+                        {"name": "outer_1", "elements": inner_elements[3:] + [{"src": "path", "path": missing_path, "name": "missing"}]},
+                    ]
+                }
+            ]
+        }
+        execute_context.execute_request(request, max_workers=4)
+        output = execute_context.galaxy_json.get("__unnamed_outputs")[0]
+        elements = output["elements"]
+        assert [element["name"] for element in elements] == ["outer_0", "outer_1"]
+        names = [inner.get("name") for element in elements for inner in element["elements"]]
+        assert names == ["element_%d" % i for i in range(6)] + [None]
+        assert "error_message" in elements[1]["elements"][-1]
+        assert all(inner["ext"] == "bed" for inner in elements[0]["elements"])
+        paths = [inner["filename"] for element in elements for inner in element["elements"][:3]]
+        assert len(set(paths)) == 6
+        stdout = capsys.readouterr().out
+        assert "Element [element_0] fetched in" in stdout
+        assert "Element [missing] failed in" in stdout
+        assert "Fetched 7 element(s) for destination [hdca]" in stdout
+
+
 @github_fetch
 def test_hdas_single_url_error():
     with _execute_context() as execute_context:
@@ -232,11 +273,14 @@ class ExecuteContext:
         self.job_directory = directory
         self.galaxy_json_path = os.path.join(directory, "galaxy.json")
 
-    def execute_request(self, request):
+    def execute_request(self, request, max_workers=None):
         request_path = os.path.join(self.job_directory, "request.json")
         with open(request_path, "w") as f:
             json.dump(request, f)
-        self._execute(["--request", request_path])
+        args = ["--request", request_path]
+        if max_workers is not None:
+            args.extend(["--max-workers", str(max_workers)])
+        self._execute(args)
 
     def _execute(self, args):
         args.extend(["--working-directory", self.job_directory])
@@ -0,0 +1,113 @@
+import gzip
+import os
+
+import pytest
+
+from galaxy.datatypes.data import Data
+from galaxy.datatypes.tabular import Sam
+from galaxy.datatypes.util import merge
+from .util import get_tmp_path
+
+SAM_HEADER = "@HD\tVN:1.6\tSO:%s\n@SQ\tSN:chr2\tLN:1000\n@SQ\tSN:chr10\tLN:1000\n"
+
+
+def write_parts(tmp_path, contents, mode="w"):
+    paths = []
+    for i, content in enumerate(contents):
+        path = str(tmp_path / ("part_%d" % i))
+        with open(path, mode) as f:
+            f.write(content)
+        paths.append(path)
+    return paths
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def sam_line(name, reference, position):
+    return "\t".join([name, "0", reference, str(position), "60", "4M", "*", "0", "0", "ACGT", "IIII"]) + "\n"
+
+
+@pytest.mark.parametrize("zero_copy", [True, False])
+def test_concatenate_files(tmp_path, monkeypatch, zero_copy):
+    if not zero_copy:
+        monkeypatch.setattr(merge, "_ZERO_COPY_FUNCTIONS", [])
+    parts = write_parts(tmp_path, ["a\nb\n", "", "#c\nd\n", "e" * 100000])
+    with get_tmp_path() as output:
+        Data.merge(parts, output)
+        assert read(output) == "a\nb\n#c\nd\n" + "e" * 100000
+        merge.concatenate_files(parts[2:3], output, offsets=[3])
+        assert read(output) == "d\n"
+        merge.concatenate_files(parts[:1], output, append=True)
+        assert read(output) == "d\na\nb\n"
+        with open(output, "ab") as f:
+            f.write(b"x")
+            merge.append_file(parts[0], f, offset=2)
+            f.write(b"y")
+        assert read(output) == "d\na\nb\nxb\ny"
+
+
+@pytest.mark.skipif(not merge._ZERO_COPY_FUNCTIONS, reason="no zero-copy system call on this platform")
+def test_concatenate_files_append_zero_copy(tmp_path, monkeypatch):
+    copied = []
+
+    def copy(in_fd, out_fd, offset, count):
+        n = zero_copy(in_fd, out_fd, offset, count)
+        copied.append(n)
+        return n
+
+    def copyfileobj(fsrc, fdst):
+        raise AssertionError("Data copied through Python")
+
+    zero_copy = merge._ZERO_COPY_FUNCTIONS[0]
+    monkeypatch.setattr(merge, "_ZERO_COPY_FUNCTIONS", [copy])
+    monkeypatch.setattr(merge.shutil, "copyfileobj", copyfileobj)
+    parts = write_parts(tmp_path, ["a\n", "b\n"])
+    output = str(tmp_path / "output")
+    merge.concatenate_files(parts[:1], output, append=True)
+    merge.concatenate_files(parts[1:], output, append=True)
+    assert read(output) == "a\nb\n"
+    assert copied == [2, 2]
+
+
+def test_merge_gzip(tmp_path):
+    parts = write_parts(tmp_path, [gzip.compress(b"a\n"), gzip.compress(b"b\n")], mode="wb")
+    with get_tmp_path() as output:
+        Data.merge(parts, output)
+        with gzip.open(output, "rt") as f:
+            assert f.read() == "a\nb\n"
+
+
+def test_merge_sorted_files(tmp_path):
+    parts = write_parts(tmp_path, ["#h\n1 a\n3 a\n5 a", "#h\n2 b\n3 b\n", "", "#h\n"])
+    with get_tmp_path() as output:
+        merge.merge_sorted_files(parts, output, key=lambda line: int(line.split()[0]), header_prefix=b"#")
+        assert read(output) == "#h\n1 a\n2 b\n3 a\n3 b\n5 a\n"
+
+
+def test_sam_merge_unsorted(tmp_path):
+    header = SAM_HEADER % "unsorted"
+    parts = write_parts(tmp_path, [
+        header + sam_line("r1", "chr10", 5),
+        header + sam_line("r2", "chr2", 1) + sam_line("r3", "chr10", 1),
+    ])
+    with get_tmp_path() as output:
+        Sam.merge(parts, output)
+        assert read(output) == header + sam_line("r1", "chr10", 5) + sam_line("r2", "chr2", 1) + sam_line("r3", "chr10", 1)
+
+
+def test_sam_merge_coordinate_sorted(tmp_path):
+    header = SAM_HEADER % "coordinate"
+    parts = write_parts(tmp_path, [
+        header + sam_line("r1", "chr2", 20) + sam_line("r2", "chr10", 5) + sam_line("u1", "*", 0),
+        header + sam_line("r3", "chr2", 3) + sam_line("r4", "chr2", 20) + sam_line("r5", "chr10", 100),
+        header,
+    ])
+    with get_tmp_path() as output:
+        Sam.merge(parts, output)
+        names = [line.split("\t")[0] for line in read(output).splitlines() if not line.startswith("@")]
+        assert names == ["r3", "r1", "r4", "r2", "r5", "u1"]
+        assert read(output).startswith(header)
+        assert os.path.getsize(output) == sum(os.path.getsize(p) for p in parts) - 2 * len(header)
@@ -1,11 +1,26 @@
+import gzip
+import os
+import re
+import shutil
+import tarfile
 import tempfile
 
 import pytest
 
+from galaxy.datatypes.binary import (
+    SQlite,
+    Sra,
+)
+from galaxy.datatypes.registry import example_datatype_registry_for_sample
 from galaxy.datatypes.sniff import (
     convert_newlines,
     convert_newlines_sep2tabs,
+    FilePrefix,
     get_test_fname,
+    handle_uploaded_dataset_file_internal,
+    run_sniffers_raw,
+    SniffPrefilter,
+    TAR_MAGIC,
 )
 
 
@@ -76,3 +91,110 @@ def test_convert_sep2tabs(source, expected):
         assert_converts_to_1234_convert_sep2tabs(source, expected=expected)
     else:
         assert_converts_to_1234_convert_sep2tabs(source)
+
+
+@pytest.mark.parametrize('source,expected,block_size', [
+    ("1  2\r\n3 \t 4", "1\t2\n3\t4\n", 1),
+    ("1  2\r\n3 \t 4", "1\t2\n3\t4\n", 3),
+    ("1\t2\n3\t4", "1\t2\n3\t4\n", 2),
+])
+def test_convert_sep2tabs_across_blocks(source, expected, block_size):
+    with tempfile.NamedTemporaryFile(delete=False, mode='w') as tf:
+        tf.write(source)
+    rval = convert_newlines(tf.name, tmp_prefix="gxtest", tmp_dir=tempfile.gettempdir(), block_size=block_size, regexp=re.compile(br"[^\S\n]+"))
+    assert open(tf.name).read() == expected
+    assert rval == (2, None)
+
+
+def test_convert_newlines_skips_normalized_files():
+    with tempfile.NamedTemporaryFile(delete=False, mode='w') as tf:
+        tf.write("1\t2\n3\t4\n")
+    inode = os.stat(tf.name).st_ino
+    assert convert_newlines(tf.name, tmp_prefix="gxtest", tmp_dir=tempfile.gettempdir()) == (2, None)
+    assert convert_newlines_sep2tabs(tf.name, tmp_prefix="gxtest", tmp_dir=tempfile.gettempdir()) == (2, None)
+    assert os.stat(tf.name).st_ino == inode
+    assert convert_newlines(tf.name, in_place=False) == (2, tf.name)
+
+
+@pytest.mark.parametrize('ext', ["auto", "tabular"])
+def test_upload_decompresses_and_converts(ext):
+    registry = example_datatype_registry_for_sample()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, "upload.gz")
+        with gzip.open(path, "wb") as f:
+            f.write(b"1 2\r\n3 4")
+        ext, converted_path, compressed_type = handle_uploaded_dataset_file_internal(
+            path, registry, ext=ext, tmp_dir=tmp_dir, convert_to_posix_lines=True, convert_spaces_to_tabs=True
+        )
+        assert compressed_type == "gz"
+        assert open(converted_path).read() == "1\t2\n3\t4\n"
+        assert sorted(os.listdir(tmp_dir)) == sorted(["upload.gz", os.path.basename(converted_path)])
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_file_prefix_is_read_lazily_and_once(monkeypatch):
+    opened = []
+    real_open = open
+
+    def counting_open(path, *args, **kwargs):
+        opened.append(path)
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", counting_open)
+    fname = get_test_fname("1.bed")
+    file_prefix = FilePrefix(fname)
+    assert opened == []
+    assert file_prefix.compressed_format is None
+    assert file_prefix.startswith("chr1")
+    assert not file_prefix.binary
+    assert next(file_prefix.line_iterator()).startswith("chr1")
+    assert opened == [fname]
+
+
+def test_file_prefix_compressed():
+    file_prefix = FilePrefix(get_test_fname("1.fastqsanger.gz"))
+    assert file_prefix.compressed_format == "gzip"
+    assert file_prefix.raw_header_bytes.startswith(b"\x1f\x8b")
+    assert file_prefix.startswith("@")
+
+
+class Sniffed:
+
+    def __init__(self, datatype, sniffed):
+        self.datatype = datatype
+        self.sniffed = sniffed
+
+    def __getattr__(self, name):
+        return getattr(self.datatype, name)
+
+    def sniff(self, filename):
+        self.sniffed.append(self.datatype.file_ext)
+        return self.datatype.sniff(filename)
+
+
+def test_prefilter_skips_sniffers_by_magic():
+    sniffed = []
+    sniff_order = [Sniffed(SQlite(), sniffed), Sniffed(Sra(), sniffed)]
+    prefilter = SniffPrefilter(sniff_order)
+    assert prefilter.plausible(b"NCBI.sra\0\0") == {1}
+    assert prefilter.plausible(b"SQLite format 3\0") == {0}
+    assert prefilter.plausible(b"NCBI") == set()
+
+    assert run_sniffers_raw(get_test_fname("1.bed"), sniff_order) is None
+    assert sniffed == []
+    assert run_sniffers_raw(get_test_fname("test.ncbitaxonomy.sqlite"), sniff_order) == "sqlite"
+    assert sniffed == ["sqlite"]
+
+
+def test_tar_magic():
+    with open(get_test_fname("1.bed"), "rb") as f:
+        assert not TAR_MAGIC(f.read(1024))
+    with open(get_test_fname("1.fastqsanger.gz"), "rb") as f:
+        assert TAR_MAGIC(f.read(1024))
+    with tempfile.NamedTemporaryFile(suffix=".tar") as tf:
+        with tarfile.open(tf.name, "w") as tar:
+            tar.add(get_test_fname("1.bed"), arcname="1.bed")
+        with open(tf.name, "rb") as f:
+            assert TAR_MAGIC(f.read(1024))
@@ -0,0 +1,142 @@
+import json
+import os
+from contextlib import contextmanager
+
+from galaxy.datatypes.tabular import (
+    ColumnTypeGuesser,
+    guess_column_type,
+    Tabular,
+)
+from galaxy.datatypes.util.line_index import build_line_index
+from galaxy.util.bunch import Bunch
+from .util import (
+    get_dataset,
+    get_tmp_path,
+)
+
+
+@contextmanager
+def get_tabular_dataset(contents):
+    with get_tmp_path(should_exist=True) as path:
+        with open(path, "w") as f:
+            f.write(contents)
+        with get_dataset("1.bed", index_attr="line_index") as dataset:
+            dataset.file_name = path
+            dataset.get_size = lambda: os.path.getsize(path)
+            yield dataset
+
+
+def _tabular(line_index_min_size=0):
+    tabular = Tabular()
+    tabular.line_index_min_size = line_index_min_size
+    return tabular
+
+
+def test_set_meta_builds_line_index():
+    contents = "#header\n" + "".join("%d\tfoo\n" % i for i in range(20)) + "\n# trailing comment\n1\tbar"
+    with get_tabular_dataset(contents) as dataset:
+        tabular = _tabular()
+        tabular.set_meta(dataset, max_data_lines=5)
+        # Counts are complete even though type guessing stopped after 5 data lines
+        assert dataset.metadata.data_lines == 21
+        assert dataset.metadata.comment_lines == 3
+        assert dataset.metadata.column_types == ["int", "str"]
+        line_index = tabular.get_line_index(dataset)
+        assert line_index.lines == 24
+        assert line_index.size == len(contents)
+        assert tabular.count_data_lines(dataset) == 21
+        assert tabular.get_line_offset(dataset, 1) == len("#header\n")
+        assert tabular.get_line_offset(dataset, 100) == len(contents)
+
+
+def test_set_meta_skip_with_line_index():
+    contents = "a\tb\nc\td\n" + "1\t2\n" * 10
+    with get_tabular_dataset(contents) as dataset:
+        _tabular().set_meta(dataset, skip=2, max_data_lines=3)
+        assert dataset.metadata.data_lines == 10
+        assert dataset.metadata.comment_lines == 2
+
+
+def test_small_files_are_not_indexed():
+    with get_tabular_dataset("1\t2\n3\t4\n") as dataset:
+        tabular = _tabular(line_index_min_size=1024)
+        tabular.set_meta(dataset)
+        assert dataset.metadata.line_index is None
+        assert tabular.get_line_index(dataset) is None
+        assert tabular.get_line_offset(dataset, 1) == 4
+        assert tabular.count_data_lines(dataset) == 2
+
+
+def test_stale_line_index_is_ignored():
+    with get_tabular_dataset("1\t2\n3\t4\n") as dataset:
+        tabular = _tabular()
+        tabular.set_meta(dataset)
+        assert tabular.get_line_index(dataset) is not None
+        with open(dataset.file_name, "a") as f:
+            f.write("5\t6\n")
+        assert tabular.get_line_index(dataset) is None
+        assert tabular.count_data_lines(dataset) == 3
+
+
+def test_get_chunk_from_line():
+    contents = "".join("%d\tvalue\n" % i for i in range(1000))
+    with get_tabular_dataset(contents) as dataset:
+        tabular = _tabular()
+        tabular.set_meta(dataset)
+        trans = Bunch(app=Bunch(config=Bunch(display_chunk_size=10)))
+        chunk = json.loads(tabular.display_data(trans, dataset, line=500))
+        assert chunk["ck_data"] == "500\tvalue\n"
+        assert chunk["offset"] == contents.index("501\t")
+
+
+def test_line_index_checkpoints():
+    with get_tmp_path(should_exist=True) as path:
+        with open(path, "w") as f:
+            f.write("".join("line %d\n" % i for i in range(10000)))
+        line_index = build_line_index(path, checkpoint_interval=1000)
+        assert len(line_index.checkpoints) > 50
+        with open(path, "rb") as fh:
+            for line in (0, 1, 999, 5000, 9999):
+                offset = line_index.line_offset(fh, line)
+                fh.seek(offset)
+                assert fh.readline() == b"line %d\n" % line
+
+
+def test_column_type_guesser():
+    values = [
+        "", "1", "-12", "+3", "007", "1_000", "1.5", "-.5", "1.", "1e5", "2.5E-3", "nan", "-Inf", "infinity", "NA", " na ",
+        " 7", "٣", "1,2", "a,b", "abc", "1.2.3", "e5", "+", "0x10", "1e", "inf5",
+    ]
+    rows = [
+        [values[(i * 7 + j * 3) % len(values)] if (i + j) % 5 else values[(i + j) % 16] for j in range(6)]
+        for i in range(50)
+    ]
+    rows.append(["1"] * 8)
+    rank = {None: 0, "int": 1, "float": 2, "list": 3, "str": 4}
+    expected = []
+    for fields in rows:
+        for i, field in enumerate(fields):
+            if i >= len(expected):
+                expected.append(None)
+            column_type = guess_column_type(field)
+            if rank[column_type] > rank[expected[i]]:
+                expected[i] = column_type
+    for block_size in (1, 7, 1000):
+        guesser = ColumnTypeGuesser(block_size=block_size)
+        for fields in rows:
+            guesser.add_row(fields)
+        assert guesser.column_types == expected
+    numeric = ColumnTypeGuesser()
+    for i in range(100):
+        numeric.add_row([str(i), "%s.5" % i, "", "NA" if i % 2 else str(i)])
+    assert numeric.column_types == ["int", "float", None, "float"]
+
+
+def test_column_type_guesser_mismatch_at_end_of_numeric_column():
+    # Used to backtrack exponentially in the number of rows, e.g. a VCF QUAL column with a missing value
+    for numeric_value, other_value, column_type in (("50", ".", "str"), ("12345678", "x", "str"), ("1.5", "1,5", "list")):
+        guesser = ColumnTypeGuesser()
+        for _ in range(999):
+            guesser.add_row([numeric_value])
+        guesser.add_row([other_value])
+        assert guesser.column_types == [column_type]
@@ -7,6 +7,8 @@ from sqlalchemy import inspect
 import galaxy.datatypes.registry
 import galaxy.model
 import galaxy.model.mapping as mapping
+from galaxy.model import disk_usage
+from galaxy.model.security import GalaxyRBACAgent
 
 datatypes_registry = galaxy.datatypes.registry.Registry()
 datatypes_registry.load_datatypes()
@@ -280,6 +282,52 @@ class MappingTests(unittest.TestCase):
         user_reload = model.session.query(model.User).get(u_id)
         assert user_reload.disk_usage == 1
 
+    def test_disk_usage_ledger(self):
+        model = self.model
+        model.User.use_disk_usage_ledger = True
+        try:
+            u = model.User(email="disk_ledger@test.com", password="password")
+            h = model.History(name="History for disk usage", user=u)
+            self.persist(u, h)
+            d1 = model.HistoryDatasetAssociation(name="1", create_dataset=True, sa_session=model.session)
+            d1.dataset.total_size = 10
+            # Adding the dataset records a delta of 10
+            h.add_dataset(d1)
+            self.persist(d1)
+            u.adjust_total_disk_usage(5)
+            u_id = u.id
+            self.expunge()
+
+            user_reload = model.session.query(model.User).get(u_id)
+            assert user_reload.disk_usage is None
+            assert self.query(model.UserDiskUsageDelta).filter_by(user_id=u_id).count() == 2
+            assert user_reload.get_disk_usage() == 15
+            assert disk_usage.find_disk_usage_drift(model.engine, user_ids=[u_id]) == [(u_id, 15, 10)]
+
+            assert disk_usage.apply_disk_usage_deltas(model.engine) == 2
+            assert disk_usage.apply_disk_usage_deltas(model.engine) == 0
+            self.expunge()
+            user_reload = model.session.query(model.User).get(u_id)
+            assert user_reload.disk_usage == 15
+            assert user_reload.get_disk_usage() == 15
+
+            user_reload.adjust_total_disk_usage(3)
+            self.expunge()
+            changes = list(disk_usage.recalculate_disk_usage(model.engine, user_ids=[u_id], dryrun=True))
+            assert changes == [(u_id, 15, 10)]
+            changes = list(disk_usage.recalculate_disk_usage(model.engine, user_ids=[u_id]))
+            assert changes == [(u_id, 15, 10)]
+            self.expunge()
+            user_reload = model.session.query(model.User).get(u_id)
+            assert user_reload.disk_usage == 10
+            assert self.query(model.UserDiskUsageDelta).filter_by(user_id=u_id).count() == 0
+            assert disk_usage.find_disk_usage_drift(model.engine, user_ids=[u_id]) == []
+            assert list(disk_usage.recalculate_disk_usage(model.engine, user_ids=[u_id])) == []
+            # A random sample of users
+            assert len(disk_usage.find_disk_usage_drift(model.engine, sample_size=1)) <= 1
+        finally:
+            model.User.use_disk_usage_ledger = False
+
     def test_basic(self):
         model = self.model
 
@@ -406,6 +454,45 @@ class MappingTests(unittest.TestCase):
 
         assert contents_iter_names(ids=[d1.id, d3.id]) == ["1", "3"]
 
+    def test_next_hid(self):
+        model = self.model
+        u = model.User(email="next_hid@foo.bar.baz", password="password")
+        h1 = model.History(name="NextHidHistory1", user=u)
+        self.persist(u, h1, expunge=False)
+
+        pending = model.HistoryDatasetAssociation(create_dataset=True, sa_session=model.session)
+        self.session().add(pending)
+        assert h1._next_hid(n=3) == 1
+        assert h1._next_hid() == 4
+        # Allocating hids doesn't flush the objects waiting for them
+        assert pending.id is None
+        pending.hid = 1
+        pending.history = h1
+        self.session().flush()
+        assert pending.id is not None
+
+    def test_set_new_datasets_permissions(self):
+        model = self.model
+        security_agent = GalaxyRBACAgent(model)
+        u = model.User(email="new_permissions@foo.bar.baz", password="password")
+        h1 = model.History(name="NewPermissionsHistory1", user=u)
+        role = model.Role(name="new_permissions_role", type=model.Role.types.PRIVATE)
+        self.persist(u, h1, role, expunge=False)
+        d1 = self.new_hda(h1, name="1")
+        d2 = self.new_hda(h1, name="2")
+        self.session().flush()
+
+        manage = security_agent.permitted_actions.DATASET_MANAGE_PERMISSIONS
+        access = security_agent.permitted_actions.DATASET_ACCESS
+        security_agent.set_new_datasets_permissions([
+            (d1.dataset, {manage: [role], access: [role]}),
+            # Without a manage role no permission is set
+            (d2.dataset, {access: [role]}),
+        ])
+        assert sorted(dp.action for dp in d1.dataset.actions) == sorted([manage.action, access.action])
+        assert all(dp.role == role for dp in d1.dataset.actions)
+        assert d2.dataset.actions == []
+
     def _non_empty_flush(self):
         model = self.model
         lf = model.LibraryFolder(name="RootFolder")
@@ -0,0 +1,100 @@
+import json
+import unittest
+
+import galaxy.datatypes.registry
+import galaxy.model
+import galaxy.model.mapping as mapping
+from galaxy.managers.jobs import JobSearch
+from galaxy.model.job_equivalence import (
+    equivalence_hash,
+    job_equivalence_hash,
+)
+from galaxy.util.bunch import Bunch
+
+datatypes_registry = galaxy.datatypes.registry.Registry()
+datatypes_registry.load_datatypes()
+galaxy.model.set_datatypes_registry(datatypes_registry)
+
+
+class JobEquivalenceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.model = mapping.init("/tmp", "sqlite:///:memory:", create_tables=True)
+        self.sa_session = self.model.session
+        self.u = self.model.User(email="equivalence@example.com", password="password")
+        self.history = self.model.History(name="Equivalence", user=self.u)
+        self.hda = self.model.HistoryDatasetAssociation(name="input.txt", extension="txt", history=self.history, create_dataset=True, sa_session=self.sa_session)
+        self.persist(self.u, self.history, self.hda)
+
+    def persist(self, *args):
+        for arg in args:
+            self.sa_session.add(arg)
+        self.sa_session.flush()
+
+    def new_job(self, hda, **params):
+        job = self.model.Job()
+        job.tool_id = "cat1"
+        job.tool_version = "1.0.0"
+        job.user = self.u
+        job.add_input_dataset("input1", hda)
+        job.add_parameter("input1", json.dumps({"values": [{"src": "hda", "id": hda.id}]}, sort_keys=True))
+        # Set by tool actions, not part of the hash
+        job.add_parameter("dbkey", json.dumps("hg19"))
+        job.add_parameter("__input_ext", json.dumps("txt"))
+        job.add_parameter("input1|__identifier__", json.dumps("element"))
+        for name, value in params.items():
+            job.add_parameter(name, json.dumps(value, sort_keys=True))
+        self.persist(job)
+        return job
+
+    def request_hash(self, hda, **params):
+        params["input1"] = {"values": [{"src": "hda", "id": hda.id}]}
+        return equivalence_hash(self.sa_session, "cat1", "1.0.0", params, {"input1": "element"})
+
+    def test_equivalence_hash(self):
+        job = self.new_job(self.hda, lines=10, options={"sort": True})
+        job_hash = job_equivalence_hash(self.sa_session, job)
+        assert job_hash is not None
+        assert job_hash == self.request_hash(self.hda, lines=10, options={"sort": True})
+        # Copies of the input have the same content
+        copied_hda = self.hda.copy()
+        self.persist(copied_hda)
+        assert job_hash == self.request_hash(copied_hda, lines=10, options={"sort": True})
+        # Other parameters or inputs don't
+        assert job_hash != self.request_hash(self.hda, lines=11, options={"sort": True})
+        assert job_hash != equivalence_hash(self.sa_session, "cat1", "1.0.0", {"input1": {"values": [{"src": "hda", "id": self.hda.id}]}, "lines": 10, "options": {"sort": True}}, {"input1": "other"})
+        copied_hda.extension = "tabular"
+        self.persist(copied_hda)
+        assert job_hash != self.request_hash(copied_hda, lines=10, options={"sort": True})
+
+    def test_unhashable_jobs(self):
+        job = self.new_job(self.hda)
+        assert job_equivalence_hash(self.sa_session, job) is not None
+        # The input was changed after the job ran
+        job.input_datasets[0].dataset_version = self.hda.version + 1
+        assert job_equivalence_hash(self.sa_session, job) is None
+        assert equivalence_hash(self.sa_session, "cat1", "1.0.0", {"input1": {"values": [{"src": "unknown", "id": 1}]}}) is None
+
+    def test_search_by_tool_input(self):
+        job = self.new_job(self.hda, lines=10)
+        job.state = job.states.OK
+        job.equivalence_hash = job_equivalence_hash(self.sa_session, job)
+        self.persist(job)
+        job_search = JobSearch.__new__(JobSearch)
+        job_search.sa_session = self.sa_session
+        trans = Bunch(user=self.u)
+
+        def search(**params):
+            param_dump = dict(input1={"values": [{"src": "hda", "id": self.hda.id}]}, **params)
+            param = dict(input1=[self.hda], **params)
+            with self.assertLogs("galaxy.managers.jobs", level="INFO") as logs:
+                found = job_search.by_tool_input(trans, "cat1", "1.0.0", param=param, param_dump=param_dump)
+            return found, any("by hash" in message for message in logs.output)
+
+        self.hda.element_identifier = "element"
+        assert search(lines=10) == (job, True)
+        assert search(lines=11) == (None, False)
+        # Jobs whose stored hash doesn't match the one of the request are found by their parameters
+        job.equivalence_hash = "0" * 64
+        self.persist(job)
+        assert search(lines=10) == (job, False)
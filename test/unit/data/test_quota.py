@@ -0,0 +1,119 @@
+import gc
+import unittest
+
+from sqlalchemy.orm import Session
+
+import galaxy.model.mapping as mapping
+import galaxy.quota
+from galaxy.quota import QuotaAgent
+
+
+class QuotaTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.model = mapping.init("/tmp", "sqlite:///:memory:", create_tables=True)
+        self.quota_agent = QuotaAgent(self.model)
+        self.u = self.model.User(email="quota@example.com", password="password")
+        self.persist(self.u)
+
+    def persist(self, *args):
+        for arg in args:
+            self.model.session.add(arg)
+        self.model.session.flush()
+
+    def add_quota(self, amount, operation="=", name=None, user=None, group=None, default=None):
+        quota = self.model.Quota(name=name or f"{operation}{amount}", description="", amount=amount, operation=operation)
+        self.persist(quota)
+        if default:
+            self.quota_agent.set_default_quota(default, quota)
+        if user:
+            self.persist(self.model.UserQuotaAssociation(user, quota))
+        if group:
+            self.persist(self.model.GroupQuotaAssociation(group, quota))
+        return quota
+
+    def test_default_quotas(self):
+        types = self.model.DefaultQuotaAssociation.types
+        assert self.quota_agent.get_quota(self.u) is None
+        assert self.quota_agent.get_quota(None) is None
+        self.add_quota(100, default=types.REGISTERED)
+        self.add_quota(10, default=types.UNREGISTERED)
+        assert self.quota_agent.get_quota(self.u) == 100
+        assert self.quota_agent.get_quota(None) == 10
+        assert self.quota_agent.get_quota(self.u, nice_size=True) == "100 bytes"
+
+    def test_user_and_group_quotas(self):
+        types = self.model.DefaultQuotaAssociation.types
+        self.add_quota(100, default=types.REGISTERED)
+        self.add_quota(30, operation="+", user=self.u)
+        assert self.quota_agent.get_quota(self.u) == 130
+
+        group = self.model.Group(name="quota group")
+        self.persist(group, self.model.UserGroupAssociation(self.u, group))
+        self.add_quota(500, group=group)
+        self.add_quota(200, user=self.u)
+        # The highest '=' quota replaces the default
+        assert self.quota_agent.get_quota(self.u) == 530
+
+        # A quota shared by user and group counts once
+        minus = self.add_quota(40, operation="-", user=self.u, group=group)
+        assert self.quota_agent.get_quota(self.u) == 490
+
+        minus.deleted = True
+        self.persist(minus)
+        assert self.quota_agent.get_quota(self.u) == 530
+
+        self.add_quota(1000, operation="-", user=self.u)
+        assert self.quota_agent.get_quota(self.u) == 0
+
+        self.add_quota(None, name="unlimited", group=group)
+        assert self.quota_agent.get_quota(self.u) is None
+        assert self.quota_agent.get_quota(self.u, nice_size=True) == "unlimited"
+
+    def test_cache_invalidation(self):
+        quota = self.add_quota(100, user=self.u)
+        assert self.quota_agent.get_quota(self.u) == 100
+        quota.amount = 50
+        self.persist(quota)
+        assert self.quota_agent.get_quota(self.u) == 50
+
+        # Changes not going through the mapper are seen once the cache expires
+        self.model.session.execute(self.model.Quota.table.update().values(bytes=20))
+        assert self.quota_agent.get_quota(self.u) == 50
+        self.quota_agent.invalidate()
+        assert self.quota_agent.get_quota(self.u) == 20
+
+        uncached_agent = QuotaAgent(self.model, cache_ttl=0)
+        self.model.session.execute(self.model.Quota.table.update().values(bytes=10))
+        assert uncached_agent.get_quota(self.u) == 10
+
+    def test_cache_invalidated_on_commit(self):
+        quota = self.add_quota(100, user=self.u)
+        assert self.quota_agent.get_quota(self.u) == 100
+        session = Session(bind=self.model.engine)
+        session.query(self.model.Quota).get(quota.id).amount = 50
+        session.flush()
+        # Not committed yet, other readers still see the old quota
+        assert self.quota_agent._cache
+        session.commit()
+        assert not self.quota_agent._cache
+        assert self.quota_agent.get_quota(self.u) == 50
+        session.close()
+
+    def test_agents_not_kept_alive(self):
+        gc.collect()
+        agents = len(galaxy.quota._quota_agents)
+        QuotaAgent(self.model)
+        gc.collect()
+        assert len(galaxy.quota._quota_agents) == agents
+
+    def test_get_quotas(self):
+        types = self.model.DefaultQuotaAssociation.types
+        self.add_quota(100, default=types.REGISTERED)
+        users = [self.model.User(email=f"quota{i}@example.com", password="password") for i in range(3)]
+        self.persist(*users)
+        self.add_quota(200, user=users[0])
+        self.add_quota(None, name="unlimited", user=users[1])
+        quotas = self.quota_agent.get_quotas([self.u.id] + [user.id for user in users])
+        assert quotas == {self.u.id: 100, users[0].id: 200, users[1].id: None, users[2].id: 100}
+        assert self.quota_agent.get_quotas([users[0].id], nice_size=True) == {users[0].id: "200 bytes"}
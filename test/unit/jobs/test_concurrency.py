@@ -0,0 +1,59 @@
+from galaxy.jobs.concurrency import JobConcurrencyCounters
+
+
+def test_increment_and_decrement():
+    counters = JobConcurrencyCounters()
+    counters.increment(1, 10, "local")
+    counters.increment(2, 10, "cluster")
+    counters.increment(3, 11, "cluster")
+    assert counters.user_job_count == {10: 2, 11: 1}
+    assert counters.user_job_count_per_destination == {10: {"local": 1, "cluster": 1}, 11: {"cluster": 1}}
+    assert counters.total_job_count_per_destination == {"local": 1, "cluster": 2}
+    counters.decrement(2)
+    counters.decrement(3)
+    assert counters.user_job_count == {10: 1}
+    assert counters.user_job_count_per_destination == {10: {"local": 1}}
+    assert counters.total_job_count_per_destination == {"local": 1}
+
+
+def test_decrement_is_idempotent():
+    counters = JobConcurrencyCounters()
+    counters.increment(1, 10, "local")
+    counters.decrement(1)
+    counters.decrement(1)
+    counters.decrement(42)
+    assert counters.user_job_count == {}
+    assert counters.total_job_count_per_destination == {}
+    assert len(counters) == 0
+
+
+def test_increment_replaces_previous_entry():
+    counters = JobConcurrencyCounters()
+    counters.increment(1, 10, "local")
+    counters.increment(1, 10, "cluster")
+    assert counters.user_job_count == {10: 1}
+    assert counters.total_job_count_per_destination == {"cluster": 1}
+
+
+def test_resubmitted_and_anonymous_jobs():
+    counters = JobConcurrencyCounters()
+    counters.increment(1, 10, "local", per_destination=False)
+    counters.increment(2, None, "local")
+    assert counters.user_job_count == {10: 1}
+    assert counters.user_job_count_per_destination == {None: {"local": 1}}
+    assert counters.total_job_count_per_destination == {"local": 1}
+
+
+def test_reconcile():
+    counters = JobConcurrencyCounters()
+    assert counters.needs_reconcile(60)
+    counters.increment(1, 10, "local")
+    user_job_count = counters.user_job_count
+    counters.reconcile([(2, 11, "cluster", True), (3, 11, "cluster", False)])
+    assert not counters.needs_reconcile(60)
+    # Dictionaries are updated in place so references held by the handler stay valid
+    assert user_job_count is counters.user_job_count
+    assert counters.user_job_count == {11: 2}
+    assert counters.total_job_count_per_destination == {"cluster": 1}
+    counters.decrement(1)
+    assert counters.user_job_count == {11: 2}
@@ -0,0 +1,42 @@
+from galaxy import model
+from galaxy.jobs.handler import ItemGrabber
+from galaxy.model import mapping
+from galaxy.util.bunch import Bunch
+from galaxy.web_stack.handlers import HANDLER_ASSIGNMENT_METHODS
+
+HANDLER_TAG = "_default_"
+
+
+def _grabber(max_grab, grab_batch_size, shard=None):
+    model_mapping = mapping.init("/tmp", "sqlite:///:memory:", create_tables=True)
+    with model_mapping.engine.begin() as conn:
+        conn.execute(model.Job.table.insert(), [dict(state=model.Job.states.NEW, handler=HANDLER_TAG, tool_id="cat1") for _ in range(120)])
+    app = Bunch(model=model_mapping, config=Bunch(server_name="handler0"))
+    return ItemGrabber(
+        app=app,
+        grab_type="Job",
+        handler_assignment_method=HANDLER_ASSIGNMENT_METHODS.DB_TRANSACTION_ISOLATION,
+        max_grab=max_grab,
+        self_handler_tags=[HANDLER_TAG],
+        handler_tags=[HANDLER_TAG],
+        grab_batch_size=grab_batch_size,
+        shard=shard,
+    )
+
+
+def test_grab_in_batches_up_to_max_grab():
+    grabber = _grabber(max_grab=60, grab_batch_size=50)
+    assert grabber.grab_unhandled_items() == list(range(1, 61))
+    assert grabber.grab_unhandled_items() == list(range(61, 121))
+    assert grabber.grab_unhandled_items() == []
+
+
+def test_grab_without_max_grab():
+    grabber = _grabber(max_grab=None, grab_batch_size=50)
+    assert len(grabber.grab_unhandled_items()) == 120
+
+
+def test_grab_shard_first():
+    grabber = _grabber(max_grab=None, grab_batch_size=50, shard=(1, 2))
+    assert grabber.grab_unhandled_items() == list(range(1, 121, 2))
+    assert grabber.grab_unhandled_items() == list(range(2, 121, 2))
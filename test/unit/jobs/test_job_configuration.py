@@ -79,11 +79,12 @@ class BaseJobConfXmlParserTestCase(unittest.TestCase):
         self._uwsgi_opt = uwsgi_opt
         self._application_stack = UWSGIApplicationStack()
 
-    def _with_handlers_config(self, assign_with=None, default=None, handlers=None, base_pools=None):
+    def _with_handlers_config(self, assign_with=None, default=None, handlers=None, base_pools=None, **attribs):
         handlers = handlers or []
         template = {
             'assign_with': ' assign_with="%s"' % assign_with if assign_with is not None else '',
-            'default': ' default="%s"' % default if default is not None else '',
+            'default': (' default="%s"' % default if default is not None else '') + ''.join(
+                f' {k}="{v}"' for k, v in attribs.items()),
             'handlers': '\n'.join(
                 '<handler id="{id}"{tags}/>'.format(
                     id=x['id'],
@@ -215,6 +216,22 @@ class SimpleJobConfXmlParserTestCase(BaseJobConfXmlParserTestCase):
         assert self.job_config.default_handler_id is None
         assert sorted(self.job_config.handlers['_default_']) == ['handler0', 'main.job-handlers.1']
 
+    def test_grab_batch_size_and_shard_grab(self):
+        self._with_handlers_config(assign_with='db-skip-locked', grab_batch_size='50', shard_grab='true')
+        assert self.job_config.handler_grab_batch_size == 50
+        assert self.job_config.handler_shard_grab is True
+
+    def test_handler_shard(self):
+        self.config.server_name = 'handler1'
+        self._with_handlers_config(
+            assign_with='db-skip-locked',
+            handlers=[{'id': 'handler0', 'tags': 'handlers'}, {'id': 'handler1', 'tags': 'handlers'}, {'id': 'handler2', 'tags': 'other'}],
+        )
+        assert self.job_config.handler_shard_grab is False
+        assert self.job_config.get_handler_shard() == (1, 2)
+        self.config.server_name = 'handler2'
+        assert self.job_config.get_handler_shard() is None
+
     def test_uwsgi_farms_as_handler_tags(self):
         self._with_uwsgi_application_stack(
             mule=['lib/galaxy/main.py'] * 2,
@@ -1,3 +1,4 @@
+import importlib
 import uuid
 
 from galaxy.jobs import (
@@ -5,6 +6,7 @@ from galaxy.jobs import (
     JobDestination,
 )
 from galaxy.jobs.mapper import (
+    destination_mapping_cache,
     ERROR_MESSAGE_NO_RULE_FUNCTION,
     ERROR_MESSAGE_RULE_FUNCTION_NOT_FOUND,
     JobRunnerMapper,
@@ -103,6 +105,27 @@ def test_dynamic_mapping_rule_module_override():
     assert mapper.job_config.rule_response == "new_rules_package"
 
 
+def test_dynamic_mapping_memoized():
+    memoized_rule_calls = importlib.import_module("%s.10_site" % test_rules.__name__).MEMOIZED_RULE_CALLS
+    del memoized_rule_calls[:]
+    destination_mapping_cache.clear()
+    for _ in range(2):
+        mapper = __mapper(__dynamic_destination(dict(function="memoized_user_rule", memoize="true")))
+        assert mapper.get_job_destination({}) is DYNAMICALLY_GENERATED_DESTINATION
+        assert mapper.job_config.rule_response == "memoized_dest_id"
+    assert memoized_rule_calls == [("testtoolshed/devteam/tool1/23abcd13123", "test@example.com")]
+
+
+def test_dynamic_mapping_memoize_ignored_for_job_specific_rules():
+    memoized_rule_calls = importlib.import_module("%s.10_site" % test_rules.__name__).MEMOIZED_RULE_CALLS
+    del memoized_rule_calls[:]
+    destination_mapping_cache.clear()
+    for _ in range(2):
+        mapper = __mapper(__dynamic_destination(dict(function="memoized_job_rule", memoize="true")))
+        assert mapper.get_job_destination({}) is DYNAMICALLY_GENERATED_DESTINATION
+    assert memoized_rule_calls == [12345, 12345]
+
+
 def test_dynamic_mapping_externally_set_job_destination():
     mapper = __mapper(__dynamic_destination(dict(function="upload")))
     # Initially, the mapper should not have a cached destination
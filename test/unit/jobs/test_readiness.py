@@ -0,0 +1,69 @@
+from galaxy.jobs.readiness import JobReadinessTracker
+
+NON_READY_STATES = ("new", "upload", "queued", "running", "setting_metadata")
+
+
+def test_job_without_unmet_inputs_is_ready():
+    tracker = JobReadinessTracker()
+    tracker.track(1)
+    assert tracker.pop_ready() == [1]
+    assert 1 not in tracker
+    assert tracker.pop_ready() == []
+
+
+def test_job_ready_once_all_inputs_ready():
+    tracker = JobReadinessTracker()
+    tracker.track(1, [10, 11])
+    tracker.track(2, [11])
+    assert tracker.unmet_count(1) == 2
+    assert tracker.watched_dataset_ids == {10, 11}
+    assert tracker.dataset_ready(11) == [2]
+    assert tracker.pop_ready() == [2]
+    assert tracker.unmet_count(1) == 1
+    tracker.dataset_ready(10)
+    assert tracker.pop_ready() == [1]
+    assert len(tracker) == 0
+    assert tracker.watched_dataset_ids == set()
+
+
+def test_state_change_to_non_ready_state_is_ignored():
+    tracker = JobReadinessTracker()
+    tracker.track(1, [10])
+    assert tracker.dataset_state_changed(10, "running", NON_READY_STATES) == []
+    assert tracker.pop_ready() == []
+    assert tracker.dataset_state_changed(10, "error", NON_READY_STATES) == [1]
+    assert tracker.pop_ready() == [1]
+
+
+def test_unwatched_dataset_event_is_ignored():
+    tracker = JobReadinessTracker()
+    tracker.track(1, [10])
+    assert tracker.dataset_ready(42) == []
+    assert tracker.unmet_count(1) == 1
+
+
+def test_forget_releases_watched_datasets():
+    tracker = JobReadinessTracker()
+    tracker.track(1, [10])
+    tracker.track(2, [10, 11])
+    tracker.forget(2)
+    assert tracker.watched_dataset_ids == {10}
+    tracker.dataset_ready(10)
+    assert tracker.pop_ready() == [1]
+
+
+def test_retrack_replaces_dependencies():
+    tracker = JobReadinessTracker()
+    tracker.track(1, [10])
+    tracker.track(1)
+    assert tracker.watched_dataset_ids == set()
+    assert tracker.pop_ready() == [1]
+
+
+def test_reconcile():
+    tracker = JobReadinessTracker()
+    tracker.track(1, [10])
+    tracker.track(2, [11])
+    assert tracker.reconcile([2, 3, 4]) == [3, 4]
+    assert tracker.job_ids == {2}
+    assert tracker.watched_dataset_ids == {11}
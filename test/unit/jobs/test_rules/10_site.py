@@ -70,3 +70,16 @@ def check_resource_params(resource_params):
 
 def check_workflow_invocation_uuid(workflow_invocation_uuid):
     return workflow_invocation_uuid
+
+
+MEMOIZED_RULE_CALLS = []
+
+
+def memoized_user_rule(tool_id, user_email):
+    MEMOIZED_RULE_CALLS.append((tool_id, user_email))
+    return "memoized_dest_id"
+
+
+def memoized_job_rule(job_id):
+    MEMOIZED_RULE_CALLS.append(job_id)
+    return "memoized_dest_id"
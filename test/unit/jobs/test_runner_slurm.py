@@ -0,0 +1,75 @@
+from galaxy.jobs.runners import slurm
+from galaxy.util.bunch import Bunch
+
+SQUEUE_OUTPUT = """CLUSTER: cluster1
+1 PENDING
+2 RUNNING
+3 COMPLETING
+4 COMPLETED
+"""
+
+JOB_STATES = Bunch(QUEUED_ACTIVE="queued_active", RUNNING="running")
+
+
+def test_parse_squeue_states():
+    assert slurm._parse_squeue_states(SQUEUE_OUTPUT) == {
+        "1": "PENDING",
+        "2": "RUNNING",
+        "3": "COMPLETING",
+        "4": "COMPLETED",
+    }
+
+
+def test_get_batch_job_states(monkeypatch):
+    calls = []
+
+    def execute(cmd):
+        calls.append(cmd)
+        return SQUEUE_OUTPUT
+
+    monkeypatch.setattr(slurm.commands, "execute", execute)
+    runner = _runner(batch_job_status=True)
+    watched = [Bunch(job_id="%d.cluster1" % i) for i in range(1, 6)]
+    states = runner._get_batch_job_states(watched)
+    # terminal and completing jobs are left to be checked individually
+    assert states == {"1.cluster1": "queued_active", "2.cluster1": "running"}
+    assert calls == [["squeue", "--noheader", "--format=%i %T", "-M", "cluster1", "--jobs=1,2,3,4,5"]]
+
+
+def test_get_batch_job_states_disabled(monkeypatch):
+    monkeypatch.setattr(slurm.commands, "execute", None)
+    runner = _runner(batch_job_status=False)
+    assert runner._get_batch_job_states([Bunch(job_id="1")]) == {}
+
+
+def _runner(batch_job_status):
+    runner = slurm.SlurmJobRunner.__new__(slurm.SlurmJobRunner)
+    runner.runner_params = Bunch(batch_job_status=batch_job_status)
+    runner.drmaa_job_states = JOB_STATES
+    return runner
+
+
+def test_stop_jobs(monkeypatch):
+    calls = []
+
+    def execute(cmd):
+        calls.append(cmd)
+        if "-M" not in cmd:
+            raise slurm.commands.CommandLineException(cmd, "", "", 1)
+        return ""
+
+    monkeypatch.setattr(slurm.commands, "execute", execute)
+    runner = _runner(batch_job_status=False)
+    stopped_individually = []
+    monkeypatch.setattr(slurm.DRMAAJobRunner, "stop_jobs", lambda self, job_wrappers: stopped_individually.extend(job_wrappers))
+    job_wrappers = [_job_wrapper(1, "11.cluster1"), _job_wrapper(2, "12"), _job_wrapper(3, None),
+                    _job_wrapper(4, "14.cluster1"), _job_wrapper(5, "15", kill_script="kill.sh")]
+    runner.stop_jobs(job_wrappers)
+    # A failing scancel call doesn't prevent jobs on other clusters from being cancelled
+    assert calls == [["scancel", "-M", "cluster1", "11", "14"], ["scancel", "12"]]
+    assert stopped_individually == [job_wrappers[4]]
+
+
+def _job_wrapper(job_id, external_id, kill_script=None):
+    job = Bunch(id=job_id, get_job_runner_external_id=lambda: external_id)
+    return Bunch(get_job=lambda: job, get_destination_configuration=lambda key: kill_script)
@@ -0,0 +1,98 @@
+import os
+
+from galaxy import model
+from galaxy.datatypes.tabular import (
+    Sam,
+    Tabular,
+)
+from galaxy.jobs.splitters import multi
+from galaxy.util.bunch import Bunch
+
+
+class MockJobWrapper:
+
+    def __init__(self, working_directory, outputs, external_chown_script=None):
+        self.working_directory = working_directory
+        self.outputs = outputs
+        self.external_chown_script = external_chown_script
+        self.parallelism = Bunch(attributes={"merge_outputs": ",".join(outputs)})
+
+    def get_parallelism(self):
+        return self.parallelism
+
+    def get_destination_configuration(self, key, default=None):
+        assert key == "external_chown_script"
+        return self.external_chown_script
+
+    def get_output_hdas_and_fnames(self):
+        return {name: (Bunch(datatype=datatype), None) for name, datatype in self.outputs.items()}
+
+    def get_output_fnames(self):
+        return [os.path.join(self.working_directory, "outputs", "%s.dat" % name) for name in self.outputs]
+
+
+class MockTaskWrapper:
+
+    def __init__(self, working_directory):
+        self.working_directory = working_directory
+        self.state = model.Task.states.RUNNING
+
+    def get_state(self):
+        return self.state
+
+    def get_task(self):
+        return Bunch(stdout="", stderr="")
+
+
+def setup_tasks(tmp_path, outputs, tasks=3):
+    os.makedirs(str(tmp_path / "outputs"))
+    task_wrappers = []
+    for i in range(tasks):
+        task_directory = str(tmp_path / ("task_%d" % i))
+        os.makedirs(task_directory)
+        for name in outputs:
+            with open(os.path.join(task_directory, "%s.dat" % name), "w") as f:
+                f.write("@HD\tVN:1.6\n%s\t%d\n" % (name, i))
+        task_wrappers.append(MockTaskWrapper(task_directory))
+    return task_wrappers
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_incremental_merge(tmp_path):
+    job_wrapper = MockJobWrapper(str(tmp_path), {"table": Tabular(), "alignments": Sam()})
+    table_path, alignments_path = job_wrapper.get_output_fnames()
+    task_wrappers = setup_tasks(tmp_path, job_wrapper.outputs)
+    merger = multi.IncrementalMerger(job_wrapper)
+
+    # Only the leading run of finished tasks is merged, and only concatenated outputs
+    task_wrappers[1].state = model.Task.states.OK
+    merger.update(task_wrappers)
+    assert not os.path.exists(table_path)
+    task_wrappers[0].state = model.Task.states.OK
+    merger.update(task_wrappers)
+    assert merger.merged_tasks == 2
+    assert read(table_path) == "@HD\tVN:1.6\ntable\t0\n@HD\tVN:1.6\ntable\t1\n"
+    assert not os.path.exists(alignments_path)
+
+    task_wrappers[2].state = model.Task.states.OK
+    stdout, stderr = multi.do_merge(job_wrapper, task_wrappers, merger=merger)
+    assert not stderr
+    assert read(table_path) == "".join("@HD\tVN:1.6\ntable\t%d\n" % i for i in range(3))
+    assert read(alignments_path) == "@HD\tVN:1.6\n" + "".join("alignments\t%d\n" % i for i in range(3))
+
+
+def test_incremental_merge_disabled_with_external_chown(tmp_path):
+    job_wrapper = MockJobWrapper(str(tmp_path), {"table": Tabular()}, external_chown_script="chown.sh")
+    table_path = job_wrapper.get_output_fnames()[0]
+    task_wrappers = setup_tasks(tmp_path, job_wrapper.outputs, tasks=2)
+    merger = multi.IncrementalMerger(job_wrapper)
+    for task_wrapper in task_wrappers:
+        task_wrapper.state = model.Task.states.OK
+    merger.update(task_wrappers)
+    assert not os.path.exists(table_path)
+    multi.do_merge(job_wrapper, task_wrappers, merger=merger)
+    assert read(table_path) == "@HD\tVN:1.6\ntable\t0\n@HD\tVN:1.6\ntable\t1\n"
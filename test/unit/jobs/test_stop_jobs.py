@@ -0,0 +1,133 @@
+from sqlalchemy import event
+
+from galaxy import model
+from galaxy.jobs import handler
+from galaxy.jobs.runners import BaseJobRunner, cli, pbs
+from galaxy.model import mapping
+from galaxy.util.bunch import Bunch
+
+
+class RecordingRunner:
+
+    def __init__(self, fail=False):
+        self.stopped = []
+        self.fail = fail
+
+    def stop_jobs(self, job_wrappers):
+        self.stopped.append(list(job_wrappers))
+        if self.fail:
+            raise Exception("Cannot stop jobs")
+
+
+def test_stop_queue_stops_jobs_in_bulk(monkeypatch):
+    model_mapping = mapping.init("/tmp", "sqlite:///:memory:", create_tables=True)
+    sa_session = model_mapping.context
+    jobs = []
+    for job_runner_name in ["cli://", "cli://", None]:
+        job = model.Job()
+        job.state = model.Job.states.DELETED_NEW
+        job.handler = "main"
+        job.job_runner_name = job_runner_name
+        jobs.append(job)
+    finished_job = model.Job()
+    finished_job.state = model.Job.states.OK
+    sa_session.add_all(jobs + [finished_job])
+    sa_session.flush()
+    job_ids = [job.id for job in jobs]
+
+    dispatcher = Bunch(stopped=[])
+    dispatcher.stop_jobs = dispatcher.stopped.append
+    monkeypatch.setattr(handler, "JobWrapper", lambda job, queue, use_persisted_destination: Bunch(job_id=job.id))
+    stop_queue = handler.JobHandlerStopQueue.__new__(handler.JobHandlerStopQueue)
+    stop_queue.app = Bunch(config=Bunch(track_jobs_in_database=True, server_name="main"))
+    stop_queue.dispatcher = dispatcher
+    stop_queue.job_counters = None
+    stop_queue.sa_session = sa_session
+    stop_queue.queue = handler.Queue()
+    stop_queue.queue.put((finished_job.id, None))
+
+    flushes = []
+    event.listen(sa_session, "after_flush", lambda session, context: flushes.append(True))
+    stop_queue.monitor_step()
+    # All jobs are updated with a single flush
+    assert len(flushes) == 1
+    for job_id in job_ids:
+        assert sa_session.query(model.Job).get(job_id).state == model.Job.states.DELETED
+    assert sa_session.query(model.Job).get(finished_job.id).state == model.Job.states.OK
+    # and jobs dispatched to a runner are stopped with a single call
+    assert len(dispatcher.stopped) == 1
+    assert [job_wrapper.job_id for job, job_wrapper in dispatcher.stopped[0]] == job_ids[:2]
+
+
+def test_dispatcher_stops_jobs_by_runner():
+    dispatcher = handler.DefaultJobDispatcher.__new__(handler.DefaultJobDispatcher)
+    dispatcher.job_runners = {"cli": RecordingRunner(fail=True), "slurm": RecordingRunner()}
+    jobs_and_wrappers = []
+    for job_runner_name in ["cli://", "slurm://", "cli://", "unknown://", None]:
+        job = Bunch(get_job_runner_name=lambda job_runner_name=job_runner_name: job_runner_name)
+        jobs_and_wrappers.append((job, Bunch(get_id_tag=lambda: "1")))
+    dispatcher.stop_jobs(jobs_and_wrappers)
+    # A failing runner doesn't prevent the other runners from stopping jobs
+    assert dispatcher.job_runners["cli"].stopped == [[jobs_and_wrappers[0][1], jobs_and_wrappers[2][1]]]
+    assert dispatcher.job_runners["slurm"].stopped == [[jobs_and_wrappers[1][1]]]
+
+
+def test_base_runner_stops_jobs_individually():
+    stopped = []
+
+    def stop_job(job_wrapper):
+        if job_wrapper.fail:
+            raise Exception("Cannot stop job")
+        stopped.append(job_wrapper)
+
+    runner = BaseJobRunner.__new__(BaseJobRunner)
+    runner.stop_job = stop_job
+    job_wrappers = [Bunch(fail=False), Bunch(fail=True, get_id_tag=lambda: "2"), Bunch(fail=False)]
+    runner.stop_jobs(job_wrappers)
+    assert stopped == [job_wrappers[0], job_wrappers[2]]
+
+
+def test_cli_runner_deletes_jobs_per_destination(monkeypatch):
+    monkeypatch.setattr(cli, "MAX_DELETE_BATCH", 2)
+    deleted = []
+
+    def get_cli_plugins(shell_params, job_params):
+        if job_params.get("plugin") == "broken":
+            raise Exception("Unknown job plugin")
+        shell = Bunch(execute=lambda cmd: deleted.append(cmd) or Bunch(returncode=0))
+        job_interface = Bunch(delete_all=lambda ids: (job_params["plugin"], ids))
+        return shell, job_interface
+
+    runner = cli.ShellJobRunner.__new__(cli.ShellJobRunner)
+    runner.parse_destination_params = lambda params: ({}, params)
+    runner.get_cli_plugins = get_cli_plugins
+    job_wrappers = []
+    for job_id, plugin in enumerate(["broken", "slurm", "torque", "slurm", "slurm"]):
+        job = Bunch(id=job_id, job_runner_external_id=str(job_id), destination_params={"plugin": plugin})
+        job_wrappers.append(Bunch(get_job=lambda job=job: job))
+    job = Bunch(id=5, job_runner_external_id=None, destination_params={"plugin": "slurm"})
+    job_wrappers.append(Bunch(get_job=lambda: job))
+    runner.stop_jobs(job_wrappers)
+    # A broken destination doesn't prevent jobs of other destinations from being stopped
+    assert deleted == [("slurm", ["1", "3"]), ("slurm", ["4"]), ("torque", ["2"])]
+
+
+def test_pbs_runner_stops_jobs_without_external_id(monkeypatch):
+    deleted = []
+    monkeypatch.setattr(pbs, "pbs", Bunch(
+        pbs_connect=lambda server: 1,
+        pbs_deljob=lambda c, job_id, extend: deleted.append(job_id),
+        pbs_disconnect=lambda c: None,
+    ))
+    runner = pbs.PBSJobRunner.__new__(pbs.PBSJobRunner)
+    job_wrappers = []
+    for job_id, external_id in enumerate(["1.server", None, "3.server"]):
+        job = Bunch(
+            destination_params={"destination": "batch@server"},
+            get_id_tag=lambda job_id=job_id: str(job_id),
+            get_job_runner_external_id=lambda external_id=external_id: external_id,
+        )
+        job_wrappers.append(Bunch(get_job=lambda job=job: job))
+    runner.stop_jobs(job_wrappers)
+    # A job without an external id doesn't prevent the other jobs from being stopped
+    assert deleted == [b"1.server", b"3.server"]
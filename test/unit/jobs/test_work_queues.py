@@ -0,0 +1,105 @@
+import pytest
+
+from galaxy.jobs.runners.work_queues import (
+    FINISH_STAGE,
+    QUEUE_STAGE,
+    RunnerWorkQueues,
+)
+from galaxy.util.bunch import Bunch
+
+
+def queue_job(job_wrapper):
+    pass
+
+
+def finish_job(job_state):
+    pass
+
+
+def fail_job(job_state):
+    pass
+
+
+def stop(arg):
+    pass
+
+
+def _job_state(output_count):
+    outputs = [Bunch(false_path=None, real_path="/nonexistent/%d" % i) for i in range(output_count)]
+    return Bunch(job_wrapper=Bunch(get_output_fnames=lambda: outputs))
+
+
+def test_single_stage_by_default():
+    queues = RunnerWorkQueues()
+    assert queues.stage_for(finish_job) == QUEUE_STAGE
+    queues.put((queue_job, 1))
+    queues.put((finish_job, 2))
+    assert queues.qsize() == 2
+    assert queues.get() == (queue_job, 1)
+    assert queues.get() == (finish_job, 2)
+    assert list(queues.stats()) == [QUEUE_STAGE]
+
+
+def test_finish_methods_routed_to_finish_stage():
+    queues = RunnerWorkQueues(separate_finish_stage=True)
+    queues.put((queue_job, 1))
+    queues.put((finish_job, 2))
+    queues.put((fail_job, 3))
+    assert queues.get(QUEUE_STAGE) == (queue_job, 1)
+    assert queues.get(FINISH_STAGE) == (finish_job, 2)
+    assert queues.get(FINISH_STAGE) == (fail_job, 3)
+    stats = queues.stats()
+    assert stats[QUEUE_STAGE]["processed"] == 1
+    assert stats[FINISH_STAGE]["processed"] == 2
+    assert stats[FINISH_STAGE]["depth"] == 0
+
+
+def test_fewest_outputs_first():
+    queues = RunnerWorkQueues(separate_finish_stage=True, finish_priority="fewest_outputs_first")
+    many, few = _job_state(5), _job_state(1)
+    queues.put((finish_job, many))
+    queues.put((finish_job, few))
+    assert queues.get(FINISH_STAGE)[1] is few
+    assert queues.get(FINISH_STAGE)[1] is many
+
+
+def test_stop_signal_processed_last():
+    queues = RunnerWorkQueues(separate_finish_stage=True, finish_priority="fewest_outputs_first")
+    queues.put_stop_signal(FINISH_STAGE, stop)
+    queues.put((finish_job, _job_state(100)))
+    assert queues.get(FINISH_STAGE)[0] is finish_job
+    assert queues.get(FINISH_STAGE) == (stop, None)
+
+
+def test_invalid_priority():
+    with pytest.raises(Exception):
+        RunnerWorkQueues(finish_priority="largest_first")
+
+
+def test_smallest_outputs_first(tmp_path):
+    queues = RunnerWorkQueues(separate_finish_stage=True, finish_priority="smallest_outputs_first")
+    large, small = tmp_path / "large", tmp_path / "small"
+    large.write_text("x" * 100)
+    small.write_text("x")
+    large_state = Bunch(job_wrapper=Bunch(get_output_fnames=lambda: [Bunch(false_path=None, real_path=str(large))]))
+    small_state = Bunch(job_wrapper=Bunch(get_output_fnames=lambda: [Bunch(false_path=None, real_path=str(small))]))
+    queues.put((finish_job, large_state))
+    queues.put((finish_job, small_state))
+    # Output sizes are determined in a separate thread
+    queues._prioritize_queue.join()
+    assert queues.get(FINISH_STAGE)[1] is small_state
+    assert queues.get(FINISH_STAGE)[1] is large_state
+
+
+def test_stats_sent_to_statsd():
+    metrics = []
+    statsd_client = Bunch(
+        timing=lambda path, time: metrics.append(("timing", path)),
+        gauge=lambda path, value: metrics.append(("gauge", path, value)),
+    )
+    queues = RunnerWorkQueues(separate_finish_stage=True, statsd_client=statsd_client, metric_prefix="runner")
+    queues.put((queue_job, 1))
+    queues.put((finish_job, 2))
+    queues.put((finish_job, 3))
+    queues.get(FINISH_STAGE)
+    assert metrics == [("timing", "runner.finish.wait"), ("gauge", "runner.finish.depth", 1)]
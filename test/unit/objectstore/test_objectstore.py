@@ -5,6 +5,7 @@ from uuid import uuid4
 from galaxy.exceptions import ObjectInvalid
 from galaxy.objectstore.azure_blob import AzureBlobObjectStore
 from galaxy.objectstore.cloud import Cloud
+from galaxy.objectstore.deduplicating import hash_file
 from galaxy.objectstore.pithos import PithosObjectStore
 from galaxy.objectstore.s3 import S3ObjectStore
 from galaxy.util import directory_hash_id
@@ -177,6 +178,56 @@ def test_disk_store_alt_name_abspath():
             pass
 
 
+DEDUPLICATING_DISK_TEST_CONFIG_YAML = """
+type: deduplicating_disk
+files_dir: "${temp_directory}/files1"
+extra_dirs:
+  - type: temp
+    path: "${temp_directory}/tmp1"
+  - type: job_work
+    path: "${temp_directory}/job_working_directory1"
+"""
+
+
+def test_deduplicating_disk_store():
+    with TestConfig(DEDUPLICATING_DISK_TEST_CONFIG_YAML) as (directory, object_store):
+        first_dataset, second_dataset, other_dataset = MockDataset(1), MockDataset(2), MockDataset(3)
+        output_path = directory.write("Hello World!", "job_working_directory1/example_output")
+        other_path = directory.write("Goodbye World!", "job_working_directory1/other_output")
+        object_store.update_from_file(first_dataset, file_name=output_path, create=True)
+        object_store.update_from_file(second_dataset, file_name=output_path, create=True)
+        object_store.update_from_file(other_dataset, file_name=other_path, create=True)
+
+        first_path = object_store.get_filename(first_dataset)
+        second_path = object_store.get_filename(second_dataset)
+        # Datasets keep their usual paths but share the storage of identical content
+        assert first_path == os.path.join(directory.temp_directory, "files1", "000", "dataset_1.dat")
+        assert os.path.samefile(first_path, second_path)
+        assert not os.path.samefile(first_path, object_store.get_filename(other_dataset))
+        assert object_store.get_data(second_dataset) == "Hello World!"
+        assert object_store.size(second_dataset) == len("Hello World!")
+
+        stats = object_store.get_deduplication_stats()
+        assert stats["blobs"] == 2
+        assert stats["references"] == 3
+        assert stats["saved_bytes"] == len("Hello World!")
+        assert stats["saved_bytes_since_start"] == len("Hello World!")
+
+        # Blobs are removed with their last reference only
+        blob_path = object_store.blobs.blob_path(hash_file(first_path))
+        assert object_store.delete(first_dataset)
+        assert os.path.exists(blob_path)
+        assert object_store.get_data(second_dataset) == "Hello World!"
+        assert object_store.delete(second_dataset)
+        assert not os.path.exists(blob_path)
+        assert object_store.get_deduplication_stats()["blobs"] == 1
+
+        # Files stored before deduplication are linked in place
+        existing_path = directory.write("Goodbye World!", "files1/000/dataset_4.dat")
+        assert object_store.deduplicate_existing(existing_path) == len("Goodbye World!")
+        assert os.path.samefile(existing_path, object_store.get_filename(other_dataset))
+
+
 MIXED_STORE_BY_HIERARCHICAL_TEST_CONFIG = """<?xml version="1.0"?>
 <object_store type="hierarchical">
     <backends>
@@ -338,6 +389,82 @@ def test_distributed_store():
             assert len(extra_dirs) == 2
 
 
+DISTRIBUTED_LOCATION_INDEX_TEST_CONFIG = DISTRIBUTED_TEST_CONFIG.replace(
+    '<object_store type="distributed">',
+    '<object_store type="distributed" location_index="${temp_directory}/locations.sqlite">'
+)
+HIERARCHICAL_LOCATION_INDEX_TEST_CONFIG = HIERARCHICAL_TEST_CONFIG.replace(
+    '<object_store type="hierarchical">',
+    '<object_store type="hierarchical" location_index="${temp_directory}/locations.sqlite">'
+)
+
+
+class ExistsCounter:
+
+    def __init__(self, store):
+        self.calls = 0
+        self._exists = store.exists
+        store.exists = self
+
+    def __call__(self, obj, **kwargs):
+        self.calls += 1
+        return self._exists(obj, **kwargs)
+
+
+def test_distributed_store_location_index():
+    with TestConfig(DISTRIBUTED_LOCATION_INDEX_TEST_CONFIG) as (directory, object_store):
+        index = object_store.location_index
+        assert object_store.to_dict()["location_index"] == index.path
+        # Dataset without object_store_id, found by asking the backends
+        directory.write("Hello World!", "files2/000/dataset_1.dat")
+        assert object_store.get_data(MockDataset(1)) == "Hello World!"
+        assert index.lookup(("MockDataset", 1)) == "files2"
+
+        counters = {backend_id: ExistsCounter(store) for backend_id, store in object_store.backends.items()}
+        dataset = MockDataset(1)
+        assert object_store.get_data(dataset) == "Hello World!"
+        assert dataset.object_store_id == "files2"
+        assert counters["files1"].calls == 0
+
+        # Extra files are located without the index and don't change the location of their dataset
+        directory.write("Extra", "files1/000/dataset_1_files/extra.txt")
+        assert object_store.exists(MockDataset(1), extra_dir="dataset_1_files", alt_name="extra.txt")
+        assert index.lookup(("MockDataset", 1)) == "files2"
+
+        dataset = MockDataset(2)
+        object_store.create(dataset)
+        assert index.lookup(("MockDataset", 2)) == dataset.object_store_id
+        object_store.delete(dataset)
+        assert index.lookup(("MockDataset", 2)) is None
+
+
+def test_hierarchical_store_location_index():
+    with TestConfig(HIERARCHICAL_LOCATION_INDEX_TEST_CONFIG) as (directory, object_store):
+        index = object_store.location_index
+        directory.write("Hello World!", "files2/000/dataset_1.dat")
+        assert object_store.exists(MockDataset(1))
+        assert index.lookup(("MockDataset", 1)) == "1"
+
+        counters = [ExistsCounter(store) for store in object_store.backends.values()]
+        assert object_store.get_data(MockDataset(1)) == "Hello World!"
+        assert counters[0].calls == 0
+
+        # Stale locations are corrected by asking the backends
+        directory.write("Hello World!", "files2/000/dataset_2.dat")
+        index.record(("MockDataset", 2), 0)
+        counters = [ExistsCounter(store) for store in object_store.backends.values()]
+        assert object_store.exists(MockDataset(2))
+        assert index.lookup(("MockDataset", 2)) == "1"
+        # The backend in the index is not asked again
+        assert [counter.calls for counter in counters] == [1, 1]
+
+        dataset = MockDataset(3)
+        object_store.create(dataset)
+        assert index.lookup(("MockDataset", 3)) == "0"
+        assert not object_store.exists(MockDataset(4))
+        assert index.lookup(("MockDataset", 4)) is None
+
+
 # Unit testing the cloud and advanced infrastructure object stores is difficult, but
 # we can at least stub out initializing and test the configuration of these things from
 # XML and dicts.
@@ -0,0 +1,140 @@
+import random
+
+from galaxy.objectstore.placement import PlacementEngine
+
+GB = 1024 ** 3
+
+
+class FakeBackends:
+
+    def __init__(self, **free):
+        self.total = 100 * GB
+        self.free = free
+        self.now = 1000.0
+
+    def probe(self, backend_id):
+        free = self.free[backend_id]
+        if free is None:
+            return 10.0, None, None
+        return (self.total - free) * 100.0 / self.total, self.total, free
+
+    def clock(self):
+        return self.now
+
+
+def _engine(backends, weights=None, max_percent_full=None, **kwd):
+    weights = weights or {}
+    max_percent_full = max_percent_full or {}
+    engine = PlacementEngine(
+        [(backend_id, weights.get(backend_id, 1), max_percent_full.get(backend_id, 0)) for backend_id in sorted(backends.free)],
+        backends.probe,
+        clock=backends.clock,
+        rng=random.Random(42),
+        **kwd
+    )
+    engine.refresh()
+    return engine
+
+
+def _place(engine, count, size=None, start=0):
+    placed = {}
+    for i in range(start, start + count):
+        backend_id = engine.choose(("Dataset", i), size=size)
+        placed[backend_id] = placed.get(backend_id, 0) + 1
+    return placed
+
+
+def test_weights():
+    backends = FakeBackends(a=50 * GB, b=50 * GB)
+    engine = _engine(backends, weights={"a": 3, "b": 1}, reserve_size=0)
+    placed = _place(engine, 1000)
+    assert 2.5 < placed["a"] / placed["b"] < 3.5
+
+
+def test_zero_weight_never_chosen():
+    backends = FakeBackends(a=50 * GB, b=50 * GB)
+    engine = _engine(backends, weights={"a": 1, "b": 0})
+    assert _place(engine, 100) == {"a": 100}
+
+
+def test_free_space_preferred():
+    backends = FakeBackends(a=80 * GB, b=20 * GB)
+    engine = _engine(backends, reserve_size=0)
+    placed = _place(engine, 1000)
+    assert placed["a"] > 3 * placed["b"]
+
+
+def test_full_backend_excluded():
+    backends = FakeBackends(a=50 * GB, b=5 * GB)
+    engine = _engine(backends, global_max_percent_full=90)
+    assert _place(engine, 100) == {"a": 100}
+
+
+def test_reservations_count_before_refresh():
+    # b has room for 4 GB below its limit, each dataset reserves 1 GB
+    backends = FakeBackends(a=50 * GB, b=14 * GB)
+    engine = _engine(backends, max_percent_full={"b": 90}, reserve_size=GB)
+    _place(engine, 40)
+    metrics = engine.metrics()["backends"]
+    assert metrics["b"]["placements"] <= 4
+    assert metrics["b"]["reserved_bytes"] == metrics["b"]["placements"] * GB
+    assert engine.choose(("Dataset", 1000), size=200 * GB) is None
+    assert engine.metrics()["rejections"] == 1
+
+
+def test_reservations_expire_and_are_released():
+    backends = FakeBackends(a=50 * GB)
+    engine = _engine(backends, reserve_size=GB, reservation_ttl=60)
+    _place(engine, 3)
+    engine.written("a", ("Dataset", 0), 10)
+    metrics = engine.metrics()["backends"]["a"]
+    assert metrics["reservations"] == 2
+    assert metrics["reserved_bytes"] == 2 * GB + 10
+    backends.now += 61
+    assert engine.metrics()["backends"]["a"]["reserved_bytes"] == 10
+    # written bytes are part of the next measurement
+    engine.refresh()
+    assert engine.metrics()["backends"]["a"]["reserved_bytes"] == 0
+
+
+def test_reservations_released_by_refresh():
+    backends = FakeBackends(a=50 * GB)
+    engine = _engine(backends, reserve_size=GB)
+    _place(engine, 3)
+    assert engine.metrics()["backends"]["a"]["reserved_bytes"] == 3 * GB
+    # e.g. outputs written by jobs, which don't release their reservations
+    backends.now += 30
+    backends.free["a"] -= 3 * GB
+    engine.refresh()
+    assert engine.metrics()["backends"]["a"]["reservations"] == 0
+
+
+def test_reservations_dont_prevent_placement():
+    # b has room for 4 GB below its limit
+    backends = FakeBackends(b=14 * GB)
+    engine = _engine(backends, max_percent_full={"b": 90}, reserve_size=GB)
+    assert _place(engine, 10) == {"b": 10}
+    assert engine.metrics()["rejections"] == 0
+    assert engine.choose(("Dataset", 1000), size=5 * GB) is None
+    assert engine.metrics()["rejections"] == 1
+
+
+def test_busy_backend_avoided():
+    backends = FakeBackends(a=50 * GB, b=50 * GB)
+    engine = _engine(backends, reserve_size=0)
+    backends.now += 60
+    backends.free["a"] -= 10 * GB
+    engine.refresh()
+    metrics = engine.metrics()["backends"]
+    assert metrics["a"]["write_rate"] > 0
+    assert metrics["b"]["write_rate"] == 0
+    placed = _place(engine, 1000)
+    assert placed["b"] > 2 * placed["a"]
+
+
+def test_usage_percent_only_backends():
+    backends = FakeBackends(a=None, b=None)
+    engine = _engine(backends, global_max_percent_full=5)
+    assert engine.choose(("Dataset", 1)) is None
+    engine = _engine(backends, global_max_percent_full=90)
+    assert set(_place(engine, 100)) == {"a", "b"}
@@ -0,0 +1,113 @@
+import os
+import time
+from tempfile import mkdtemp
+
+from galaxy.objectstore.caching import (
+    CACHE_INDEX_FILENAME,
+    StagingCache,
+)
+
+
+def _write(cache, rel_path, size):
+    path = os.path.join(cache.staging_path, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fh:
+        fh.write("x" * size)
+    cache.added(rel_path)
+    return path
+
+
+def _staging_cache(limit=100, **kwd):
+    cache = StagingCache(mkdtemp(), size=1, **kwd)
+    cache.limit = limit
+    return cache
+
+
+def test_accounting():
+    cache = _staging_cache()
+    _write(cache, "000/dataset_1.dat", 10)
+    _write(cache, "000/dataset_2.dat", 20)
+    _write(cache, "000/dataset_2_files/a.txt", 5)
+    _write(cache, "000/dataset_2_files/b.txt", 5)
+    assert cache.index.total() == (40, 4)
+    # Rewriting a file accounts for the difference only
+    _write(cache, "000/dataset_1.dat", 15)
+    assert cache.index.total() == (45, 4)
+    cache.removed_tree("000/dataset_2_files")
+    assert cache.index.total() == (35, 2)
+    cache.removed("000/dataset_2.dat")
+    assert cache.index.total() == (15, 1)
+    cache.shutdown()
+
+
+def test_lookup_counts_hits_and_misses():
+    cache = _staging_cache()
+    _write(cache, "000/dataset_1.dat", 10)
+    assert cache.lookup("000/dataset_1.dat")
+    assert not cache.lookup("000/dataset_2.dat")
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["size"] == 10
+    cache.shutdown()
+
+
+def test_clean_evicts_least_recently_used():
+    cache = _staging_cache(limit=100)
+    paths = [_write(cache, "000/dataset_%d.dat" % i, 30) for i in range(3)]
+    # dataset_0 becomes the most recently used file
+    cache.index.add("000/dataset_0.dat", 30)
+    assert cache.clean() == 0
+    path = _write(cache, "000/dataset_3.dat", 30)
+    # evicts until below 90% of the limit
+    assert cache.clean() == 30
+    assert [os.path.exists(p) for p in paths + [path]] == [True, False, True, True]
+    assert cache.index.total() == (90, 3)
+    assert cache.stats()["evictions"] == 1
+    cache.shutdown()
+
+
+def test_pinned_files_not_evicted():
+    cache = _staging_cache(limit=100, pin_seconds=3600)
+    pinned = _write(cache, "000/dataset_0.dat", 60)
+    cache.lookup("000/dataset_0.dat", pin=True)
+    other = _write(cache, "000/dataset_1.dat", 60)
+    assert cache.clean() == 60
+    assert os.path.exists(pinned)
+    assert not os.path.exists(other)
+    cache.shutdown()
+
+
+def test_size_policy_evicts_large_files_first():
+    cache = _staging_cache(limit=100, eviction_policy="size")
+    small = _write(cache, "000/dataset_0.dat", 10)
+    large = _write(cache, "000/dataset_1.dat", 90)
+    now = time.time()
+    with cache.index._transaction() as conn:
+        conn.execute("UPDATE cache_file SET last_access = ?", (now - 100,))
+    assert cache.clean() == 90
+    assert os.path.exists(small)
+    assert not os.path.exists(large)
+    cache.shutdown()
+
+
+def test_reconcile():
+    cache = _staging_cache()
+    _write(cache, "000/dataset_0.dat", 10)
+    # written by a process not recording files in the index
+    with open(os.path.join(cache.staging_path, "dataset_1.dat"), "w") as fh:
+        fh.write("x" * 20)
+    os.remove(os.path.join(cache.staging_path, "000/dataset_0.dat"))
+    assert cache.index.reconcile() == (20, 1)
+    assert os.path.exists(os.path.join(cache.staging_path, CACHE_INDEX_FILENAME))
+    cache.shutdown()
+
+
+def test_unmanaged_cache_has_no_index():
+    cache = StagingCache(mkdtemp(), size=1, managed=False)
+    _write(cache, "000/dataset_0.dat", 10)
+    assert cache.lookup("000/dataset_0.dat")
+    assert cache.clean() == 0
+    assert cache.stats()["hits"] == 1
+    assert not os.path.exists(os.path.join(cache.staging_path, CACHE_INDEX_FILENAME))
+    cache.shutdown()
@@ -0,0 +1,296 @@
+import base64
+import hashlib
+import os
+import re
+import threading
+from tempfile import mkdtemp
+from xml.etree import ElementTree
+
+import pytest
+
+from galaxy.objectstore import (
+    s3,
+    transfer,
+)
+from galaxy.objectstore.caching import StagingCache
+from galaxy.objectstore.transfer import (
+    MEGABYTE,
+    parse_transfer_xml,
+    TransferError,
+    TransferManager,
+)
+
+# 2.5 parts of the minimum part size
+CONTENT = os.urandom(5 * MEGABYTE // 2) * 5
+
+
+class FakeObject:
+    """In-memory stand-in for an object in a bucket or container."""
+
+    def __init__(self, content=b'', failures=0):
+        self.content = content
+        self.failures = failures
+        self.parts = {}
+        self.lock = threading.Lock()
+
+    def _maybe_fail(self):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise OSError("connection reset")
+
+    def read_range(self, offset, length):
+        self._maybe_fail()
+        if offset >= len(self.content):
+            # Like an HTTP 416 response to a range starting past the end
+            raise OSError("requested range not satisfiable")
+        return self.content[offset:offset + length]
+
+    def upload_part(self, part_number, data, md5):
+        self._maybe_fail()
+        assert md5.hexdigest() == hashlib.md5(data).hexdigest()
+        self.parts[part_number] = data
+        return part_number
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(transfer, "RETRY_DELAY", 0)
+    manager = TransferManager(max_workers=3, part_size=5, max_retries=2)
+    yield manager
+    manager.shutdown()
+
+
+def _destination():
+    return os.path.join(mkdtemp(), "dataset_1.dat")
+
+
+def test_parts(manager):
+    assert manager.parts(12 * MEGABYTE) == [(0, 5 * MEGABYTE), (5 * MEGABYTE, 5 * MEGABYTE), (10 * MEGABYTE, 2 * MEGABYTE)]
+    assert manager.parts(10, offset=3) == [(3, 10)]
+    assert manager.parts(0) == []
+
+
+def test_part_size_has_a_minimum():
+    manager = TransferManager(part_size=1)
+    assert manager.part_size == 5 * MEGABYTE
+    assert manager.to_dict()["part_size"] == 5
+    manager.shutdown()
+
+
+def test_parse_transfer_xml():
+    config_xml = ElementTree.fromstring('<object_store><transfer max_workers="8" part_size="64"/></object_store>')
+    assert parse_transfer_xml(config_xml) == {"max_workers": 8, "part_size": 64, "max_retries": 3}
+    assert parse_transfer_xml(ElementTree.fromstring('<object_store/>')) == {}
+
+
+def test_download_in_parts(manager):
+    obj = FakeObject(CONTENT)
+    destination = _destination()
+    manager.download(len(CONTENT), obj.read_range, destination, expected_md5=hashlib.md5(CONTENT).hexdigest())
+    with open(destination, "rb") as fh:
+        assert fh.read() == CONTENT
+    assert os.listdir(os.path.dirname(destination)) == ["dataset_1.dat"]
+
+
+def test_download_retries_failed_parts(manager):
+    obj = FakeObject(CONTENT, failures=2)
+    destination = _destination()
+    manager.download(len(CONTENT), obj.read_range, destination)
+    with open(destination, "rb") as fh:
+        assert fh.read() == CONTENT
+
+
+def test_download_gives_up_after_retries(manager):
+    obj = FakeObject(CONTENT, failures=100)
+    destination = _destination()
+    with pytest.raises(OSError):
+        manager.download(len(CONTENT), obj.read_range, destination)
+    assert os.listdir(os.path.dirname(destination)) == []
+
+
+def test_download_checksum_mismatch(manager):
+    obj = FakeObject(CONTENT)
+    destination = _destination()
+    with pytest.raises(TransferError):
+        manager.download(len(CONTENT), obj.read_range, destination, expected_md5=hashlib.md5(b"other").hexdigest())
+    assert os.listdir(os.path.dirname(destination)) == []
+
+
+def test_download_short_read(manager):
+    obj = FakeObject(CONTENT[:-1])
+    destination = _destination()
+    with pytest.raises(TransferError):
+        manager.download(len(CONTENT), obj.read_range, destination)
+    assert not os.path.exists(destination)
+
+
+def test_upload_in_parts(manager):
+    source = _destination()
+    with open(source, "wb") as fh:
+        fh.write(CONTENT)
+    obj = FakeObject(failures=1)
+    assert manager.upload(source, obj.upload_part) == [1, 2, 3]
+    assert b"".join(obj.parts[i] for i in sorted(obj.parts)) == CONTENT
+
+
+def test_read_range(manager):
+    obj = FakeObject(CONTENT)
+    offset, length = MEGABYTE, 8 * MEGABYTE
+    assert manager.read(obj.read_range, offset, length) == CONTENT[offset:offset + length]
+    assert manager.read(obj.read_range, 1, 6) == CONTENT[1:7]
+    # ranges past the end of the object return what is there
+    assert manager.read(obj.read_range, len(CONTENT) - 3, 100) == CONTENT[-3:]
+
+
+def test_read_range_clamped_to_size(manager):
+    obj = FakeObject(CONTENT[:MEGABYTE])
+    # parts past the end of the object are not requested
+    assert manager.read(obj.read_range, 0, 12 * MEGABYTE, size=MEGABYTE) == obj.content
+    assert manager.read(obj.read_range, MEGABYTE, 100, size=MEGABYTE) == b''
+    assert manager.read(obj.read_range, 2 * MEGABYTE, 100, size=MEGABYTE) == b''
+    assert manager.read(obj.read_range, 0, 0, size=MEGABYTE) == b''
+
+
+class FakeS3ResponseError(Exception):
+    pass
+
+
+class FakeBucket:
+    """In-memory stand-in for a boto bucket, records the ranges requested and parts uploaded."""
+
+    name = "galaxy"
+
+    def __init__(self, failures=0):
+        self.objects = {}
+        self.ranges = []
+        self.uploads = {}
+        self.cancelled = []
+        self.failures = failures
+        self.lock = threading.Lock()
+
+    def get_key(self, name):
+        return FakeKey(self, name) if name in self.objects else None
+
+    def initiate_multipart_upload(self, key_name, reduced_redundancy=False):
+        mp = FakeMultiPartUpload(self)
+        mp.key_name = key_name
+        mp.id = str(len(self.uploads))
+        self.uploads[mp.id] = {}
+        return mp
+
+
+class FakeKey:
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def size(self):
+        return len(self.bucket.objects[self.name])
+
+    @property
+    def etag(self):
+        return '"%s"' % hashlib.md5(self.bucket.objects[self.name]).hexdigest()
+
+    def exists(self):
+        return self.name in self.bucket.objects
+
+    def get_contents_as_string(self, headers):
+        start, end = map(int, re.match(r"bytes=(\d+)-(\d+)$", headers["Range"]).groups())
+        with self.bucket.lock:
+            self.bucket.ranges.append((start, end))
+        return self.bucket.objects[self.name][start:end + 1]
+
+
+class FakeMultiPartUpload:
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def upload_part_from_file(self, fp, part_num, size, md5):
+        with self.bucket.lock:
+            if self.bucket.failures:
+                self.bucket.failures -= 1
+                raise FakeS3ResponseError("part %d failed" % part_num)
+        data = fp.read(size)
+        assert md5 == (hashlib.md5(data).hexdigest(), base64.b64encode(hashlib.md5(data).digest()).decode())
+        self.bucket.uploads[self.id][part_num] = data
+
+    def complete_upload(self):
+        parts = self.bucket.uploads.pop(self.id)
+        self.bucket.objects[self.key_name] = b"".join(parts[i] for i in sorted(parts))
+
+    def cancel_upload(self):
+        self.bucket.uploads.pop(self.id)
+        self.bucket.cancelled.append(self.key_name)
+
+
+class FakeConnection:
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def get_bucket(self, name, validate=True):
+        return self.bucket
+
+
+@pytest.fixture
+def s3_store(monkeypatch, manager):
+    # boto is an optional dependency, the module attributes may not exist
+    monkeypatch.setattr(s3, "Key", FakeKey, raising=False)
+    monkeypatch.setattr(s3, "MultiPartUpload", FakeMultiPartUpload, raising=False)
+    monkeypatch.setattr(s3, "S3ResponseError", FakeS3ResponseError, raising=False)
+    store = s3.S3ObjectStore.__new__(s3.S3ObjectStore)
+    bucket = FakeBucket()
+    store.bucket = bucket.name
+    store._bucket = bucket
+    store._connect = lambda: FakeConnection(bucket)
+    store._thread_local = threading.local()
+    store.transfer = manager
+    store.use_rr = False
+    store.multipart = True
+    store.staging_path = mkdtemp()
+    store.cache = StagingCache(store.staging_path, managed=False)
+    return store
+
+
+def test_s3_multipart_upload(s3_store):
+    source = _destination()
+    with open(source, "wb") as fh:
+        fh.write(CONTENT)
+    assert s3_store._push_to_os("000/dataset_1.dat", source_file=source)
+    assert s3_store._bucket.objects["000/dataset_1.dat"] == CONTENT
+    assert s3_store._bucket.uploads == {}
+
+
+def test_s3_multipart_upload_cancelled_on_failure(s3_store):
+    # More failures than retries of a part
+    s3_store._bucket.failures = 100
+    source = _destination()
+    with open(source, "wb") as fh:
+        fh.write(CONTENT)
+    assert not s3_store._push_to_os("000/dataset_1.dat", source_file=source)
+    assert s3_store._bucket.objects == {}
+    assert s3_store._bucket.cancelled == ["000/dataset_1.dat"]
+
+
+def test_s3_download_in_ranges(s3_store):
+    s3_store._bucket.objects["000/dataset_1.dat"] = CONTENT
+    # Created by _pull_into_cache
+    os.makedirs(s3_store._get_cache_path("000"))
+    assert s3_store._download("000/dataset_1.dat")
+    with open(s3_store._get_cache_path("000/dataset_1.dat"), "rb") as fh:
+        assert fh.read() == CONTENT
+    part_size = s3_store.transfer.part_size
+    assert sorted(s3_store._bucket.ranges) == [(0, part_size - 1), (part_size, 2 * part_size - 1), (2 * part_size, len(CONTENT) - 1)]
+
+
+def test_s3_get_data_reads_range(s3_store):
+    s3_store._bucket.objects["000/dataset_1.dat"] = b"0123456789" * MEGABYTE
+    s3_store._construct_path = lambda obj, **kwargs: "000/dataset_1.dat"
+    assert s3_store._get_data(None, start=3, count=4) == "3456"
+    assert s3_store._bucket.ranges == [(3, 6)]
+    # The object is not staged in the cache
+    assert not os.path.exists(s3_store._get_cache_path("000/dataset_1.dat"))
@@ -0,0 +1,80 @@
+import os
+
+from galaxy.tool_util.parser import get_tool_source
+from galaxy.tools.cache import (
+    CURRENT_TOOL_CACHE_VERSION,
+    ToolDocumentCache,
+)
+
+MACROS = """<macros>
+    <token name="@VERSION@">1.0.1</token>
+    <xml name="requirements">
+        <requirements>
+            <requirement type="package" version="1.9">samtools</requirement>
+        </requirements>
+    </xml>
+</macros>
+"""
+TOOL = """<tool id="cached_tool" name="Cached tool" version="@VERSION@">
+    <macros>
+        <import>macros.xml</import>
+    </macros>
+    <description>with a description</description>
+    <expand macro="requirements"/>
+    <command>samtools view '$input' > '$output'</command>
+    <inputs>
+        <param name="input" type="data" format="sam"/>
+    </inputs>
+    <outputs>
+        <data name="output" format="sam"/>
+    </outputs>
+</tool>
+"""
+
+
+def write_tool(directory):
+    with open(os.path.join(directory, "macros.xml"), "w") as f:
+        f.write(MACROS)
+    tool_path = os.path.join(directory, "tool.xml")
+    with open(tool_path, "w") as f:
+        f.write(TOOL)
+    return tool_path
+
+
+def test_tool_document_cache(tmp_path):
+    tool_path = write_tool(str(tmp_path))
+    cache_dir = str(tmp_path / "cache")
+    cache = ToolDocumentCache(cache_dir)
+    cache.set(tool_path, get_tool_source(tool_path))
+    # Pending entries are visible to the process that wrote them
+    assert 'id="cached_tool"' in cache.get(tool_path)["document"]
+    cache.persist()
+
+    # And to every other process once persisted
+    other_cache = ToolDocumentCache(cache_dir)
+    tool_document = other_cache.get(tool_path)
+    assert tool_document["tool_cache_version"] == CURRENT_TOOL_CACHE_VERSION
+    assert tool_document["macro_paths"] == [os.path.join(str(tmp_path), "macros.xml")]
+    assert "@VERSION@" not in tool_document["document"]
+    assert '<requirement type="package" version="1.9">samtools</requirement>' in tool_document["document"]
+
+    # Entries written concurrently by several processes are all kept
+    other_tool_path = os.path.join(str(tmp_path), "other_tool.xml")
+    with open(other_tool_path, "w") as f:
+        f.write(TOOL.replace("cached_tool", "other_tool"))
+    other_cache.set(other_tool_path, get_tool_source(other_tool_path))
+    other_cache.persist()
+    cache.set(tool_path, get_tool_source(tool_path))
+    cache.persist()
+    cache.reopen_ro()
+    assert 'id="other_tool"' in cache.get(other_tool_path)["document"]
+    assert 'id="cached_tool"' in cache.get(tool_path)["document"]
+
+    # Entries are invalidated when the tool or its macros change
+    os.utime(os.path.join(str(tmp_path), "macros.xml"), (0, 0))
+    assert cache.get(tool_path) is None
+    cache.delete(other_tool_path)
+    cache.persist()
+    assert other_cache.get(other_tool_path) is None
+    cache.close()
+    other_cache.close()
@@ -188,6 +188,60 @@ class ToolBoxTestCase(BaseToolBoxTestCase):
         assert tool is not None
         assert len(tool._macro_paths) == 1
 
+    def test_tool_loading_threads(self):
+        self.app.config.tool_loading_threads = 2
+        self._init_tool()
+        self._init_tool(filename="tool_with_macro.xml",
+                        tool_contents=SIMPLE_TOOL_WITH_MACRO,
+                        extra_file_contents=SIMPLE_MACRO.substitute(tool_version="2.0"),
+                        extra_file_path="external.xml")
+        self._add_config("""<toolbox><tool file="tool_with_macro.xml"/><section id="tid" name="TID"><tool file="missing.xml" /><tool file="tool.xml" /></section></toolbox>""")
+        toolbox = self.toolbox
+        assert len(toolbox.get_tool("tool_with_macro")._macro_paths) == 1
+        assert toolbox.get_tool("test_tool") is not None
+        assert list(toolbox._tool_panel.keys()) == ["tool_tool_with_macro", "tid"]
+        assert list(toolbox._tool_panel["tid"].elems.keys()) == ["tool_test_tool"]
+        # Tool sources are only read ahead while loading the config files
+        assert toolbox._tool_source_executor is None
+        assert not toolbox._prefetched_tool_sources
+
+    def test_finalized_tool_cache_size(self):
+        self.app.config.delay_tool_initialization = True
+        self.app.config.finalized_tool_cache_size = 1
+        self._init_tool(filename="tool_1.xml", tool_id="test_tool_1")
+        self._init_tool(filename="tool_2.xml", tool_id="test_tool_2")
+        self._add_config("""<toolbox><tool file="tool_1.xml"/><tool file="tool_2.xml" /></toolbox>""")
+        toolbox = self.toolbox
+        tool_1, tool_2 = toolbox.get_tool("test_tool_1"), toolbox.get_tool("test_tool_2")
+        assert not tool_1.finalized and not tool_2.finalized
+        assert "param1" in tool_1.inputs
+        assert tool_1.finalized
+        # Using a second tool releases the least recently used one ...
+        assert "param1" in tool_2.inputs
+        assert tool_2.finalized and not tool_1.finalized
+        assert "inputs" not in tool_1.__dict__ and "display" not in tool_1.__dict__
+        # Every released attribute is parsed again when used
+        assert tool_1.display is None
+        assert tool_1.finalized
+        tool_2.assert_finalized()
+        assert not tool_1.finalized
+        # ... which is parsed again when used
+        inputs = tool_1.inputs
+        assert list(inputs.keys()) == ["param1"]
+        assert len(tool_1.inputs_by_page) == 1
+        assert tool_1.finalized and not tool_2.finalized
+        # Pinned tools are not released
+        with tool_1.in_use():
+            assert "param1" in tool_2.inputs
+            assert tool_1.finalized and tool_2.finalized
+            assert not tool_1.release()
+            assert tool_1.inputs is inputs
+        tool_2.assert_finalized()
+        assert tool_2.finalized and not tool_1.finalized
+        # Structures parsed again replace the released ones instead of being filled in place
+        assert list(inputs.keys()) == ["param1"]
+        assert tool_1.inputs is not inputs
+
     def test_tool_reload_when_macro_is_altered(self):
         self._init_tool(filename="tool_with_macro.xml",
                         tool_contents=SIMPLE_TOOL_WITH_MACRO,
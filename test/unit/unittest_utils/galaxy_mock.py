@@ -156,6 +156,9 @@ class MockAppConfig(Bunch):
         # Compliance related config
         self.redact_email_in_job_name = False
 
+        self.job_runner_finish_workers = 0
+        self.job_runner_finish_priority = 'fifo'
+
         # Follow two required by GenomeBuilds
         self.len_file_path = os.path.join('tool-data', 'shared', 'ucsc', 'chrom')
         self.builds_file_path = os.path.join('tool-data', 'shared', 'ucsc', 'builds.txt.sample')